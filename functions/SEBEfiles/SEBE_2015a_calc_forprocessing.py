@@ -2,17 +2,74 @@ from builtins import range
 import numpy as np
 from ...util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_13 import shadowingfunction_wallheight_13
 from ...util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_23 import shadowingfunction_wallheight_23
+from ...util.shadowingfunctions import get_shadow_backend, set_shadow_backend
+from ...util import parallel
+from ..svf_functions import svf_halo, svf_partition
 import linecache
 import sys
 
-def SEBE_2015a_calc(a, scale, slope, aspect, voxelheight, sizey, sizex, vegdem, vegdem2, walls, dirwalls, albedo, psi, 
-                radmatI, radmatD, radmatR, usevegdem, feedback, wallmaxheight):
 
-    # Parameters
-    deg2rad = np.pi/180
-    Knight = np.zeros((sizex, sizey))
-    Energyyearroof = np.copy(Knight)
+def _slice_bounds(start, stop, length):
+    """Bounds of the python slices [start:stop] of a sequence of length, for arrays of start and stop."""
+    start = np.where(start < 0, start + length, start).clip(0, length)
+    stop = np.where(stop < 0, stop + length, stop).clip(0, length)
+    return start, stop
+
+
+def wall_voxels(wallrow, wallcol, wallsun, wallstot, wallsh, wallshve, Iw, Dw, Rw, psi, voxelheight, sections):
+    """
+    Irradiance of the wall voxels (wall pixels, sections) from one sky patch.
+    Sunlit sections get Iw + Dw + Rw, sections in vegetation shade (wallshve,
+    None without vegetation) (Iw + Dw) * psi and sections in building shade
+    Rw, in this order of precedence from the bottom of each wall. wallsun,
+    wallsh and wallshve are rounded down to voxelheight. Gives the same
+    matrix as filling the sections wall by wall with slices.
+    """
+    ws = wallsun[wallrow, wallcol]
+    wt = wallstot[wallrow, wallcol]
+    wsh = wallsh[wallrow, wallcol]
+    Iw = Iw[wallrow, wallcol]
+    Dw = Dw[wallrow, wallcol]
+    Rw = Rw[wallrow, wallcol]
+    nowall = np.zeros(wallrow.shape[0], dtype=np.int64)
+
+    # Sections in building shade, from the bottom
+    _, shade = _slice_bounds(0, (wsh / voxelheight).astype(np.int64), sections)
+    shade = np.where(wsh > 0, shade, 0)
+    # Sections in vegetation shade, above the building shade
+    veg = shade
+    if wallshve is not None:
+        wsv = wallshve[wallrow, wallcol]
+        _, stop = _slice_bounds(0, ((wsv + wsh) / voxelheight).astype(np.int64), sections)
+        veg = np.maximum(np.where(wsv > 0, stop, 0), shade)
+    # Sections in sun, the whole wall or the sections from (wt - ws) / voxelheight - 1 up, above the shade
+    start = np.where(ws == wt, 0, ((wt - ws) / voxelheight).astype(np.int64) - 1)
+    start, stop = _slice_bounds(start, (wt / voxelheight).astype(np.int64), sections)
+    start = np.maximum(start, veg)
+    stop = np.where(ws > 0, np.maximum(stop, start), start)
+
+    # Index of the irradiance of each section (0 none, 1 building shade, 2 vegetation shade, 3 sun), set at the
+    # first section of each part and removed after its last, summed up along the sections
+    index = np.zeros((wallrow.shape[0], sections + 1), dtype=np.int8)
+    for value, first, last in ((1, nowall, shade), (2, shade, veg), (3, start, stop)):
+        walls = np.nonzero(last > first)[0]
+        index[walls, first[walls]] += value
+        index[walls, last[walls]] -= value
+    np.cumsum(index, axis=1, out=index)
+
+    irradiance = np.empty((wallrow.shape[0], 4))
+    irradiance[:, 0] = 0.
+    irradiance[:, 1] = Rw
+    irradiance[:, 2] = (Iw + Dw) * psi
+    irradiance[:, 3] = Iw + Dw + Rw
+    return np.take_along_axis(irradiance, index[:, :sections], axis=1)
 
+
+def sebe_prepare(a, vegdem, vegdem2, usevegdem):
+    """
+    amaxvalue, the vegetation DSMs elevated by the ground and building DSM a,
+    the bushes and the vegetation pixels (row, col, height) written by SEBE.
+    """
     if usevegdem == 1:
         # amaxvalue
         vegmax = vegdem.max()
@@ -27,28 +84,7 @@ def SEBE_2015a_calc(a, scale, slope, aspect, voxelheight, sizey, sizex, vegdem,
 
         #% Bush separation
         bush = np.logical_not((vegdem2*vegdem))*vegdem
-    else:
-        psi = 1
-
-    # Creating wallmatrix (1 meter interval)
-    wallcol, wallrow = np.where(np.transpose(walls) > 0)    # row and col for each wall pixel
-    wallstot = np.floor(walls * (1 / voxelheight)) * voxelheight
-    # wallsections = np.floor(np.max(walls) * (1 / voxelheight))     # finding tallest wall
-    wallsections = np.floor(wallmaxheight * (1 / voxelheight))
-    # feedback.setProgressText('np.max(walls):' + str(np.max(walls)))   
-    # feedback.setProgressText('1 / voxelheight:' + str(1 / voxelheight))       
-    # feedback.setProgressText('voxel:' + str(voxelheight))
-    # feedback.setProgressText('wallsections:' + str(wallsections))
-    # feedback.setProgressText('np.shape(wallrow)[0]:' + str(np.shape(wallrow)[0]))
-    wallmatrix = np.zeros((np.shape(wallrow)[0], int(wallsections)))
-    Energyyearwall = np.copy(wallmatrix)
-
-    # Main loop - Creating skyvault of patches of constant radians (Tregeneza and Sharples, 1993)
-    skyvaultaltint = np.array([6, 18, 30, 42, 54, 66, 78, 90])
-    aziinterval = np.array([30, 30, 24, 24, 18, 12, 6, 1])
 
-    if usevegdem == 1:
-        wallshve = np.zeros(np.shape(a))
         vegrow, vegcol = np.where(vegdem > 0)  # row and col for each veg pixel
         vegdata = np.zeros((np.shape(vegrow)[0], 3))
         for i in range(0, vegrow.shape[0] - 1):
@@ -56,91 +92,128 @@ def SEBE_2015a_calc(a, scale, slope, aspect, voxelheight, sizey, sizex, vegdem,
             vegdata[i, 1] = vegcol[i] + 1
             vegdata[i, 2] = vegdem[vegrow[i], vegcol[i]]
     else:
+        amaxvalue = None
+        bush = None
         vegdata = 0
 
-    index = 0
-    for i in range(skyvaultaltint.size):
-        for j in range(aziinterval[i]):
+    return amaxvalue, vegdem, vegdem2, bush, vegdata
 
-            feedback.setProgress(int(index * (100. / 145.)))
 
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
+def sebe_patches(radmatI):
+    """Altitudes and azimuths of the 145 sky patches (Tregeneza and Sharples, 1993) of radmatI."""
+    return {'altitude': radmatI[:, 0], 'azimuth': radmatI[:, 1]}
 
-            #################### SOLAR RADIATION POSITIONS ###################
-            #Solar Incidence angle (Roofs)
-            suniroof = np.sin(slope) * np.cos(radmatI[index, 0] * deg2rad) * \
-                        np.cos((radmatI[index, 1]*deg2rad)-aspect) + \
-                        np.cos(slope) * np.sin((radmatI[index, 0] * deg2rad))
 
-            suniroof[suniroof < 0] = 0
+def sebe_sweep(a, scale, slope, aspect, voxelheight, vegdem, vegdem2, bush, amaxvalue, walls, dirwalls, psi,
+               radmatI, radmatD, radmatR, usevegdem, sections, feedback, selection=None, shadowcache=None):
+    """
+    Roof irradiance and wall voxel irradiance (walls in the order of
+    np.where(np.transpose(walls) > 0), sections) summed over the sky patches
+    in selection (all 145 patches by default). shadowcache is a ShadowCache
+    or None. The vegetation DSMs are elevated as given by sebe_prepare.
+    """
+    deg2rad = np.pi/180
+    Knight = np.zeros(np.shape(a))
+    Energyyearroof = np.copy(Knight)
 
-            # Solar Incidence angle (Walls)
-            suniwall = np.abs(np.sin(np.pi/2) * np.cos(radmatI[index, 0] * deg2rad) *
-                                np.cos((radmatI[index, 1] * deg2rad) - dirwalls*deg2rad) + np.cos(np.pi/2) *
-                                np.sin((radmatI[index, 0] * deg2rad)))
+    if usevegdem == 0:
+        psi = 1
 
-            # Shadow image
-            if usevegdem == 1:
-                vegsh, sh, _, wallsh, wallsun, wallshve, _, facesun = shadowingfunction_wallheight_23(a,
-                                    vegdem, vegdem2, radmatI[index, 1], radmatI[index, 0], scale, amaxvalue,
-                                                                                bush, walls, dirwalls * deg2rad)
-                shadow = np.copy(sh-(1.-vegsh)*(1.-psi))
-            else:
-                sh, wallsh, wallsun, facesh, facesun = shadowingfunction_wallheight_13(a, radmatI[index, 1],
-                                                            radmatI[index, 0], scale, walls, dirwalls * deg2rad)
-                shadow = np.copy(sh)
+    # Creating wallmatrix (1 meter interval)
+    wallcol, wallrow = np.where(np.transpose(walls) > 0)    # row and col for each wall pixel
+    wallstot = np.floor(walls * (1 / voxelheight)) * voxelheight
+    Energyyearwall = np.zeros((np.shape(wallrow)[0], sections))
 
-            # roof irradiance calculation
-            # direct radiation
-            if radmatI[index, 2] > 0:
-                I = shadow * radmatI[index, 2] * suniroof
-            else:
-                I = np.copy(Knight)
+    # shadowcache (util/shadowcache.py) reuses shadows cast for this surface in earlier runs
+    if shadowcache is not None:
+        if usevegdem == 1:
+            shadowcache = shadowcache.surface(a, walls, dirwalls * deg2rad, scale, vegdem, vegdem2, bush, amaxvalue)
+        else:
+            shadowcache = shadowcache.surface(a, walls, dirwalls * deg2rad, scale)
+
+    # Main loop - skyvault of patches of constant radians (Tregeneza and Sharples, 1993), see sunmapcreator_2015a
+    if selection is None:
+        selection = range(radmatI.shape[0])
+    for index in selection:
+
+        feedback.setProgress(int(index * (100. / 145.)))
+
+        if feedback.isCanceled():
+            feedback.setProgressText("Calculation cancelled")
+            break
 
-            # roof diffuse and reflected radiation
-            D = radmatD[index, 2] * shadow
-            R = radmatR[index, 2] * (shadow*-1 + 1)
+        #################### SOLAR RADIATION POSITIONS ###################
+        #Solar Incidence angle (Roofs)
+        suniroof = np.sin(slope) * np.cos(radmatI[index, 0] * deg2rad) * \
+                    np.cos((radmatI[index, 1]*deg2rad)-aspect) + \
+                    np.cos(slope) * np.sin((radmatI[index, 0] * deg2rad))
 
-            Energyyearroof = np.copy(Energyyearroof+D+R+I)
+        suniroof[suniroof < 0] = 0
 
-            # WALL IRRADIANCE
-            # direct radiation
-            if radmatI[index, 2] > 0:
-                Iw = radmatI[index, 2] * suniwall    # wall
+        # Solar Incidence angle (Walls)
+        suniwall = np.abs(np.sin(np.pi/2) * np.cos(radmatI[index, 0] * deg2rad) *
+                            np.cos((radmatI[index, 1] * deg2rad) - dirwalls*deg2rad) + np.cos(np.pi/2) *
+                            np.sin((radmatI[index, 0] * deg2rad)))
+
+        # Shadow image
+        if usevegdem == 1:
+            if shadowcache is not None:
+                vegsh, sh, _, wallsh, wallsun, wallshve, _, facesun = shadowcache.wallheight_23(
+                                                                    radmatI[index, 1], radmatI[index, 0])
+            else:
+                vegsh, sh, _, wallsh, wallsun, wallshve, _, facesun = shadowingfunction_wallheight_23(a,
+                                vegdem, vegdem2, radmatI[index, 1], radmatI[index, 0], scale, amaxvalue,
+                                                                            bush, walls, dirwalls * deg2rad)
+            shadow = np.copy(sh-(1.-vegsh)*(1.-psi))
+        else:
+            if shadowcache is not None:
+                sh, wallsh, wallsun, facesh, facesun = shadowcache.wallheight_13(radmatI[index, 1],
+                                                                                 radmatI[index, 0])
             else:
-                Iw = np.copy(Knight)
+                sh, wallsh, wallsun, facesh, facesun = shadowingfunction_wallheight_13(a, radmatI[index, 1],
+                                                        radmatI[index, 0], scale, walls, dirwalls * deg2rad)
+            shadow = np.copy(sh)
 
-            # wall diffuse and reflected radiation
-            Dw = radmatD[index, 2] * facesun
-            Rw = radmatR[index, 2] * facesun
+        # roof irradiance calculation
+        # direct radiation
+        if radmatI[index, 2] > 0:
+            I = shadow * radmatI[index, 2] * suniroof
+        else:
+            I = np.copy(Knight)
 
-            # for each wall level (voxelheight interval)
-            wallsun = np.floor(wallsun*(1/voxelheight)) * voxelheight
-            wallsh = np.floor(wallsh*(1/voxelheight)) * voxelheight
-            if usevegdem == 1:
-                wallshve = np.floor(wallshve*(1/voxelheight)) * voxelheight
+        # roof diffuse and reflected radiation
+        D = radmatD[index, 2] * shadow
+        R = radmatR[index, 2] * (shadow*-1 + 1)
 
-            wallmatrix = wallmatrix * 0
+        Energyyearroof = np.copy(Energyyearroof+D+R+I)
 
-            for p in range(np.shape(wallmatrix)[0]):
-                if wallsun[wallrow[p], wallcol[p]] > 0:    # Sections in sun
-                    if wallsun[int(wallrow[p]), int(wallcol[p])] == wallstot[int(wallrow[p]), int(wallcol[p])]:  # All sections in sun
-                        wallmatrix[p, 0:int(wallstot[int(wallrow[p]), int(wallcol[p])] / voxelheight)] = Iw[wallrow[p], wallcol[p]] + Dw[wallrow[p], wallcol[p]] + Rw[wallrow[p], wallcol[p]]
-                    else:
-                        wallmatrix[p, int((wallstot[wallrow[p], wallcol[p]] - wallsun[wallrow[p], wallcol[p]]) / voxelheight) - 1:int(wallstot[wallrow[p], wallcol[p]] / voxelheight)] = Iw[wallrow[p], wallcol[p]] + Dw[wallrow[p], wallcol[p]] + Rw[wallrow[p], wallcol[p]]
+        # WALL IRRADIANCE
+        # direct radiation
+        if radmatI[index, 2] > 0:
+            Iw = radmatI[index, 2] * suniwall    # wall
+        else:
+            Iw = np.copy(Knight)
 
-                if usevegdem == 1 and wallshve[wallrow[p], wallcol[p]] > 0:    # sections in vegetation shade
-                    wallmatrix[p, 0:int((wallshve[int(wallrow[p]), int(wallcol[p])] + wallsh[int(wallrow[p]), int(wallcol[p])]) / voxelheight)] = (Iw[wallrow[p], wallcol[p]] + Dw[wallrow[p], wallcol[p]])*psi
+        # wall diffuse and reflected radiation
+        Dw = radmatD[index, 2] * facesun
+        Rw = radmatR[index, 2] * facesun
 
-                if wallsh[wallrow[p], wallcol[p]] > 0:    # sections in building shade
-                    wallmatrix[p, 0:int(wallsh[wallrow[p], wallcol[p]] / voxelheight)] = Rw[wallrow[p], wallcol[p]]
+        # for each wall level (voxelheight interval)
+        wallsun = np.floor(wallsun*(1/voxelheight)) * voxelheight
+        wallsh = np.floor(wallsh*(1/voxelheight)) * voxelheight
+        if usevegdem == 1:
+            wallshve = np.floor(wallshve*(1/voxelheight)) * voxelheight
 
-            Energyyearwall = Energyyearwall + np.copy(wallmatrix)
+        wallmatrix = wall_voxels(wallrow, wallcol, wallsun, wallstot, wallsh, wallshve if usevegdem == 1 else None,
+                                 Iw, Dw, Rw, psi, voxelheight, sections)
 
-            index = index + 1
+        Energyyearwall = Energyyearwall + np.copy(wallmatrix)
 
+    return Energyyearroof, Energyyearwall, wallrow, wallcol
+
+
+def sebe_finalise(Energyyearroof, Energyyearwall, wallrow, wallcol, radmatR, albedo):
+    """Roof irradiance (kWh) and the rows (row, col, sections, 1 based) of the wall irradiance (kWh)."""
     # Including radiation from ground on walls as well as removing pixels high than walls
     # fix_print_with_import
     wallmatrixbol = (Energyyearwall > 0).astype(float)
@@ -150,6 +223,151 @@ def SEBE_2015a_calc(a, scale, slope, aspect, voxelheight, sizey, sizex, vegdem,
     Energyyearwall /= 1000
     Energyyearwall = np.transpose(np.vstack((wallrow + 1, wallcol + 1, np.transpose(Energyyearwall))))    # adding 1 to wallrow and wallcol so that the tests pass
 
+    return Energyyearroof, Energyyearwall
+
+
+def _sebe_worker(task):
+    """Partial SEBE sweep over a subset of the sky patches, run in a worker process."""
+    descriptors, settings, radmats, selection, shadowcache, backend = task
+    set_shadow_backend(backend)
+    blocks, arrays = parallel.attach_arrays(descriptors)
+    try:
+        result = sebe_sweep(arrays['a'], settings['scale'], arrays['slope'], arrays['aspect'], settings['voxelheight'],
+                            arrays.get('vegdem'), arrays.get('vegdem2'), arrays.get('bush'), settings['amaxvalue'],
+                            arrays['walls'], arrays['dirwalls'], settings['psi'], radmats[0], radmats[1], radmats[2],
+                            settings['usevegdem'], settings['sections'], parallel.worker_feedback(), selection,
+                            shadowcache)
+    finally:
+        arrays.clear()
+        parallel.release_arrays(blocks, unlink=False)
+
+    cachecount = (0, 0) if shadowcache is None else (shadowcache.hits, shadowcache.misses)
+    return result[:2], cachecount
+
+
+def sebe_sweep_parallel(a, scale, slope, aspect, voxelheight, vegdem, vegdem2, bush, amaxvalue, walls, dirwalls,
+                        psi, radmatI, radmatD, radmatR, usevegdem, sections, feedback, workers, shadowcache=None):
+    """
+    Same as sebe_sweep, with the sky patches split over a pool of worker
+    processes (see svf_partition). The grids are shared with the workers
+    through shared memory and the partial sums are reduced in worker order,
+    so the result is reproducible for a given number of workers.
+    """
+    selections = svf_partition(sebe_patches(radmatI), workers)
+    inputs = {'a': a, 'slope': slope, 'aspect': aspect, 'walls': walls, 'dirwalls': dirwalls}
+    if usevegdem == 1:
+        inputs.update({'vegdem': vegdem, 'vegdem2': vegdem2, 'bush': bush})
+    settings = {'scale': scale, 'voxelheight': voxelheight, 'amaxvalue': amaxvalue, 'psi': psi,
+                'usevegdem': usevegdem, 'sections': sections}
+    blocks, shared, descriptors = parallel.share_arrays(inputs)
+    inputs = None
+    try:
+        pool, counter, cancel = parallel.process_pool(len(selections))
+        try:
+            tasks = [(descriptors, settings, (radmatI, radmatD, radmatR), selection, shadowcache,
+                      get_shadow_backend()) for selection in selections]
+            partials = parallel.run_in_pool(pool, _sebe_worker, tasks, feedback, counter, cancel, radmatI.shape[0])
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        shared.clear()
+        parallel.release_arrays(blocks)
+
+    if cancel.is_set():
+        feedback.setProgressText("Calculation cancelled")
+
+    wallcol, wallrow = np.where(np.transpose(walls) > 0)
+    Energyyearroof = np.zeros(np.shape(a))
+    Energyyearwall = np.zeros((np.shape(wallrow)[0], sections))
+    for (roof, wall), (hits, misses) in partials:
+        Energyyearroof += roof
+        Energyyearwall += wall
+        if shadowcache is not None:
+            shadowcache.hits += hits
+            shadowcache.misses += misses
+
+    return Energyyearroof, Energyyearwall, wallrow, wallcol
+
+
+def SEBE_2015a_calc(a, scale, slope, aspect, voxelheight, sizey, sizex, vegdem, vegdem2, walls, dirwalls, albedo, psi, 
+                radmatI, radmatD, radmatR, usevegdem, feedback, wallmaxheight,
+                shadowcache=None, workers=1):
+
+    amaxvalue, vegdem, vegdem2, bush, vegdata = sebe_prepare(a, vegdem, vegdem2, usevegdem)
+    # wallsections = np.floor(np.max(walls) * (1 / voxelheight))     # finding tallest wall
+    wallsections = int(np.floor(wallmaxheight * (1 / voxelheight)))
+
+    if workers > 1:
+        result = sebe_sweep_parallel(a, scale, slope, aspect, voxelheight, vegdem, vegdem2, bush, amaxvalue, walls,
+                                     dirwalls, psi, radmatI, radmatD, radmatR, usevegdem, wallsections, feedback,
+                                     workers, shadowcache)
+    else:
+        result = sebe_sweep(a, scale, slope, aspect, voxelheight, vegdem, vegdem2, bush, amaxvalue, walls, dirwalls,
+                            psi, radmatI, radmatD, radmatR, usevegdem, wallsections, feedback,
+                            shadowcache=shadowcache)
+    Energyyearroof, Energyyearwall = sebe_finalise(*result, radmatR=radmatR, albedo=albedo)
+
     seberesult = {'Energyyearroof': Energyyearroof, 'Energyyearwall': Energyyearwall, 'vegdata': vegdata}
 
-    return seberesult
\ No newline at end of file
+    return seberesult
+
+
+def SEBE_2015a_calc_tiles(a, scale, slope, aspect, voxelheight, vegdem, vegdem2, walls, dirwalls, albedo, psi,
+                          radmatI, radmatD, radmatR, usevegdem, feedback, wallmaxheight, tilesize,
+                          shadowcache=None, workers=1):
+    """
+    Tiled version of SEBE_2015a_calc for DSMs too large to be calculated at
+    once. Each tile is extended by a halo large enough to capture all shadows
+    cast into it (see svf_halo), so the results inside each tile equal the
+    untiled ones. Yields (row offset, column offset, Energyyearroof of the
+    tile, Energyyearwall of the walls in the tile) per tile, the walls with
+    the row and column (1 based) of the whole DSM. The vegetation pixels are
+    given by sebe_prepare.
+    """
+    rows = a.shape[0]
+    cols = a.shape[1]
+
+    amaxvalue, vegdem, vegdem2, bush, _ = sebe_prepare(a, vegdem, vegdem2, usevegdem)
+    wallsections = int(np.floor(wallmaxheight * (1 / voxelheight)))
+    halo = svf_halo(a, vegdem if usevegdem == 1 else a, scale, sebe_patches(radmatI))
+
+    tiles = [(r, c) for r in range(0, rows, tilesize) for c in range(0, cols, tilesize)]
+    for t, (r0, c0) in enumerate(tiles):
+        if feedback.isCanceled():
+            feedback.setProgressText("Calculation cancelled")
+            break
+        feedback.setProgressText('Calculating irradiance for tile ' + str(t + 1) + ' of ' + str(len(tiles)))
+        r1 = min(r0 + tilesize, rows)
+        c1 = min(c0 + tilesize, cols)
+        pr0 = max(r0 - halo, 0)
+        pr1 = min(r1 + halo, rows)
+        pc0 = max(c0 - halo, 0)
+        pc1 = min(c1 + halo, cols)
+        window = (slice(pr0, pr1), slice(pc0, pc1))
+        core = (slice(r0 - pr0, r1 - pr0), slice(c0 - pc0, c1 - pc0))
+
+        tile = [a[window], slope[window], aspect[window]]
+        if usevegdem == 1:
+            tile += [vegdem[window], vegdem2[window], bush[window]]
+        else:
+            tile += [None, None, None]
+        tile += [walls[window], dirwalls[window]]
+        if workers > 1:
+            result = sebe_sweep_parallel(tile[0], scale, tile[1], tile[2], voxelheight, tile[3], tile[4], tile[5],
+                                         amaxvalue, tile[6], tile[7], psi, radmatI, radmatD, radmatR, usevegdem,
+                                         wallsections, feedback, workers, shadowcache)
+        else:
+            result = sebe_sweep(tile[0], scale, tile[1], tile[2], voxelheight, tile[3], tile[4], tile[5], amaxvalue,
+                                tile[6], tile[7], psi, radmatI, radmatD, radmatR, usevegdem, wallsections, feedback,
+                                shadowcache=shadowcache)
+        Energyyearroof, Energyyearwall = sebe_finalise(*result, radmatR=radmatR, albedo=albedo)
+
+        # walls inside the tile, with rows and columns of the whole DSM
+        inside = ((Energyyearwall[:, 0] > r0 - pr0) & (Energyyearwall[:, 0] <= r1 - pr0) &
+                  (Energyyearwall[:, 1] > c0 - pc0) & (Energyyearwall[:, 1] <= c1 - pc0))
+        Energyyearwall = Energyyearwall[inside]
+        Energyyearwall[:, 0] += pr0
+        Energyyearwall[:, 1] += pc0
+
+        yield r0, c0, Energyyearroof[core], Energyyearwall
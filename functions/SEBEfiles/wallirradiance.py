@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Compact storage of the wall irradiance of SEBE.
+
+SEBE gives the irradiance of every wall pixel as a (walls, 2 + sections)
+matrix of row, column (1 based) and the irradiance of each voxelheight
+section, most of which are zero for all but the tallest walls. The walls are
+kept here as runs of non-zero sections:
+
+    row, col   - row and column of each wall (1 based, as in Energyyearwall.txt)
+    sections   - number of sections
+    runptr     - runs of wall i are runptr[i]:runptr[i + 1]
+    runstart   - first section of each run
+    runlength  - number of sections of each run
+    values     - irradiance of the sections of all runs, in order
+
+and saved as Energyyearwall.npz, with float32 values, next to the text file
+Energyyearwall.txt written by earlier versions.
+"""
+
+import numpy as np
+
+WALL_HEADER = '%row col irradiance'
+
+
+def pack_walls(Energyyearwall):
+    """Runs of the (walls, 2 + sections) matrix Energyyearwall."""
+    matrix = Energyyearwall[:, 2:]
+    walls, sections = matrix.shape
+    nonzero = np.zeros((walls, sections + 2), dtype=np.int8)
+    nonzero[:, 1:-1] = matrix != 0
+    change = np.diff(nonzero, axis=1)
+    wall, runstart = np.nonzero(change == 1)
+    runstop = np.nonzero(change == -1)[1]
+    runptr = np.zeros(walls + 1, dtype=np.int64)
+    runptr[1:] = np.cumsum(np.bincount(wall, minlength=walls))
+    return {'row': Energyyearwall[:, 0].astype(np.int32), 'col': Energyyearwall[:, 1].astype(np.int32),
+            'sections': sections, 'runptr': runptr, 'runstart': runstart.astype(np.int32),
+            'runlength': (runstop - runstart).astype(np.int32), 'values': matrix[matrix != 0]}
+
+
+def unpack_walls(walls, first=0, last=None):
+    """Energyyearwall matrix of the walls first to last (all walls by default)."""
+    if last is None:
+        last = walls['row'].shape[0]
+    runptr = walls['runptr']
+    r0 = runptr[first]
+    r1 = runptr[last]
+    lengths = walls['runlength'][r0:r1].astype(np.int64)
+    v0 = int(walls['runlength'][:r0].sum())
+    count = int(lengths.sum())
+
+    wall = np.repeat(np.repeat(np.arange(last - first), np.diff(runptr[first:last + 1])), lengths)
+    section = np.repeat(walls['runstart'][r0:r1] - np.cumsum(lengths) + lengths, lengths) + np.arange(count)
+    Energyyearwall = np.zeros((last - first, int(walls['sections']) + 2))
+    Energyyearwall[:, 0] = walls['row'][first:last]
+    Energyyearwall[:, 1] = walls['col'][first:last]
+    Energyyearwall[wall, section + 2] = walls['values'][v0:v0 + count]
+    return Energyyearwall
+
+
+def select_walls(walls, order):
+    """The walls in order (indices of walls)."""
+    order = np.asarray(order, dtype=np.int64)
+    runptr = walls['runptr']
+    counts = np.diff(runptr)[order]
+    newptr = np.zeros(order.shape[0] + 1, dtype=np.int64)
+    newptr[1:] = np.cumsum(counts)
+    runs = np.repeat(runptr[order] - newptr[:-1], counts) + np.arange(newptr[-1])
+
+    lengths = walls['runlength'].astype(np.int64)
+    valueptr = np.cumsum(lengths) - lengths
+    newlengths = lengths[runs]
+    newvalueptr = np.cumsum(newlengths) - newlengths
+    values = np.repeat(valueptr[runs] - newvalueptr, newlengths) + np.arange(newlengths.sum())
+    return {'row': walls['row'][order], 'col': walls['col'][order], 'sections': walls['sections'],
+            'runptr': newptr, 'runstart': walls['runstart'][runs], 'runlength': walls['runlength'][runs],
+            'values': walls['values'][values]}
+
+
+def concatenate_walls(parts, sections):
+    """
+    Walls of parts (e.g. of the tiles of a DSM) in one set, ordered by column
+    and row as the walls of an untiled run.
+    """
+    if not parts:
+        return pack_walls(np.zeros((0, sections + 2)))
+    runptr = [np.zeros(1, dtype=np.int64)]
+    offset = 0
+    for part in parts:
+        runptr.append(part['runptr'][1:] + offset)
+        offset += part['runptr'][-1]
+    walls = {'sections': sections, 'runptr': np.concatenate(runptr)}
+    for name in ('row', 'col', 'runstart', 'runlength', 'values'):
+        walls[name] = np.concatenate([part[name] for part in parts])
+    return select_walls(walls, np.lexsort((walls['row'], walls['col'])))
+
+
+def save_walls_text(filename, walls, blocksize=100000):
+    """Energyyearwall.txt as written by earlier versions, unpacked blocksize walls at a time."""
+    numformat = '%4d %4d ' + '%6.2f ' * int(walls['sections'])
+    count = walls['row'].shape[0]
+    with open(filename, 'wb') as f:
+        np.savetxt(f, unpack_walls(walls, 0, min(blocksize, count)), fmt=numformat, header=WALL_HEADER,
+                   comments='')
+        for first in range(blocksize, count, blocksize):
+            np.savetxt(f, unpack_walls(walls, first, min(first + blocksize, count)), fmt=numformat)
+
+
+def save_walls_npz(filename, walls):
+    arrays = dict(walls)
+    arrays['sections'] = np.array(walls['sections'])
+    arrays['values'] = walls['values'].astype(np.float32)
+    np.savez_compressed(filename, **arrays)
+
+
+def load_walls_npz(filename):
+    with np.load(filename) as data:
+        walls = dict((name, data[name]) for name in data.files)
+    walls['sections'] = int(walls['sections'])
+    return walls
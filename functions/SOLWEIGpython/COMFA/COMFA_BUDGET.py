@@ -84,11 +84,8 @@ def COMFA_rc(va, rco):
     # value of clothing, s/m), va (activity wind velocity in m/s), vw
     # (windspeed, m/s). Note that rco must be known based on clothing worn. 
 
-    if va == 0:
-        rc = rco
-    else:
-        rc = rco * (-0.37 * (1 - np.exp(-va / 0.72)) + 1)
-        # rc = rco * (-0.37 * (1 - np.exp(-va / 0.72)) + 1)
+    # va and rco can be scalars or arrays
+    rc = np.where(va == 0, rco, rco * (-0.37 * (1 - np.exp(-va / 0.72)) + 1))[()]
 
     # This is new equation from Kenny et al. (2009b) - IJB.
 
@@ -142,17 +139,13 @@ def COMFA_ra(vw, va):
         
     Re =  vr * D / v
 
-    if Re < 4000:
-        A = 0.683
-        n = 0.466
-    elif ((Re >= 4000) and (Re < 40000)):
-        A = 0.193
-        n = 0.618
-    else: # Re >= 40000
-        A = 0.0266
-        n = 0.805
+    # Re < 4000, 4000 <= Re < 40000 and Re >= 40000, for scalar or array wind speeds
+    low = Re < 4000
+    mid = (Re >= 4000) & (Re < 40000)
+    A = np.where(low, 0.683, np.where(mid, 0.193, 0.0266))
+    n = np.where(low, 0.466, np.where(mid, 0.618, 0.805))
 
-    ra = 0.17 / (A * Re**n * Pr**0.33 * k)
+    ra = (0.17 / (A * Re**n * Pr**0.33 * k))[()]
 
     # A = Re
     # n = Re
@@ -476,10 +469,7 @@ def COMFA_EVAP(Mact, Ta, RH, vw, va, rco, rcvo, age, kid):
 
     Em = COMFA_Em(Mact, Ta, RH, vw, va, rco, rcvo, age, kid)
  
-    if Etot <= Em:
-        EVAP = Etot
-    else:
-        EVAP = Em
+    EVAP = np.where(Etot <= Em, Etot, Em)[()]
 
     # EVAP = np.zeros((Em.shape[0]))
     
@@ -536,6 +526,7 @@ def COMFA_TREMIT(Mact, Ta, RH, vw, va, rco, age, kid):
 
 def COMFA_BUDGET(Mact, Ta, RH, vw, va, rco, rcvo, weight, height, age, kid):
     # Calculates the four energy fluxes MET, CONV, EVAP, and TREMIT in the COMFA energy budget, with inputs 
+    # (Ta, RH and vw can be arrays, e.g. a wind speed grid with Ta and RH of shape (time, 1, 1) for a stack of timesteps)
     # Tair (air temperature, degrees C), Metabolic activity (W/m2), Relative Humidty (%),
     # Wind Velocity (m/s), activity velocity (va, m s-1), static clothing resistance (rco, sm-1), static clothing vapor reistance (rcvo, s m-1). 
     # Note can also make Rabs an input. See below.
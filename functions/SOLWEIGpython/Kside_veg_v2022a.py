@@ -17,29 +17,29 @@ def Kside_veg_v2022a(radI,radD,radG,
     aziW=azimuth-180+t
     aziN=azimuth-270+t
     deg2rad=np.pi/180
-    KsideD = np.zeros((rows, cols))
-    Kref_sun = np.zeros((rows, cols))
-    Kref_sh = np.zeros((rows, cols))
-    Kref_veg = np.zeros((rows, cols))
-    Kside = np.zeros((rows, cols))
-
-    Kref_veg_n = np.zeros((rows, cols))
-    Kref_veg_s = np.zeros((rows, cols))
-    Kref_veg_e = np.zeros((rows, cols))
-    Kref_veg_w = np.zeros((rows, cols))
-
-    Kref_sh_n = np.zeros((rows, cols))
-    Kref_sh_s = np.zeros((rows, cols))
-    Kref_sh_e = np.zeros((rows, cols))
-    Kref_sh_w = np.zeros((rows, cols))
-
-    Kref_sun_n = np.zeros((rows, cols))
-    Kref_sun_s = np.zeros((rows, cols))
-    Kref_sun_e = np.zeros((rows, cols))
-    Kref_sun_w = np.zeros((rows, cols))
-
-    KeastRef = np.zeros((rows, cols)); KwestRef = np.zeros((rows, cols)); KnorthRef = np.zeros((rows, cols)); KsouthRef = np.zeros((rows, cols))
-    diffRadE = np.zeros((rows, cols)); diffRadS = np.zeros((rows, cols)); diffRadW = np.zeros((rows, cols)); diffRadN = np.zeros((rows, cols))
+    KsideD = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_sun = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_sh = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_veg = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kside = np.zeros((rows, cols), dtype=shadow.dtype)
+
+    Kref_veg_n = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_veg_s = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_veg_e = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_veg_w = np.zeros((rows, cols), dtype=shadow.dtype)
+
+    Kref_sh_n = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_sh_s = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_sh_e = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_sh_w = np.zeros((rows, cols), dtype=shadow.dtype)
+
+    Kref_sun_n = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_sun_s = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_sun_e = np.zeros((rows, cols), dtype=shadow.dtype)
+    Kref_sun_w = np.zeros((rows, cols), dtype=shadow.dtype)
+
+    KeastRef = np.zeros((rows, cols), dtype=shadow.dtype); KwestRef = np.zeros((rows, cols), dtype=shadow.dtype); KnorthRef = np.zeros((rows, cols), dtype=shadow.dtype); KsouthRef = np.zeros((rows, cols), dtype=shadow.dtype)
+    diffRadE = np.zeros((rows, cols), dtype=shadow.dtype); diffRadS = np.zeros((rows, cols), dtype=shadow.dtype); diffRadW = np.zeros((rows, cols), dtype=shadow.dtype); diffRadN = np.zeros((rows, cols), dtype=shadow.dtype)
 
     ### Direct radiation ###
     if cyl == 1: ### Kside with cylinder ###
@@ -99,13 +99,15 @@ def Kside_veg_v2022a(radI,radD,radG,
         # Calculation of steradian for each patch
         steradian = np.zeros((patch_altitude.shape[0]))
         for i in range(patch_altitude.shape[0]):
+            # number of patches in the band of patch i
+            band_patches = skyalt_c[skyalt == patch_altitude[i]][0]
             # If there are more than one patch in a band
-            if skyalt_c[skyalt == patch_altitude[i]] > 1:
-                steradian[i] = ((360 / skyalt_c[skyalt == patch_altitude[i]]) * deg2rad) * (np.sin((patch_altitude[i] + patch_altitude[0]) * deg2rad) \
+            if band_patches > 1:
+                steradian[i] = ((360 / band_patches) * deg2rad) * (np.sin((patch_altitude[i] + patch_altitude[0]) * deg2rad) \
                 - np.sin((patch_altitude[i] - patch_altitude[0]) * deg2rad))
             # If there is only one patch in band, i.e. 90 degrees
             else:
-                steradian[i] = ((360 / skyalt_c[skyalt == patch_altitude[i]]) * deg2rad) * (np.sin((patch_altitude[i]) * deg2rad) \
+                steradian[i] = ((360 / band_patches) * deg2rad) * (np.sin((patch_altitude[i]) * deg2rad) \
                     - np.sin((patch_altitude[i-1] + patch_altitude[0]) * deg2rad))
 
             radTot += (patch_luminance[i] * steradian[i] * np.sin(patch_altitude[i] * deg2rad)) # Radiance fraction normalization
@@ -150,7 +152,7 @@ def Kside_veg_v2022a(radI,radD,radG,
             # Kwest  = (albedo * (svfviktbuvegW * (radG * (1 - F_sh) + radD * F_sh)) + KupW) * 0.5
             # Knorth = (albedo * (svfviktbuvegN * (radG * (1 - F_sh) + radD * F_sh)) + KupN) * 0.5
         else: # Box
-            diffRadE = np.zeros((rows, cols)); diffRadS = np.zeros((rows, cols)); diffRadW = np.zeros((rows, cols)); diffRadN = np.zeros((rows, cols))
+            diffRadE = np.zeros((rows, cols), dtype=shadow.dtype); diffRadS = np.zeros((rows, cols), dtype=shadow.dtype); diffRadW = np.zeros((rows, cols), dtype=shadow.dtype); diffRadN = np.zeros((rows, cols), dtype=shadow.dtype)
 
             for idx in range(patch_azimuth.shape[0]):
                 if (patch_azimuth[idx] > 360) or (patch_azimuth[idx] <= 180):
@@ -42,13 +42,15 @@ def Lcyl_v2022a(esky, sky_patches, Ta, Tgwall, ewall, Lup, shmat, vegshmat, vbsh
     # Calculation of steradian for each patch
     steradian = np.zeros((patch_altitude.shape[0]))
     for i in range(patch_altitude.shape[0]):
+        # number of patches in the band of patch i
+        band_patches = skyalt_c[skyalt == patch_altitude[i]][0]
         # If there are more than one patch in a band
-        if skyalt_c[skyalt == patch_altitude[i]] > 1:
-            steradian[i] = ((360 / skyalt_c[skyalt == patch_altitude[i]]) * deg2rad) * (np.sin((patch_altitude[i] + patch_altitude[0]) * deg2rad) \
+        if band_patches > 1:
+            steradian[i] = ((360 / band_patches) * deg2rad) * (np.sin((patch_altitude[i] + patch_altitude[0]) * deg2rad) \
             - np.sin((patch_altitude[i] - patch_altitude[0]) * deg2rad))
         # If there is only one patch in band, i.e. 90 degrees
         else:
-            steradian[i] = ((360 / skyalt_c[skyalt == patch_altitude[i]]) * deg2rad) * (np.sin((patch_altitude[i]) * deg2rad) \
+            steradian[i] = ((360 / band_patches) * deg2rad) * (np.sin((patch_altitude[i]) * deg2rad) \
                 - np.sin((patch_altitude[i-1] + patch_altitude[0]) * deg2rad))
 
     # True = anisotropic sky, False = isotropic sky
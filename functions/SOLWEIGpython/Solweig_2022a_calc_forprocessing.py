@@ -27,7 +27,8 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
                        landcover, lc_grid, dectime, altmax, dirwalls, walls, cyl, elvis, Ta, RH, radG, radD, radI, P,
                        amaxvalue, bush, Twater, TgK, Tstart, alb_grid, emis_grid, TgK_wall, Tstart_wall, TmaxLST,
                        TmaxLST_wall, first, second, svfalfa, svfbuveg, firstdaytime, timeadd, timestepdec, Tgmap1, 
-                       Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, CI, TgOut1, diffsh, shmat, vegshmat, vbshvegshmat, anisotropic_sky, asvf, patch_option):
+                       Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, CI, TgOut1, diffsh, shmat, vegshmat, vbshvegshmat, anisotropic_sky, asvf, patch_option,
+                       shadowcache=None, gvfengine=None):
 
 #def Solweig_2021a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, svfveg, svfNveg, svfEveg, svfSveg,
 #                       svfWveg, svfaveg, svfEaveg, svfSaveg, svfWaveg, svfNaveg, vegdem, vegdem2, albedo_b, absK, absL,
@@ -95,6 +96,9 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
     # CI = Clearness index
     # TgOut1 = old Ts model
     # diffsh, ani = Used in anisotrpic models (Wallenberg et al. 2019, 2022)
+    # diffsh = DiffuseShadowMatrix (util/shadowmats.py) with the precomputed diffuse shadow matrix
+    # shadowcache = CachedShadows (util/shadowcache.py) bound to this surface, None to cast all shadows
+    # gvfengine = GvfEngine (gvf_engine.py) precomputed for this run, None to use gvf_2018a
 
     # # # Core program start # # #
     # Instrument offset in degrees
@@ -103,8 +107,20 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
     # Stefan Bolzmans Constant
     SBC = 5.67051e-8
 
+    # Scalars in the precision of the grids (float32 in the single precision mode), since numpy promotes
+    # float32 grids combined with float64 scalars to float64
+    ftype = dsm.dtype.type
+    altitude, azimuth, zen, jday, dectime, altmax, Ta, RH, radG, radD, radI, P, psi, timeadd, timestepdec, CI, \
+        TgK_wall, Tstart_wall, TmaxLST, TmaxLST_wall, first, second, albedo_b, ewall = \
+        [ftype(value) for value in (altitude, azimuth, zen, jday, dectime, altmax, Ta, RH, radG, radD, radI, P, psi,
+                                    timeadd, timestepdec, CI, TgK_wall, Tstart_wall, TmaxLST, TmaxLST_wall, first,
+                                    second, albedo_b, ewall)]
+    if not isinstance(Twater, list):
+        Twater = ftype(Twater)
+
     # Find sunrise decimal hour - new from 2014a
     _, _, _, SNUP = daylen(jday, location['latitude'])
+    SNUP = ftype(SNUP)
 
     # Vapor pressure
     ea = 6.107 * 10 ** ((7.5 * Ta) / (237.3 + Ta)) * (RH / 100.)
@@ -127,6 +143,7 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
                 CI = 1
 
             radI, radD = diffusefraction(radG, altitude, Kt, Ta, RH)
+        I0, CI, radI, radD = [ftype(value) for value in (I0, CI, radI, radD)]
 
         # Diffuse Radiation
         # Anisotropic Diffuse Radiation after Perez et al. 1993
@@ -136,9 +153,7 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
             # Relative luminance
             lv, pc_, pb_ = Perez_v3(zenDeg, azimuth, radD, radI, jday, patchchoice, patch_option)   
             # Total relative luminance from sky, i.e. from each patch, into each cell
-            aniLum = np.zeros((rows, cols))
-            for idx in range(lv.shape[0]):
-                aniLum += diffsh[:,:,idx] * lv[idx,2]     
+            aniLum = diffsh.luminance(lv[:,2])
 
             dRad = aniLum * radD   # Total diffuse radiation from sky into each cell
         else:
@@ -150,12 +165,22 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
 
         # Shadow  images
         if usevegdem == 1:
-            vegsh, sh, _, wallsh, wallsun, wallshve, _, facesun = shadowingfunction_wallheight_23(dsm, vegdem, vegdem2,
+            if shadowcache is not None:
+                vegsh, sh, _, wallsh, wallsun, wallshve, _, facesun = shadowcache.wallheight_23(azimuth, altitude)
+            else:
+                vegsh, sh, _, wallsh, wallsun, wallshve, _, facesun = shadowingfunction_wallheight_23(dsm, vegdem, vegdem2,
                                         azimuth, altitude, scale, amaxvalue, bush, walls, dirwalls * np.pi / 180.)
+            vegsh, sh, wallsh, wallsun, wallshve, facesun = [np.asarray(a).astype(ftype, copy=False) for a in
+                                                             (vegsh, sh, wallsh, wallsun, wallshve, facesun)]
             shadow = sh - (1 - vegsh) * (1 - psi)
         else:
-            sh, wallsh, wallsun, facesh, facesun = shadowingfunction_wallheight_13(dsm, azimuth, altitude, scale,
-                                                                                   walls, dirwalls * np.pi / 180.)
+            if shadowcache is not None:
+                sh, wallsh, wallsun, facesh, facesun = shadowcache.wallheight_13(azimuth, altitude)
+            else:
+                sh, wallsh, wallsun, facesh, facesun = shadowingfunction_wallheight_13(dsm, azimuth, altitude, scale,
+                                                                                       walls, dirwalls * np.pi / 180.)
+            sh, wallsh, wallsun, facesh, facesun = [np.asarray(a).astype(ftype, copy=False) for a in
+                                                    (sh, wallsh, wallsun, facesh, facesun)]
             shadow = sh
 
         # # # Surface temperature parameterisation during daytime # # # #
@@ -183,6 +208,7 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
         CI_TgG = (radG / radG0) + (1 - corr)
         if (CI_TgG > 1) or (CI_TgG == np.inf):
             CI_TgG = 1
+        CI_Tg, CI_TgG = ftype(CI_Tg), ftype(CI_TgG)
         
         # Tg = Tg * CI_Tg  # new estimation
         # Tgwall = Tgwall * CI_Tg
@@ -192,10 +218,19 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
             Tg[Tg < 0] = 0  # temporary for removing low Tg during morning 20130205
 
         # # # # Ground View Factors # # # #
-        gvfLup, gvfalb, gvfalbnosh, gvfLupE, gvfalbE, gvfalbnoshE, gvfLupS, gvfalbS, gvfalbnoshS, gvfLupW, gvfalbW,\
-        gvfalbnoshW, gvfLupN, gvfalbN, gvfalbnoshN, gvfSum, gvfNorm = gvf_2018a(wallsun, walls, buildings, scale, shadow, first,
-                second, dirwalls, Tg, Tgwall, Ta, emis_grid, ewall, alb_grid, SBC, albedo_b, rows, cols,
-                                                                 Twater, lc_grid, landcover)
+        if gvfengine is not None:
+            gvfLup, gvfalb, gvfalbnosh, gvfLupE, gvfalbE, gvfalbnoshE, gvfLupS, gvfalbS, gvfalbnoshS, gvfLupW, gvfalbW,\
+            gvfalbnoshW, gvfLupN, gvfalbN, gvfalbnoshN, gvfSum, gvfNorm = gvfengine.calc(wallsun, shadow, Tg, Tgwall, Ta,
+                                                                                           ewall, SBC, Twater)
+        else:
+            gvfLup, gvfalb, gvfalbnosh, gvfLupE, gvfalbE, gvfalbnoshE, gvfLupS, gvfalbS, gvfalbnoshS, gvfLupW, gvfalbW,\
+            gvfalbnoshW, gvfLupN, gvfalbN, gvfalbnoshN, gvfSum, gvfNorm = gvf_2018a(wallsun, walls, buildings, scale, shadow, first,
+                    second, dirwalls, Tg, Tgwall, Ta, emis_grid, ewall, alb_grid, SBC, albedo_b, rows, cols,
+                                                                     Twater, lc_grid, landcover)
+            gvfLup, gvfalb, gvfalbnosh, gvfLupE, gvfalbE, gvfalbnoshE, gvfLupS, gvfalbS, gvfalbnoshS, gvfLupW, gvfalbW,\
+            gvfalbnoshW, gvfLupN, gvfalbN, gvfalbnoshN, gvfSum, gvfNorm = [a.astype(ftype, copy=False) for a in (
+                gvfLup, gvfalb, gvfalbnosh, gvfLupE, gvfalbE, gvfalbnoshE, gvfLupS, gvfalbS, gvfalbnoshS, gvfLupW,
+                gvfalbW, gvfalbnoshW, gvfLupN, gvfalbN, gvfalbnoshN, gvfSum, gvfNorm)]
 
         # # # # Lup, daytime # # # #
         # Surface temperature wave delay - new as from 2014a
@@ -239,24 +274,24 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
         # CI_Tg = -999  # F_sh = []
 
         # Nocturnal K fluxes set to 0
-        Knight = np.zeros((rows, cols))
-        Kdown = np.zeros((rows, cols))
-        Kwest = np.zeros((rows, cols))
-        Kup = np.zeros((rows, cols))
-        Keast = np.zeros((rows, cols))
-        Ksouth = np.zeros((rows, cols))
-        Knorth = np.zeros((rows, cols))
-        KsideI = np.zeros((rows, cols))
-        KsideD = np.zeros((rows, cols))
-        F_sh = np.zeros((rows, cols))
-        Tg = np.zeros((rows, cols))
-        shadow = np.zeros((rows, cols))
+        Knight = np.zeros((rows, cols), dtype=ftype)
+        Kdown = np.zeros((rows, cols), dtype=ftype)
+        Kwest = np.zeros((rows, cols), dtype=ftype)
+        Kup = np.zeros((rows, cols), dtype=ftype)
+        Keast = np.zeros((rows, cols), dtype=ftype)
+        Ksouth = np.zeros((rows, cols), dtype=ftype)
+        Knorth = np.zeros((rows, cols), dtype=ftype)
+        KsideI = np.zeros((rows, cols), dtype=ftype)
+        KsideD = np.zeros((rows, cols), dtype=ftype)
+        F_sh = np.zeros((rows, cols), dtype=ftype)
+        Tg = np.zeros((rows, cols), dtype=ftype)
+        shadow = np.zeros((rows, cols), dtype=ftype)
         CI_Tg = deepcopy(CI)
         CI_TgG = deepcopy(CI)
 
-        dRad = np.zeros((rows,cols))
+        dRad = np.zeros((rows, cols), dtype=ftype)
 
-        Kside = np.zeros((rows,cols))
+        Kside = np.zeros((rows, cols), dtype=ftype)
 
         # # # # Lup # # # #
         Lup = SBC * emis_grid * ((Knight + Ta + Tg + 273.15) ** 4)
@@ -303,6 +338,8 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
         Ldown, Lside, Least_, Lwest_, Lnorth_, Lsouth_ \
                   = Lcyl_v2022a(esky, L_patches, Ta, Tgwall, ewall, Lup, shmat, vegshmat, vbshvegshmat, 
                                 altitude, azimuth, rows, cols, asvf)
+        Ldown, Lside, Least_, Lwest_, Lnorth_, Lsouth_ = [np.asarray(a).astype(ftype, copy=False) for a in
+                                                          (Ldown, Lside, Least_, Lwest_, Lnorth_, Lsouth_)]
 
     else:
         Ldown = (svf + svfveg - 1) * esky * SBC * ((Ta + 273.15) ** 4) + (2 - svfveg - svfaveg) * ewall * SBC * \
@@ -310,7 +347,7 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
                     (2 - svf - svfveg) * (1 - ewall) * esky * SBC * ((Ta + 273.15) ** 4)  # Jonsson et al.(2006)
         # Ldown = Ldown - 25 # Shown by Jonsson et al.(2006) and Duarte et al.(2006)
 
-        Lside = np.zeros((rows, cols))
+        Lside = np.zeros((rows, cols), dtype=ftype)
         L_patches = None
  
         if CI < 0.95:  # non - clear conditions
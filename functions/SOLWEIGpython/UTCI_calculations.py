@@ -1,5 +1,254 @@
 import numpy as np
 
+# Terms of the 6th order UTCI polynomial in utci_polynomial as
+# (coefficient, power of Ta, power of va, power of D_Tmrt, power of Pa)
+UTCI_TERMS = [
+    (6.07562052E-01, 0, 0, 0, 0),
+    (-2.27712343E-02, 1, 0, 0, 0),
+    (8.06470249E-04, 2, 0, 0, 0),
+    (-1.54271372E-04, 3, 0, 0, 0),
+    (-3.24651735E-06, 4, 0, 0, 0),
+    (7.32602852E-08, 5, 0, 0, 0),
+    (1.35959073E-09, 6, 0, 0, 0),
+    (-2.25836520E+00, 0, 1, 0, 0),
+    (8.80326035E-02, 1, 1, 0, 0),
+    (2.16844454E-03, 2, 1, 0, 0),
+    (-1.53347087E-05, 3, 1, 0, 0),
+    (-5.72983704E-07, 4, 1, 0, 0),
+    (-2.55090145E-09, 5, 1, 0, 0),
+    (-7.51269505E-01, 0, 2, 0, 0),
+    (-4.08350271E-03, 1, 2, 0, 0),
+    (-5.21670675E-05, 2, 2, 0, 0),
+    (1.94544667E-06, 3, 2, 0, 0),
+    (1.14099531E-08, 4, 2, 0, 0),
+    (1.58137256E-01, 0, 3, 0, 0),
+    (-6.57263143E-05, 1, 3, 0, 0),
+    (2.22697524E-07, 2, 3, 0, 0),
+    (-4.16117031E-08, 3, 3, 0, 0),
+    (-1.27762753E-02, 0, 4, 0, 0),
+    (9.66891875E-06, 1, 4, 0, 0),
+    (2.52785852E-09, 2, 4, 0, 0),
+    (4.56306672E-04, 0, 5, 0, 0),
+    (-1.74202546E-07, 1, 5, 0, 0),
+    (-5.91491269E-06, 0, 6, 0, 0),
+    (3.98374029E-01, 0, 0, 1, 0),
+    (1.83945314E-04, 1, 0, 1, 0),
+    (-1.73754510E-04, 2, 0, 1, 0),
+    (-7.60781159E-07, 3, 0, 1, 0),
+    (3.77830287E-08, 4, 0, 1, 0),
+    (5.43079673E-10, 5, 0, 1, 0),
+    (-2.00518269E-02, 0, 1, 1, 0),
+    (8.92859837E-04, 1, 1, 1, 0),
+    (3.45433048E-06, 2, 1, 1, 0),
+    (-3.77925774E-07, 3, 1, 1, 0),
+    (-1.69699377E-09, 4, 1, 1, 0),
+    (1.69992415E-04, 0, 2, 1, 0),
+    (-4.99204314E-05, 1, 2, 1, 0),
+    (2.47417178E-07, 2, 2, 1, 0),
+    (1.07596466E-08, 3, 2, 1, 0),
+    (8.49242932E-05, 0, 3, 1, 0),
+    (1.35191328E-06, 1, 3, 1, 0),
+    (-6.21531254E-09, 2, 3, 1, 0),
+    (-4.99410301E-06, 0, 4, 1, 0),
+    (-1.89489258E-08, 1, 4, 1, 0),
+    (8.15300114E-08, 0, 5, 1, 0),
+    (7.55043090E-04, 0, 0, 2, 0),
+    (-5.65095215E-05, 1, 0, 2, 0),
+    (-4.52166564E-07, 2, 0, 2, 0),
+    (2.46688878E-08, 3, 0, 2, 0),
+    (2.42674348E-10, 4, 0, 2, 0),
+    (1.54547250E-04, 0, 1, 2, 0),
+    (5.24110970E-06, 1, 1, 2, 0),
+    (-8.75874982E-08, 2, 1, 2, 0),
+    (-1.50743064E-09, 3, 1, 2, 0),
+    (-1.56236307E-05, 0, 2, 2, 0),
+    (-1.33895614E-07, 1, 2, 2, 0),
+    (2.49709824E-09, 2, 2, 2, 0),
+    (6.51711721E-07, 0, 3, 2, 0),
+    (1.94960053E-09, 1, 3, 2, 0),
+    (-1.00361113E-08, 0, 4, 2, 0),
+    (-1.21206673E-05, 0, 0, 3, 0),
+    (-2.18203660E-07, 1, 0, 3, 0),
+    (7.51269482E-09, 2, 0, 3, 0),
+    (9.79063848E-11, 3, 0, 3, 0),
+    (1.25006734E-06, 0, 1, 3, 0),
+    (-1.81584736E-09, 1, 1, 3, 0),
+    (-3.52197671E-10, 2, 1, 3, 0),
+    (-3.36514630E-08, 0, 2, 3, 0),
+    (1.35908359E-10, 1, 2, 3, 0),
+    (4.17032620E-10, 0, 3, 3, 0),
+    (-1.30369025E-09, 0, 0, 4, 0),
+    (4.13908461E-10, 1, 0, 4, 0),
+    (9.22652254E-12, 2, 0, 4, 0),
+    (-5.08220384E-09, 0, 1, 4, 0),
+    (-2.24730961E-11, 1, 1, 4, 0),
+    (1.17139133E-10, 0, 2, 4, 0),
+    (6.62154879E-10, 0, 0, 5, 0),
+    (4.03863260E-13, 1, 0, 5, 0),
+    (1.95087203E-12, 0, 1, 5, 0),
+    (-4.73602469E-12, 0, 0, 6, 0),
+    (5.12733497E+00, 0, 0, 0, 1),
+    (-3.12788561E-01, 1, 0, 0, 1),
+    (-1.96701861E-02, 2, 0, 0, 1),
+    (9.99690870E-04, 3, 0, 0, 1),
+    (9.51738512E-06, 4, 0, 0, 1),
+    (-4.66426341E-07, 5, 0, 0, 1),
+    (5.48050612E-01, 0, 1, 0, 1),
+    (-3.30552823E-03, 1, 1, 0, 1),
+    (-1.64119440E-03, 2, 1, 0, 1),
+    (-5.16670694E-06, 3, 1, 0, 1),
+    (9.52692432E-07, 4, 1, 0, 1),
+    (-4.29223622E-02, 0, 2, 0, 1),
+    (5.00845667E-03, 1, 2, 0, 1),
+    (1.00601257E-06, 2, 2, 0, 1),
+    (-1.81748644E-06, 3, 2, 0, 1),
+    (-1.25813502E-03, 0, 3, 0, 1),
+    (-1.79330391E-04, 1, 3, 0, 1),
+    (2.34994441E-06, 2, 3, 0, 1),
+    (1.29735808E-04, 0, 4, 0, 1),
+    (1.29064870E-06, 1, 4, 0, 1),
+    (-2.28558686E-06, 0, 5, 0, 1),
+    (-3.69476348E-02, 0, 0, 1, 1),
+    (1.62325322E-03, 1, 0, 1, 1),
+    (-3.14279680E-05, 2, 0, 1, 1),
+    (2.59835559E-06, 3, 0, 1, 1),
+    (-4.77136523E-08, 4, 0, 1, 1),
+    (8.64203390E-03, 0, 1, 1, 1),
+    (-6.87405181E-04, 1, 1, 1, 1),
+    (-9.13863872E-06, 2, 1, 1, 1),
+    (5.15916806E-07, 3, 1, 1, 1),
+    (-3.59217476E-05, 0, 2, 1, 1),
+    (3.28696511E-05, 1, 2, 1, 1),
+    (-7.10542454E-07, 2, 2, 1, 1),
+    (-1.24382300E-05, 0, 3, 1, 1),
+    (-7.38584400E-09, 1, 3, 1, 1),
+    (2.20609296E-07, 0, 4, 1, 1),
+    (-7.32469180E-04, 0, 0, 2, 1),
+    (-1.87381964E-05, 1, 0, 2, 1),
+    (4.80925239E-06, 2, 0, 2, 1),
+    (-8.75492040E-08, 3, 0, 2, 1),
+    (2.77862930E-05, 0, 1, 2, 1),
+    (-5.06004592E-06, 1, 1, 2, 1),
+    (1.14325367E-07, 2, 1, 2, 1),
+    (2.53016723E-06, 0, 2, 2, 1),
+    (-1.72857035E-08, 1, 2, 2, 1),
+    (-3.95079398E-08, 0, 3, 2, 1),
+    (-3.59413173E-07, 0, 0, 3, 1),
+    (7.04388046E-07, 1, 0, 3, 1),
+    (-1.89309167E-08, 2, 0, 3, 1),
+    (-4.79768731E-07, 0, 1, 3, 1),
+    (7.96079978E-09, 1, 1, 3, 1),
+    (1.62897058E-09, 0, 2, 3, 1),
+    (3.94367674E-08, 0, 0, 4, 1),
+    (-1.18566247E-09, 1, 0, 4, 1),
+    (3.34678041E-10, 0, 1, 4, 1),
+    (-1.15606447E-10, 0, 0, 5, 1),
+    (-2.80626406E+00, 0, 0, 0, 2),
+    (5.48712484E-01, 1, 0, 0, 2),
+    (-3.99428410E-03, 2, 0, 0, 2),
+    (-9.54009191E-04, 3, 0, 0, 2),
+    (1.93090978E-05, 4, 0, 0, 2),
+    (-3.08806365E-01, 0, 1, 0, 2),
+    (1.16952364E-02, 1, 1, 0, 2),
+    (4.95271903E-04, 2, 1, 0, 2),
+    (-1.90710882E-05, 3, 1, 0, 2),
+    (2.10787756E-03, 0, 2, 0, 2),
+    (-6.98445738E-04, 1, 2, 0, 2),
+    (2.30109073E-05, 2, 2, 0, 2),
+    (4.17856590E-04, 0, 3, 0, 2),
+    (-1.27043871E-05, 1, 3, 0, 2),
+    (-3.04620472E-06, 0, 4, 0, 2),
+    (5.14507424E-02, 0, 0, 1, 2),
+    (-4.32510997E-03, 1, 0, 1, 2),
+    (8.99281156E-05, 2, 0, 1, 2),
+    (-7.14663943E-07, 3, 0, 1, 2),
+    (-2.66016305E-04, 0, 1, 1, 2),
+    (2.63789586E-04, 1, 1, 1, 2),
+    (-7.01199003E-06, 2, 1, 1, 2),
+    (-1.06823306E-04, 0, 2, 1, 2),
+    (3.61341136E-06, 1, 2, 1, 2),
+    (2.29748967E-07, 0, 3, 1, 2),
+    (3.04788893E-04, 0, 0, 2, 2),
+    (-6.42070836E-05, 1, 0, 2, 2),
+    (1.16257971E-06, 2, 0, 2, 2),
+    (7.68023384E-06, 0, 1, 2, 2),
+    (-5.47446896E-07, 1, 1, 2, 2),
+    (-3.59937910E-08, 0, 2, 2, 2),
+    (-4.36497725E-06, 0, 0, 3, 2),
+    (1.68737969E-07, 1, 0, 3, 2),
+    (2.67489271E-08, 0, 1, 3, 2),
+    (3.23926897E-09, 0, 0, 4, 2),
+    (-3.53874123E-02, 0, 0, 0, 3),
+    (-2.21201190E-01, 1, 0, 0, 3),
+    (1.55126038E-02, 2, 0, 0, 3),
+    (-2.63917279E-04, 3, 0, 0, 3),
+    (4.53433455E-02, 0, 1, 0, 3),
+    (-4.32943862E-03, 1, 1, 0, 3),
+    (1.45389826E-04, 2, 1, 0, 3),
+    (2.17508610E-04, 0, 2, 0, 3),
+    (-6.66724702E-05, 1, 2, 0, 3),
+    (3.33217140E-05, 0, 3, 0, 3),
+    (-2.26921615E-03, 0, 0, 1, 3),
+    (3.80261982E-04, 1, 0, 1, 3),
+    (-5.45314314E-09, 2, 0, 1, 3),
+    (-7.96355448E-04, 0, 1, 1, 3),
+    (2.53458034E-05, 1, 1, 1, 3),
+    (-6.31223658E-06, 0, 2, 1, 3),
+    (3.02122035E-04, 0, 0, 2, 3),
+    (-4.77403547E-06, 1, 0, 2, 3),
+    (1.73825715E-06, 0, 1, 2, 3),
+    (-4.09087898E-07, 0, 0, 3, 3),
+    (6.14155345E-01, 0, 0, 0, 4),
+    (-6.16755931E-02, 1, 0, 0, 4),
+    (1.33374846E-03, 2, 0, 0, 4),
+    (3.55375387E-03, 0, 1, 0, 4),
+    (-5.13027851E-04, 1, 1, 0, 4),
+    (1.02449757E-04, 0, 2, 0, 4),
+    (-1.48526421E-03, 0, 0, 1, 4),
+    (-4.11469183E-05, 1, 0, 1, 4),
+    (-6.80434415E-06, 0, 1, 1, 4),
+    (-9.77675906E-06, 0, 0, 2, 4),
+    (8.82773108E-02, 0, 0, 0, 5),
+    (-3.01859306E-03, 1, 0, 0, 5),
+    (1.04452989E-03, 0, 1, 0, 5),
+    (2.47090539E-04, 0, 0, 1, 5),
+    (1.48348065E-03, 0, 0, 0, 6),
+]
+
+# Number of pixels evaluated at once by utci_polynomial_array, bounds the memory used for the powers
+CHUNKSIZE = 65536
+
+
+def _power_pairs():
+    return [(i, j) for i in range(7) for j in range(7 - i)]
+
+
+def _utci_matrix():
+    # UTCI = sum over DP pairs a and TV pairs b of C[a, b] * D_Tmrt^k * Pa^l * Ta^i * va^j
+    pairs = _power_pairs()
+    index = dict((pair, n) for n, pair in enumerate(pairs))
+    C = np.zeros((len(pairs), len(pairs)))
+    for coefficient, ta, va, dtmrt, pa in UTCI_TERMS:
+        C[index[(dtmrt, pa)], index[(ta, va)]] += coefficient
+    # the polynomial is added to Ta
+    C[index[(0, 0)], index[(1, 0)]] += 1.
+    return C
+
+
+UTCI_MATRIX = _utci_matrix()
+
+
+def _powers(x, y):
+    # x^i * y^j for all pairs (i, j) of _power_pairs, x and y 1D
+    xp = np.empty((7, x.shape[0]))
+    yp = np.empty((7, x.shape[0]))
+    xp[0] = 1.
+    yp[0] = 1.
+    for n in range(1, 7):
+        np.multiply(xp[n - 1], x, out=xp[n])
+        np.multiply(yp[n - 1], y, out=yp[n])
+    return np.array([xp[i] * yp[j] for i, j in _power_pairs()])
+
 def utci_polynomial(D_Tmrt, Ta, va, Pa):
 
     # calculate 6th order polynomial as approximation
@@ -250,6 +499,53 @@ def utci_calculator(Ta, RH, Tmrt, va10m):
 
     return UTCI_approx
 
+def utci_polynomial_array(D_Tmrt, Ta, va, Pa, chunksize=CHUNKSIZE, feedback=None):
+    """
+    utci_polynomial for arrays (broadcast against each other), evaluated from
+    precomputed powers in chunks of chunksize values. Returns None if cancelled.
+    """
+    D_Tmrt, Ta, va, Pa = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (D_Tmrt, Ta, va, Pa)])
+    shape = D_Tmrt.shape
+    D_Tmrt, Ta, va, Pa = [x.ravel() for x in (D_Tmrt, Ta, va, Pa)]
+    UTCI_approx = np.empty(D_Tmrt.shape[0])
+    for start in range(0, D_Tmrt.shape[0], chunksize):
+        if feedback is not None:
+            if feedback.isCanceled():
+                feedback.setProgressText("Calculation cancelled")
+                return None
+            feedback.setProgress(int(start * 100. / D_Tmrt.shape[0]))
+        chunk = slice(start, start + chunksize)
+        inner = UTCI_MATRIX.dot(_powers(Ta[chunk], va[chunk]))
+        UTCI_approx[chunk] = np.einsum('ij,ij->j', _powers(D_Tmrt[chunk], Pa[chunk]), inner)
+    return UTCI_approx.reshape(shape)
+
+
+def utci_calculator_array(Ta, RH, Tmrt, va10m, chunksize=CHUNKSIZE):
+    """
+    utci_calculator for arrays of Ta, RH, Tmrt and va10m (broadcast against
+    each other), -999 where any of them is missing (<= -999).
+    """
+    Ta, RH, Tmrt, va10m = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (Ta, RH, Tmrt, va10m)])
+    UTCI_approx = np.full(Ta.shape, -999.)
+    calc = (Ta > -999) & (RH > -999) & (va10m > -999) & (Tmrt > -999)
+    Pa = saturation_vapour_pressure(Ta[calc]) * RH[calc] / 100. / 10.0  # use vapour pressure in kPa
+    UTCI_approx[calc] = utci_polynomial_array(Tmrt[calc] - Ta[calc], Ta[calc], va10m[calc], Pa, chunksize)
+    return UTCI_approx
+
+
+def saturation_vapour_pressure(Ta):
+    # saturation vapour pressure (es, hPa) for scalar or array Ta
+    g = np.array([-2.8365744E3, - 6.028076559E3, 1.954263612E1, - 2.737830188E-2,
+                  1.6261698E-5, 7.0229056E-10, - 1.8680009E-13, 2.7150305])
+
+    tk = Ta + 273.15  # ! air temp in K
+    es = g[7] * np.log(tk)
+    for i in range(0, 7):
+        es = es + g[i] * tk ** (i + 1 - 3.)
+
+    return np.exp(es) * 0.01
+
+
 def utci_calculator_grid(Ta, RH, Tmrt, va10m, feedback):
     # Program for calculating UTCI Temperature (UTCI)
     # released for public use after termination of COST Action 730
@@ -263,48 +559,39 @@ def utci_calculator_grid(Ta, RH, Tmrt, va10m, feedback):
 
     # If Tair or relative humidity is NaN, set all UTCI to -999
     if Ta <= -999 or RH <= -999:
-        UTCI_approx = np.ones((rows, cols)) * -999
-    # Else, create an empty raster for UTCI and start estimating UTCI
-    else:
-        UTCI_approx = np.zeros((rows, cols))
+        return np.ones((rows, cols)) * -999
 
-        # saturation vapour pressure (es)
-        g = np.array([-2.8365744E3, - 6.028076559E3, 1.954263612E1, - 2.737830188E-2,
-                      1.6261698E-5, 7.0229056E-10, - 1.8680009E-13, 2.7150305])
+    return utci_calculator_stack(np.array([Ta]), np.array([RH]), Tmrt[np.newaxis], va10m, feedback)[0]
 
-        tk = Ta + 273.15  # ! air temp in K
-        es = g[7] * np.log(tk)
-        for i in range(0, 7):
-            es = es + g[i] * tk ** (i + 1 - 3.)
 
-        es = np.exp(es) * 0.01
+def utci_calculator_stack(Ta, RH, Tmrt, va10m, feedback=None, chunksize=CHUNKSIZE):
+    """
+    UTCI for a stack of timesteps. Ta and RH are (time,) arrays, Tmrt is
+    (time, rows, cols) and va10m (rows, cols) or (time, rows, cols). Timesteps
+    with Ta or RH missing (<= -999) are -999, pixels with Tmrt or wind speed
+    missing -9999 and pixels without wind 0, as in utci_calculator_grid.
+    """
+    Ta = np.asarray(Ta, dtype=float)
+    RH = np.asarray(RH, dtype=float)
+    Tmrt = np.asarray(Tmrt, dtype=float)
+    va10m = np.broadcast_to(np.asarray(va10m, dtype=float), Tmrt.shape)
 
-        ehPa = es * RH / 100.
-        Pa = ehPa / 10.0  # use vapour pressure in kPa
+    UTCI_approx = np.zeros(Tmrt.shape)
+    nodata = (Ta <= -999) | (RH <= -999)
+    UTCI_approx[nodata] = -999
 
-        # For progress counter
-        index = 0
-        total = 100. / (rows * cols)
+    Pa = saturation_vapour_pressure(Ta) * RH / 100. / 10.0  # use vapour pressure in kPa
+    Ta = np.broadcast_to(Ta[:, np.newaxis, np.newaxis], Tmrt.shape)
+    Pa = np.broadcast_to(Pa[:, np.newaxis, np.newaxis], Tmrt.shape)
+    valid = ~nodata[:, np.newaxis, np.newaxis]
 
-        # Start UTCI approximation
-        for iy in np.arange(rows):
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
-            for ix in np.arange(cols):
-
-                D_Tmrt = Tmrt[iy, ix] - Ta
-                # va = va10m[iy, ix]
-                
-                # Set UTCI to NaN (-999) if Tmrt or wind speed is NaN
-                if Tmrt[iy, ix] <= -999 or va10m[iy, ix] <= -999:
-                    UTCI_approx[iy, ix] = -9999
-                # Calculate 6th order polynomial as approximation if wind speed is above zero
-                elif va10m[iy, ix] > 0:
-                    UTCI_approx[iy, ix] = utci_polynomial(D_Tmrt, Ta, va10m[iy, ix], Pa)
-
-                # Progress counter
-                index = index + 1
-                feedback.setProgress(int(index * total))
-
-    return UTCI_approx
\ No newline at end of file
+    # Set UTCI to NaN (-9999) if Tmrt or wind speed is NaN
+    missing = valid & ((Tmrt <= -999) | (va10m <= -999))
+    UTCI_approx[missing] = -9999
+    # Calculate 6th order polynomial as approximation if wind speed is above zero
+    calc = valid & ~missing & (va10m > 0)
+    result = utci_polynomial_array(Tmrt[calc] - Ta[calc], Ta[calc], va10m[calc], Pa[calc], chunksize, feedback)
+    if result is not None:
+        UTCI_approx[calc] = result
+
+    return UTCI_approx
@@ -11,7 +11,7 @@ def cylindric_wedge(zen, svfalfa, rows, cols):
 
     beta=zen
     # alfa=svfalfa
-    alfa=np.zeros((rows, cols)) + svfalfa
+    alfa=np.zeros((rows, cols), dtype=svfalfa.dtype) + svfalfa
     # measure the size of the image
     # sizex=size(svfalfa,2)
     # sizey=size(svfalfa,1)
@@ -21,23 +21,23 @@ def cylindric_wedge(zen, svfalfa, rows, cols):
     ba=(1./np.tan(alfa))
     hkil=2.*ba*ha
     
-    qa=np.zeros((rows, cols))
+    qa=np.zeros((rows, cols), dtype=svfalfa.dtype)
     # qa(length(svfalfa),length(svfalfa))=0;
     qa[xa<0]=np.tan(beta)/2
     
-    Za=np.zeros((rows, cols))
+    Za=np.zeros((rows, cols), dtype=svfalfa.dtype)
     # Za(length(svfalfa),length(svfalfa))=0;
     Za[xa<0]=((ba[xa<0]**2)-((qa[xa<0]**2)/4))**0.5
     
-    phi=np.zeros((rows, cols))
+    phi=np.zeros((rows, cols), dtype=svfalfa.dtype)
     #phi(length(svfalfa),length(svfalfa))=0;
     phi[xa<0]=np.arctan(Za[xa<0]/qa[xa<0])
     
-    A=np.zeros((rows, cols))
+    A=np.zeros((rows, cols), dtype=svfalfa.dtype)
     # A(length(svfalfa),length(svfalfa))=0;
     A[xa<0]=(np.sin(phi[xa<0])-phi[xa<0]*np.cos(phi[xa<0]))/(1-np.cos(phi[xa<0]))
     
-    ukil=np.zeros((rows, cols))
+    ukil=np.zeros((rows, cols), dtype=svfalfa.dtype)
     # ukil(length(svfalfa),length(svfalfa))=0
     ukil[xa<0]=2*ba[xa<0]*xa[xa<0]*A[xa<0]
     
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+Ground view factors of SOLWEIG (gvf_2018a) with the direction-independent
+parts precomputed once per model run.
+
+gvf_2018a calls sunonsurface_2018a for 18 search directions on every daytime
+timestep, shifting the building, shadow, Lup and albedo grids up to `second`
+pixels in each direction. Only shadow, wallsun, Tg and Tgwall change between
+timesteps. GvfEngine therefore keeps per direction
+
+- the step offsets of the search,
+- the step at which the (moving) building footprint stops the search in each
+  pixel (stop), which replaces the running minimum of the shifted buildings,
+- the wall pixels facing away from the direction (the self-shadowing mask),
+
+together with the albedo-only view factors (gvfalbnosh), which do not depend
+on time at all. A timestep then evaluates the shadow- and temperature-
+dependent sums of all directions in a single pass (a compiled kernel with the
+numba shadow backend), giving the same 17 grids as gvf_2018a. The buildings
+grid has to be binary (1 = ground, 0 = building) as prepared by SOLWEIG.
+"""
+
+import numpy as np
+
+from ...util.shadowingfunctions import get_shadow_backend
+from ...util.shadowingfunctions_numba import njit, prange
+
+AZIMUTHS = np.arange(5, 359, 20)  # Search directions for Ground View Factors (GVF)
+
+
+def search_steps(azimuthA, second):
+    """(dx, dy) pixel offsets of the `second` search steps of sunonsurface_2018a in direction azimuthA."""
+    azimuth = azimuthA * (np.pi / 180)
+    pibyfour = np.pi / 4
+    threetimespibyfour = 3 * pibyfour
+    fivetimespibyfour = 5 * pibyfour
+    seventimespibyfour = 7 * pibyfour
+    tanazimuth = np.tan(azimuth)
+    signsinazimuth = np.sign(np.sin(azimuth))
+    signcosazimuth = np.sign(np.cos(azimuth))
+
+    steps = np.zeros((second, 2), dtype=np.int64)
+    for index in range(second):
+        if (pibyfour <= azimuth and azimuth < threetimespibyfour) or (
+                fivetimespibyfour <= azimuth and azimuth < seventimespibyfour):
+            dy = signsinazimuth * index
+            dx = -1 * signcosazimuth * np.abs(np.round(index / tanazimuth))
+        else:
+            dy = signsinazimuth * abs(round(index * tanazimuth))
+            dx = -1 * signcosazimuth * index
+        steps[index] = int(dx), int(dy)
+    return steps
+
+
+def shift(source, temp, dx, dy):
+    """
+    Move source by (dx, dy) into temp as in sunonsurface_2018a. Pixels outside
+    the shifted window keep their previous value in temp.
+    """
+    sizex, sizey = source.shape[-2:]
+    absdx = abs(dx)
+    absdy = abs(dy)
+    xc1 = (dx + absdx) // 2
+    xc2 = sizex + (dx - absdx) // 2
+    yc1 = (dy + absdy) // 2
+    yc2 = sizey + (dy - absdy) // 2
+    xp1 = -((dx - absdx) // 2)
+    xp2 = sizex - (dx + absdx) // 2
+    yp1 = -((dy - absdy) // 2)
+    yp2 = sizey - (dy + absdy) // 2
+    if xp1 < xp2 and yp1 < yp2:
+        temp[..., xp1:xp2, yp1:yp2] = source[..., xc1:xc2, yc1:yc2]
+
+
+def facing_away(azimuthA, aspect, walls):
+    """Wall pixels not in self shadow for direction azimuthA (facesh == 0 in sunonsurface_2018a)."""
+    wallbol = (walls > 0) * 1
+    azimuth = azimuthA * (np.pi / 180)
+    azilow = azimuth - np.pi / 2
+    azihigh = azimuth + np.pi / 2
+    if azilow >= 0 and azihigh < 2 * np.pi:  # 90 to 270  (SHADOW)
+        facesh = (np.logical_or(aspect < azilow, aspect >= azihigh).astype(float) - wallbol + 1)
+    elif azilow < 0 and azihigh <= 2 * np.pi:  # 0 to 90
+        azilow = azilow + 2 * np.pi
+        facesh = np.logical_or(aspect > azilow, aspect <= azihigh) * -1 + 1  # (SHADOW)
+    elif azilow > 0 and azihigh >= 2 * np.pi:  # 270 to 360
+        azihigh = azihigh - 2 * np.pi
+        facesh = np.logical_or(aspect > azilow, aspect <= azihigh) * -1 + 1  # (SHADOW)
+    return facesh == 0
+
+
+def direction_groups(azimuthA):
+    """Membership of each direction in the E, S, W and N view factors."""
+    return np.array([[(az >= 0) and (az < 180), (az >= 90) and (az < 270), (az >= 180) and (az < 360),
+                      (az >= 270) or (az < 90)] for az in azimuthA])
+
+
+def combine_directions(sh2, lup1, lup2, alb1, alb2, w, keep, Lwall, albedo_b, first, second, nfirst):
+    """
+    gvf2, gvfLup and gvfalb (without the ground terms) of one direction from the
+    shadow sum over all search steps, the Lup and albedo sums over the first
+    `nfirst` and all search steps and the step w at which the search first
+    reached a sunlit wall (second if none). As in sunonsurface_2018a, the
+    shadow sum over the first steps (gvf1) does not feed any output.
+    """
+    wallsum_first = np.maximum(nfirst - w, 0)
+    wallsum = second - w
+    wallsuninfluence_first = wallsum_first > 0
+    wallsuninfluence_second = wallsum > 0
+    # removing walls in self shadowing
+    wallsum = np.where(keep, 0, wallsum)
+
+    gvf2 = np.where(wallsuninfluence_second, (wallsum + sh2) / (second + 1), sh2 / second)
+    gvf2[gvf2 > 1.] = 1.
+    gvfLup1 = np.where(wallsuninfluence_first, (Lwall * wallsum_first + lup1) / (first + 1), lup1 / first)
+    gvfLup2 = np.where(wallsuninfluence_second, (Lwall * wallsum + lup2) / (second + 1), lup2 / second)
+    gvfalb1 = np.where(wallsuninfluence_first, (albedo_b * wallsum_first + alb1) / (first + 1), alb1 / first)
+    gvfalb2 = np.where(wallsuninfluence_second, (albedo_b * wallsum + alb2) / (second + 1), alb2 / second)
+
+    return gvf2, (gvfLup1 * 0.5 + gvfLup2 * 0.4) / 0.9, (gvfalb1 * 0.5 + gvfalb2 * 0.4) / 0.9
+
+
+@njit(parallel=True, cache=True)
+def gvf_kernel(stop, steps, noface, groups, shadow, lup, lup0, albshadow, sunwall, lupground, albground,
+               Lwall, albedo_b, first, second, nfirst, out):
+    """
+    Shadow- and temperature-dependent part of all directions in one pass.
+    Adds gvfLup, gvfalb and gvf2 of every direction to out[0:3] and gvfLup and
+    gvfalb to the E, S, W and N sums in out[3:11].
+    """
+    ndir = stop.shape[0]
+    sizex = shadow.shape[0]
+    sizey = shadow.shape[1]
+    nsteps = int(second)
+    for i in prange(sizex):
+        for j in range(sizey):
+            for d in range(ndir):
+                si = np.int64(i)
+                sj = np.int64(j)
+                sh2 = lup1 = lup2 = alb1 = alb2 = 0.
+                w = nsteps
+                if d == 0:
+                    lupsource = lup0
+                else:
+                    lupsource = lup
+                s = stop[d, i, j]
+                for n in range(s):
+                    xi = i + steps[d, n, 0]
+                    yj = j + steps[d, n, 1]
+                    # outside the shifted window the last moved value is kept
+                    if xi >= 0 and xi < sizex and yj >= 0 and yj < sizey:
+                        si = xi
+                        sj = yj
+                    sh2 += shadow[si, sj]
+                    lup2 += lupsource[si, sj]
+                    alb2 += albshadow[si, sj]
+                    if w == nsteps and sunwall[si, sj]:
+                        w = n
+                    if n == nfirst - 1:
+                        lup1 = lup2
+                        alb1 = alb2
+                if s < nfirst:
+                    lup1 = lup2
+                    alb1 = alb2
+
+                wallsum_first = max(nfirst - w, 0)
+                wallsum = nsteps - w
+                wallsuninfluence_first = wallsum_first > 0
+                wallsuninfluence_second = wallsum > 0
+                if w == 0 and noface[d, i, j]:
+                    wallsum = 0
+
+                if wallsuninfluence_second:
+                    gvf2 = (wallsum + sh2) / (second + 1)
+                    gvfLup2 = (Lwall * wallsum + lup2) / (second + 1)
+                    gvfalb2 = (albedo_b * wallsum + alb2) / (second + 1)
+                else:
+                    gvf2 = sh2 / second
+                    gvfLup2 = lup2 / second
+                    gvfalb2 = alb2 / second
+                if gvf2 > 1.:
+                    gvf2 = 1.
+                if wallsuninfluence_first:
+                    gvfLup1 = (Lwall * wallsum_first + lup1) / (first + 1)
+                    gvfalb1 = (albedo_b * wallsum_first + alb1) / (first + 1)
+                else:
+                    gvfLup1 = lup1 / first
+                    gvfalb1 = alb1 / first
+
+                gvfLup = (gvfLup1 * 0.5 + gvfLup2 * 0.4) / 0.9 + lupground[i, j]
+                gvfalb = (gvfalb1 * 0.5 + gvfalb2 * 0.4) / 0.9 + albground[i, j]
+                out[0, i, j] += gvfLup
+                out[1, i, j] += gvfalb
+                out[2, i, j] += gvf2
+                for g in range(4):
+                    if groups[d, g]:
+                        out[3 + 2 * g, i, j] += gvfLup
+                        out[4 + 2 * g, i, j] += gvfalb
+
+
+class GvfEngine(object):
+    """
+    Ground view factors for one SOLWEIG run. Set up once with the grids that
+    are constant during the run, then calc() replaces gvf_2018a for each
+    daytime timestep. The search state takes about 3 bytes per pixel and
+    direction (54 bytes per pixel).
+    """
+
+    def __init__(self, buildings, walls, dirwalls, scale, first, second, alb_grid, emis_grid, albedo_b, lc_grid,
+                 landcover):
+        if not np.all((buildings == 0) | (buildings == 1)):
+            raise ValueError('GvfEngine requires a binary buildings grid')
+        rows, cols = buildings.shape
+        self.buildings = buildings
+        self.walls = walls
+        self.alb_grid = alb_grid
+        self.emis_grid = emis_grid
+        self.albedo_b = albedo_b
+        self.lc_grid = lc_grid
+        self.landcover = landcover
+
+        first = np.round(first * scale)
+        if first < 1:
+            first = 1
+        self.first = float(first)
+        self.second = float(np.round(second * scale))
+        nsteps = int(self.second)
+        self.nfirst = int(min(self.first, self.second))
+
+        self.ground = buildings * -1 + 1
+        self.albground = alb_grid * self.ground
+        self.groups = direction_groups(AZIMUTHS)
+        self.steps = np.array([search_steps(azimuthA, nsteps) for azimuthA in AZIMUTHS])
+        self.stop = np.zeros((AZIMUTHS.shape[0], rows, cols), dtype=np.min_scalar_type(nsteps))
+        self.noface = np.zeros((AZIMUTHS.shape[0], rows, cols), dtype=bool)
+
+        # gvf from albedo only does not change with time
+        aspect = dirwalls * np.pi / 180
+        gvfalbnosh = np.zeros((5, rows, cols))
+        source = np.array([buildings, alb_grid])
+        for d, azimuthA in enumerate(AZIMUTHS):
+            temp = np.zeros((2, rows, cols))
+            self.noface[d] = facing_away(azimuthA, aspect, walls)
+            f = buildings
+            stop = np.full((rows, cols), nsteps)
+            weightsumalbnosh = np.zeros((rows, cols))
+            weightsumalbwallnosh = np.zeros((rows, cols))
+            for n in range(nsteps):
+                shift(source, temp, *self.steps[d, n])
+                f = np.min([f, temp[0]], axis=0)  # utsmetning av buildings
+                stop[(f == 0) & (stop == nsteps)] = n
+                weightsumalbnosh = weightsumalbnosh + temp[1] * f
+                weightsumalbwallnosh = weightsumalbwallnosh + ((f * -1 + 1) > 0) * albedo_b
+                if n == self.nfirst - 1:
+                    weightsumalbnosh_first = weightsumalbnosh
+                    weightsumalbwallnosh_first = weightsumalbwallnosh
+            self.stop[d] = stop
+
+            wallinfluence_first = weightsumalbwallnosh_first > 0
+            wallinfluence_second = weightsumalbwallnosh > 0
+            gvfalbnosh1 = ((weightsumalbwallnosh_first + weightsumalbnosh_first) / (self.first + 1)) * wallinfluence_first + \
+                          (weightsumalbnosh_first) / (self.first) * (wallinfluence_first * -1 + 1)
+            gvfalbnosh2 = ((weightsumalbwallnosh + weightsumalbnosh) / (self.second)) * wallinfluence_second + \
+                          (weightsumalbnosh) / (self.second) * (wallinfluence_second * -1 + 1)
+            gvfalbnoshi = (gvfalbnosh1 * 0.5 + gvfalbnosh2 * 0.4) / 0.9
+            gvfalbnoshi = gvfalbnoshi * buildings + alb_grid * self.ground
+            gvfalbnosh[0] += gvfalbnoshi
+            gvfalbnosh[1:][self.groups[d]] += gvfalbnoshi
+
+        gvfalbnosh[0] /= AZIMUTHS.shape[0]
+        gvfalbnosh[1:] /= (AZIMUTHS.shape[0] / 2)
+        gvfalbnosh = gvfalbnosh.astype(alb_grid.dtype, copy=False)
+        gvfalbnosh.setflags(write=False)
+        self.gvfalbnosh = gvfalbnosh
+
+    def calc(self, wallsun, shadow, Tg, Tgwall, Ta, ewall, SBC, Twater):
+        """
+        gvf_2018a for one timestep (same return values). As in sunonsurface_2018a,
+        Tg is set to the water temperature on water pixels in place.
+        """
+        emis_grid = self.emis_grid
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sunwall = (wallsun / self.walls * self.buildings) == 1  # new as from 2015a
+
+        # sunonsurface_2018a sets the water temperature only after Lup of the first direction
+        lup0 = SBC * emis_grid * (Tg * shadow + Ta + 273.15) ** 4 - SBC * emis_grid * (Ta + 273.15) ** 4  # +Ta
+        if self.landcover == 1:
+            Tg[self.lc_grid == 3] = Twater - Ta  # Setting water temperature
+            lup = SBC * emis_grid * (Tg * shadow + Ta + 273.15) ** 4 - SBC * emis_grid * (Ta + 273.15) ** 4
+        else:
+            lup = lup0
+        Lwall = SBC * ewall * (Tgwall + Ta + 273.15) ** 4 - SBC * ewall * (Ta + 273.15) ** 4  # +Ta
+        albshadow = self.alb_grid * shadow
+        lupground = lup * self.ground
+        albground = self.albground * shadow
+
+        rows, cols = shadow.shape
+        out = np.zeros((11, rows, cols))
+        if get_shadow_backend() == 'numba':
+            gvf_kernel(self.stop, self.steps, self.noface, self.groups, np.ascontiguousarray(shadow, dtype=float),
+                       np.ascontiguousarray(lup, dtype=float), np.ascontiguousarray(lup0, dtype=float), albshadow,
+                       sunwall, lupground, albground, float(Lwall), float(self.albedo_b), self.first, self.second,
+                       self.nfirst, out)
+        else:
+            self._calc_numpy(shadow, lup, lup0, albshadow, sunwall, lupground, albground, Lwall, out)
+        # summed in float64, returned in the precision of the grids
+        out = out.astype(emis_grid.dtype, copy=False)
+
+        ndir = AZIMUTHS.shape[0]
+        gvfLup = out[0] / ndir + SBC * emis_grid * (Ta + 273.15) ** 4
+        gvfalb = out[1] / ndir
+        gvfSum = out[2]
+        gvfLupE, gvfalbE, gvfLupS, gvfalbS, gvfLupW, gvfalbW, gvfLupN, gvfalbN = out[3:] / (ndir / 2)
+        gvfLupE = gvfLupE + SBC * emis_grid * (Ta + 273.15) ** 4
+        gvfLupS = gvfLupS + SBC * emis_grid * (Ta + 273.15) ** 4
+        gvfLupW = gvfLupW + SBC * emis_grid * (Ta + 273.15) ** 4
+        gvfLupN = gvfLupN + SBC * emis_grid * (Ta + 273.15) ** 4
+        gvfalbnosh, gvfalbnoshE, gvfalbnoshS, gvfalbnoshW, gvfalbnoshN = self.gvfalbnosh
+
+        gvfNorm = gvfSum / ndir
+        gvfNorm[self.buildings == 0] = 1
+
+        return gvfLup, gvfalb, gvfalbnosh, gvfLupE, gvfalbE, gvfalbnoshE, gvfLupS, gvfalbS, gvfalbnoshS, gvfLupW, \
+               gvfalbW, gvfalbnoshW, gvfLupN, gvfalbN, gvfalbnoshN, gvfSum, gvfNorm
+
+    def _calc_numpy(self, shadow, lup, lup0, albshadow, sunwall, lupground, albground, Lwall, out):
+        """NumPy version of gvf_kernel, moving all time dependent grids in one stack per step."""
+        nsteps = int(self.second)
+        source = np.array([shadow, lup0, albshadow, sunwall])
+        for d in range(AZIMUTHS.shape[0]):
+            if d == 1:
+                source[1] = lup
+            temp = np.zeros(source.shape)
+            weightsum = np.zeros((3,) + shadow.shape)
+            w = np.full(shadow.shape, nsteps)
+            for n in range(nsteps):
+                shift(source, temp, *self.steps[d, n])
+                active = n < self.stop[d]
+                weightsum += temp[:3] * active
+                w = np.where(active & (temp[3] > 0) & (w == nsteps), n, w)
+                if n == self.nfirst - 1:
+                    weightsum_first = weightsum.copy()
+
+            gvf2, gvfLup, gvfalb = combine_directions(weightsum[0], weightsum_first[1], weightsum[1],
+                                                      weightsum_first[2], weightsum[2], w,
+                                                      (w == 0) & self.noface[d], Lwall, self.albedo_b, self.first,
+                                                      self.second, self.nfirst)
+            gvfLup = gvfLup + lupground
+            gvfalb = gvfalb + albground
+            out[0] += gvfLup
+            out[1] += gvfalb
+            out[2] += gvf2
+            for g in range(4):
+                if self.groups[d, g]:
+                    out[3 + 2 * g] += gvfLup
+                    out[4 + 2 * g] += gvfalb
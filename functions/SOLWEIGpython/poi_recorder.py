@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Recorder for the point of interest (POI) outputs of SOLWEIG.
+
+The rows of all POIs (see solweig_timeseries.poi_rows) are gathered into a
+preallocated (timesteps, POIs, columns) buffer. When the buffer is full (and
+on flush and close), PET and UTCI are calculated for the whole buffer at once
+and the rows are written to
+
+    text files - POI_<name>.txt per POI, as written by earlier versions
+    'csv'      - one table POI.csv with a row per timestep and POI
+    'netcdf'   - POI.nc with a (time, poi) variable per column (needs netCDF4)
+
+so that every file is opened once per buffer instead of once per timestep
+and POI.
+"""
+
+import os
+
+import numpy as np
+
+from .solweig_timeseries import poi_comfort, POI_FORMAT
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+POI_TABLES = [None, 'csv', 'netcdf']
+
+NODATA = -9999.
+
+
+class PoiRecorder(object):
+    """
+    Recorder for the POIs poiname (with the settings poi, see poi_rows) of a
+    run of ntimes timesteps, saved in folder. header holds the column names
+    of the POI text files. buffersize timesteps are kept before writing. With
+    resume True the files of an earlier (interrupted) run are appended to.
+    """
+
+    def __init__(self, folder, poiname, poi, header, ntimes, textfiles=True, table=None, buffersize=168,
+                 resume=False):
+        if table not in POI_TABLES:
+            raise ValueError('Unknown POI table format: ' + str(table))
+        if table == 'netcdf' and netCDF4 is None:
+            raise ImportError('NetCDF output requires the python package netCDF4')
+        self.folder = folder
+        self.poiname = [str(name) for name in poiname]
+        self.poi = poi
+        self.header = header
+        self.columns = header.split()
+        self.ntimes = int(ntimes)
+        self.textfiles = textfiles
+        self.table = table
+        self.rows = np.zeros((buffersize, len(self.poiname), len(self.columns)))
+        self.times = np.zeros(buffersize, dtype=np.int64)
+        # wind speed of the buffered timesteps still without PET and UTCI, nan for complete rows
+        self.wind = np.full(buffersize, np.nan)
+        self.count = 0
+        self.dataset = None
+
+        if not resume:
+            if textfiles:
+                for name in self.poiname:
+                    np.savetxt(self.textfile(name), [], delimiter=' ', header=header, comments='')
+            if table == 'csv':
+                with open(self.tablefile(), 'w') as f:
+                    f.write(','.join(['poi'] + self.columns) + '\n')
+        if table == 'netcdf':
+            if resume and os.path.isfile(self.tablefile()):
+                self.dataset = netCDF4.Dataset(self.tablefile(), 'a')
+            else:
+                self.dataset = self._create_netcdf()
+
+    def textfile(self, name):
+        return os.path.join(self.folder, 'POI_' + name + '.txt')
+
+    def tablefile(self):
+        return os.path.join(self.folder, 'POI.nc' if self.table == 'netcdf' else 'POI.csv')
+
+    def record(self, index, rows, Ws=None):
+        """
+        Add the rows (POIs, columns) of timestep index (0 based). Without Ws
+        the rows are complete, otherwise PET and UTCI are calculated from the
+        wind speed Ws when the buffer is written.
+        """
+        self.rows[self.count] = rows
+        self.times[self.count] = index
+        self.wind[self.count] = np.nan if Ws is None else Ws
+        self.count += 1
+        if self.count == self.rows.shape[0]:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered timesteps."""
+        if self.count == 0:
+            return
+        rows = self.rows[:self.count]
+        pending = ~np.isnan(self.wind[:self.count])
+        if np.any(pending):
+            block = rows[pending]
+            poi_comfort(block, self.wind[:self.count][pending], self.poi)
+            rows[pending] = block
+
+        if self.textfiles:
+            for k, name in enumerate(self.poiname):
+                with open(self.textfile(name), 'ab') as f_handle:
+                    np.savetxt(f_handle, rows[:, k], fmt=POI_FORMAT)
+        if self.table == 'csv':
+            fmt = '%s,' + POI_FORMAT.replace(' ', ',') + '\n'
+            with open(self.tablefile(), 'a') as f:
+                f.writelines(fmt % ((name,) + tuple(row)) for timestep in rows
+                             for name, row in zip(self.poiname, timestep))
+        elif self.table == 'netcdf':
+            times = self.times[:self.count]
+            for c, column in enumerate(self.columns):
+                self.dataset.variables[column][times, :] = rows[:, :, c]
+            self.dataset.sync()
+        self.count = 0
+
+    def positions(self):
+        """Write the buffer and return the sizes of the text files, to be restored by truncate."""
+        self.flush()
+        filenames = [self.textfile(name) for name in self.poiname] if self.textfiles else []
+        if self.table == 'csv':
+            filenames.append(self.tablefile())
+        return np.array([os.path.getsize(filename) for filename in filenames], dtype=np.int64)
+
+    def truncate(self, positions):
+        """Remove the rows written after positions were taken (the rows of the NetCDF file are overwritten)."""
+        filenames = [self.textfile(name) for name in self.poiname] if self.textfiles else []
+        if self.table == 'csv':
+            filenames.append(self.tablefile())
+        for filename, position in zip(filenames, positions):
+            os.truncate(filename, int(position))
+
+    def close(self):
+        """Write the buffer and close the files."""
+        self.flush()
+        if self.dataset is not None:
+            self.dataset.close()
+            self.dataset = None
+
+    def _create_netcdf(self):
+        dataset = netCDF4.Dataset(self.tablefile(), 'w', format='NETCDF4')
+        dataset.source = 'UMEP'
+        dataset.createDimension('time', self.ntimes)
+        dataset.createDimension('poi', len(self.poiname))
+        names = dataset.createVariable('poi', str, ('poi',))
+        for k, name in enumerate(self.poiname):
+            names[k] = name
+        # one chunk holds a block of timesteps of all POIs, as written
+        chunks = (min(self.rows.shape[0], self.ntimes), len(self.poiname))
+        for column in self.columns:
+            dataset.createVariable(column, 'f8', ('time', 'poi'), zlib=True, complevel=4, chunksizes=chunks,
+                                   fill_value=NODATA)
+        return dataset
@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+"""
+Time loop of SOLWEIG, i.e. Solweig_2022a_calc over the rows of the
+meteorological forcing.
+
+The static inputs of a run are collected in a model dict (named as the
+variables in processAlgorithm) and the forcing in a met dict with one value
+per timestep. The only variables carried from one timestep to the next are
+the ground temperature delay (Tgmap1*, TgOut1, timeadd, firstdaytime), the
+clearness index CI used at night and the daily water temperature, which are
+kept in a state dict.
+
+Long runs can be split into day segments that are run by a pool of worker
+processes. The state carried into a segment starting at midnight after a
+nighttime timestep is the same as in a sequential run, since the delay is
+restarted at the first daytime timestep and CI is reset at midnight. When the
+sun did not set before the segment (polar day), the segment is preceded by a
+warm-up of up to one day whose outputs are discarded. The weight of the
+unknown initial state in the delayed ground temperature drops by a factor
+of four per hour, to below 1e-13 after a day, so the float32 outputs of the
+segment differ from those of a sequential run by less than 1e-6. The outputs
+of a finished segment are kept in a checkpoint folder only until they are
+stitched into the outputs of the run, which is done as soon as all earlier
+segments are stitched, so that at most the segments running or waiting for
+an earlier one are on disk twice. An interrupted run is resumed by starting
+it again with the same inputs and output folder.
+
+A sequential run can save snapshots of its state (save_snapshot), together
+with the sums accumulated so far and the sizes of the POI files, and be
+resumed from the latest snapshot of a run with the same inputs.
+
+A model can be run in single precision (model_precision), with all grids of
+the radiation calculations kept as float32. precision_differences reports the
+resulting differences in Tmrt against the float64 run.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from . import Solweig_2022a_calc_forprocessing as so
+from . import PET_calculations as p
+from . import UTCI_calculations as utci
+from .gvf_engine import GvfEngine
+from ...util import parallel
+from ...util import shadowingfunctions as shadow
+from ...util.shadowcache import ShadowCache, array_hash
+from ...util.shadowmats import ShadowMatrix, DiffuseShadowMatrix
+from ...util.SEBESOLWEIGCommonFiles.clearnessindex_2013b import clearnessindex_2013b
+
+# names of the values returned by Solweig_2022a_calc
+OUTPUT_NAMES = ('Tmrt', 'Kdown', 'Kup', 'Ldown', 'Lup', 'Tg', 'ea', 'esky', 'I0', 'CI', 'shadow', 'firstdaytime',
+                'timestepdec', 'timeadd', 'Tgmap1', 'Tgmap1E', 'Tgmap1S', 'Tgmap1W', 'Tgmap1N', 'Keast', 'Ksouth',
+                'Kwest', 'Knorth', 'Least', 'Lsouth', 'Lwest', 'Lnorth', 'KsideI', 'TgOut1', 'TgOut', 'radIout',
+                'radDout', 'Lside', 'Lsky_patch_characteristics', 'CI_Tg', 'CI_TgG', 'KsideD', 'dRad', 'Kside')
+
+# outputs that are carried to the next timestep
+STATE_NAMES = ('CI', 'firstdaytime', 'timestepdec', 'timeadd', 'Tgmap1', 'Tgmap1E', 'Tgmap1S', 'Tgmap1W', 'Tgmap1N',
+               'TgOut1')
+
+# raster outputs (file name prefix) and the output they are taken from
+RASTER_OUTPUTS = {'Tmrt': 'Tmrt', 'Kup': 'Kup', 'Kdown': 'Kdown', 'Lup': 'Lup', 'Ldown': 'Ldown', 'Shadow': 'shadow',
+                  'Kdiff': 'dRad'}
+
+POI_FORMAT = '%d %d %d %d %.5f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f ' \
+             '%.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f ' \
+             '%.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f'
+
+# model entries that are rebuilt in each worker process instead of being shared
+WORKER_OBJECTS = ('shadowcache', 'gvfengine')
+
+
+def initial_state(rows, cols, met, dtype=np.float64):
+    """State before the first timestep of a run (a metfile that starts at night), grids of dtype."""
+    dectime = met['dectime']
+    if dectime.shape[0] == 1:
+        timestepdec = 0
+    else:
+        timestepdec = dectime[1] - dectime[0]
+    state = {'CI': 1., 'firstdaytime': 1., 'timestepdec': timestepdec, 'timeadd': 0., 'Twater': []}
+    for name in ('Tgmap1', 'Tgmap1E', 'Tgmap1S', 'Tgmap1W', 'Tgmap1N', 'TgOut1'):
+        state[name] = np.zeros((rows, cols), dtype=dtype)
+    return state
+
+
+def solweig_step(i, start, model, met, state):
+    """
+    Run timestep i, start being the first timestep of the run (or segment).
+    state is updated in place and the outputs of Solweig_2022a_calc are
+    returned as a dict.
+    """
+    m = model
+    dectime = met['dectime']
+    Ta = met['Ta']
+
+    # Daily water body temperature
+    if m['landcover'] == 1:
+        if ((dectime[i] - np.floor(dectime[i]))) == 0 or (i == start):
+            state['Twater'] = np.mean(Ta[met['jday'] == np.floor(dectime[i])])
+    # Nocturnal cloudfraction from Offerle et al. 2003
+    if (dectime[i] - np.floor(dectime[i])) == 0:
+        daylines = np.where(np.floor(dectime) == dectime[i])
+        if daylines.__len__() > 1:
+            alt = met['altitude'][daylines]
+            alt2 = np.where(alt > 1)
+            rise = alt2[0][0]
+            [_, CI, _, _, _] = clearnessindex_2013b(met['zen'][i + rise + 1], met['jday'][i + rise + 1],
+                                                    Ta[i + rise + 1], met['RH'][i + rise + 1] / 100.,
+                                                    met['radG'][i + rise + 1], m['location'],
+                                                    met['P'][i + rise + 1])  # i+rise+1 to match matlab code. correct?
+            if (CI > 1.) or (CI == np.inf):
+                CI = 1.
+            state['CI'] = CI
+        else:
+            state['CI'] = 1.
+
+    outputs = so.Solweig_2022a_calc(
+        i, m['dsm'], m['scale'], m['rows'], m['cols'], m['svf'], m['svfN'], m['svfW'], m['svfE'], m['svfS'],
+        m['svfveg'], m['svfNveg'], m['svfEveg'], m['svfSveg'], m['svfWveg'], m['svfaveg'], m['svfEaveg'],
+        m['svfSaveg'], m['svfWaveg'], m['svfNaveg'], m['vegdsm'], m['vegdsm2'], m['albedo_b'], m['absK'], m['absL'],
+        m['ewall'], m['Fside'], m['Fup'], m['Fcyl'], met['altitude'][i], met['azimuth'][i], met['zen'][i],
+        met['jday'][i], m['usevegdem'], m['onlyglobal'], m['buildings'], m['location'], met['psi'][i],
+        m['landcover'], m['lcgrid'], dectime[i], met['altmax'][i], m['wallaspect'], m['wallheight'], m['cyl'],
+        m['elvis'], Ta[i], met['RH'][i], met['radG'][i], met['radD'][i], met['radI'][i], met['P'][i],
+        m['amaxvalue'], m['bush'], state['Twater'], m['TgK'], m['Tstart'], m['alb_grid'], m['emis_grid'],
+        m['TgK_wall'], m['Tstart_wall'], m['TmaxLST'], m['TmaxLST_wall'], m['first'], m['second'], m['svfalfa'],
+        m['svfbuveg'], state['firstdaytime'], state['timeadd'], state['timestepdec'], state['Tgmap1'],
+        state['Tgmap1E'], state['Tgmap1S'], state['Tgmap1W'], state['Tgmap1N'], state['CI'], state['TgOut1'],
+        m['diffsh'], m['shmat'], m['vegshmat'], m['vbshvegshmat'], m['anisotropic_sky'], m['asvf'],
+        m['patch_option'], m['shadowcache'], m['gvfengine'])
+
+    outputs = dict(zip(OUTPUT_NAMES, outputs))
+    for name in STATE_NAMES:
+        state[name] = outputs[name]
+    return outputs
+
+
+def poi_rows(i, out, model, met, poi, comfort=True):
+    """
+    Rows written to the POI files for timestep i, one per point of interest.
+    poi holds the pixel positions ('xy', as poisxy) and the PET settings. The
+    values of all points are gathered at once; with comfort False, PET and
+    UTCI (columns 33 and 34) are left to poi_comfort, e.g. for a block of
+    timesteps.
+    """
+    poisxy = poi['xy']
+    row, col = poisxy[:, 2].astype(int), poisxy[:, 1].astype(int)
+    rows = np.zeros((poisxy.shape[0], 41))
+    values = {0: met['YYYY'][i], 1: met['jday'][i], 2: met['hours'][i], 3: met['minu'][i], 4: met['dectime'][i],
+              5: met['altitude'][i], 6: met['azimuth'][i], 7: out['radIout'], 8: out['radDout'], 9: met['radG'][i],
+              22: met['Ta'][i], 24: met['RH'][i], 25: out['esky'], 27: out['I0'], 28: out['CI'], 35: out['CI_Tg'],
+              36: out['CI_TgG']}
+    grids = {10: out['Kdown'], 11: out['Kup'], 12: out['Keast'], 13: out['Ksouth'], 14: out['Kwest'],
+             15: out['Knorth'], 16: out['Ldown'], 17: out['Lup'], 18: out['Least'], 19: out['Lsouth'],
+             20: out['Lwest'], 21: out['Lnorth'], 23: out['TgOut'], 26: out['Tmrt'], 29: out['shadow'],
+             30: model['svf'], 31: model['svfbuveg'], 32: out['KsideI'], 37: out['KsideD'], 38: out['Lside'],
+             39: out['dRad'], 40: out['Kside']}
+    for column, value in values.items():
+        rows[:, column] = value
+    for column, grid in grids.items():
+        rows[:, column] = grid[row, col]
+    if comfort:
+        poi_comfort(rows, met['Ws'][i], poi)
+    return rows
+
+
+def poi_comfort(rows, Ws, poi):
+    """
+    Set PET and UTCI (columns 33 and 34) of POI rows, an array (..., points, 41),
+    from Ta, RH and Tmrt of the rows and the wind speed Ws (...) at 10 m.
+    """
+    Ws = np.asarray(Ws, dtype=float)[..., np.newaxis]
+    # Recalculating wind speed based on powerlaw
+    WsPET = (1.1 / poi['sensorheight']) ** 0.2 * Ws
+    WsUTCI = (10. / poi['sensorheight']) ** 0.2 * Ws
+    person = p.PET_person(mbody=poi['mbody'], age=poi['age'], height=poi['ht'], activity=poi['activity'],
+                          sex=poi['sex'], clo=poi['clo'])
+    rows[..., 33] = p.calculate_PET_array(rows[..., 22], rows[..., 24], rows[..., 26], WsPET, person)
+    rows[..., 34] = utci.utci_calculator_array(rows[..., 22], rows[..., 24], rows[..., 26], WsUTCI)
+
+
+def timestep_stamp(met, i):
+    """File name suffix of timestep i, e.g. '2021_172_1200D'."""
+    if met['altitude'][i] > 0:
+        w = 'D'
+    else:
+        w = 'N'
+    return '%d_%d_%02d%02d%s' % (met['YYYY'][i], met['DOY'][i], met['hours'][i], met['minu'][i], w)
+
+
+def snapshot_due(interval, met, i):
+    """
+    True if a snapshot is to be saved after timestep i, every interval timesteps
+    or, with interval 0, after the last timestep of each day.
+    """
+    if i + 1 >= met['dectime'].shape[0]:
+        return False
+    if interval == 0:
+        return np.floor(met['dectime'][i + 1]) != np.floor(met['dectime'][i])
+    return (i + 1) % interval == 0
+
+
+def save_snapshot(filename, signature, timestep, state, outputs):
+    """
+    Save the state carried into timestep, the accumulated outputs (dict of
+    arrays) and the signature of the run (see run_signature). The file is
+    replaced atomically, so that a crash while saving keeps the previous one.
+    """
+    arrays = {'signature': np.array(signature), 'timestep': np.array(timestep)}
+    for name, value in state.items():
+        arrays['state_' + name] = np.asarray(value)
+    for name, value in outputs.items():
+        arrays['output_' + name] = np.asarray(value)
+    fd, tempname = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(filename)))
+    with os.fdopen(fd, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tempname, filename)
+
+
+def load_snapshot(filename, signature):
+    """(timestep, state, outputs) saved by save_snapshot, or None without a snapshot of the same run."""
+    try:
+        with np.load(filename) as data:
+            if str(data['signature']) != signature:
+                return None
+            timestep = int(data['timestep'])
+            state = {}
+            outputs = {}
+            for key in data.files:
+                value = data[key]
+                if key.startswith('state_'):
+                    if value.ndim == 0:
+                        value = value.item()
+                    elif key == 'state_Twater' and value.size == 0:
+                        value = []
+                    state[key[6:]] = value
+                elif key.startswith('output_'):
+                    outputs[key[7:]] = value
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+    return timestep, state, outputs
+
+
+def model_shadowcache(model, folder, tolerance, size):
+    """Shadow cache bound to the surface of model."""
+    cache = ShadowCache(folder, tolerance, size)
+    aspect = model['wallaspect'] * np.pi / 180.
+    if model['usevegdem'] == 1:
+        return cache.surface(model['dsm'], model['wallheight'], aspect, model['scale'], model['vegdsm'],
+                             model['vegdsm2'], model['bush'], model['amaxvalue'])
+    return cache.surface(model['dsm'], model['wallheight'], aspect, model['scale'])
+
+
+def model_gvfengine(model):
+    """Direction independent parts of the ground view factors, if the building grid is binary."""
+    buildings = model['buildings']
+    if not np.all((buildings == 0) | (buildings == 1)):
+        return None
+    return GvfEngine(buildings, model['wallheight'], model['wallaspect'], model['scale'], model['first'],
+                     model['second'], model['alb_grid'], model['emis_grid'], model['albedo_b'], model['lcgrid'],
+                     model['landcover'])
+
+
+def model_precision(model, dtype):
+    """
+    Copy of model run in the precision dtype (np.float32 for single precision).
+    The float grids are converted (grids already in dtype are shared, not
+    copied, so a model set up in dtype does not take memory twice), the
+    shadow matrices unpack to dtype, the diffuse shadow matrix accumulates
+    the luminance in dtype and the ground view factor engine is rebuilt from
+    the converted grids. Scalars, shadows and the ground view factors (summed
+    in float64) are converted in Solweig_2022a_calc.
+    """
+    converted = dict(model)
+    for name, value in model.items():
+        if isinstance(value, ShadowMatrix):
+            converted[name] = ShadowMatrix(value.packed, value.shape[1], value.offset, dtype)
+        elif isinstance(value, DiffuseShadowMatrix):
+            converted[name] = DiffuseShadowMatrix.from_matrix(value.matrix, value.shape, value.cachesize, dtype)
+        elif isinstance(value, np.ndarray) and value.ndim > 1 and value.dtype.kind == 'f':
+            converted[name] = value.astype(dtype, copy=False)
+    if model.get('gvfengine') is not None:
+        converted['gvfengine'] = model_gvfengine(converted)
+    return converted
+
+
+def precision_differences(model, met, dtype=np.float32, feedback=None):
+    """
+    Run model over met in float64 and in dtype and return statistics of the
+    differences in Tmrt (K) over all pixels and timesteps: maximum and mean
+    absolute difference, 99th percentile of the absolute difference and RMSE,
+    together with the timestep of the maximum.
+    """
+    reduced = model_precision(model, dtype)
+    states = (initial_state(model['rows'], model['cols'], met),
+              initial_state(model['rows'], model['cols'], met, dtype))
+    ntimes = met['dectime'].shape[0]
+    differences = np.empty((ntimes, model['rows'], model['cols']), dtype=np.float32)
+    for i in range(ntimes):
+        if feedback is not None:
+            if feedback.isCanceled():
+                return None
+            feedback.setProgress(int(i * (100. / ntimes)))
+        reference = solweig_step(i, 0, model, met, states[0])['Tmrt']
+        differences[i] = solweig_step(i, 0, reduced, met, states[1])['Tmrt'] - reference
+    absolute = np.abs(differences)
+    return {'max': float(absolute.max()), 'mean': float(absolute.mean()),
+            'p99': float(np.percentile(absolute, 99)), 'rmse': float(np.sqrt(np.mean(differences.astype(float) ** 2))),
+            'timestep': int(np.unravel_index(np.argmax(absolute), absolute.shape)[0])}
+
+
+def day_segments(met, days=1):
+    """(start, stop) timesteps of segments of days days, split where the day changes."""
+    day = np.floor(met['dectime'])
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])[::days]
+    stops = np.r_[starts[1:], day.shape[0]]
+    return [(int(start), int(stop)) for start, stop in zip(starts, stops)]
+
+
+def segment_warmup(met, start, steps):
+    """
+    First timestep to run for a segment starting at start, so that the state
+    carried into start is the one of a sequential run. That is the case after
+    a nighttime timestep, if the timestep is either at midnight (CI reset) or
+    in daytime (delay restarted, CI calculated). Otherwise (polar day) the
+    warm-up is steps timesteps long.
+    """
+    altitude = met['altitude']
+    dectime = met['dectime']
+    for w in range(start, max(start - steps, 0), -1):
+        if altitude[w - 1] <= 0 and (altitude[w] > 0 or dectime[w] == np.floor(dectime[w])):
+            return w
+    return max(start - steps, 0)
+
+
+def segment_folder(folder, segment):
+    return os.path.join(folder, 'segment_%06d' % segment[0])
+
+
+def segment_finished(folder, segment):
+    return os.path.isfile(os.path.join(segment_folder(folder, segment), 'segment.npz'))
+
+
+def run_segment(model, met, poi, rasters, folder, segment, warmup, feedback):
+    """
+    Run the timesteps of segment after a warm-up from timestep warmup, saving
+    the rasters of every timestep as float32 .npy files and the POI rows, I0
+    values and sum of Tmrt in segment.npz. That file is written last and marks
+    the segment as finished. Returns False if cancelled.
+    """
+    start, stop = segment
+    path = segment_folder(folder, segment)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    state = initial_state(model['rows'], model['cols'], met, model['dsm'].dtype)
+    for i in range(warmup, start):
+        if feedback.isCanceled():
+            return False
+        solweig_step(i, warmup, model, met, state)
+
+    summary = {'I0': np.zeros(stop - start), 'tmrt': np.zeros((model['rows'], model['cols']))}
+    poirows = []
+    for i in range(start, stop):
+        if feedback.isCanceled():
+            return False
+        out = solweig_step(i, warmup, model, met, state)
+        summary['I0'][i - start] = out['I0']
+        summary['tmrt'] += out['Tmrt']
+        for name in rasters:
+            np.save(os.path.join(path, name + '_%d.npy' % i), np.asarray(out[RASTER_OUTPUTS[name]], dtype=np.float32))
+        if poi is not None:
+            poirows.append(poi_rows(i, out, model, met, poi))
+        if i == 0 and model['anisotropic_sky'] == 1:
+            summary['Lsky_patch_characteristics'] = out['Lsky_patch_characteristics']
+        feedback.setProgress(i)
+    if poi is not None:
+        summary['poi'] = np.array(poirows)
+
+    fd, tempname = tempfile.mkstemp(suffix='.tmp', dir=path)
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **summary)
+    os.replace(tempname, os.path.join(path, 'segment.npz'))
+    return True
+
+
+def segment_outputs(folder, segment, rasters):
+    """
+    Summary of a finished segment (see run_segment) and the outputs of its
+    timesteps as (i, {name: raster}, POI rows or None, I0) in time order.
+    """
+    path = segment_folder(folder, segment)
+    with np.load(os.path.join(path, 'segment.npz')) as data:
+        summary = dict(data)
+
+    def timesteps():
+        for i in range(segment[0], segment[1]):
+            arrays = {}
+            for name in rasters:
+                arrays[name] = np.load(os.path.join(path, name + '_%d.npy' % i))
+            poirows = summary['poi'][i - segment[0]] if 'poi' in summary else None
+            yield i, arrays, poirows, summary['I0'][i - segment[0]]
+
+    return summary, timesteps()
+
+
+def remove_segment_rasters(folder, segment, rasters):
+    """Remove the rasters of a stitched segment, segment.npz is kept to mark it as finished."""
+    path = segment_folder(folder, segment)
+    for i in range(segment[0], segment[1]):
+        for name in rasters:
+            os.remove(os.path.join(path, name + '_%d.npy' % i))
+
+
+def share_model(model):
+    """
+    Split model into the arrays handed to the workers through shared memory,
+    the picklable settings and the description of the shadow matrix objects
+    wrapping shared arrays.
+    """
+    arrays = {}
+    settings = {}
+    wrappers = {}
+    for name, value in model.items():
+        if name in WORKER_OBJECTS:
+            continue
+        if isinstance(value, ShadowMatrix):
+            arrays[name] = value.packed
+            wrappers[name] = (value.shape[1], value.offset, value.dtype)
+        elif isinstance(value, DiffuseShadowMatrix):
+            arrays[name] = value.matrix
+            wrappers[name] = (value.shape, value.cachesize, value.dtype)
+        elif isinstance(value, np.ndarray) and value.ndim > 1:
+            arrays[name] = value
+        else:
+            settings[name] = value
+    return arrays, settings, wrappers
+
+
+def _segment_worker(task):
+    """Run one segment in a worker process, with the model rebuilt from shared memory."""
+    descriptors, settings, wrappers, cache, met, poi, rasters, folder, segment, warmup, backend = task
+    shadow.set_shadow_backend(backend)
+    blocks, arrays = parallel.attach_arrays(descriptors)
+    try:
+        model = dict(settings)
+        model.update(arrays)
+        for name, wrapper in wrappers.items():
+            if name == 'diffsh':
+                model[name] = DiffuseShadowMatrix.from_matrix(arrays[name], *wrapper)
+            else:
+                model[name] = ShadowMatrix(arrays[name], *wrapper)
+        if cache is not None:
+            model['shadowcache'] = model_shadowcache(model, *cache)
+        else:
+            model['shadowcache'] = None
+        model['gvfengine'] = model_gvfengine(model)
+        finished = run_segment(model, met, poi, rasters, folder, segment, warmup, parallel.worker_feedback())
+    finally:
+        model = None
+        arrays.clear()
+        parallel.release_arrays(blocks, unlink=False)
+    return finished
+
+
+def run_signature(model, met, poi, rasters):
+    """Hash of the inputs of a run, used to decide if checkpoints can be reused."""
+    arrays, settings, _ = share_model(model)
+    values = [arrays[name] for name in sorted(arrays)]
+    values += [np.asarray(met[name], dtype=float) for name in sorted(met)]
+    if poi is not None:
+        values.append(poi['xy'])
+    text = repr(sorted((name, repr(value)) for name, value in settings.items()))
+    text += repr(poi is None or sorted((name, repr(value)) for name, value in poi.items() if name != 'xy'))
+    text += repr(sorted(rasters))
+    return array_hash(np.frombuffer(text.encode(), dtype=np.uint8), *values)
+
+
+def open_checkpoints(folder, signature):
+    """
+    Prepare the checkpoint folder of a run. Checkpoints left by a run with
+    other inputs are removed.
+    """
+    filename = os.path.join(folder, 'signature.txt')
+    if os.path.isdir(folder):
+        try:
+            with open(filename) as f:
+                previous = f.read().strip()
+        except IOError:
+            previous = None
+        if previous != signature:
+            shutil.rmtree(folder)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+        with open(filename, 'w') as f:
+            f.write(signature)
+
+
+def run_segments(model, met, poi, rasters, cache, folder, segments, workers, feedback):
+    """
+    Run the segments of the forcing (see day_segments) that are not finished
+    yet on a pool of workers processes. cache is (folder, tolerance, size) of
+    the shadow cache or None. Yields the segments in time order as soon as a
+    segment and all segments before it are finished, so that their outputs
+    can be stitched while the later segments are running, and stops at the
+    first segment that is not finished (cancelled run).
+    """
+    dectime = met['dectime']
+    if dectime.shape[0] > 1 and dectime[1] > dectime[0]:
+        steps = int(round(1. / (dectime[1] - dectime[0])))
+    else:
+        steps = dectime.shape[0]
+    todo = [segment for segment in segments if not segment_finished(folder, segment)]
+    if len(todo) < len(segments):
+        feedback.setProgressText(str(len(segments) - len(todo)) + ' of ' + str(len(segments)) +
+                                 ' day segments reused from an earlier run')
+    if not todo:
+        for segment in segments:
+            yield segment
+        return
+
+    arrays, settings, wrappers = share_model(model)
+    blocks, shared, descriptors = parallel.share_arrays(arrays)
+    arrays = None
+    try:
+        pool, counter, cancel = parallel.process_pool(min(workers, len(todo)))
+        try:
+            tasks = [(descriptors, settings, wrappers, cache, met, poi, rasters, folder, segment,
+                      segment_warmup(met, segment[0], steps), shadow.get_shadow_backend()) for segment in todo]
+            total = sum(stop - start for start, stop in todo)
+            finished = parallel.imap_in_pool(pool, _segment_worker, tasks, feedback, counter, cancel, total)
+            for segment in segments:
+                if segment in todo and not next(finished):
+                    return
+                yield segment
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        shared.clear()
+        parallel.release_arrays(blocks)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch calculation of the URock wind field for several wind directions and
+reference wind speeds (e.g. pedestrian wind comfort studies).
+
+The H2GIS database is started once to load the input data, and the blocks,
+stacked blocks and their base heights, which do not depend on the wind
+direction, are calculated once. Each wind direction is then calculated with
+the native Röckle zones (same zones as the H2GIS ones, see NativeRockle)
+impacting the output grid, in parallel processes. When the vertical wind
+profile is proportional to the reference wind speed (see
+LINEAR_PROFILE_TYPES), the initial wind field is too, and so is the wind
+field of the mass-balance solver: only the first speed is calculated and the
+others are rescaled.
+
+The wind fields are interpolated (bilinear) on a common grid (not rotated)
+and saved in one NetCDF file indexed by direction and speed.
+
+@author: Jérémy Bernard, University of Gothenburg
+"""
+
+from .GlobalVariables import *
+
+from . import H2gisConnection
+from . import loadData
+from . import saveData
+from . import NativeRockle
+from . import WindSolver
+from . import DataUtil
+from pathlib import Path
+import concurrent.futures
+import multiprocessing
+import time
+import os
+
+
+def main(javaEnvironmentPath,
+         pluginDirectory,
+         outputFilePath,
+         buildingFilePath,
+         srid,
+         windDirections,
+         windSpeeds,
+         outputFilename = OUTPUT_FILENAME,
+         vegetationFilePath = "",
+         z_ref = Z_REF,
+         prefix = PREFIX_NAME,
+         meshSize = MESH_SIZE,
+         dz = DZ,
+         alongWindZoneExtend = ALONG_WIND_ZONE_EXTEND,
+         crossWindZoneExtend = CROSS_WIND_ZONE_EXTEND,
+         verticalExtend = VERTICAL_EXTEND,
+         tempoDirectory = TEMPO_DIRECTORY,
+         onlyInitialization = ONLY_INITIALIZATION,
+         maxIterations = MAX_ITERATIONS,
+         thresholdIterations = THRESHOLD_ITERATIONS,
+         solverMethod = SOLVER_METHOD,
+         idFieldBuild = ID_FIELD_BUILD,
+         buildingHeightField = HEIGHT_FIELD,
+         vegetationBaseHeight = VEGETATION_CROWN_BASE_HEIGHT,
+         vegetationTopHeight = VEGETATION_CROWN_TOP_HEIGHT,
+         idVegetation = ID_VEGETATION,
+         vegetationAttenuationFactor = VEGETATION_ATTENUATION_FACTOR,
+         outputExtent = None,
+         nWorkers = BATCH_N_WORKERS,
+         feedback = None,
+         profileType = PROFILE_TYPE,
+         verticalProfileFile = None):
+    """ Calculates the wind field for each wind direction and reference wind
+    speed and saves them in one NetCDF file.
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            windDirections: list of float
+                Wind directions (°, clock-wise, North = 0°)
+            windSpeeds: list of float
+                Wind speeds (m/s) at the reference height z_ref
+            outputExtent: list, default None
+                xmin, ymin, xmax, ymax of the output grid (by default the
+                obstacle extent extended by crossWindZoneExtend)
+            nWorkers: int, default BATCH_N_WORKERS
+                Number of processes calculating the directions in parallel
+                (None: number of CPUs, 1: calculated in the current process)
+            (other parameters): see MainCalculation.main
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            netcdf_path: String
+                Path of the NetCDF file"""
+    windDirections = list(windDirections)
+    windSpeeds = list(windSpeeds)
+    # If the function is called within QGIS, a feedback is sent into the QGIS interface
+    if feedback:
+        feedback.setProgressText('Creates an H2GIS Instance and load data')
+    dBDir = os.path.join(Path(pluginDirectory).parent, 'functions','URock')
+    cursor, conn, localH2InstanceDir = \
+        H2gisConnection.startH2gisInstance(dbDirectory = dBDir,
+                                           dbInstanceDir = tempoDirectory,
+                                           suffix = str(time.time()).replace(".", "_"))
+    loadData.loadData(fromCad = False,
+                      prefix = prefix,
+                      idFieldBuild = idFieldBuild,
+                      buildingHeightField = buildingHeightField,
+                      vegetationBaseHeight = vegetationBaseHeight,
+                      vegetationTopHeight = vegetationTopHeight,
+                      idVegetation = idVegetation,
+                      vegetationAttenuationFactor = vegetationAttenuationFactor,
+                      cursor = cursor,
+                      buildingFilePath = buildingFilePath,
+                      vegetationFilePath = vegetationFilePath,
+                      srid = srid)
+
+    # Obstacles not depending on wind direction
+    if feedback:
+        feedback.setProgressText('Creates the stacked blocks used as obstacles')
+    buildings, vegetation = NativeRockle.loadObstacles(cursor)
+    stackedBlocks = NativeRockle.identifyBlockBase(NativeRockle.createsBlocks(buildings))
+    rotationCenterCoordinates = NativeRockle.rotationCenter(stackedBlocks, vegetation)
+
+    # Common output grid (and its longitude and latitude)
+    if outputExtent is None:
+        extent = NativeRockle.obstacleExtent(stackedBlocks, vegetation)
+        outputExtent = [extent[0] - crossWindZoneExtend, extent[1] - crossWindZoneExtend,
+                        extent[2] + crossWindZoneExtend, extent[3] + crossWindZoneExtend]
+    outputX = outputExtent[0] + (np.arange(int(math.ceil((outputExtent[2] - outputExtent[0]) / meshSize))) + 0.5) * meshSize
+    outputY = outputExtent[1] + (np.arange(int(math.ceil((outputExtent[3] - outputExtent[1]) / meshSize))) + 0.5) * meshSize
+    gridPoint = NativeRockle.createGridTable(cursor, outputX, outputY, meshSize, srid, prefix = prefix)
+    cursor.execute("""
+       SELECT ST_X({0}) AS LON, ST_Y({0}) AS LAT FROM
+       (SELECT ST_TRANSFORM({0}, 4326) AS {0}, {1}, {2} FROM {3})
+       ORDER BY {1}, {2}
+       """.format( GEOM_FIELD, ID_POINT_X, ID_POINT_Y, gridPoint))
+    coord = np.array(cursor.fetchall()).reshape(outputX.size, outputY.size, 2)
+    H2gisConnection.closeAndRemoveH2gisInstance(localH2InstanceDir = localH2InstanceDir,
+                                                conn = conn,
+                                                cur = cursor)
+
+    # NetCDF file filled direction by direction
+    netcdf_base_dir_name = os.path.join(outputFilePath, DataUtil.prefix(outputFilename, prefix))
+    if os.path.isfile(netcdf_base_dir_name + OUTPUT_NETCDF_EXTENSION):
+        if DELETE_OUTPUT_IF_EXISTS:
+            os.remove(netcdf_base_dir_name + OUTPUT_NETCDF_EXTENSION)
+        else:
+            netcdf_base_dir_name = saveData.renameFileIfExists(filedir = netcdf_base_dir_name,
+                                                               extension = OUTPUT_NETCDF_EXTENSION)
+    f = saveData.createBatchNetCDF(longitude = coord[:, :, 0],
+                                   latitude = coord[:, :, 1],
+                                   x = outputX,
+                                   y = outputY,
+                                   windDirections = windDirections,
+                                   windSpeeds = windSpeeds,
+                                   path = netcdf_base_dir_name,
+                                   urock_srid = srid,
+                                   horizontal_res = meshSize,
+                                   vertical_res = dz)
+
+    parameters = dict(meshSize = meshSize, dz = dz, alongWindZoneExtend = alongWindZoneExtend,
+                      crossWindZoneExtend = crossWindZoneExtend, verticalExtend = verticalExtend,
+                      z_ref = z_ref, profileType = profileType,
+                      verticalProfileFile = verticalProfileFile, outputExtent = outputExtent,
+                      onlyInitialization = onlyInitialization, maxIterations = maxIterations,
+                      thresholdIterations = thresholdIterations, solverMethod = solverMethod)
+    # The index of the direction in the NetCDF file is passed along since
+    # the results of the processes come in any order
+    args = [(i_dir, (d, windSpeeds, stackedBlocks, vegetation, rotationCenterCoordinates,
+                     outputX, outputY, parameters)) for i_dir, d in enumerate(windDirections)]
+    if nWorkers == 1:
+        results = map(directionWindFieldArgs, args)
+    else:
+        # Processes are spawned (not forked) since the parent process runs a JVM
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers = nWorkers,
+                                                          mp_context = multiprocessing.get_context("spawn"))
+        results = (future.result() for future in
+                   concurrent.futures.as_completed([executor.submit(directionWindFieldArgs, a) for a in args]))
+    try:
+        for n, (i_dir, (windDirection, u, v, w, profiles)) in enumerate(results):
+            saveData.fillBatchNetCDF(f, i_dir, u, v, w, profiles)
+            if feedback:
+                feedback.setProgressText('Wind direction {0}° calculated ({1}/{2})'.format(windDirection, n + 1,
+                                                                                       len(windDirections)))
+                feedback.setProgress(int(100 * (n + 1) / len(windDirections)))
+                if feedback.isCanceled():
+                    feedback.setProgressText("Calculation cancelled by user")
+                    break
+    finally:
+        if nWorkers != 1:
+            executor.shutdown(cancel_futures = True)
+        f.close()
+
+    return netcdf_base_dir_name + OUTPUT_NETCDF_EXTENSION
+
+
+def directionWindFieldArgs(args):
+    """ directionWindField with its arguments in a tuple, preceded by the
+    index of the wind direction (for the process pool). Returns the index and
+    the results of directionWindField."""
+    i_dir, directionArgs = args
+    return i_dir, directionWindField(*directionArgs)
+
+
+def directionWindField(windDirection, windSpeeds, stackedBlocks, vegetation,
+                       rotationCenterCoordinates, outputX, outputY, parameters):
+    """ Wind field of a wind direction for each wind speed interpolated on
+    the output grid.
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            windDirection: float
+                Wind direction (°, clock-wise, North = 0°)
+            windSpeeds: list of float
+                Wind speeds (m/s) at the reference height
+            stackedBlocks: pd.DataFrame
+                Stacked blocks with their base height (not rotated)
+            vegetation: pd.DataFrame
+                Vegetation polygons (not rotated)
+            rotationCenterCoordinates: list
+                Coordinates of the center of rotation of the obstacles
+            outputX, outputY: 1D arrays
+                Coordinates of the output grid columns and rows
+            parameters: dictionary
+                Calculation parameters (see main)
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            windDirection: float
+                Wind direction
+            u, v, w: 4D arrays (speed, X, Y, Z)
+                Wind speed along East, North and vertical axes
+            profiles: 2D array (speed, Z)
+                Initial vertical wind profile"""
+    linear = parameters["profileType"] in LINEAR_PROFILE_TYPES
+    fields = []
+    for v_ref in (windSpeeds[:1] if linear else windSpeeds):
+        init = NativeRockle.rockleWindField(stackedBlocks, vegetation, windDirection,
+                                            meshSize = parameters["meshSize"],
+                                            dz = parameters["dz"],
+                                            alongWindZoneExtend = parameters["alongWindZoneExtend"],
+                                            crossWindZoneExtend = parameters["crossWindZoneExtend"],
+                                            verticalExtend = parameters["verticalExtend"],
+                                            z_ref = parameters["z_ref"],
+                                            v_ref = v_ref,
+                                            profileType = parameters["profileType"],
+                                            verticalProfileFile = parameters["verticalProfileFile"],
+                                            outputExtent = parameters["outputExtent"])
+        u, v, w = solveWindField(init["buildGrid3D"], init["u0"], init["v0"], init["w0"],
+                                 parameters)
+        u, v, w = windOnOutputGrid(u, v, w, init["x"], init["y"], windDirection,
+                                   rotationCenterCoordinates, outputX, outputY)
+        fields.append((u, v, w, init["verticalWindProfile"][HORIZ_WIND_SPEED].values))
+    if linear:
+        # The wind field is proportional to the reference wind speed
+        fields = [tuple(a * (v_ref / windSpeeds[0]) for a in fields[0]) for v_ref in windSpeeds]
+
+    return windDirection, np.stack([f[0] for f in fields]), np.stack([f[1] for f in fields]),\
+        np.stack([f[2] for f in fields]), np.stack([f[3] for f in fields])
+
+
+def solveWindField(buildGrid3D, u0, v0, w0, parameters):
+    """ Wind field of the mass-balance solver (or initial wind field if
+    'onlyInitialization') at the center of the cells (same as steps 9 and
+    10 of MainCalculation.main)."""
+    nx, ny, nz = buildGrid3D.shape
+    meshSize, dz = parameters["meshSize"], parameters["dz"]
+    cells4Solver = np.transpose(np.where(buildGrid3D == 1))
+    inside = np.all((cells4Solver > 0) & (cells4Solver < np.array([nx, ny, nz]) - 1), axis = 1)
+    cells4Solver = cells4Solver[inside].astype(np.int32)
+    buildingCoordinates = np.stack(np.where(buildGrid3D==0)).astype(np.int32)
+
+    # Wind speed located on the face of each grid cell
+    u0[1:nx, :, :] =   (u0[0:nx-1, :, :] + u0[1:nx, :, :])/2
+    v0[:, 1:ny, :] =   (v0[:, 0:ny-1, :] + v0[:,1:ny,:])/2
+    w0[:, :, 1:nz] =   (w0[:, :, 0:nz-1] + w0[:, :, 1:nz])/2
+    b = buildingCoordinates
+    for wind, shift in [(u0, (1, 0, 0)), (v0, (0, 1, 0)), (w0, (0, 0, 1))]:
+        wind[b[0], b[1], b[2]] = 0
+        wind[b[0] + shift[0], b[1] + shift[1], b[2] + shift[2]] = 0
+
+    if parameters["onlyInitialization"]:
+        u, v, w = u0, v0, w0
+    else:
+        u, v, w = WindSolver.solver(x = np.linspace(0, (nx-1) * meshSize, nx),
+                                    y = np.linspace(0, (ny-1) * meshSize, ny),
+                                    z = np.linspace(0, (nz-1) * dz, nz),
+                                    dx = meshSize, dy = meshSize, dz = dz,
+                                    u0 = u0, v0 = v0, w0 = w0, cursor = None,
+                                    buildingCoordinates = buildingCoordinates,
+                                    cells4Solver = cells4Solver,
+                                    maxIterations = parameters["maxIterations"],
+                                    thresholdIterations = parameters["thresholdIterations"],
+                                    method = parameters["solverMethod"])
+
+    # Wind speed values are recentered to the middle of the cells
+    u[0:nx-1 ,0:ny-1 ,0:nz-1]=   (u[0:nx-1, 0:ny-1, 0:nz-1] + u[1:nx, 0:ny-1, 0:nz-1])/2
+    v[0:nx-1 ,0:ny-1, 0:nz-1]=   (v[0:nx-1, 0:ny-1, 0:nz-1] + v[0:nx-1, 1:ny, 0:nz-1])/2
+    w[0:nx-1, 0:ny-1, 0:nz-1]=   (w[0:nx-1, 0:ny-1, 0:nz-1] + w[0:nx-1, 0:ny-1, 1:nz])/2
+    for wind in (u, v, w):
+        wind[b[0], b[1], b[2]] = 0
+
+    return u, v, w
+
+
+def windOnOutputGrid(u, v, w, x, y, windDirection, rotationCenterCoordinates, outputX, outputY):
+    """ Interpolate (bilinear) the wind field calculated in the rotated frame
+    (wind coming from the North) on the output grid and rotate the wind
+    components to the East and North axes (NaN out of the calculation grid).
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            u, v, w: 3D arrays
+                Wind speed along X, Y and Z axes of the rotated frame
+            x, y: 1D arrays
+                Coordinates of the cell centers in the rotated frame
+            windDirection: float
+                Wind direction (°, clock-wise, North = 0°)
+            rotationCenterCoordinates: list
+                Coordinates of the center of rotation of the obstacles
+            outputX, outputY: 1D arrays
+                Coordinates of the output grid columns and rows
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            u, v, w: 3D arrays
+                Wind speed along East, North and vertical axes on the output grid"""
+    angle = windDirection * np.pi / 180
+    cosA, sinA = np.cos(angle), np.sin(angle)
+    dx = outputX[:, np.newaxis] - rotationCenterCoordinates[0]
+    dy = outputY[np.newaxis, :] - rotationCenterCoordinates[1]
+    # Position of the output points in the rotated frame (as NativeRockle.rotateGeometries)
+    fi = (rotationCenterCoordinates[0] + dx * cosA - dy * sinA - x[0]) / (x[1] - x[0])
+    fj = (rotationCenterCoordinates[1] + dx * sinA + dy * cosA - y[0]) / (y[1] - y[0])
+    outside = (fi < 0) | (fi > x.size - 1) | (fj < 0) | (fj > y.size - 1)
+    i0 = np.clip(np.floor(fi).astype(int), 0, x.size - 2)
+    j0 = np.clip(np.floor(fj).astype(int), 0, y.size - 2)
+    ti = (fi - i0)[:, :, np.newaxis]
+    tj = (fj - j0)[:, :, np.newaxis]
+
+    def interpolate(a):
+        result = (1 - ti) * (1 - tj) * a[i0, j0] + ti * (1 - tj) * a[i0 + 1, j0]\
+            + (1 - ti) * tj * a[i0, j0 + 1] + ti * tj * a[i0 + 1, j0 + 1]
+        result[outside] = np.nan
+        return result
+
+    u, v, w = interpolate(u), interpolate(v), interpolate(w)
+
+    return u * cosA + v * sinA, -u * sinA + v * cosA, w
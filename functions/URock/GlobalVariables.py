@@ -77,6 +77,30 @@ ONLY_INITIALIZATION = False
 SAVE_ROCKLE_ZONES = False
 MAX_ITERATIONS = 500      # Based on QUIC-URB default values (2021)
 THRESHOLD_ITERATIONS = 1e-4 # Based on QUIC-URB default values (2021)
+# Iteration scheme of the wind solver: "sor" updates the cells in lexicographic
+# order (Pardyjak and Brown, 2003), "redblack" in checkerboard order (parallel),
+# "multigrid" uses a conjugate gradient preconditioned by a multigrid V-cycle
+SOLVER_METHOD = "sor"
+SOLVER_METHODS = ["sor", "redblack", "multigrid"]
+# Number of iterations between two convergence checks of the "redblack" solver
+NORM_CHECK_INTERVAL = 10
+# Number of cells under which the coarsest level of the "multigrid" solver is solved directly
+MULTIGRID_COARSEST_SIZE = 2000
+# Name of the file reporting the convergence of the wind solver (in the output directory)
+SOLVER_REPORT_FILENAME = "solver_convergence.txt"
+# Calculation of the Röckle zones and of the initial wind field: "h2gis" uses
+# spatial SQL queries in the H2GIS database, "native" is calculated in memory
+# with Shapely and NumPy following the same rules (see NativeRockle)
+ROCKLE_BACKEND = "h2gis"
+ROCKLE_BACKENDS = ["h2gis", "native"]
+# Batch calculation of several wind directions and speeds (BatchCalculation):
+# number of processes calculating the directions in parallel (None: number of
+# CPUs, 1: no parallel process) and wind profile types for which the wind
+# field is proportional to the reference wind speed (only one speed calculated)
+BATCH_N_WORKERS = None
+LINEAR_PROFILE_TYPES = ["power", "urban"]
+DIRECTION = "direction"
+SPEED = "speed"
 
 # Note that the number of points of an ellipse is only used to identify whether
 # the upper or lower part of an ellipse should be used (fro displacement zones),
@@ -3256,3 +3256,52 @@ def identifyBuildPoints(cursor, gridPoint, stackedBlocksWithBaseHeight,
                                            tempoLevelHeightPointTable])))
     
     return df_gridBuil
+
+
+def rasterizeWindField(df_wind0, df_gridBuil, nPoints):
+    """ Convert the initial 3D wind speed field and the grid points
+    intersecting buildings to 3D arrays (the ground being set as building
+    except on the sketch boundaries).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            df_wind0: pd.DataFrame
+                Initial 3D wind speed (columns U, V and W) of each grid point
+                (3D multiindex covering the whole grid, see setInitialWindField)
+            df_gridBuil: pd.DataFrame
+                3D multiindex corresponding to grid points intersecting buildings
+            nPoints: dictionary
+                Number of grid points along X, Y and Z
+    
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            buildGrid3D: 3D array
+                0 for the cells intersecting a building (or the ground), 1 otherwise
+            u0: 3D array
+                Initial 3D wind speed value in X direction
+            v0: 3D array
+                Initial 3D wind speed value in Y direction (note that v axis 
+                direction is changed since we first use Röckle schemes 
+                considering wind speed coming from North thus axis facing South)
+            w0: 3D array
+                Initial 3D wind speed value in Z direction"""
+    nx, ny, nz = nPoints[X], nPoints[Y], nPoints[Z]
+    
+    # Set the buildGrid3D object to zero when a cell intersect a building
+    # and for the ground (after getting grid size)
+    buildGrid3D = np.ones((nx, ny, nz), dtype = np.int32)
+    buildGrid3D[df_gridBuil.index.get_level_values(0),
+                df_gridBuil.index.get_level_values(1),
+                df_gridBuil.index.get_level_values(2)] = 0
+    buildGrid3D[1:nx-1, 1:ny-1, 0] = 0
+    
+    # The multiindex of the wind speed covers the whole grid: once sorted
+    # the values are in (x, y, z) order
+    df_wind0 = df_wind0.sort_index()
+    u0 = df_wind0[U].values.reshape(nx, ny, nz).copy()
+    v0 = -df_wind0[V].values.reshape(nx, ny, nz)
+    w0 = df_wind0[W].values.reshape(nx, ny, nz).copy()
+    
+    return buildGrid3D, u0, v0, w0
@@ -17,6 +17,7 @@ from . import CalculatesIndicators
 from . import InitWindField
 from . import DataUtil
 from . import WindSolver
+from . import NativeRockle
 import time
 try :
     from numba import jit
@@ -52,6 +53,7 @@ def main(javaEnvironmentPath,
          onlyInitialization = ONLY_INITIALIZATION,
          maxIterations = MAX_ITERATIONS,
          thresholdIterations = THRESHOLD_ITERATIONS,
+         solverMethod = SOLVER_METHOD,
          idFieldBuild = ID_FIELD_BUILD,
          buildingHeightField = HEIGHT_FIELD,
          vegetationBaseHeight = VEGETATION_CROWN_BASE_HEIGHT,
@@ -67,7 +69,8 @@ def main(javaEnvironmentPath,
          saveNetcdf = True,
          debug = DEBUG,
          profileType = PROFILE_TYPE,
-         verticalProfileFile = None):
+         verticalProfileFile = None,
+         rockleBackend = ROCKLE_BACKEND):
     # If the function is called within QGIS, a feedback is sent into the QGIS interface
     if feedback:
         feedback.setProgressText('Initiating algorithm')
@@ -147,499 +150,522 @@ def main(javaEnvironmentPath,
     
     timeStartCalculation = time.time()
     
-    # -----------------------------------------------------------------------------------
-    # 2. CREATES OBSTACLE GEOMETRIES ----------------------------------------------------
-    # -----------------------------------------------------------------------------------
-    if feedback:
-        feedback.setProgressText('Creates the stacked blocks used as obstacles')
-        if feedback.isCanceled():
-            cursor.close()
-            feedback.setProgressText("Calculation cancelled by user")
-            return {}
-    # Create the stacked blocks
-    blockTable, stackedBlockTable = \
-        Obstacles.createsBlocks(cursor = cursor, 
-                                inputBuildings = BUILDING_TABLE_NAME,
-                                prefix = prefix)
-    
-    # Save the blocks, stacked blocks and vegetation as geojson
-    if debug or saveRockleZones:
-        saveData.saveTable(cursor = cursor                          , tableName = blockTable,
-                           filedir = outputDataAbs["blocks"]        , delete = True)
-        saveData.saveTable(cursor = cursor                          , tableName = VEGETATION_TABLE_NAME,
-                           filedir = outputDataAbs["vegetation"]    , delete = True)
-    
-    # -----------------------------------------------------------------------------------
-    # 3. ROTATES OBSTACLES TO THE RIGHT DIRECTION AND CALCULATES GEOMETRY PROPERTIES ----
-    # -----------------------------------------------------------------------------------
-    if feedback:
-        feedback.setProgressText('Rotates obstacles to the right direction and calculates geometry properties')
-        if feedback.isCanceled():
-            cursor.close()
-            feedback.setProgressText("Calculation cancelled by user")
-            return {}
-    # Define a set of obstacles in a dictionary before the rotation
-    dicOfObstacles = {BUILDING_TABLE_NAME       : stackedBlockTable,
-                      VEGETATION_TABLE_NAME     : VEGETATION_TABLE_NAME}
-    
-    # Rotate obstacles
-    dicRotatedTables, rotationCenterCoordinates = \
-        Obstacles.windRotation(cursor = cursor,
-                               dicOfInputTables = dicOfObstacles,
-                               rotateAngle = windDirection,
-                               rotationCenterCoordinates = None,
-                               prefix = prefix)
-    
-    # Get the rotated block and vegetation table names
-    rotatedStackedBlocks = dicRotatedTables[BUILDING_TABLE_NAME]
-    rotatedVegetation = dicRotatedTables[VEGETATION_TABLE_NAME]
-    
-    # Calculates base block height and base of block cavity zone
-    rotatedPropStackedBlocks = \
-        Obstacles.identifyBlockAndCavityBase(cursor, rotatedStackedBlocks,
-                                                               prefix = prefix)
-    
-    # Init the upwind facades
-    upwindInitedTable = \
-        Obstacles.initUpwindFacades(cursor = cursor,
-                                    obstaclesTable = rotatedPropStackedBlocks,
+    if rockleBackend == ROCKLE_BACKENDS[1]:
+        # -------------------------------------------------------------------
+        # 2. TO 9. ROCKLE ZONES AND INITIAL WIND FIELD CALCULATED IN MEMORY -
+        # -------------------------------------------------------------------
+        if feedback:
+            feedback.setProgressText('Initialize the 3D wind in the grid (native Röckle zones)')
+            if feedback.isCanceled():
+                cursor.close()
+                feedback.setProgressText("Calculation cancelled by user")
+                return {}
+        timeStartRasterization = time.time()
+        nativeInit = NativeRockle.initWindField(cursor = cursor,
+                                                windDirection = windDirection,
+                                                srid = srid,
+                                                meshSize = meshSize,
+                                                dz = dz,
+                                                alongWindZoneExtend = alongWindZoneExtend,
+                                                crossWindZoneExtend = crossWindZoneExtend,
+                                                verticalExtend = verticalExtend,
+                                                z_ref = z_ref,
+                                                v_ref = v_ref,
+                                                profileType = profileType,
+                                                verticalProfileFile = verticalProfileFile,
+                                                outputRaster = outputRaster,
+                                                prefix = prefix,
+                                                feedback = feedback)
+        buildGrid3D, u0, v0, w0 = [nativeInit[k] for k in ["buildGrid3D", "u0", "v0", "w0"]]
+        nPoints = nativeInit["nPoints"]
+        verticalWindProfile = nativeInit["verticalWindProfile"]
+        gridPoint = nativeInit["gridPoint"]
+        rotationCenterCoordinates = nativeInit["rotationCenterCoordinates"]
+        nx, ny, nz = nPoints.values()
+    else:
+        # -----------------------------------------------------------------------------------
+        # 2. CREATES OBSTACLE GEOMETRIES ----------------------------------------------------
+        # -----------------------------------------------------------------------------------
+        if feedback:
+            feedback.setProgressText('Creates the stacked blocks used as obstacles')
+            if feedback.isCanceled():
+                cursor.close()
+                feedback.setProgressText("Calculation cancelled by user")
+                return {}
+        # Create the stacked blocks
+        blockTable, stackedBlockTable = \
+            Obstacles.createsBlocks(cursor = cursor, 
+                                    inputBuildings = BUILDING_TABLE_NAME,
                                     prefix = prefix)
-    # Update base height of upwind facades (if shared with the building below)
-    upwindTable = \
-        Obstacles.updateUpwindFacadeBase(cursor = cursor,
-                                        upwindTable = upwindInitedTable,
+    
+        # Save the blocks, stacked blocks and vegetation as geojson
+        if debug or saveRockleZones:
+            saveData.saveTable(cursor = cursor                          , tableName = blockTable,
+                               filedir = outputDataAbs["blocks"]        , delete = True)
+            saveData.saveTable(cursor = cursor                          , tableName = VEGETATION_TABLE_NAME,
+                               filedir = outputDataAbs["vegetation"]    , delete = True)
+    
+        # -----------------------------------------------------------------------------------
+        # 3. ROTATES OBSTACLES TO THE RIGHT DIRECTION AND CALCULATES GEOMETRY PROPERTIES ----
+        # -----------------------------------------------------------------------------------
+        if feedback:
+            feedback.setProgressText('Rotates obstacles to the right direction and calculates geometry properties')
+            if feedback.isCanceled():
+                cursor.close()
+                feedback.setProgressText("Calculation cancelled by user")
+                return {}
+        # Define a set of obstacles in a dictionary before the rotation
+        dicOfObstacles = {BUILDING_TABLE_NAME       : stackedBlockTable,
+                          VEGETATION_TABLE_NAME     : VEGETATION_TABLE_NAME}
+    
+        # Rotate obstacles
+        dicRotatedTables, rotationCenterCoordinates = \
+            Obstacles.windRotation(cursor = cursor,
+                                   dicOfInputTables = dicOfObstacles,
+                                   rotateAngle = windDirection,
+                                   rotationCenterCoordinates = None,
+                                   prefix = prefix)
+    
+        # Get the rotated block and vegetation table names
+        rotatedStackedBlocks = dicRotatedTables[BUILDING_TABLE_NAME]
+        rotatedVegetation = dicRotatedTables[VEGETATION_TABLE_NAME]
+    
+        # Calculates base block height and base of block cavity zone
+        rotatedPropStackedBlocks = \
+            Obstacles.identifyBlockAndCavityBase(cursor, rotatedStackedBlocks,
+                                                                   prefix = prefix)
+    
+        # Init the upwind facades
+        upwindInitedTable = \
+            Obstacles.initUpwindFacades(cursor = cursor,
+                                        obstaclesTable = rotatedPropStackedBlocks,
                                         prefix = prefix)
+        # Update base height of upwind facades (if shared with the building below)
+        upwindTable = \
+            Obstacles.updateUpwindFacadeBase(cursor = cursor,
+                                            upwindTable = upwindInitedTable,
+                                            prefix = prefix)
     
-    # Calculates obstacles properties
-    obstaclePropertiesTable = \
-        CalculatesIndicators.obstacleProperties(cursor = cursor,
-                                                obstaclesTable = rotatedPropStackedBlocks,
-                                                prefix = prefix)
+        # Calculates obstacles properties
+        obstaclePropertiesTable = \
+            CalculatesIndicators.obstacleProperties(cursor = cursor,
+                                                    obstaclesTable = rotatedPropStackedBlocks,
+                                                    prefix = prefix)
     
-    # Calculates obstacle zone properties
-    zonePropertiesTable = \
-        CalculatesIndicators.zoneProperties(cursor = cursor,
-                                            obstaclePropertiesTable = obstaclePropertiesTable,
-                                            prefix = prefix)
+        # Calculates obstacle zone properties
+        zonePropertiesTable = \
+            CalculatesIndicators.zoneProperties(cursor = cursor,
+                                                obstaclePropertiesTable = obstaclePropertiesTable,
+                                                prefix = prefix)
     
-    # Calculates roughness properties of the study area
-    z0, d, Hr, H_ob_max, lambda_f = \
-        CalculatesIndicators.studyAreaProperties(cursor = cursor, 
-                                                 upwindTable = upwindInitedTable, 
-                                                 stackedBlockTable = rotatedStackedBlocks, 
-                                                 vegetationTable = rotatedVegetation)
-    
-    # Calculates downwind facades 
-    downwindTable = \
-        Obstacles.initDownwindFacades(cursor = cursor,
-                                      obstaclesTable = zonePropertiesTable,
-                                      prefix = prefix)
+        # Calculates roughness properties of the study area
+        z0, d, Hr, H_ob_max, lambda_f = \
+            CalculatesIndicators.studyAreaProperties(cursor = cursor, 
+                                                     upwindTable = upwindInitedTable, 
+                                                     stackedBlockTable = rotatedStackedBlocks, 
+                                                     vegetationTable = rotatedVegetation)
+    
+        # Calculates downwind facades 
+        downwindTable = \
+            Obstacles.initDownwindFacades(cursor = cursor,
+                                          obstaclesTable = zonePropertiesTable,
+                                          prefix = prefix)
 
 
-    # Save the rotated obstacles and facades as geojson
-    if debug or saveRockleZones:
-        saveData.saveTable(cursor = cursor                                  , tableName = rotatedPropStackedBlocks,
-                           filedir = outputDataAbs["rotated_stacked_blocks"], delete = True)
-        saveData.saveTable(cursor = cursor                         , tableName = rotatedVegetation,
-                           filedir = outputDataAbs["rotated_vegetation"]    , delete = True)
-        saveData.saveTable(cursor = cursor                      , tableName = upwindTable,
-                           filedir = outputDataAbs["upwind_facades"]   , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-        saveData.saveTable(cursor = cursor                      , tableName = downwindTable,
-                           filedir = outputDataAbs["downwind_facades"]   , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-        saveData.saveTable(cursor = cursor                          , tableName = rotatedPropStackedBlocks,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection,
-                           filedir = outputDataAbs["stacked_blocks"], delete = True)
-    
-    
-    # -----------------------------------------------------------------------------------
-    # 4. CREATES THE 2D ROCKLE ZONES ----------------------------------------------------
-    # -----------------------------------------------------------------------------------
-    if feedback:
-        feedback.setProgressText('Creates the 2D Röckle zones')
-        if feedback.isCanceled():
-            cursor.close()
-            feedback.setProgressText("Calculation cancelled by user")
-            return {}
-    # Creates the displacement zone (upwind)
-    displacementZonesTable, displacementVortexZonesTable = \
-        Zones.displacementZones(cursor = cursor,
-                                                  upwindTable = upwindTable,
-                                                  zonePropertiesTable = zonePropertiesTable,
-                                                  srid = srid,
-                                                  prefix = prefix)
-    
-    
-    # Save the resulting displacement zones as geojson
-    if debug or saveRockleZones:
-        saveData.saveTable(cursor = cursor                      , tableName = displacementZonesTable,
-                  filedir = outputDataAbs["displacement"]       , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-        saveData.saveTable(cursor = cursor                          , tableName = displacementVortexZonesTable,
-                  filedir = outputDataAbs["displacement_vortex"]    , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-    
-    # Creates the cavity and wake zones
-    cavityZonesTable, wakeZonesTable = \
-        Zones.cavityAndWakeZones(cursor = cursor, 
-                                downwindWithPropTable = downwindTable,
-                                srid = srid,
-                                ellipseResolution = meshSize/3,
-                                prefix = prefix).values()
-    
-    # Save the resulting displacement zones as geojson
-    if debug or saveRockleZones:
-        saveData.saveTable(cursor = cursor             , tableName = cavityZonesTable,
-                  filedir = outputDataAbs["cavity"]    , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-        saveData.saveTable(cursor = cursor           , tableName = wakeZonesTable,
-                  filedir = outputDataAbs["wake"]    , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-    
-    
-    # Creates the street canyon zones
-    streetCanyonTable = \
-        Zones.streetCanyonZones(cursor = cursor,
-                                cavityZonesTable = cavityZonesTable,
-                                zonePropertiesTable = zonePropertiesTable,
-                                upwindTable = upwindTable,
-                                downwindTable = downwindTable,
-                                srid = srid,
-                                prefix = prefix)
-    
-    # Save the resulting street canyon zones as geojson
-    if debug or saveRockleZones:
-        saveData.saveTable(cursor = cursor                    , tableName = streetCanyonTable,
-                  filedir = outputDataAbs["street_canyon"]    , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-    
-    # Creates the rooftop zones
-    rooftopPerpendicularZoneTable, rooftopCornerZoneTable = \
-        Zones.rooftopZones(cursor = cursor,
-                           upwindTable = upwindTable,
-                           zonePropertiesTable = zonePropertiesTable,
-                           prefix = prefix)
-    # Save the resulting rooftop zones as geojson
-    if debug or saveRockleZones:
-        saveData.saveTable(cursor = cursor                              , tableName = rooftopPerpendicularZoneTable,
-                  filedir = outputDataAbs["rooftop_perpendicular"]      , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-        saveData.saveTable(cursor = cursor                      , tableName = rooftopCornerZoneTable,
-                  filedir = outputDataAbs["rooftop_corner"]     , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-    
-    # Creates the vegetation zones
-    vegetationBuiltZoneTable, vegetationOpenZoneTable = \
-        Zones.vegetationZones(cursor = cursor,
-                                                vegetationTable = rotatedVegetation,
-                                                wakeZonesTable = wakeZonesTable,
-                                                prefix = prefix)
-    if debug or saveRockleZones:
-        saveData.saveTable(cursor = cursor                      , tableName = vegetationBuiltZoneTable,
-                  filedir = outputDataAbs["vegetation_built"]   , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-        saveData.saveTable(cursor = cursor                      , tableName = vegetationOpenZoneTable,
-                  filedir = outputDataAbs["vegetation_open"]    , delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-    
-    # Define a dictionary of all building Rockle zones and same for veg
-    dicOfBuildRockleZoneTable = {DISPLACEMENT_NAME       : displacementZonesTable,
-                                DISPLACEMENT_VORTEX_NAME: displacementVortexZonesTable,
-                                CAVITY_NAME             : cavityZonesTable,
-                                WAKE_NAME               : wakeZonesTable,
-                                STREET_CANYON_NAME      : streetCanyonTable,
-                                ROOFTOP_PERP_NAME       : rooftopPerpendicularZoneTable,
-                                ROOFTOP_CORN_NAME       : rooftopCornerZoneTable}
-    dicOfVegRockleZoneTable = {VEGETATION_BUILT_NAME   : vegetationBuiltZoneTable,
-                               VEGETATION_OPEN_NAME    : vegetationOpenZoneTable}    
-    
-    if outputRaster:
-        # Creates a table with a polygon covering the raster zone envelope
-        smallStudyZone = "SMALL_STUDY_ZONE"
-        outputRasterExtent = outputRaster.extent()
-        cursor.execute("""
-           DROP TABLE IF EXISTS {0};
-           CREATE TABLE {0}({5} GEOMETRY)
-               AS SELECT ST_SETSRID(ST_ROTATE(ST_ENVELOPE('MULTIPOINT({1} {2},
-                                               {3} {4})'),
-                                              {6},
-                                              {7},
-                                              {8}), {9})
-           """.format(smallStudyZone,
-                       outputRasterExtent.xMinimum(),
-                       outputRasterExtent.yMinimum(),
-                       outputRasterExtent.xMaximum(),
-                       outputRasterExtent.yMaximum(),
-                       GEOM_FIELD,
-                       DataUtil.degToRad(windDirection),
-                       rotationCenterCoordinates[0],
-                       rotationCenterCoordinates[1],
-                       srid))
-        # Identify the stacked blocks, blocks potentially impacting the
-        # impacted zone and their corresponding Röckle zones 
-        dicOfBuildRockleZoneTable, dicOfVegRockleZoneTable, rotatedPropStackedBlocks,\
-        rotatedVegetation = \
-            Zones.identifyImpactingStackedBlocks(cursor = cursor,
-                                                 dicOfBuildRockleZoneTable = dicOfBuildRockleZoneTable,
-                                                 dicOfVegRockleZoneTable = dicOfVegRockleZoneTable,
-                                                 impactedZone = smallStudyZone,
-                                                 stackedBlocksTable = rotatedPropStackedBlocks,
-                                                 vegetationTable = rotatedVegetation,
-                                                 crossWindExtend = crossWindZoneExtend,                                                 
-                                                 prefix = prefix)
-    # ----------------------------------------------------------------------
-    # 5. SET THE 2D GRID IN THE ROCKLE ZONES -------------------------------
-    # ----------------------------------------------------------------------
-    if feedback:
-        feedback.setProgressText('Creates the 2D grid')
-        if feedback.isCanceled():
-            cursor.close()
-            feedback.setProgressText("Calculation cancelled by user")
-            return {}
+        # Save the rotated obstacles and facades as geojson
+        if debug or saveRockleZones:
+            saveData.saveTable(cursor = cursor                                  , tableName = rotatedPropStackedBlocks,
+                               filedir = outputDataAbs["rotated_stacked_blocks"], delete = True)
+            saveData.saveTable(cursor = cursor                         , tableName = rotatedVegetation,
+                               filedir = outputDataAbs["rotated_vegetation"]    , delete = True)
+            saveData.saveTable(cursor = cursor                      , tableName = upwindTable,
+                               filedir = outputDataAbs["upwind_facades"]   , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+            saveData.saveTable(cursor = cursor                      , tableName = downwindTable,
+                               filedir = outputDataAbs["downwind_facades"]   , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+            saveData.saveTable(cursor = cursor                          , tableName = rotatedPropStackedBlocks,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection,
+                               filedir = outputDataAbs["stacked_blocks"], delete = True)
+    
+    
+        # -----------------------------------------------------------------------------------
+        # 4. CREATES THE 2D ROCKLE ZONES ----------------------------------------------------
+        # -----------------------------------------------------------------------------------
+        if feedback:
+            feedback.setProgressText('Creates the 2D Röckle zones')
+            if feedback.isCanceled():
+                cursor.close()
+                feedback.setProgressText("Calculation cancelled by user")
+                return {}
+        # Creates the displacement zone (upwind)
+        displacementZonesTable, displacementVortexZonesTable = \
+            Zones.displacementZones(cursor = cursor,
+                                                      upwindTable = upwindTable,
+                                                      zonePropertiesTable = zonePropertiesTable,
+                                                      srid = srid,
+                                                      prefix = prefix)
+    
+    
+        # Save the resulting displacement zones as geojson
+        if debug or saveRockleZones:
+            saveData.saveTable(cursor = cursor                      , tableName = displacementZonesTable,
+                      filedir = outputDataAbs["displacement"]       , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+            saveData.saveTable(cursor = cursor                          , tableName = displacementVortexZonesTable,
+                      filedir = outputDataAbs["displacement_vortex"]    , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+    
+        # Creates the cavity and wake zones
+        cavityZonesTable, wakeZonesTable = \
+            Zones.cavityAndWakeZones(cursor = cursor, 
+                                    downwindWithPropTable = downwindTable,
+                                    srid = srid,
+                                    ellipseResolution = meshSize/3,
+                                    prefix = prefix).values()
+    
+        # Save the resulting displacement zones as geojson
+        if debug or saveRockleZones:
+            saveData.saveTable(cursor = cursor             , tableName = cavityZonesTable,
+                      filedir = outputDataAbs["cavity"]    , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+            saveData.saveTable(cursor = cursor           , tableName = wakeZonesTable,
+                      filedir = outputDataAbs["wake"]    , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+    
+    
+        # Creates the street canyon zones
+        streetCanyonTable = \
+            Zones.streetCanyonZones(cursor = cursor,
+                                    cavityZonesTable = cavityZonesTable,
+                                    zonePropertiesTable = zonePropertiesTable,
+                                    upwindTable = upwindTable,
+                                    downwindTable = downwindTable,
+                                    srid = srid,
+                                    prefix = prefix)
+    
+        # Save the resulting street canyon zones as geojson
+        if debug or saveRockleZones:
+            saveData.saveTable(cursor = cursor                    , tableName = streetCanyonTable,
+                      filedir = outputDataAbs["street_canyon"]    , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+    
+        # Creates the rooftop zones
+        rooftopPerpendicularZoneTable, rooftopCornerZoneTable = \
+            Zones.rooftopZones(cursor = cursor,
+                               upwindTable = upwindTable,
+                               zonePropertiesTable = zonePropertiesTable,
+                               prefix = prefix)
+        # Save the resulting rooftop zones as geojson
+        if debug or saveRockleZones:
+            saveData.saveTable(cursor = cursor                              , tableName = rooftopPerpendicularZoneTable,
+                      filedir = outputDataAbs["rooftop_perpendicular"]      , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+            saveData.saveTable(cursor = cursor                      , tableName = rooftopCornerZoneTable,
+                      filedir = outputDataAbs["rooftop_corner"]     , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+    
+        # Creates the vegetation zones
+        vegetationBuiltZoneTable, vegetationOpenZoneTable = \
+            Zones.vegetationZones(cursor = cursor,
+                                                    vegetationTable = rotatedVegetation,
+                                                    wakeZonesTable = wakeZonesTable,
+                                                    prefix = prefix)
+        if debug or saveRockleZones:
+            saveData.saveTable(cursor = cursor                      , tableName = vegetationBuiltZoneTable,
+                      filedir = outputDataAbs["vegetation_built"]   , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+            saveData.saveTable(cursor = cursor                      , tableName = vegetationOpenZoneTable,
+                      filedir = outputDataAbs["vegetation_open"]    , delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)
+    
+        # Define a dictionary of all building Rockle zones and same for veg
+        dicOfBuildRockleZoneTable = {DISPLACEMENT_NAME       : displacementZonesTable,
+                                    DISPLACEMENT_VORTEX_NAME: displacementVortexZonesTable,
+                                    CAVITY_NAME             : cavityZonesTable,
+                                    WAKE_NAME               : wakeZonesTable,
+                                    STREET_CANYON_NAME      : streetCanyonTable,
+                                    ROOFTOP_PERP_NAME       : rooftopPerpendicularZoneTable,
+                                    ROOFTOP_CORN_NAME       : rooftopCornerZoneTable}
+        dicOfVegRockleZoneTable = {VEGETATION_BUILT_NAME   : vegetationBuiltZoneTable,
+                                   VEGETATION_OPEN_NAME    : vegetationOpenZoneTable}    
+    
+        if outputRaster:
+            # Creates a table with a polygon covering the raster zone envelope
+            smallStudyZone = "SMALL_STUDY_ZONE"
+            outputRasterExtent = outputRaster.extent()
+            cursor.execute("""
+               DROP TABLE IF EXISTS {0};
+               CREATE TABLE {0}({5} GEOMETRY)
+                   AS SELECT ST_SETSRID(ST_ROTATE(ST_ENVELOPE('MULTIPOINT({1} {2},
+                                                   {3} {4})'),
+                                                  {6},
+                                                  {7},
+                                                  {8}), {9})
+               """.format(smallStudyZone,
+                           outputRasterExtent.xMinimum(),
+                           outputRasterExtent.yMinimum(),
+                           outputRasterExtent.xMaximum(),
+                           outputRasterExtent.yMaximum(),
+                           GEOM_FIELD,
+                           DataUtil.degToRad(windDirection),
+                           rotationCenterCoordinates[0],
+                           rotationCenterCoordinates[1],
+                           srid))
+            # Identify the stacked blocks, blocks potentially impacting the
+            # impacted zone and their corresponding Röckle zones 
+            dicOfBuildRockleZoneTable, dicOfVegRockleZoneTable, rotatedPropStackedBlocks,\
+            rotatedVegetation = \
+                Zones.identifyImpactingStackedBlocks(cursor = cursor,
+                                                     dicOfBuildRockleZoneTable = dicOfBuildRockleZoneTable,
+                                                     dicOfVegRockleZoneTable = dicOfVegRockleZoneTable,
+                                                     impactedZone = smallStudyZone,
+                                                     stackedBlocksTable = rotatedPropStackedBlocks,
+                                                     vegetationTable = rotatedVegetation,
+                                                     crossWindExtend = crossWindZoneExtend,                                                 
+                                                     prefix = prefix)
+        # ----------------------------------------------------------------------
+        # 5. SET THE 2D GRID IN THE ROCKLE ZONES -------------------------------
+        # ----------------------------------------------------------------------
+        if feedback:
+            feedback.setProgressText('Creates the 2D grid')
+            if feedback.isCanceled():
+                cursor.close()
+                feedback.setProgressText("Calculation cancelled by user")
+                return {}
+        
+        # Creates the grid of points
+        gridPoint = InitWindField.createGrid(cursor = cursor, 
+                                             dicOfInputTables = dict(dicOfBuildRockleZoneTable,
+                                                                     **dicOfVegRockleZoneTable),
+                                             srid = srid,
+                                             alongWindZoneExtend = alongWindZoneExtend, 
+                                             crossWindZoneExtend = crossWindZoneExtend, 
+                                             meshSize = meshSize,
+                                             prefix = prefix)
+    
+        # Affects each 2D point to a build Rockle zone and calculates needed variables for 3D wind speed factors
+        dicOfInitBuildZoneGridPoint, verticalLineTable = \
+            InitWindField.affectsPointToBuildZone(  cursor = cursor, 
+                                                    gridTable = gridPoint,
+                                                    dicOfBuildRockleZoneTable = dicOfBuildRockleZoneTable,
+                                                    prefix = prefix)
         
-    # Creates the grid of points
-    gridPoint = InitWindField.createGrid(cursor = cursor, 
-                                         dicOfInputTables = dict(dicOfBuildRockleZoneTable,
-                                                                 **dicOfVegRockleZoneTable),
-                                         srid = srid,
-                                         alongWindZoneExtend = alongWindZoneExtend, 
-                                         crossWindZoneExtend = crossWindZoneExtend, 
-                                         meshSize = meshSize,
-                                         prefix = prefix)
-    
-    # Affects each 2D point to a build Rockle zone and calculates needed variables for 3D wind speed factors
-    dicOfInitBuildZoneGridPoint, verticalLineTable = \
-        InitWindField.affectsPointToBuildZone(  cursor = cursor, 
+        # Same for vegetation Röckle zones
+        dicOfVegZoneGridPoint = \
+            InitWindField.affectsPointToVegZone(cursor = cursor, 
                                                 gridTable = gridPoint,
-                                                dicOfBuildRockleZoneTable = dicOfBuildRockleZoneTable,
+                                                dicOfVegRockleZoneTable = dicOfVegRockleZoneTable,
                                                 prefix = prefix)
-        
-    # Same for vegetation Röckle zones
-    dicOfVegZoneGridPoint = \
-        InitWindField.affectsPointToVegZone(cursor = cursor, 
-                                            gridTable = gridPoint,
-                                            dicOfVegRockleZoneTable = dicOfVegRockleZoneTable,
-                                            prefix = prefix)
-    
-    # Remove some of the Röckle points where building Röckle zones overlap
-    dicOfBuildZoneGridPoint = \
-        InitWindField.removeBuildZonePoints(cursor = cursor, 
-                                            dicOfInitBuildZoneGridPoint = dicOfInitBuildZoneGridPoint,
-                                            prefix = prefix)
-    
-    # Manage backward cavity and wake zones in the leeward zone of tall buildings
-    dicOfBuildZoneGridPoint, facadeWithinCavity =\
-        InitWindField.manageBackwardZones(cursor = cursor, 
-                                          dicOfBuildZoneGridPoint = dicOfBuildZoneGridPoint,
-                                          cavity2dInitPoints = dicOfInitBuildZoneGridPoint[CAVITY_NAME],
-                                          wake2dInitPoints = dicOfInitBuildZoneGridPoint[WAKE_NAME],
-                                          streetCanyonTable = streetCanyonTable,
-                                          gridTable = gridPoint,
-                                          meshSize = meshSize,
-                                          dz = dz,
-                                          prefix = prefix)
     
+        # Remove some of the Röckle points where building Röckle zones overlap
+        dicOfBuildZoneGridPoint = \
+            InitWindField.removeBuildZonePoints(cursor = cursor, 
+                                                dicOfInitBuildZoneGridPoint = dicOfInitBuildZoneGridPoint,
+                                                prefix = prefix)
     
-    # -----------------------------------------------------------------------------------
-    # 6. INITIALIZE THE 3D WIND FACTORS IN THE ROCKLE ZONES -------------------------------
-    # -----------------------------------------------------------------------------------   
-    if feedback:
-        feedback.setProgressText('Initializes the 3D grid within Röckle zones')
-        if feedback.isCanceled():
-            cursor.close()
-            feedback.setProgressText("Calculation cancelled by user")
-            return {}
-    # Calculates the 3D wind speed factors for each building Röckle zone
-    dicOfBuildZone3DWindFactor, maxBuildZoneHeight = \
-        InitWindField.calculates3dBuildWindFactor(cursor = cursor,
-                                                  dicOfBuildZoneGridPoint = dicOfBuildZoneGridPoint,
-                                                  dz = dz,
-                                                  prefix = prefix)
-    if debug or saveRockleZones:
-        for t in dicOfBuildZone3DWindFactor:
+        # Manage backward cavity and wake zones in the leeward zone of tall buildings
+        dicOfBuildZoneGridPoint, facadeWithinCavity =\
+            InitWindField.manageBackwardZones(cursor = cursor, 
+                                              dicOfBuildZoneGridPoint = dicOfBuildZoneGridPoint,
+                                              cavity2dInitPoints = dicOfInitBuildZoneGridPoint[CAVITY_NAME],
+                                              wake2dInitPoints = dicOfInitBuildZoneGridPoint[WAKE_NAME],
+                                              streetCanyonTable = streetCanyonTable,
+                                              gridTable = gridPoint,
+                                              meshSize = meshSize,
+                                              dz = dz,
+                                              prefix = prefix)
+    
+    
+        # -----------------------------------------------------------------------------------
+        # 6. INITIALIZE THE 3D WIND FACTORS IN THE ROCKLE ZONES -------------------------------
+        # -----------------------------------------------------------------------------------   
+        if feedback:
+            feedback.setProgressText('Initializes the 3D grid within Röckle zones')
+            if feedback.isCanceled():
+                cursor.close()
+                feedback.setProgressText("Calculation cancelled by user")
+                return {}
+        # Calculates the 3D wind speed factors for each building Röckle zone
+        dicOfBuildZone3DWindFactor, maxBuildZoneHeight = \
+            InitWindField.calculates3dBuildWindFactor(cursor = cursor,
+                                                      dicOfBuildZoneGridPoint = dicOfBuildZoneGridPoint,
+                                                      dz = dz,
+                                                      prefix = prefix)
+        if debug or saveRockleZones:
+            for t in dicOfBuildZone3DWindFactor:
+                cursor.execute("""
+                   DROP TABLE IF EXISTS point3D_Buildzone_{0};
+                   {5};
+                   {6};
+                   CREATE TABLE point3D_Buildzone_{0}
+                       AS SELECT   a.{2}, b.*
+                       FROM {3} AS a RIGHT JOIN {4} AS b
+                           ON a.{1} = b.{1}
+                       WHERE b.{1} IS NOT NULL
+                   """.format( t                            , ID_POINT,
+                               GEOM_FIELD                   , gridPoint, 
+                               dicOfBuildZone3DWindFactor[t], DataUtil.createIndex(tableName=gridPoint, 
+                                                                                   fieldName=ID_POINT,
+                                                                                   isSpatial=False),
+                               DataUtil.createIndex(tableName=dicOfBuildZone3DWindFactor[t], 
+                                                    fieldName=ID_POINT,
+                                                    isSpatial=False)))
+                saveData.saveTable(cursor = cursor,
+                                   tableName = "point3D_Buildzone_"+t,
+                                   filedir = outputDataAbs["point3D_BuildZone"]+t+".geojson",
+                                   delete = True,
+                                   rotationCenterCoordinates = rotationCenterCoordinates,
+                                   rotateAngle = - windDirection)
+        
+        # Calculates the 3D wind speed factors of the vegetation (considering all zone types)
+        # after calculation of the top of the "sketch"
+        maxHeight = H_ob_max
+        if maxBuildZoneHeight: 
+            if maxBuildZoneHeight > H_ob_max:
+                maxHeight = maxBuildZoneHeight
+        sketchHeight = maxHeight + verticalExtend
+        vegetationWeightFactorTable = \
+            InitWindField.calculates3dVegWindFactor(cursor = cursor,
+                                                    dicOfVegZoneGridPoint = dicOfVegZoneGridPoint,
+                                                    sketchHeight = sketchHeight,
+                                                    z0 = z0,
+                                                    d = d,
+                                                    dz = dz,
+                                                    prefix = prefix)
+        if debug or saveRockleZones:
             cursor.execute("""
-               DROP TABLE IF EXISTS point3D_Buildzone_{0};
+               DROP TABLE IF EXISTS point3D_AllVegZone;
+               {4};
                {5};
-               {6};
-               CREATE TABLE point3D_Buildzone_{0}
-                   AS SELECT   a.{2}, b.*
-                   FROM {3} AS a RIGHT JOIN {4} AS b
-                       ON a.{1} = b.{1}
-                   WHERE b.{1} IS NOT NULL
-               """.format( t                            , ID_POINT,
-                           GEOM_FIELD                   , gridPoint, 
-                           dicOfBuildZone3DWindFactor[t], DataUtil.createIndex(tableName=gridPoint, 
-                                                                               fieldName=ID_POINT,
-                                                                               isSpatial=False),
-                           DataUtil.createIndex(tableName=dicOfBuildZone3DWindFactor[t], 
+               CREATE TABLE point3D_AllVegZone
+                   AS SELECT   a.{1}, b.*
+                   FROM {2} AS a RIGHT JOIN {3} AS b
+                               ON a.{0} = b.{0}
+                   WHERE b.{0} IS NOT NULL
+               """.format( ID_POINT                     , GEOM_FIELD, 
+                           gridPoint                    , vegetationWeightFactorTable,
+                           DataUtil.createIndex(tableName=gridPoint, 
+                                                fieldName=ID_POINT,
+                                                isSpatial=False),
+                           DataUtil.createIndex(tableName=vegetationWeightFactorTable, 
                                                 fieldName=ID_POINT,
                                                 isSpatial=False)))
             saveData.saveTable(cursor = cursor,
-                               tableName = "point3D_Buildzone_"+t,
-                               filedir = outputDataAbs["point3D_BuildZone"]+t+".geojson",
+                               tableName = "point3D_AllVegZone",
+                               filedir = outputDataAbs["point3D_VegZone"]+".geojson",
                                delete = True,
                                rotationCenterCoordinates = rotationCenterCoordinates,
                                rotateAngle = - windDirection)
-        
-    # Calculates the 3D wind speed factors of the vegetation (considering all zone types)
-    # after calculation of the top of the "sketch"
-    maxHeight = H_ob_max
-    if maxBuildZoneHeight: 
-        if maxBuildZoneHeight > H_ob_max:
-            maxHeight = maxBuildZoneHeight
-    sketchHeight = maxHeight + verticalExtend
-    vegetationWeightFactorTable = \
-        InitWindField.calculates3dVegWindFactor(cursor = cursor,
-                                                dicOfVegZoneGridPoint = dicOfVegZoneGridPoint,
-                                                sketchHeight = sketchHeight,
-                                                z0 = z0,
-                                                d = d,
-                                                dz = dz,
-                                                prefix = prefix)
-    if debug or saveRockleZones:
-        cursor.execute("""
-           DROP TABLE IF EXISTS point3D_AllVegZone;
-           {4};
-           {5};
-           CREATE TABLE point3D_AllVegZone
-               AS SELECT   a.{1}, b.*
-               FROM {2} AS a RIGHT JOIN {3} AS b
-                           ON a.{0} = b.{0}
-               WHERE b.{0} IS NOT NULL
-           """.format( ID_POINT                     , GEOM_FIELD, 
-                       gridPoint                    , vegetationWeightFactorTable,
-                       DataUtil.createIndex(tableName=gridPoint, 
-                                            fieldName=ID_POINT,
-                                            isSpatial=False),
-                       DataUtil.createIndex(tableName=vegetationWeightFactorTable, 
-                                            fieldName=ID_POINT,
-                                            isSpatial=False)))
-        saveData.saveTable(cursor = cursor,
-                           tableName = "point3D_AllVegZone",
-                           filedir = outputDataAbs["point3D_VegZone"]+".geojson",
-                           delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)
-    
-    
-    # ----------------------------------------------------------------
-    # 7. DEALS WITH SUPERIMPOSED ZONES -------------------------------
-    # ----------------------------------------------------------------
-    # Calculates the final weighting factor for each point, dealing with duplicates (superimposition)
-    dicAllWeightFactorsTables = dicOfBuildZone3DWindFactor.copy()
-    dicAllWeightFactorsTables[ALL_VEGETATION_NAME] = vegetationWeightFactorTable
-    allZonesPointFactor = \
-        InitWindField.manageSuperimposition(cursor = cursor,
-                                            dicAllWeightFactorsTables = dicAllWeightFactorsTables,
-                                            facadeWithinCavity = facadeWithinCavity,
-                                            upstreamPriorityTables = UPSTREAM_PRIORITY_TABLES,
-                                            upstreamWeightingTables = UPSTREAM_WEIGHTING_TABLES,
-                                            upstreamWeightingInterRules = UPSTREAM_WEIGHTING_INTER_RULES,
-                                            upstreamWeightingIntraRules = UPSTREAM_WEIGHTING_INTRA_RULES,
-                                            downstreamWeightingTable = DOWNSTREAM_WEIGTHING_TABLE,
-                                            prefix = prefix,
-                                            feedback = feedback)
-    if debug or saveRockleZones:
-        cursor.execute("""
-            DROP TABLE IF EXISTS point3D_All;
-            {4};
-            {5};
-            CREATE TABLE point3D_All
-                AS SELECT   a.{1}, b.*
-                FROM {2} AS a RIGHT JOIN {3} AS b
-                            ON a.{0} = b.{0}
-                WHERE b.{0} IS NOT NULL
-            """.format( ID_POINT                    , GEOM_FIELD,
-                        gridPoint                   , allZonesPointFactor,
-                        DataUtil.createIndex(tableName=gridPoint, 
-                                             fieldName=ID_POINT,
-                                             isSpatial=False),
-                        DataUtil.createIndex(tableName=allZonesPointFactor, 
-                                             fieldName=ID_POINT,
-                                             isSpatial=False)))
-        saveData.saveTable(cursor = cursor,
-                           tableName = "point3D_All",
-                           filedir = outputDataAbs["point3D_All"]+".geojson",
-                           delete = True,
-                           rotationCenterCoordinates = rotationCenterCoordinates,
-                           rotateAngle = - windDirection)    
-    
     
-    # -------------------------------------------------------------------
-    # 8. 3D WIND SPEED INITIALIZATION -----------------------------------
-    # -------------------------------------------------------------------
-    if feedback:
-        feedback.setProgressText('Initialize the 3D wind in the grid')
-        if feedback.isCanceled():
-            cursor.close()
-            feedback.setProgressText("Calculation cancelled by user")
-            return {}
-    # Identify 3D grid points intersected by buildings
-    df_gridBuil = \
-        InitWindField.identifyBuildPoints(cursor = cursor,
-                                          gridPoint = gridPoint,
-                                          stackedBlocksWithBaseHeight = rotatedPropStackedBlocks,
-                                          dz = dz,
-                                          tempoDirectory = tempoDirectory)
-    
-    # Set the initial 3D wind speed field
-    df_wind0, nPoints, verticalWindProfile = \
-        InitWindField.setInitialWindField(cursor = cursor, 
-                                          initializedWindFactorTable = allZonesPointFactor,
-                                          gridPoint = gridPoint,
-                                          df_gridBuil = df_gridBuil,
-                                          z0 = z0,
-                                          sketchHeight = sketchHeight,
-                                          profileType = profileType,
-                                          meshSize = meshSize,
-                                          dz = dz, 
-                                          z_ref = z_ref,
-                                          V_ref = v_ref, 
-                                          tempoDirectory = tempoDirectory,
-                                          d = d,
-                                          H = Hr,
-                                          lambda_f = lambda_f,
-                                          verticalProfileFile = verticalProfileFile)
     
-    # -------------------------------------------------------------------
-    # 9. "RASTERIZE" THE DATA - PREPARE MATRICES FOR WIND CALCULATION ---
-    # -------------------------------------------------------------------
-    if feedback:
-        feedback.setProgressText('Rasterize the data')
-        if feedback.isCanceled():
-            cursor.close()
-            feedback.setProgressText("Calculation cancelled by user")
-            return {}
-    # Set the ground as "building" (understand solid wall) - after getting grid size
-    nx, ny, nz = nPoints.values()
-    df_gridBuil = df_gridBuil.reindex(df_gridBuil.index.append(pd.MultiIndex.from_product([range(1,nx-1),
-                                                                                          range(1,ny-1),
-                                                                                          [0]])))
-
-    # Set the buildGrid3D object to zero when a cell intersect a building 
-    buildGrid3D = pd.Series(1, index = df_wind0.index, dtype = np.int32)
-    buildGrid3D.loc[df_gridBuil.index] = 0
-    
-    # Convert building coordinates and wind speeds to numpy matrix...
-    # (note that v axis direction is changed since we first use Röckle schemes
-    # considering wind speed coming from North thus axis facing South)
-    buildGrid3D = np.array([buildGrid3D.xs(i, level = 0).unstack().values for i in range(0,nx)])
-    u0 = np.array([df_wind0[U].xs(i, level = 0).unstack().values for i in range(0,nx)])
-    v0 = -np.array([df_wind0[V].xs(i, level = 0).unstack().values for i in range(0,nx)])
-    w0 = np.array([df_wind0[W].xs(i, level = 0).unstack().values for i in range(0,nx)])
+        # ----------------------------------------------------------------
+        # 7. DEALS WITH SUPERIMPOSED ZONES -------------------------------
+        # ----------------------------------------------------------------
+        # Calculates the final weighting factor for each point, dealing with duplicates (superimposition)
+        dicAllWeightFactorsTables = dicOfBuildZone3DWindFactor.copy()
+        dicAllWeightFactorsTables[ALL_VEGETATION_NAME] = vegetationWeightFactorTable
+        allZonesPointFactor = \
+            InitWindField.manageSuperimposition(cursor = cursor,
+                                                dicAllWeightFactorsTables = dicAllWeightFactorsTables,
+                                                facadeWithinCavity = facadeWithinCavity,
+                                                upstreamPriorityTables = UPSTREAM_PRIORITY_TABLES,
+                                                upstreamWeightingTables = UPSTREAM_WEIGHTING_TABLES,
+                                                upstreamWeightingInterRules = UPSTREAM_WEIGHTING_INTER_RULES,
+                                                upstreamWeightingIntraRules = UPSTREAM_WEIGHTING_INTRA_RULES,
+                                                downstreamWeightingTable = DOWNSTREAM_WEIGTHING_TABLE,
+                                                prefix = prefix,
+                                                feedback = feedback)
+        if debug or saveRockleZones:
+            cursor.execute("""
+                DROP TABLE IF EXISTS point3D_All;
+                {4};
+                {5};
+                CREATE TABLE point3D_All
+                    AS SELECT   a.{1}, b.*
+                    FROM {2} AS a RIGHT JOIN {3} AS b
+                                ON a.{0} = b.{0}
+                    WHERE b.{0} IS NOT NULL
+                """.format( ID_POINT                    , GEOM_FIELD,
+                            gridPoint                   , allZonesPointFactor,
+                            DataUtil.createIndex(tableName=gridPoint, 
+                                                 fieldName=ID_POINT,
+                                                 isSpatial=False),
+                            DataUtil.createIndex(tableName=allZonesPointFactor, 
+                                                 fieldName=ID_POINT,
+                                                 isSpatial=False)))
+            saveData.saveTable(cursor = cursor,
+                               tableName = "point3D_All",
+                               filedir = outputDataAbs["point3D_All"]+".geojson",
+                               delete = True,
+                               rotationCenterCoordinates = rotationCenterCoordinates,
+                               rotateAngle = - windDirection)    
+    
+    
+        # -------------------------------------------------------------------
+        # 8. 3D WIND SPEED INITIALIZATION -----------------------------------
+        # -------------------------------------------------------------------
+        if feedback:
+            feedback.setProgressText('Initialize the 3D wind in the grid')
+            if feedback.isCanceled():
+                cursor.close()
+                feedback.setProgressText("Calculation cancelled by user")
+                return {}
+        # Identify 3D grid points intersected by buildings
+        df_gridBuil = \
+            InitWindField.identifyBuildPoints(cursor = cursor,
+                                              gridPoint = gridPoint,
+                                              stackedBlocksWithBaseHeight = rotatedPropStackedBlocks,
+                                              dz = dz,
+                                              tempoDirectory = tempoDirectory)
+    
+        # Set the initial 3D wind speed field
+        df_wind0, nPoints, verticalWindProfile = \
+            InitWindField.setInitialWindField(cursor = cursor, 
+                                              initializedWindFactorTable = allZonesPointFactor,
+                                              gridPoint = gridPoint,
+                                              df_gridBuil = df_gridBuil,
+                                              z0 = z0,
+                                              sketchHeight = sketchHeight,
+                                              profileType = profileType,
+                                              meshSize = meshSize,
+                                              dz = dz, 
+                                              z_ref = z_ref,
+                                              V_ref = v_ref, 
+                                              tempoDirectory = tempoDirectory,
+                                              d = d,
+                                              H = Hr,
+                                              lambda_f = lambda_f,
+                                              verticalProfileFile = verticalProfileFile)
+    
+        # -------------------------------------------------------------------
+        # 9. "RASTERIZE" THE DATA - PREPARE MATRICES FOR WIND CALCULATION ---
+        # -------------------------------------------------------------------
+        if feedback:
+            feedback.setProgressText('Rasterize the data')
+            if feedback.isCanceled():
+                cursor.close()
+                feedback.setProgressText("Calculation cancelled by user")
+                return {}
+        # Convert building coordinates and wind speeds to numpy matrix (the ground
+        # being set as "building", understand solid wall)
+        timeStartRasterization = time.time()
+        nx, ny, nz = nPoints.values()
+        buildGrid3D, u0, v0, w0 = InitWindField.rasterizeWindField(df_wind0 = df_wind0,
+                                                                   df_gridBuil = df_gridBuil,
+                                                                   nPoints = nPoints)
     
     # Identify all cells needing to be updated by the wind solver and store
     # their coordinates in a 1D array
@@ -679,6 +705,7 @@ def main(javaEnvironmentPath,
     z = np.linspace(0, Lz, nz)
     
     print("Time spent for wind speed initialization: {0} s".format(time.time()-timeStartCalculation))
+    print("Time spent to rasterize the data: {0} s".format(time.time()-timeStartRasterization))
     print("Shape: " + str(u0.shape) + " - " + "Nb cells: " + str(u0.shape[0] * u0.shape[1] * u0.shape[2]))
     # -------------------------------------------------------------------
     # 10. WIND SOLVER APPLICATION ----------------------------------------
@@ -691,13 +718,18 @@ def main(javaEnvironmentPath,
             return {}
     if not onlyInitialization:
         # Apply a mass-flow balance to have a more physical 3D wind speed field
+        solverReport = {}
         u, v, w = \
             WindSolver.solver(  x = x                       , y = y                 , z = z,
                                 dx = meshSize               , dy = meshSize         , dz = dz,
                                 u0 = u0                     , v0 = v0               , w0 = w0, cursor = cursor,
                                 buildingCoordinates = buildingCoordinates   , cells4Solver = cells4Solver,
                                 maxIterations = maxIterations, thresholdIterations = thresholdIterations,
-                                feedback = feedback)
+                                feedback = feedback, method = solverMethod, report = solverReport)
+        # Save the convergence of the solver to compare runs (methods, thresholds)
+        WindSolver.saveConvergenceReport(solverReport,
+                                         os.path.join(outputFilePath,
+                                                      outputFilename + "_" + SOLVER_REPORT_FILENAME))
     else:
         u = u0
         v = v0
@@ -797,14 +829,15 @@ def main(javaEnvironmentPath,
         dicVectorTables_ini = None
         netcdf_path_ini = None
 
-    # Last save the 2D grid for each Röckle zone
-    saveData.saveRockleZones(cursor = cursor,
-                             outputDataAbs = outputDataAbs,
-                             dicOfBuildZoneGridPoint = dicOfBuildZoneGridPoint,
-                             dicOfVegZoneGridPoint = dicOfVegZoneGridPoint,
-                             gridPoint = gridPoint,
-                             rotationCenterCoordinates = rotationCenterCoordinates, 
-                             windDirection = windDirection)
+    # Last save the 2D grid for each Röckle zone (not kept in H2GIS by the native backend)
+    if rockleBackend == ROCKLE_BACKENDS[0]:
+        saveData.saveRockleZones(cursor = cursor,
+                                 outputDataAbs = outputDataAbs,
+                                 dicOfBuildZoneGridPoint = dicOfBuildZoneGridPoint,
+                                 dicOfVegZoneGridPoint = dicOfVegZoneGridPoint,
+                                 gridPoint = gridPoint,
+                                 rotationCenterCoordinates = rotationCenterCoordinates, 
+                                 windDirection = windDirection)
     
     # Close the Database connection and remove the file
     if not debug:
@@ -0,0 +1,1489 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Native (Shapely / NumPy) calculation of the URock initial wind field.
+
+The obstacles, Röckle zones, grid points, 3D wind factors and their
+superimposition are calculated in memory following the H2GIS queries of
+the Obstacles, CalculatesIndicators, Zones and InitWindField modules, which
+avoids the round trips between Python and the H2GIS database (CSV files and
+SQL queries) that dominate the calculation time of small study areas. The
+H2GIS database is still used to load the input data and to save the outputs.
+
+Validated against the H2GIS initialisation with test/validate_urock_native.py
+(195 buildings of Helsinki on 400 m x 400 m, 2 m mesh, wind directions 0, 45,
+90 and 200°): the initial horizontal wind speed differs by more than 0.1 m/s in
+0.01 % of the cells at most (up to 2 m/s), the calculation being 4 to 13
+times faster. These differences come from a few grid points located on the edge
+of a zone (the geometries of GEOS and JTS differing by about 0.1 mm) and
+from the number of vertices used to build the ellipses of the displacement
+zones.
+
+Grid indices (ID_X, ID_Y) are 0 based in this module (1 based in H2GIS) and
+ID_Z is the index of the vertical level (1 for the first level above ground).
+
+@author: Jérémy Bernard, University of Gothenburg
+"""
+
+from .GlobalVariables import *
+from . import DataUtil as DataUtil
+from . import InitWindField
+
+try:
+    import shapely
+    import shapely.ops
+except ImportError:
+    shapely = None
+
+# Fields identifying a grid point (column and row)
+ID_POINT_COLUMNS = [ID_POINT_X, ID_POINT_Y]
+ZONE_INDEX = "ZONE_INDEX"
+Y_MIN = "Y_MIN"
+Y_MAX = "Y_MAX"
+BACK_WEIGHT = "BACK_WEIGHT"
+
+
+def loadObstacles(cursor):
+    """ Get the buildings and vegetation loaded in the H2GIS database.
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            cursor: conn.cursor
+                A cursor object, used to perform spatial SQL queries
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            buildings: pd.DataFrame
+                Building polygons (one per row) with their ID and height
+            vegetation: pd.DataFrame
+                Vegetation polygons (one per row) with their ID, crown base
+                and top heights and attenuation factor"""
+    if shapely is None:
+        raise ImportError("'shapely' Python package is needed by the native Röckle initialisation")
+
+    cursor.execute("""
+           SELECT ST_ASTEXT({0}), {1}, {2} FROM {3}
+           """.format(GEOM_FIELD, ID_FIELD_BUILD, HEIGHT_FIELD, BUILDING_TABLE_NAME))
+    buildings = pd.DataFrame(cursor.fetchall(), columns = [GEOM_FIELD, ID_FIELD_BUILD, HEIGHT_FIELD])
+    cursor.execute("""
+           SELECT ST_ASTEXT({0}), {1}, {2}, {3}, {4} FROM {5}
+           """.format(GEOM_FIELD                   , ID_VEGETATION,
+                      VEGETATION_CROWN_BASE_HEIGHT , VEGETATION_CROWN_TOP_HEIGHT,
+                      VEGETATION_ATTENUATION_FACTOR, VEGETATION_TABLE_NAME))
+    vegetation = pd.DataFrame(cursor.fetchall(),
+                              columns = [GEOM_FIELD, ID_VEGETATION,
+                                         VEGETATION_CROWN_BASE_HEIGHT,
+                                         VEGETATION_CROWN_TOP_HEIGHT,
+                                         VEGETATION_ATTENUATION_FACTOR])
+
+    return explodePolygons(buildings), explodePolygons(vegetation)
+
+
+def explodePolygons(df):
+    """ Convert the geometries of 'df' (WKT or Shapely) to one polygon per row."""
+    geometries = np.asarray(df[GEOM_FIELD].values)
+    if geometries.size and isinstance(geometries[0], str):
+        geometries = shapely.from_wkt(geometries)
+    parts, index = shapely.get_parts(geometries, return_index = True)
+    df = df.iloc[index].copy()
+    df[GEOM_FIELD] = parts
+
+    return df[shapely.area(parts) > 0].reset_index(drop = True)
+
+
+def createsBlocks(buildings, snappingTolerance = GEOMETRY_MERGE_TOLERANCE):
+    """ Merge buildings into blocks and creates the stacked blocks (same as
+    Obstacles.createsBlocks).
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            buildings: pd.DataFrame
+                Building polygons with their height
+            snappingTolerance: float, default GEOMETRY_MERGE_TOLERANCE
+                Distance in meter below which two buildings are merged
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            stackedBlocks: pd.DataFrame
+                Stacked block polygons with their block ID and height"""
+    columns = [ID_FIELD_STACKED_BLOCK, ID_FIELD_BLOCK, HEIGHT_FIELD, GEOM_FIELD]
+    if buildings.empty:
+        return pd.DataFrame(columns = columns)
+    buffered = shapely.buffer(buildings[GEOM_FIELD].values, snappingTolerance,
+                              join_style = "mitre")
+    blocks = shapely.get_parts(shapely.union_all(buffered))
+    blocks = shapely.make_valid(shapely.simplify(shapely.normalize(blocks),
+                                                 GEOMETRY_SIMPLIFICATION_DISTANCE))
+
+    # Building / block relations and building height converted to integer
+    tree = shapely.STRtree(blocks)
+    idBuild, idBlock = tree.query(buildings[GEOM_FIELD].values, predicate = "intersects")
+    correl = pd.DataFrame({ID_FIELD_BLOCK: idBlock,
+                           HEIGHT_FIELD: np.floor(buildings[HEIGHT_FIELD].values[idBuild]
+                                                  .astype(float) + 0.5).astype(int)})
+
+    # One stacked block for each building height of each block
+    stackedBlocks = []
+    for (block, height), _ in correl.groupby([ID_FIELD_BLOCK, HEIGHT_FIELD]):
+        higher = buffered[idBuild[(idBlock == block) & (correl[HEIGHT_FIELD].values >= height)]]
+        stacked = shapely.make_valid(shapely.snap(shapely.simplify(shapely.union_all(higher),
+                                                                   GEOMETRY_SIMPLIFICATION_DISTANCE),
+                                                  blocks[block],
+                                                  snappingTolerance))
+        for part in shapely.get_parts(stacked):
+            if shapely.area(part) > 0:
+                stackedBlocks.append([len(stackedBlocks) + 1, block + 1, height,
+                                      shapely.normalize(shapely.make_valid(part))])
+    stackedBlocks = explodePolygons(pd.DataFrame(stackedBlocks, columns = columns))
+    stackedBlocks[ID_FIELD_STACKED_BLOCK] = np.arange(1, stackedBlocks.index.size + 1)
+
+    return stackedBlocks
+
+
+def obstacleExtent(stackedBlocks, vegetation):
+    """ xmin, ymin, xmax, ymax of the stacked blocks and vegetation."""
+    bounds = shapely.bounds(np.concatenate([stackedBlocks[GEOM_FIELD].values,
+                                            vegetation[GEOM_FIELD].values]))
+
+    return [np.nanmin(bounds[:, 0]), np.nanmin(bounds[:, 1]),
+            np.nanmax(bounds[:, 2]), np.nanmax(bounds[:, 3])]
+
+
+def rotationCenter(stackedBlocks, vegetation):
+    """ Upper right corner of the obstacle extent (center used by Obstacles.windRotation)."""
+    return obstacleExtent(stackedBlocks, vegetation)[2:]
+
+
+def rotateGeometries(geometries, rotateAngle, rotationCenterCoordinates):
+    """ Rotate counter-clockwise 'geometries' of 'rotateAngle' (in degree)
+    around 'rotationCenterCoordinates'."""
+    angle = rotateAngle * np.pi / 180
+    cosA = np.cos(angle)
+    sinA = np.sin(angle)
+    x0, y0 = rotationCenterCoordinates
+
+    def rotate(coords):
+        dx = coords[:, 0] - x0
+        dy = coords[:, 1] - y0
+        return np.column_stack([x0 + dx * cosA - dy * sinA,
+                                y0 + dx * sinA + dy * cosA])
+
+    return shapely.normalize(shapely.transform(np.asarray(geometries), rotate))
+
+
+def identifyBlockBase(stackedBlocks):
+    """ Base height of each stacked block: height of the highest lower stacked
+    block of the same block containing or overlapping it (0 if none)."""
+    geometries = stackedBlocks[GEOM_FIELD].values
+    heights = stackedBlocks[HEIGHT_FIELD].values
+    tree = shapely.STRtree(geometries)
+    a, b = tree.query(geometries, predicate = "intersects")
+    keep = (stackedBlocks[ID_FIELD_BLOCK].values[a] == stackedBlocks[ID_FIELD_BLOCK].values[b])\
+        & (heights[a] > heights[b])
+    a, b = a[keep], b[keep]
+    keep = shapely.contains(geometries[b], geometries[a]) | shapely.overlaps(geometries[b], geometries[a])
+    baseHeight = pd.Series(heights[b[keep]]).groupby(a[keep]).max()
+    stackedBlocks = stackedBlocks.copy()
+    stackedBlocks[BASE_HEIGHT_FIELD] = baseHeight.reindex(np.arange(geometries.size)).fillna(0).values
+
+    return stackedBlocks
+
+
+def facadeSegments(stackedBlocks):
+    """ Split the boundary (shell and holes) of each stacked block into
+    segments and calculate their azimuth (clockwise from North, as ST_AZIMUTH)."""
+    rings, ringIndex = shapely.get_rings(stackedBlocks[GEOM_FIELD].values, return_index = True)
+    coords, coordIndex = shapely.get_coordinates(rings, return_index = True)
+    sameRing = coordIndex[:-1] == coordIndex[1:]
+    start = coords[:-1][sameRing]
+    end = coords[1:][sameRing]
+    dx = end[:, 0] - start[:, 0]
+    dy = end[:, 1] - start[:, 1]
+    nonEmpty = (dx != 0) | (dy != 0)
+    start, end, dx, dy = start[nonEmpty], end[nonEmpty], dx[nonEmpty], dy[nonEmpty]
+    block = ringIndex[coordIndex[:-1][sameRing][nonEmpty]]
+
+    segments = stackedBlocks.iloc[block][[ID_FIELD_STACKED_BLOCK, ID_FIELD_BLOCK,
+                                          HEIGHT_FIELD, BASE_HEIGHT_FIELD]].reset_index(drop = True)
+    segments[UPWIND_FACADE_ANGLE_FIELD] = np.mod(np.arctan2(dx, dy), 2 * np.pi)
+    segments[GEOM_FIELD] = shapely.linestrings(np.stack([start, end], axis = 1))
+
+    return segments
+
+
+def initFacades(stackedBlocks):
+    """ Upwind facades (azimuth lower than pi) and downwind facades (azimuth
+    higher than pi, merged for each stacked block) of the stacked blocks."""
+    segments = facadeSegments(stackedBlocks)
+    upwind = segments[segments[UPWIND_FACADE_ANGLE_FIELD] < np.pi].reset_index(drop = True)
+    upwind[UPWIND_FACADE_FIELD] = np.arange(1, upwind.index.size + 1)
+
+    downwind = []
+    for stacked, seg in segments[segments[UPWIND_FACADE_ANGLE_FIELD] > np.pi]\
+                        .groupby(ID_FIELD_STACKED_BLOCK):
+        merged = shapely.line_merge(shapely.multilinestrings(seg[GEOM_FIELD].values))
+        for line in shapely.get_parts(merged):
+            downwind.append([stacked, line])
+    downwind = pd.DataFrame(downwind, columns = [ID_FIELD_STACKED_BLOCK, GEOM_FIELD])
+    downwind[DOWNWIND_FACADE_FIELD] = np.arange(1, downwind.index.size + 1)
+
+    return upwind, downwind
+
+
+def updateUpwindFacadeBase(upwind):
+    """ Set the base height of the upwind facades shared with a lower stacked
+    block to the base of this lower block (same as Obstacles.updateUpwindFacadeBase)."""
+    geometries = upwind[GEOM_FIELD].values
+    heights = upwind[HEIGHT_FIELD].values
+    tree = shapely.STRtree(geometries)
+    a, b = tree.query(geometries, predicate = "intersects")
+    keep = (upwind[ID_FIELD_BLOCK].values[a] == upwind[ID_FIELD_BLOCK].values[b])\
+        & (heights[a] > heights[b])
+    a, b = a[keep], b[keep]
+    shared = shapely.length(shapely.intersection(shapely.snap(geometries[a], geometries[b],
+                                                              SNAPPING_TOLERANCE),
+                                                 geometries[b])) > 0
+    newBase = pd.Series(upwind[BASE_HEIGHT_FIELD].values[b[shared]]).groupby(a[shared]).min()
+    upwind = upwind.copy()
+    upwind.loc[newBase.index, BASE_HEIGHT_FIELD] = newBase.values
+
+    return upwind
+
+
+def zoneProperties(stackedBlocks):
+    """ Effective width and length of each stacked block and length / height
+    of the Röckle zones (same as CalculatesIndicators.obstacleProperties
+    and CalculatesIndicators.zoneProperties)."""
+    geometries = stackedBlocks[GEOM_FIELD].values
+    bounds = shapely.bounds(geometries)
+    width = bounds[:, 2] - bounds[:, 0]
+    length = bounds[:, 3] - bounds[:, 1]
+    ratio = shapely.area(geometries) / (width * length)
+    W = width * ratio
+    L = length * ratio
+    H = stackedBlocks[HEIGHT_FIELD].values.astype(float)
+
+    props = stackedBlocks.copy()
+    props[EFFECTIVE_WIDTH_FIELD] = W
+    props[EFFECTIVE_LENGTH_FIELD] = L
+    props[DISPLACEMENT_LENGTH_FIELD] = 1.5 * W / (1 + 0.8 * W / H)
+    props[DISPLACEMENT_LENGTH_VORTEX_FIELD] = 0.6 * W / (1 + 0.8 * W / H)
+    props[CAVITY_LENGTH_FIELD] = 1.8 * W / ((L / H) ** 0.3 * (1 + 0.24 * W / H))
+    props[WAKE_LENGTH_FIELD] = 3 * props[CAVITY_LENGTH_FIELD]
+    props[ROOFTOP_PERP_HEIGHT] = 0.22 * (0.67 * np.minimum(H, W) + 0.33 * np.maximum(H, W))
+    props[ROOFTOP_PERP_LENGTH] = 0.9 * (0.67 * np.minimum(H, W) + 0.33 * np.maximum(H, W))
+    props[ROOFTOP_WIND_FACTOR] = 1 + 0.05 * W / H
+    props[STACKED_BLOCK_X_MED] = (bounds[:, 2] + bounds[:, 0]) / 2
+    props[STACKED_BLOCK_WIDTH] = width
+    props[Y_MIN] = bounds[:, 1]
+    props[Y_MAX] = bounds[:, 3]
+
+    return props.set_index(ID_FIELD_STACKED_BLOCK, drop = False)
+
+
+def studyAreaProperties(upwind, stackedBlocks, vegetation):
+    """ Roughness length, displacement height, geometric mean and maximum
+    obstacle heights and frontal density of the study area (same as
+    CalculatesIndicators.studyAreaProperties)."""
+    geometries = np.concatenate([stackedBlocks[GEOM_FIELD].values, vegetation[GEOM_FIELD].values])
+    bounds = shapely.bounds(geometries)
+    extent = shapely.box(np.nanmin(bounds[:, 0]), np.nanmin(bounds[:, 1]),
+                         np.nanmax(bounds[:, 2]), np.nanmax(bounds[:, 3]))
+    area = shapely.area(shapely.buffer(extent, 15))
+
+    # Geometric mean height of blocks and vegetation weighted by their area
+    blockHeights = stackedBlocks.groupby(ID_FIELD_BLOCK)[HEIGHT_FIELD].max()
+    blockAreas = stackedBlocks.groupby(ID_FIELD_BLOCK)[GEOM_FIELD]\
+        .agg(lambda g: shapely.area(shapely.union_all(g.values)))
+    heights = np.concatenate([blockHeights.values.astype(float),
+                              vegetation[VEGETATION_CROWN_TOP_HEIGHT].values.astype(float)])
+    areas = np.concatenate([blockAreas.reindex(blockHeights.index).values.astype(float),
+                            shapely.area(vegetation[GEOM_FIELD].values)])
+    Hr = np.exp((areas * np.log(heights)).sum() / areas.sum())
+    H_ob_max = heights.max()
+
+    # Frontal density
+    upwindBounds = shapely.bounds(upwind[GEOM_FIELD].values)
+    vegBounds = shapely.bounds(vegetation[GEOM_FIELD].values)
+    frontalArea = ((upwindBounds[:, 2] - upwindBounds[:, 0])
+                   * (upwind[HEIGHT_FIELD].values - upwind[BASE_HEIGHT_FIELD].values)).sum()\
+        + ((vegBounds[:, 2] - vegBounds[:, 0])
+           * (vegetation[VEGETATION_CROWN_TOP_HEIGHT].values
+              - vegetation[VEGETATION_CROWN_BASE_HEIGHT].values)).sum()
+    lambda_f = frontalArea / area
+
+    # Roughness properties (Hanna and Britter, 2002)
+    if lambda_f <= 0.15:
+        z0 = lambda_f * Hr
+        if lambda_f <= 0.05:
+            d = 3 * lambda_f * Hr
+        else:
+            d = (0.15 + 5.5 * (lambda_f - 0.05)) * Hr
+    else:
+        lambda_f = min(lambda_f, 1)
+        z0 = 0.15 * Hr
+        d = (0.7 + 0.35 * (lambda_f - 0.15)) * Hr
+
+    return z0, d, Hr, H_ob_max, lambda_f
+
+
+def displacementZones(upwind, props):
+    """ Displacement and displacement vortex zones: upwind half of an ellipse
+    whose axes are the facade and the displacement length (same as Zones.displacementZones)."""
+    facades = upwind.join(props[[DISPLACEMENT_LENGTH_FIELD, DISPLACEMENT_LENGTH_VORTEX_FIELD]],
+                          on = ID_FIELD_STACKED_BLOCK)
+    theta = facades[UPWIND_FACADE_ANGLE_FIELD].values
+    vortex = (theta > (90 - PERPENDICULAR_THRESHOLD_ANGLE) * np.pi / 180)\
+        & (theta < (90 + PERPENDICULAR_THRESHOLD_ANGLE) * np.pi / 180)
+    coords = shapely.get_coordinates(facades[GEOM_FIELD].values).reshape(-1, 2, 2)
+
+    zones = {}
+    for name, lengthField, selection in [(DISPLACEMENT_NAME, DISPLACEMENT_LENGTH_FIELD, True),
+                                         (DISPLACEMENT_VORTEX_NAME, DISPLACEMENT_LENGTH_VORTEX_FIELD, vortex)]:
+        b = facades[lengthField].values * np.sin(theta) ** 2
+        keep = (b > ELLIPSOID_MIN_LENGTH) & selection
+        start, end, b = coords[keep, 0], coords[keep, 1], b[keep]
+        center = (start + end) / 2
+        a = np.hypot(*(end - start).T) / 2
+        direction = np.column_stack([np.sin(theta[keep]), np.cos(theta[keep])])
+        normal = np.column_stack([-direction[:, 1], direction[:, 0]])
+        # Half ellipse on the left side of the facade (out of the building)
+        t = np.linspace(0, np.pi, NPOINTS_ELLIPSE // 2 + 1)
+        ellipse = center[:, np.newaxis, :]\
+            + (a[:, np.newaxis] * np.cos(t))[:, :, np.newaxis] * direction[:, np.newaxis, :]\
+            + (b[:, np.newaxis] * np.sin(t))[:, :, np.newaxis] * normal[:, np.newaxis, :]
+        zone = facades.loc[keep, [UPWIND_FACADE_FIELD, ID_FIELD_STACKED_BLOCK,
+                                  HEIGHT_FIELD, UPWIND_FACADE_ANGLE_FIELD]].reset_index(drop = True)
+        zone[GEOM_FIELD] = shapely.polygons(np.concatenate([ellipse, ellipse[:, :1]], axis = 1))\
+            if keep.any() else np.array([], dtype = object)
+        zones[name] = zone
+
+    return zones[DISPLACEMENT_NAME], zones[DISPLACEMENT_VORTEX_NAME]
+
+
+def cavityAndWakeZones(downwind, props):
+    """ Cavity and wake zones: downwind facade shifted downstream of an ellipse
+    whose length is the cavity (or wake) length (same as Zones.cavityAndWakeZones)."""
+    facades = downwind.join(props[[HEIGHT_FIELD, CAVITY_LENGTH_FIELD, WAKE_LENGTH_FIELD,
+                                   STACKED_BLOCK_X_MED, STACKED_BLOCK_WIDTH]],
+                            on = ID_FIELD_STACKED_BLOCK)
+    zones = {CAVITY_NAME: [], WAKE_NAME: []}
+    for row in facades.itertuples(index = False):
+        points = densifySegments(getattr(row, GEOM_FIELD))
+        halfWidth = getattr(row, STACKED_BLOCK_WIDTH) / 2
+        relX = (points[:, 0] - getattr(row, STACKED_BLOCK_X_MED)) / halfWidth
+        inside = np.abs(relX) < 1
+        for name, lengthField in [(CAVITY_NAME, CAVITY_LENGTH_FIELD), (WAKE_NAME, WAKE_LENGTH_FIELD)]:
+            shifted = points.copy()
+            shifted[inside, 1] -= getattr(row, lengthField) * np.sqrt(1 - relX[inside] ** 2)
+            ring = np.round(np.concatenate([points, shifted[::-1], points[:1]]), 2)
+            polygon = shapely.make_valid(shapely.polygons(ring))
+            if shapely.area(polygon) > 0:
+                zones[name].append([getattr(row, DOWNWIND_FACADE_FIELD), getattr(row, ID_FIELD_STACKED_BLOCK),
+                                    getattr(row, HEIGHT_FIELD), getattr(row, STACKED_BLOCK_X_MED),
+                                    getattr(row, STACKED_BLOCK_WIDTH), polygon])
+    columns = [DOWNWIND_FACADE_FIELD, ID_FIELD_STACKED_BLOCK, HEIGHT_FIELD,
+               STACKED_BLOCK_X_MED, STACKED_BLOCK_WIDTH, GEOM_FIELD]
+
+    return pd.DataFrame(zones[CAVITY_NAME], columns = columns),\
+        pd.DataFrame(zones[WAKE_NAME], columns = columns)
+
+
+def densifySegments(line, nPoints = CAV_N_WAKE_FACADE_NPOINTS):
+    """ Points of each segment of 'line' densified as
+    ST_DENSIFY(segment, ST_LENGTH(segment) / nPoints) does (the JTS
+    densifier cuts a segment in int(length / tolerance) + 1 parts, thus
+    usually nPoints + 1)."""
+    coords = shapely.get_coordinates(line)
+    points = []
+    for p0, p1 in zip(coords[:-1], coords[1:]):
+        dx, dy = p1 - p0
+        tolerance = math.sqrt(dx * dx + dy * dy) / nPoints
+        length = math.hypot(dx, dy)
+        n = int(length / tolerance) + 1 if length > tolerance else 1
+        fraction = [0.] + [j * (length / n) / length for j in range(1, n)] + [1.]
+        points.append(p0 + np.array(fraction)[:, np.newaxis] * (p1 - p0))
+
+    return np.concatenate(points)
+
+
+def streetCanyonZones(upwind, cavity, downwind, props):
+    """ Street canyon zones: part of the upwind facades located in an upstream
+    cavity zone extended upstream until the downwind facade of the upstream
+    block (same as Zones.streetCanyonZones)."""
+    columns = [ID_FIELD_CANYON, ID_UPSTREAM_STACKED_BLOCK, ID_DOWNSTREAM_STACKED_BLOCK,
+               DOWNSTREAM_HEIGHT_FIELD, UPSTREAM_HEIGHT_FIELD, UPWIND_FACADE_ANGLE_FIELD,
+               BASE_HEIGHT_FIELD, UPWIND_FACADE_FIELD, DOWNWIND_FACADE_FIELD, GEOM_FIELD]
+    theta = upwind[UPWIND_FACADE_ANGLE_FIELD].values
+    facades = upwind[(theta >= STREET_CANYON_ANGLE_THRESH * np.pi / 180)
+                     & (theta <= (180 - STREET_CANYON_ANGLE_THRESH) * np.pi / 180)].reset_index(drop = True)
+    if facades.empty or cavity.empty:
+        return pd.DataFrame(columns = columns)
+    tree = shapely.STRtree(cavity[GEOM_FIELD].values)
+    a, b = tree.query(facades[GEOM_FIELD].values, predicate = "intersects")
+    downwindLines = downwind.set_index(DOWNWIND_FACADE_FIELD)[GEOM_FIELD]
+
+    canyons = []
+    for ia, ib in zip(a, b):
+        facade = facades.iloc[ia]
+        zone = cavity.iloc[ib]
+        line = shapely.intersection(facade[GEOM_FIELD], zone[GEOM_FIELD])
+        line = shapely.get_parts(line)
+        line = line[shapely.get_type_id(line) == 1]
+        # As ST_STARTPOINT, only single lines are used
+        if line.size != 1:
+            continue
+        upstream = props.loc[zone[ID_FIELD_STACKED_BLOCK]]
+        dy = upstream[Y_MAX] - upstream[Y_MIN] + upstream[CAVITY_LENGTH_FIELD]
+        coords = shapely.get_coordinates(line[0])
+        ring = np.concatenate([coords[:1], coords[:1] + [0, dy], coords[-1:] + [0, dy], coords[::-1]])
+        polygon = shapely.polygons(ring)
+        # Keep the piece adjacent to the downstream facade (no zone when the
+        # upstream downwind facade does not split the polygon, as ST_SPLIT)
+        splitter = shapely.snap(downwindLines.loc[zone[DOWNWIND_FACADE_FIELD]], polygon, 0.01)
+        pieces = shapely.get_parts(shapely.ops.split(polygon, splitter))
+        pieces = pieces[shapely.area(pieces) > 0]
+        if pieces.size < 2:
+            continue
+        piece = pieces[np.argmin(shapely.distance(pieces, shapely.line_interpolate_point(line[0], 0.5,
+                                                                                        normalized = True)))]
+        canyons.append([len(canyons) + 1, zone[ID_FIELD_STACKED_BLOCK], facade[ID_FIELD_STACKED_BLOCK],
+                        facade[HEIGHT_FIELD], zone[HEIGHT_FIELD], facade[UPWIND_FACADE_ANGLE_FIELD],
+                        facade[BASE_HEIGHT_FIELD], facade[UPWIND_FACADE_FIELD],
+                        zone[DOWNWIND_FACADE_FIELD], piece])
+
+    return pd.DataFrame(canyons, columns = columns)
+
+
+def rooftopZones(upwind, props):
+    """ Rooftop perpendicular zones: facade translated downstream of the
+    recirculation length intersected with the stacked block (same as
+    Zones.rooftopZones, see rooftopCornerZones for the corner zones)."""
+    theta = upwind[UPWIND_FACADE_ANGLE_FIELD].values
+    facades = upwind[(theta > (90 - PERPENDICULAR_THRESHOLD_ANGLE) * np.pi / 180)
+                     & (theta < (90 + PERPENDICULAR_THRESHOLD_ANGLE) * np.pi / 180)]\
+        .join(props[[ROOFTOP_PERP_LENGTH, ROOFTOP_PERP_HEIGHT]], on = ID_FIELD_STACKED_BLOCK)\
+        .reset_index(drop = True)
+    coords = shapely.get_coordinates(facades[GEOM_FIELD].values).reshape(-1, 2, 2)
+    shift = np.column_stack([np.zeros(facades.index.size), -facades[ROOFTOP_PERP_LENGTH].values])
+    ring = np.stack([coords[:, 0], coords[:, 0] + shift, coords[:, 1] + shift,
+                     coords[:, 1], coords[:, 0]], axis = 1)
+    zones = facades[[ID_FIELD_STACKED_BLOCK, UPWIND_FACADE_FIELD, HEIGHT_FIELD,
+                     ROOFTOP_PERP_LENGTH, ROOFTOP_PERP_HEIGHT]].copy()
+    if zones.empty:
+        zones[GEOM_FIELD] = np.array([], dtype = object)
+        return zones
+    zones[GEOM_FIELD] = shapely.intersection(shapely.polygons(ring),
+                                             props.loc[facades[ID_FIELD_STACKED_BLOCK], GEOM_FIELD].values)
+
+    return zones[~shapely.is_empty(zones[GEOM_FIELD].values)].reset_index(drop = True)
+
+
+def rooftopCornerZones(upwind, props):
+    """ Rooftop corner zones: triangle at the upstream corner of the facades
+    oblique to the wind, whose length along the facade is the corner length
+    Lc (Bagal et al. 2004), intersected with the stacked block (same as
+    Zones.rooftopZones).
+
+    The corner of the zone (used for the height of the zone in
+    affectsPointToBuildZone) is the first vertex of the triangle: the end of
+    the facade if its angle is lower than pi/2, its start otherwise."""
+    theta = upwind[UPWIND_FACADE_ANGLE_FIELD].values
+    facades = upwind[((theta > (90 - CORNER_THRESHOLD_ANGLE[1]) * np.pi / 180)
+                      & (theta < (90 - CORNER_THRESHOLD_ANGLE[0]) * np.pi / 180))
+                     | ((theta > (90 + CORNER_THRESHOLD_ANGLE[0]) * np.pi / 180)
+                        & (theta < (90 + CORNER_THRESHOLD_ANGLE[1]) * np.pi / 180))]\
+        .join(props[[ROOFTOP_WIND_FACTOR]], on = ID_FIELD_STACKED_BLOCK)\
+        .reset_index(drop = True)
+    columns = [ID_FIELD_STACKED_BLOCK, UPWIND_FACADE_FIELD, HEIGHT_FIELD, ROOFTOP_CORNER_LENGTH,
+               ROOFTOP_CORNER_FACADE_LENGTH, UPWIND_FACADE_ANGLE_FIELD, ROOFTOP_WIND_FACTOR,
+               X, Y, GEOM_FIELD]
+    if facades.empty:
+        return pd.DataFrame(columns = columns)
+    theta = facades[UPWIND_FACADE_ANGLE_FIELD].values
+    coords = shapely.get_coordinates(facades[GEOM_FIELD].values).reshape(-1, 2, 2)
+    start, end = coords[:, 0], coords[:, 1]
+    facadeLength = shapely.length(facades[GEOM_FIELD].values)
+    Lc = 2 * facadeLength * np.tan(2.94 * np.exp(0.0297 * np.abs(np.pi / 2 - theta)))
+    shift = Lc[:, np.newaxis] * np.column_stack([-np.cos(theta), np.sin(theta)])
+    beforePerp = (theta < np.pi / 2)[:, np.newaxis, np.newaxis]
+    ring = np.where(beforePerp,
+                    np.stack([end, start + shift, start, end], axis = 1),
+                    np.stack([start, end, end + shift, start], axis = 1))
+
+    zones = facades[[ID_FIELD_STACKED_BLOCK, UPWIND_FACADE_FIELD, HEIGHT_FIELD]].copy()
+    zones[ROOFTOP_CORNER_LENGTH] = np.abs(Lc)
+    zones[ROOFTOP_CORNER_FACADE_LENGTH] = facadeLength
+    zones[UPWIND_FACADE_ANGLE_FIELD] = theta
+    zones[ROOFTOP_WIND_FACTOR] = facades[ROOFTOP_WIND_FACTOR].values
+    zones[X] = ring[:, 0, 0]
+    zones[Y] = ring[:, 0, 1]
+    zones[GEOM_FIELD] = shapely.intersection(shapely.polygons(ring),
+                                             props.loc[facades[ID_FIELD_STACKED_BLOCK], GEOM_FIELD].values)
+
+    return zones[~shapely.is_empty(zones[GEOM_FIELD].values)].reset_index(drop = True)
+
+
+def vegetationZones(vegetation, wake):
+    """ Built-up vegetation zones (vegetation within building wake zones) and
+    open vegetation zones (same as Zones.vegetationZones)."""
+    columns = [ID_VEGETATION, VEGETATION_CROWN_BASE_HEIGHT, VEGETATION_CROWN_TOP_HEIGHT,
+               VEGETATION_ATTENUATION_FACTOR]
+    if wake.empty or vegetation.empty:
+        return pd.DataFrame(columns = columns + [GEOM_FIELD]), vegetation.copy()
+    tree = shapely.STRtree(wake[GEOM_FIELD].values)
+    a, b = tree.query(vegetation[GEOM_FIELD].values, predicate = "intersects")
+    pieces = vegetation.iloc[a][columns].reset_index(drop = True)
+    pieces[GEOM_FIELD] = shapely.intersection(vegetation[GEOM_FIELD].values[a],
+                                              wake[GEOM_FIELD].values[b])
+    built = pieces.groupby(columns, as_index = False)[GEOM_FIELD]\
+        .agg(lambda g: shapely.union_all(g.values))
+
+    # As in H2GIS, the difference is calculated with each wake intersection separately
+    openZones = vegetation.iloc[np.setdiff1d(np.arange(vegetation.index.size), a)][columns + [GEOM_FIELD]]
+    openParts = pieces.copy()
+    openParts[GEOM_FIELD] = shapely.difference(vegetation[GEOM_FIELD].values[a], pieces[GEOM_FIELD].values)
+    openZones = pd.concat([openZones, openParts], ignore_index = True)
+
+    return explodePolygons(built), explodePolygons(openZones[~shapely.is_empty(openZones[GEOM_FIELD].values)])
+
+
+def impactingVegetationZones(dicOfVegZones, stackedBlocks, vegetation, impactedZone,
+                             crossWindExtend = CROSS_WIND_ZONE_EXTEND):
+    """ Vegetation zones of the vegetation patches potentially impacting the
+    (rotated) output raster extent 'impactedZone' (same as
+    Zones.identifyImpactingStackedBlocks).
+
+    The stacked blocks are all kept: in H2GIS the blocks impacting the
+    impacted zone are right joined to all the stacked blocks. Only the
+    vegetation patches out of the envelope of the stacked blocks and of the
+    impacted zone, extended of 'crossWindExtend' in the cross-wind
+    direction, are removed."""
+    bounds = shapely.bounds(np.append(stackedBlocks[GEOM_FIELD].values, impactedZone))
+    crossWindBox = shapely.box(np.nanmin(bounds[:, 0]) - crossWindExtend, np.nanmin(bounds[:, 1]),
+                               np.nanmax(bounds[:, 2]) + crossWindExtend, np.nanmax(bounds[:, 3]))
+    impacting = vegetation.loc[shapely.intersects(vegetation[GEOM_FIELD].values, crossWindBox),
+                               ID_VEGETATION]
+
+    return {t: zones[zones[ID_VEGETATION].isin(impacting)].reset_index(drop = True)
+            for t, zones in dicOfVegZones.items()}
+
+
+def createGrid(zones, meshSize = MESH_SIZE,
+               alongWindZoneExtend = ALONG_WIND_ZONE_EXTEND,
+               crossWindZoneExtend = CROSS_WIND_ZONE_EXTEND):
+    """ Cell center coordinates of the grid covering the extended envelope
+    of the zones (same as ST_MAKEGRIDPOINTS in InitWindField.createGrid).
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            x: 1D array
+                x coordinate of the grid columns
+            y: 1D array
+                y coordinate of the grid rows
+            envelope: list
+                xmin, ymin, xmax, ymax of the extended envelope"""
+    geometries = np.concatenate([z[GEOM_FIELD].values for z in zones])
+    bounds = shapely.bounds(geometries)
+    envelope = [np.nanmin(bounds[:, 0]) - crossWindZoneExtend,
+                np.nanmin(bounds[:, 1]) - alongWindZoneExtend,
+                np.nanmax(bounds[:, 2]) + crossWindZoneExtend,
+                np.nanmax(bounds[:, 3]) + alongWindZoneExtend]
+    nx = int(math.ceil((envelope[2] - envelope[0]) / meshSize))
+    ny = int(math.ceil((envelope[3] - envelope[1]) / meshSize))
+    x = envelope[0] + (np.arange(nx) + 0.5) * meshSize
+    y = envelope[1] + (np.arange(ny) + 0.5) * meshSize
+
+    return x, y, envelope
+
+
+def createGridTable(cursor, x, y, meshSize, srid, prefix = PREFIX_NAME):
+    """ Creates in H2GIS the grid point table (as InitWindField.createGrid)
+    corresponding to the grid coordinates 'x' and 'y' (used to save outputs)."""
+    gridTable = DataUtil.prefix("GRID", prefix = prefix)
+    # The envelope is reduced of half a cell to get exactly the same number of cells
+    cursor.execute("""
+        DROP TABLE IF EXISTS {0};
+        CREATE TABLE {0}
+            AS SELECT   ST_SETSRID({1}, {2}) AS {1},
+                        ID AS {3},
+                        ID_COL AS {4},
+                        ID_ROW AS {5},
+                        ST_Y({1}) AS {6}
+            FROM ST_MAKEGRIDPOINTS(ST_MAKEENVELOPE({7}, {8}, {9}, {10}, {2}), {11}, {11})
+        """.format(gridTable                   , GEOM_FIELD,
+                   srid                        , ID_POINT,
+                   ID_POINT_X                  , ID_POINT_Y,
+                   Y_POINT                     , x[0] - meshSize / 2,
+                   y[0] - meshSize / 2         , x[-1],
+                   y[-1]                       , meshSize))
+
+    return gridTable
+
+
+def zonePoints(geometries, x, y):
+    """ Grid points (column and row indices) intersecting each zone.
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            points: pd.DataFrame
+                Index of the zone, column (ID_X) and row (ID_Y) of each point"""
+    shapely.prepare(geometries)
+    bounds = shapely.bounds(geometries)
+    iMin = np.searchsorted(x, bounds[:, 0], side = "left")
+    iMax = np.searchsorted(x, bounds[:, 2], side = "right")
+    jMin = np.searchsorted(y, bounds[:, 1], side = "left")
+    jMax = np.searchsorted(y, bounds[:, 3], side = "right")
+    zoneIndex, listI, listJ = [], [], []
+    for n, geometry in enumerate(geometries):
+        if iMax[n] <= iMin[n] or jMax[n] <= jMin[n]:
+            continue
+        i, j = np.meshgrid(np.arange(iMin[n], iMax[n]), np.arange(jMin[n], jMax[n]), indexing = "ij")
+        inside = shapely.intersects_xy(geometry, x[i], y[j])
+        zoneIndex.append(np.full(inside.sum(), n))
+        listI.append(i[inside])
+        listJ.append(j[inside])
+    if not zoneIndex:
+        return pd.DataFrame({ZONE_INDEX: [], ID_POINT_X: [], ID_POINT_Y: []}, dtype = int)
+
+    return pd.DataFrame({ZONE_INDEX: np.concatenate(zoneIndex),
+                         ID_POINT_X: np.concatenate(listI),
+                         ID_POINT_Y: np.concatenate(listJ)})
+
+
+def columnLimits(geometries, x):
+    """ Intersection of the vertical line of each grid column with each zone.
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            limits: pd.DataFrame
+                Index of the zone, column (ID_X), minimum and maximum y and
+                length of the intersection"""
+    bounds = shapely.bounds(geometries)
+    iMin = np.searchsorted(x, bounds[:, 0], side = "left")
+    iMax = np.searchsorted(x, bounds[:, 2], side = "right")
+    counts = np.maximum(iMax - iMin, 0)
+    zoneIndex = np.repeat(np.arange(geometries.size), counts)
+    i = np.repeat(iMin - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    lines = shapely.linestrings(np.stack([np.column_stack([x[i], bounds[zoneIndex, 1] - 1]),
+                                          np.column_stack([x[i], bounds[zoneIndex, 3] + 1])], axis = 1))\
+        if i.size else np.array([], dtype = object)
+    intersections = shapely.intersection(lines, geometries[zoneIndex])
+    length = shapely.length(intersections)
+    interBounds = shapely.bounds(intersections)
+    keep = length > 0
+
+    return pd.DataFrame({ZONE_INDEX: zoneIndex[keep], ID_POINT_X: i[keep],
+                         Y_MIN: interBounds[keep, 1], Y_MAX: interBounds[keep, 3],
+                         LENGTH_ZONE_FIELD: length[keep]})
+
+
+def zoneGridPoints(zones, x, y, fields):
+    """ Grid points of each zone joined to the limits of the zone along their
+    column and to the zone 'fields'."""
+    geometries = zones[GEOM_FIELD].values
+    if geometries.size == 0:
+        points = pd.DataFrame(columns = [ZONE_INDEX, ID_POINT_X, ID_POINT_Y, Y_MIN, Y_MAX,
+                                         LENGTH_ZONE_FIELD, Y_POINT] + fields)
+        return points.astype({ZONE_INDEX: int, ID_POINT_X: int, ID_POINT_Y: int})
+    points = zonePoints(geometries, x, y).merge(columnLimits(geometries, x),
+                                                on = [ZONE_INDEX, ID_POINT_X])
+    points[Y_POINT] = y[points[ID_POINT_Y].values]
+    for f in fields:
+        points[f] = zones[f].values[points[ZONE_INDEX].values]
+
+    return points
+
+
+def affectsPointToBuildZone(dicOfBuildZones, x, y):
+    """ Grid points of each building Röckle zone with the variables needed for
+    the 3D wind factors (same as InitWindField.affectsPointToBuildZone).
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            dicOfBuildZones: dictionary of pd.DataFrame
+                Zones of each building Röckle zone type
+            x: 1D array
+                x coordinate of the grid columns
+            y: 1D array
+                y coordinate of the grid rows
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            dicOfBuildZoneGridPoint: dictionary of pd.DataFrame
+                Grid points of each building Röckle zone type"""
+    dicOfPoints = {}
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        for name, coef in [(DISPLACEMENT_NAME, 0.6), (DISPLACEMENT_VORTEX_NAME, 0.5)]:
+            p = zoneGridPoints(dicOfBuildZones[name], x, y,
+                               [UPWIND_FACADE_FIELD, ID_FIELD_STACKED_BLOCK, HEIGHT_FIELD])
+            p[Y_WALL] = p[Y_MIN]
+            p[POINT_RELATIVE_POSITION_FIELD] = (p[Y_POINT] - p[Y_WALL]) / p[LENGTH_ZONE_FIELD]
+            p[UPPER_VERTICAL_THRESHOLD] = coef * p[HEIGHT_FIELD]\
+                * np.sqrt(1 - p[POINT_RELATIVE_POSITION_FIELD] ** 2)
+            dicOfPoints[name] = p
+
+        fields = [DOWNWIND_FACADE_FIELD, ID_FIELD_STACKED_BLOCK, HEIGHT_FIELD,
+                  STACKED_BLOCK_X_MED, STACKED_BLOCK_WIDTH]
+        for name in [CAVITY_NAME, WAKE_NAME]:
+            p = zoneGridPoints(dicOfBuildZones[name], x, y, fields)
+            p[Y_WALL] = p[Y_MAX]
+            p[LENGTH_ZONE_FIELD] = p[Y_MAX] - p[Y_MIN]
+            p[DISTANCE_BUILD_TO_POINT_FIELD] = p[Y_WALL] - p[Y_POINT]
+            p[UPPER_VERTICAL_THRESHOLD] = p[HEIGHT_FIELD]\
+                * np.sqrt(1 - (p[DISTANCE_BUILD_TO_POINT_FIELD] / p[LENGTH_ZONE_FIELD]) ** 2)
+            dicOfPoints[name] = p
+        cavityLength = dicOfPoints[CAVITY_NAME]\
+            .groupby([DOWNWIND_FACADE_FIELD, ID_POINT_X])[LENGTH_ZONE_FIELD].first()
+
+        p = dicOfPoints[CAVITY_NAME]
+        halfWidth = p[STACKED_BLOCK_WIDTH] / 2
+        p[POINT_RELATIVE_POSITION_FIELD] = p[DISTANCE_BUILD_TO_POINT_FIELD] / p[LENGTH_ZONE_FIELD]
+        p[DOWNSTREAM_X_RELATIVE_POSITION] = np.sqrt((halfWidth - np.abs(x[p[ID_POINT_X].values]
+                                                                        - p[STACKED_BLOCK_X_MED]))
+                                                    / halfWidth)
+
+        p = dicOfPoints[WAKE_NAME]
+        D0c = cavityLength.reindex(pd.MultiIndex.from_arrays([p[DOWNWIND_FACADE_FIELD], p[ID_POINT_X]])).values
+        DY = p[DISTANCE_BUILD_TO_POINT_FIELD].values
+        p[WAKE_RELATIVE_POSITION_FIELD] = np.where(DY > 0, (D0c / DY) ** 1.5, 0)
+        p.loc[(DY > 0) & np.isnan(D0c), WAKE_RELATIVE_POSITION_FIELD] = np.nan
+        p[UPPER_VERTICAL_THRESHOLD + CAVITY_NAME[0]] = np.where(DY <= D0c,
+                                                                p[HEIGHT_FIELD] * np.sqrt(1 - (DY / D0c) ** 2),
+                                                                0)
+
+        p = zoneGridPoints(dicOfBuildZones[STREET_CANYON_NAME], x, y,
+                           [ID_FIELD_CANYON, ID_UPSTREAM_STACKED_BLOCK, UPSTREAM_HEIGHT_FIELD,
+                            DOWNSTREAM_HEIGHT_FIELD, UPWIND_FACADE_ANGLE_FIELD, BASE_HEIGHT_FIELD,
+                            UPWIND_FACADE_FIELD, DOWNWIND_FACADE_FIELD])
+        p[MAX_CANYON_HEIGHT_FIELD] = np.minimum(p[UPSTREAM_HEIGHT_FIELD], p[DOWNSTREAM_HEIGHT_FIELD])
+        p[HEIGHT_FIELD] = p[UPSTREAM_HEIGHT_FIELD]
+        p[Y_WALL] = p[Y_MAX]
+        D0 = p[Y_MAX] - p[Y_MIN]
+        d = p[Y_WALL] - p[Y_POINT]
+        theta = p[UPWIND_FACADE_ANGLE_FIELD] - np.pi / 2
+        p[U] = np.sin(2 * theta) * (0.5 + d * (D0 - d) / (0.5 * D0 ** 2))
+        p[V] = 1 - np.cos(theta) ** 2 * (1 + d * (D0 - d) / (0.5 * D0) ** 2)
+        p[W] = -np.abs(0.5 * (1 - d / (0.5 * D0))) * (1 - (D0 - d) / (0.5 * D0))
+        Lr_D0 = cavityLength.reindex(pd.MultiIndex.from_arrays([p[DOWNWIND_FACADE_FIELD],
+                                                                p[ID_POINT_X]])).values
+        p[UPPER_VERTICAL_THRESHOLD] = p[UPSTREAM_HEIGHT_FIELD] * np.sqrt(1 - (d / Lr_D0) ** 2)
+        dicOfPoints[STREET_CANYON_NAME] = p
+
+        p = zoneGridPoints(dicOfBuildZones[ROOFTOP_PERP_NAME], x, y,
+                           [ID_FIELD_STACKED_BLOCK, UPWIND_FACADE_FIELD, HEIGHT_FIELD,
+                            ROOFTOP_PERP_LENGTH, ROOFTOP_PERP_HEIGHT])
+        p[Y_WALL] = p[Y_MAX]
+        p[ROOFTOP_PERP_VAR_HEIGHT] = p[ROOFTOP_PERP_HEIGHT]\
+            * np.sqrt(1 - (((p[Y_WALL] - p[Y_POINT]) - p[ROOFTOP_PERP_LENGTH] / 2) / p[ROOFTOP_PERP_LENGTH]) ** 2)
+        dicOfPoints[ROOFTOP_PERP_NAME] = p
+
+        # The height of the corner zones depends on the distance to the corner
+        # along the facade direction (azimuths calculated as ST_AZIMUTH)
+        corner = dicOfBuildZones[ROOFTOP_CORN_NAME]
+        fields = [ID_FIELD_STACKED_BLOCK, UPWIND_FACADE_FIELD, HEIGHT_FIELD, ROOFTOP_CORNER_LENGTH,
+                  ROOFTOP_CORNER_FACADE_LENGTH, UPWIND_FACADE_ANGLE_FIELD, ROOFTOP_WIND_FACTOR]
+        p = zonePoints(corner[GEOM_FIELD].values, x, y)
+        for f in fields:
+            p[f] = corner[f].values[p[ZONE_INDEX].values]
+        cornerX = corner[X].values.astype(float)[p[ZONE_INDEX].values]
+        cornerY = corner[Y].values.astype(float)[p[ZONE_INDEX].values]
+        dx = cornerX - x[p[ID_POINT_X].values]
+        dy = cornerY - y[p[ID_POINT_Y].values]
+        theta = p[UPWIND_FACADE_ANGLE_FIELD].values
+        angle = np.where(theta < np.pi / 2,
+                         theta - np.mod(np.arctan2(dx, dy), 2 * np.pi),
+                         np.mod(np.arctan2(-dx, -dy), 2 * np.pi) - theta)
+        p[ROOFTOP_CORNER_VAR_HEIGHT] = np.hypot(dx, dy) / np.cos(angle)\
+            / p[ROOFTOP_CORNER_FACADE_LENGTH] * p[ROOFTOP_CORNER_LENGTH]
+        p[Y_WALL] = cornerY
+        dicOfPoints[ROOFTOP_CORN_NAME] = p
+
+    return dicOfPoints
+
+
+def removeBuildZonePoints(dicOfInitBuildZoneGridPoint):
+    """ Remove the cavity (and corresponding wake and street canyon) points of
+    the zones contained in an upstream cavity zone, the overlapping cavity
+    points of the upstream zones and the rooftop points downstream of a high
+    street canyon (same as InitWindField.removeBuildZonePoints)."""
+    dicOfPoints = dict(dicOfInitBuildZoneGridPoint)
+    cavity = dicOfPoints[CAVITY_NAME]
+
+    # Cavity points of each stacked block being the upstreamest of their column...
+    firstY = cavity.groupby([ID_POINT_X, ID_FIELD_STACKED_BLOCK], as_index = False)[ID_POINT_Y].max()
+    firstPoint = firstY.merge(cavity[[ID_POINT_X, ID_POINT_Y, ID_FIELD_STACKED_BLOCK,
+                                      UPPER_VERTICAL_THRESHOLD, Y_WALL]],
+                              on = [ID_POINT_X, ID_POINT_Y, ID_FIELD_STACKED_BLOCK])
+    # ...contained in the cavity zone of an other stacked block
+    relations = firstPoint.merge(cavity[[ID_POINT_X, ID_POINT_Y, ID_FIELD_STACKED_BLOCK,
+                                         UPPER_VERTICAL_THRESHOLD, Y_WALL]],
+                                 on = [ID_POINT_X, ID_POINT_Y], suffixes = ("_DOWN", "_UP"))
+    relations = relations[(relations[UPPER_VERTICAL_THRESHOLD + "_DOWN"] < relations[UPPER_VERTICAL_THRESHOLD + "_UP"])
+                          & (relations[Y_WALL + "_UP"] > relations[Y_WALL + "_DOWN"]
+                             + max(GEOMETRY_MERGE_TOLERANCE, SNAPPING_TOLERANCE,
+                                   GEOMETRY_SIMPLIFICATION_DISTANCE))]
+    relations = relations.rename(columns = {ID_FIELD_STACKED_BLOCK + "_UP": "UP",
+                                            ID_FIELD_STACKED_BLOCK + "_DOWN": "DOWN"})
+    relations = relations[[ID_POINT_X, "UP", "DOWN"]].drop_duplicates()
+
+    # Zones containing no other zone
+    noContained = firstPoint[[ID_POINT_X, ID_FIELD_STACKED_BLOCK]].drop_duplicates()\
+        .rename(columns = {ID_FIELD_STACKED_BLOCK: "UP"})\
+        .merge(relations[[ID_POINT_X, "UP"]].drop_duplicates(), how = "left", indicator = True)
+    noContained = noContained[noContained["_merge"] == "left_only"][[ID_POINT_X, "UP"]]
+    noContained["DOWN"] = np.nan
+    relationsAll = pd.concat([noContained, relations], ignore_index = True)
+    # Zones contained in an upstream zone and containing an other zone
+    upAndDown = relations[relations["DOWN"].isin(relations["UP"])][[ID_POINT_X, "DOWN"]]\
+        .drop_duplicates().rename(columns = {"DOWN": "UP"})
+    withoutUpAndDown = relationsAll.merge(upAndDown, how = "left", indicator = True)
+    withoutUpAndDown = withoutUpAndDown[withoutUpAndDown["_merge"] == "left_only"].drop(columns = "_merge")
+    withoutDown = withoutUpAndDown[[ID_POINT_X, "UP"]]\
+        .merge(withoutUpAndDown[[ID_POINT_X, "DOWN"]].dropna().rename(columns = {"DOWN": "UP"})
+               .drop_duplicates(), how = "left", indicator = True)
+    withoutDown = withoutDown[withoutDown["_merge"] == "left_only"][[ID_POINT_X, "UP"]].drop_duplicates()
+
+    # Remove the zones covered by an other zone
+    for name, field in [(STREET_CANYON_NAME, ID_UPSTREAM_STACKED_BLOCK),
+                        (WAKE_NAME, ID_FIELD_STACKED_BLOCK),
+                        (CAVITY_NAME, ID_FIELD_STACKED_BLOCK)]:
+        dicOfPoints[name] = dicOfPoints[name].merge(withoutDown.rename(columns = {"UP": field}),
+                                                    on = [ID_POINT_X, field])
+
+    # Keep only the more downstream cavity zone for each point
+    cavity = dicOfPoints[CAVITY_NAME]
+    minYwall = cavity.groupby([ID_POINT_X, ID_POINT_Y])[Y_WALL].transform("min")
+    dicOfPoints[CAVITY_NAME] = cavity[cavity[Y_WALL] == minYwall]
+
+    # Remove the rooftop points downstream of a street canyon as high as the building
+    canyon = dicOfPoints[STREET_CANYON_NAME]
+    for name in [ROOFTOP_PERP_NAME, ROOFTOP_CORN_NAME]:
+        rooftop = dicOfPoints[name]
+        toRemove = rooftop.merge(canyon[[UPWIND_FACADE_FIELD, ID_POINT_X, MAX_CANYON_HEIGHT_FIELD]],
+                                 on = [UPWIND_FACADE_FIELD, ID_POINT_X])
+        toRemove = toRemove[toRemove[HEIGHT_FIELD] <= toRemove[MAX_CANYON_HEIGHT_FIELD]]
+        dicOfPoints[name] = removePoints(rooftop, toRemove, [UPWIND_FACADE_FIELD, ID_POINT_X])
+
+    return dicOfPoints
+
+
+def removePoints(points, toRemove, fields):
+    """ Points whose 'fields' values are not found in 'toRemove'."""
+    remove = pd.MultiIndex.from_frame(points[fields])\
+        .isin(pd.MultiIndex.from_frame(toRemove[fields]))
+
+    return points[~remove]
+
+
+def manageBackwardZones(dicOfBuildZoneGridPoint, dicOfInitBuildZoneGridPoint, streetCanyonZones,
+                        ny, meshSize = MESH_SIZE, dz = DZ):
+    """ Backward cavity and wake zones of the stacked blocks whose upwind
+    facade is (vertically) entirely within the cavity zone of a taller
+    upstream stacked block, and removal of the street canyon and rooftop
+    points they replace (same as InitWindField.manageBackwardZones).
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            dicOfBuildZoneGridPoint: dictionary of pd.DataFrame
+                Grid points of each building Röckle zone (removeBuildZonePoints)
+            dicOfInitBuildZoneGridPoint: dictionary of pd.DataFrame
+                Grid points of each building Röckle zone before any point
+                removal (affectsPointToBuildZone)
+            streetCanyonZones: pd.DataFrame
+                Street canyon zones (streetCanyonZones)
+            ny: int
+                Number of grid rows
+            meshSize: float, default MESH_SIZE
+                Resolution (in meter) of the grid
+            dz: float, default DZ
+                Resolution (in meter) of the grid in the vertical direction
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            dicOfBuildZoneGridPoint: dictionary of pd.DataFrame
+                Grid points of each building Röckle zone, the backward zones
+                included
+            facadeWithinCavity: pd.DataFrame
+                Point (ID_X, ID_Y, ID_Z) of the facades within an upstream
+                cavity zone used to weight the backward zones"""
+    dicOfPoints = dict(dicOfBuildZoneGridPoint)
+    canyon = dicOfPoints[STREET_CANYON_NAME]
+
+    # Downstreamest point of each column of each street canyon zone, kept
+    # when the upstream cavity zone is higher than the canyon
+    lastY = canyon.groupby([ID_POINT_X, ID_FIELD_CANYON], as_index = False)[ID_POINT_Y].min()
+    facade = lastY.merge(canyon, on = [ID_POINT_X, ID_FIELD_CANYON, ID_POINT_Y])
+    facade = facade[facade[UPPER_VERTICAL_THRESHOLD] > facade[MAX_CANYON_HEIGHT_FIELD]].copy()
+    facade[LENGTH_ZONE_FIELD] = facade[Y_MAX] - facade[Y_MIN]
+    facade[Y_WALL] = facade[Y_WALL] - facade[LENGTH_ZONE_FIELD]
+    facade[ID_POINT_Z] = np.trunc(facade[MAX_CANYON_HEIGHT_FIELD].astype(float) / dz).astype(int) + 1
+    facadeWithinCavity = facade[[ID_POINT_X, ID_POINT_Y, ID_POINT_Z, UPWIND_FACADE_FIELD]]\
+        .reset_index(drop = True)
+
+    # The cavity and wake points of the downstream stacked block located
+    # within the canyon are reverted upstream of its upwind facade
+    impacted = facade[[ID_POINT_X, ID_FIELD_STACKED_BLOCK, ID_POINT_Y, Y_WALL, ID_FIELD_CANYON,
+                       LENGTH_ZONE_FIELD, UPWIND_FACADE_FIELD]]\
+        .merge(streetCanyonZones[[ID_FIELD_CANYON, ID_DOWNSTREAM_STACKED_BLOCK]], on = ID_FIELD_CANYON)
+    for name, initName, fields in [(CAVITY_BACKWARD_NAME, CAVITY_NAME,
+                                    [LENGTH_ZONE_FIELD, POINT_RELATIVE_POSITION_FIELD]),
+                                   (WAKE_BACKWARD_NAME, WAKE_NAME,
+                                    [WAKE_RELATIVE_POSITION_FIELD, UPPER_VERTICAL_THRESHOLD + CAVITY_NAME[0]])]:
+        init = dicOfInitBuildZoneGridPoint[initName]
+        p = impacted.merge(init[[ID_POINT_X, ID_FIELD_STACKED_BLOCK, UPPER_VERTICAL_THRESHOLD,
+                                 DISTANCE_BUILD_TO_POINT_FIELD, HEIGHT_FIELD] + fields]
+                           .rename(columns = {ID_FIELD_STACKED_BLOCK: ID_DOWNSTREAM_STACKED_BLOCK,
+                                              LENGTH_ZONE_FIELD: LENGTH_ZONE_FIELD + initName[0]}),
+                           on = [ID_DOWNSTREAM_STACKED_BLOCK, ID_POINT_X])
+        p = p[p[DISTANCE_BUILD_TO_POINT_FIELD] < p[LENGTH_ZONE_FIELD] + meshSize].copy()
+        p[ID_POINT_Y] = p[ID_POINT_Y] + np.trunc(p[DISTANCE_BUILD_TO_POINT_FIELD] / meshSize).astype(int)
+        dicOfPoints[name] = p[p[ID_POINT_Y] < ny].reset_index(drop = True)
+
+    # Remove the street canyon and rooftop points replaced by the backward zones
+    dicOfPoints[STREET_CANYON_NAME] = removePoints(canyon, facade, [ID_FIELD_CANYON, ID_POINT_X])
+    for name in [ROOFTOP_PERP_NAME, ROOFTOP_CORN_NAME]:
+        dicOfPoints[name] = removePoints(dicOfPoints[name], facade, [UPWIND_FACADE_FIELD, ID_POINT_X])
+
+    return dicOfPoints, facadeWithinCavity
+
+
+def maxBuildZoneHeight(dicOfBuildZoneGridPoint):
+    """ Maximum height where the wind may be affected by the building zones."""
+    varHeights = {ROOFTOP_PERP_NAME: ROOFTOP_PERP_VAR_HEIGHT,
+                  ROOFTOP_CORN_NAME: ROOFTOP_CORNER_VAR_HEIGHT}
+    heights = [dicOfBuildZoneGridPoint[t][UPPER_VERTICAL_THRESHOLD].max()
+               for t in dicOfBuildZoneGridPoint if t not in varHeights]
+    heights += [(dicOfBuildZoneGridPoint[t][varHeights[t]] + dicOfBuildZoneGridPoint[t][HEIGHT_FIELD]).max()
+                for t in varHeights if t in dicOfBuildZoneGridPoint]
+    heights = [h for h in heights if not pd.isna(h)]
+
+    return max(heights) if heights else None
+
+
+def expandLevels(points, levelHeights):
+    """ Repeat each point for each level (ID_Z starting at 1, Z the level height)."""
+    n = levelHeights.size
+    expanded = points.iloc[np.repeat(np.arange(points.index.size), n)].reset_index(drop = True)
+    expanded[ID_POINT_Z] = np.tile(np.arange(1, n + 1), points.index.size)
+    expanded[Z] = np.tile(levelHeights, points.index.size)
+
+    return expanded
+
+
+def calculates3dBuildWindFactor(dicOfBuildZoneGridPoint, dz = DZ):
+    """ 3D wind factors of each building Röckle zone (same as
+    InitWindField.calculates3dBuildWindFactor).
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            dicOfBuildZone3DWindFactor: dictionary of pd.DataFrame
+                ID_X, ID_Y, ID_Z, HEIGHT, Y_WALL and wind factors (U, V, W
+                and for the wake the weighting factors) of each 3D point
+            maxHeight: float
+                Maximum height where the wind may be affected by building zones"""
+    maxHeight = maxBuildZoneHeight(dicOfBuildZoneGridPoint)
+    levelHeights = np.arange(float(dz) / 2,
+                             float(dz) / 2 + math.trunc(maxHeight / dz) * dz,
+                             dz) if maxHeight else np.array([])
+
+    dicOf3D = {}
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        for t, p in dicOfBuildZoneGridPoint.items():
+            p = expandLevels(p, levelHeights)
+            z = p[Z]
+            if t == DISPLACEMENT_NAME:
+                p = p[z < p[UPPER_VERTICAL_THRESHOLD]].copy()
+                p[U] = 0.
+                p[V] = C_DZ * (p[Z] / p[HEIGHT_FIELD]) ** P_DZ
+                p[W] = 0.
+            elif t == DISPLACEMENT_VORTEX_NAME:
+                p = p[z < p[UPPER_VERTICAL_THRESHOLD]].copy()
+                p[U] = np.nan
+                p[V] = -(0.6 * np.cos(np.pi * p[Z] / (0.5 * p[HEIGHT_FIELD])) + 0.05)\
+                    * 0.6 * np.sin(np.pi * p[POINT_RELATIVE_POSITION_FIELD])
+                p[W] = -0.1 * np.cos(np.pi * p[POINT_RELATIVE_POSITION_FIELD]) - 0.05
+            elif t == CAVITY_NAME:
+                p = p[z < p[UPPER_VERTICAL_THRESHOLD]].copy()
+                p[U] = 0.
+                p[V] = -(1 - p[POINT_RELATIVE_POSITION_FIELD]
+                         / np.sqrt(1 - (p[Z] / p[HEIGHT_FIELD]) ** 2)) ** 2\
+                    * p[DOWNSTREAM_X_RELATIVE_POSITION] ** 0.5
+                p[W] = 0.
+            elif t == WAKE_NAME:
+                p = p[(z < p[UPPER_VERTICAL_THRESHOLD])
+                      & (z >= p[UPPER_VERTICAL_THRESHOLD + CAVITY_NAME[0]])].copy()
+                factor = 1 - p[WAKE_RELATIVE_POSITION_FIELD]\
+                    * np.sqrt(1 - (p[Z] / p[HEIGHT_FIELD]) ** 2) ** 1.5
+                p[U] = 0. * factor
+                p[V] = factor
+                p[W] = np.nan
+                p[U_WEIGHT] = factor
+                p[V_WEIGHT] = factor
+                p[W_WEIGHT] = factor
+            elif t == STREET_CANYON_NAME:
+                p = p[(z < p[UPPER_VERTICAL_THRESHOLD]) & (z < p[MAX_CANYON_HEIGHT_FIELD])].copy()
+            elif t == ROOFTOP_PERP_NAME:
+                top = p[HEIGHT_FIELD] + p[ROOFTOP_PERP_VAR_HEIGHT]
+                p = p[(z < top) & (z > p[HEIGHT_FIELD])].copy()
+                top = p[HEIGHT_FIELD] + p[ROOFTOP_PERP_VAR_HEIGHT]
+                p[U] = np.nan
+                p[V] = -((top - p[Z]) / Z_REF) ** P_RTP * np.abs(top - p[Z]) / p[ROOFTOP_PERP_VAR_HEIGHT]
+                p[W] = np.nan
+            elif t == ROOFTOP_CORN_NAME:
+                top = p[HEIGHT_FIELD] + p[ROOFTOP_CORNER_VAR_HEIGHT]
+                p = p[(z < top) & (z > p[HEIGHT_FIELD])].copy()
+                top = p[HEIGHT_FIELD] + p[ROOFTOP_CORNER_VAR_HEIGHT]
+                factor = -p[ROOFTOP_WIND_FACTOR] * ((top - p[Z]) / Z_REF) ** P_RTP\
+                    * np.abs(top - p[Z]) / p[ROOFTOP_CORNER_VAR_HEIGHT]
+                p[U] = factor * np.sin(2 * p[UPWIND_FACADE_ANGLE_FIELD])
+                p[V] = factor * np.sin(p[UPWIND_FACADE_ANGLE_FIELD]) ** 2
+                p[W] = np.nan
+            elif t == CAVITY_BACKWARD_NAME:
+                p = p[z < p[UPPER_VERTICAL_THRESHOLD]].copy()
+                p[U] = np.nan
+                p[V] = (1 - p[POINT_RELATIVE_POSITION_FIELD]
+                        / np.sqrt(1 - (p[Z] / p[HEIGHT_FIELD]) ** 2)) ** 2
+                p[W] = np.nan
+            elif t == WAKE_BACKWARD_NAME:
+                p = p[(z < p[UPPER_VERTICAL_THRESHOLD])
+                      & (z >= p[UPPER_VERTICAL_THRESHOLD + CAVITY_NAME[0]])].copy()
+                factor = -1 + (p[WAKE_RELATIVE_POSITION_FIELD]
+                               * np.sqrt(1 - (p[Z] / p[HEIGHT_FIELD]) ** 2)) ** 1.5
+                p[U] = factor
+                p[V] = factor
+                p[W] = factor
+            columns = [ID_POINT_X, ID_POINT_Y, ID_POINT_Z, HEIGHT_FIELD, Y_WALL, U, V, W]
+            if t == WAKE_NAME:
+                columns += [U_WEIGHT, V_WEIGHT, W_WEIGHT]
+            elif t in [CAVITY_BACKWARD_NAME, WAKE_BACKWARD_NAME]:
+                columns += [UPWIND_FACADE_FIELD]
+            dicOf3D[t] = p[columns].reset_index(drop = True)
+
+    return dicOf3D, maxHeight
+
+
+def calculates3dVegWindFactor(dicOfVegZones, x, y, sketchHeight, z0, dz = DZ):
+    """ 3D wind factor of the vegetation zones, the minimum being kept where
+    several vegetation zones overlap (same as InitWindField.affectsPointToVegZone
+    and InitWindField.calculates3dVegWindFactor)."""
+    levelHeights = np.arange(float(dz) / 2,
+                             float(dz) / 2 + math.trunc(sketchHeight / dz) * dz,
+                             dz)
+    allVeg = []
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        for t, zones in dicOfVegZones.items():
+            if zones.empty:
+                continue
+            p = zonePoints(zones[GEOM_FIELD].values, x, y)
+            for f in [VEGETATION_CROWN_BASE_HEIGHT, VEGETATION_CROWN_TOP_HEIGHT, VEGETATION_ATTENUATION_FACTOR]:
+                p[f] = zones[f].values[p[ZONE_INDEX].values].astype(float)
+            p[TOP_CANOPY_HEIGHT_POINT] = p.groupby(ID_POINT_COLUMNS)[VEGETATION_CROWN_TOP_HEIGHT]\
+                .transform("max")
+            p = expandLevels(p, levelHeights)
+            z = p[Z]
+            Hcan = p[TOP_CANOPY_HEIGHT_POINT]
+            top = p[VEGETATION_CROWN_TOP_HEIGHT]
+            base = p[VEGETATION_CROWN_BASE_HEIGHT]
+            attenuation = np.exp(p[VEGETATION_ATTENUATION_FACTOR] * (z / Hcan - 1))
+            if t == VEGETATION_OPEN_NAME:
+                factor = np.where(z > top,
+                                  np.log((z - 0.15 * Hcan) / z0) / np.log(z / z0),
+                                  np.where(z < base,
+                                           np.log((Hcan - 0.15 * Hcan) / z0) / np.log(z / z0),
+                                           np.log((top - 0.15 * Hcan) / z0) / np.log(z / z0) * attenuation))
+                keep = z > 0
+            else:
+                factor = np.log(Hcan / z0) / np.log(z / z0)
+                factor = np.where((z > top) | (z < base), factor, factor * attenuation)
+                keep = (z < Hcan) & (z > 0)
+            p[VEGETATION_FACTOR] = np.clip(factor, 0, 1)
+            allVeg.append(p.loc[keep, [ID_POINT_X, ID_POINT_Y, ID_POINT_Z, VEGETATION_FACTOR]])
+    if not allVeg:
+        return pd.DataFrame(columns = [ID_POINT_X, ID_POINT_Y, ID_POINT_Z, VEGETATION_FACTOR])
+
+    return pd.concat(allVeg).groupby([ID_POINT_X, ID_POINT_Y, ID_POINT_Z], as_index = False)\
+        [VEGETATION_FACTOR].min()
+
+
+def identifyUpstreamer(dicOf3D, names, upstream = True, weightingZone = False,
+                       priorities = None):
+    """ Keep one value per 3D point: the one of the upstreamest (Y_WALL) and
+    highest obstacle (or the downstreamest and lowest if 'upstream' is
+    False), then the one with the lowest priority (same as
+    InitWindField.identifyUpstreamer)."""
+    frames = []
+    for t in names:
+        p = dicOf3D[t]
+        frame = p[[ID_POINT_X, ID_POINT_Y, ID_POINT_Z, HEIGHT_FIELD, Y_WALL]].copy()
+        # Wind factors not set by the zone are null
+        for factor, name in zip([U_WEIGHT, V_WEIGHT, W_WEIGHT] if weightingZone else [U, V, W],
+                                [U, V, W]):
+            frame[name] = p[factor].values if factor in p else np.nan
+        if priorities is not None:
+            for f in [REF_HEIGHT_FIELD, PRIORITY_FIELD, IS_UPSTREAM_FIELD]:
+                frame[f] = priorities.loc[t, f]
+        frames.append(frame)
+    allPoints = pd.concat(frames, ignore_index = True)
+    # Heights and Y_WALL are stored as integers in H2GIS
+    allPoints[HEIGHT_FIELD] = np.floor(allPoints[HEIGHT_FIELD].astype(float) + 0.5)
+    allPoints[Y_WALL] = np.floor(allPoints[Y_WALL].astype(float) + 0.5)
+    sortColumns = [Y_WALL, HEIGHT_FIELD]
+    ascending = [not upstream, not upstream]
+    if priorities is not None:
+        sortColumns.append(PRIORITY_FIELD)
+        ascending.append(True)
+
+    return allPoints.sort_values(sortColumns, ascending = ascending, kind = "stable")\
+        .drop_duplicates([ID_POINT_X, ID_POINT_Y, ID_POINT_Z])
+
+
+def manageUpstreamSuperimposition(dicOf3D, upstreamPriorityTables = UPSTREAM_PRIORITY_TABLES,
+                                  upstreamWeightingTables = UPSTREAM_WEIGHTING_TABLES,
+                                  backward = False):
+    """ Keep one wind factor per 3D point where forward (or backward) Röckle
+    zones overlap, then weight them by the upstream weighting zones (same as
+    InitWindField.manageUpstreamSuperimposition).
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            upstreamWindFactor: pd.DataFrame
+                ID_X, ID_Y, ID_Z, HEIGHT, wind factors (U, V, W) and reference
+                height rule (REF_HEIGHT_FIELD) of each 3D point"""
+    keys = [ID_POINT_X, ID_POINT_Y, ID_POINT_Z]
+    columns = keys + [HEIGHT_FIELD, U, V, W, REF_HEIGHT_FIELD]
+    priorityNames = [t for t in upstreamPriorityTables.index
+                     if t in dicOf3D and t not in upstreamWeightingTables]
+    weightingNames = [t for t in upstreamWeightingTables if t in dicOf3D]
+
+    priorities = identifyUpstreamer(dicOf3D, priorityNames, upstream = True,
+                                    priorities = upstreamPriorityTables)
+    weights = identifyUpstreamer(dicOf3D, weightingNames, upstream = not backward, weightingZone = True)
+    downstreamWeights = identifyUpstreamer(dicOf3D, weightingNames, upstream = backward)
+    downstreamWeights = downstreamWeights.merge(priorities[keys], how = "left", indicator = True)
+    downstreamWeights = downstreamWeights[downstreamWeights["_merge"] == "left_only"].drop(columns = "_merge")
+    downstreamWeights[W] = np.nan
+    downstreamWeights[REF_HEIGHT_FIELD] = REF_HEIGHT_UPSTREAM_WEIGHTING
+    downstreamWeights[IS_UPSTREAM_FIELD] = IS_UPSTREAM_UPSTREAM_WEIGHTING
+    prioritiesAll = pd.concat([priorities, downstreamWeights], ignore_index = True)
+
+    # Weight the wind factors when the weight comes from a more upstream and higher obstacle
+    joined = prioritiesAll.merge(weights[keys + [HEIGHT_FIELD, Y_WALL, U, V, W]], on = keys,
+                                 how = "left", suffixes = ("", "_WEIGHT"))
+    weighted = ((joined[Y_WALL + "_WEIGHT"] >= joined[Y_WALL])
+                & (joined[HEIGHT_FIELD + "_WEIGHT"] > joined[HEIGHT_FIELD]))\
+        | ((joined[Y_WALL + "_WEIGHT"] > joined[Y_WALL]) & (joined[IS_UPSTREAM_FIELD] == 1))
+    result = joined[columns].copy()
+    result.loc[weighted, HEIGHT_FIELD] = joined.loc[weighted, HEIGHT_FIELD + "_WEIGHT"]
+    for c in [U, V]:
+        result.loc[weighted, c] = (joined[c + "_WEIGHT"] * joined[c]).fillna(joined[c + "_WEIGHT"])[weighted]
+    result.loc[weighted, W] = (joined[W + "_WEIGHT"] * joined[W]).fillna(0)[weighted]
+    result[REF_HEIGHT_FIELD] = result[REF_HEIGHT_FIELD].fillna(REF_HEIGHT_UPSTREAM_WEIGHTING)
+
+    return result
+
+
+def manageSuperimposition(dicOf3D, vegetationFactor, facadeWithinCavity):
+    """ Keep one wind factor per 3D point where Röckle zones overlap, the
+    backward zones weighted by the wind factor of the facade within the
+    upstream cavity replacing the forward ones, and weight them by the
+    vegetation (same as InitWindField.manageSuperimposition).
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            allZonesPointFactor: pd.DataFrame
+                ID_X, ID_Y, ID_Z, HEIGHT, wind factors (U, V, W) and reference
+                height rule (REF_HEIGHT_FIELD) of each 3D point"""
+    keys = [ID_POINT_X, ID_POINT_Y, ID_POINT_Z]
+    columns = keys + [HEIGHT_FIELD, U, V, W, REF_HEIGHT_FIELD]
+    result = manageUpstreamSuperimposition(dicOf3D)
+
+    # Weight the backward zones by the wind factor at the facade within the cavity
+    backWeights = facadeWithinCavity.merge(result[keys + [HEIGHT_FIELD, V]], on = keys, how = "left")
+    backWeights[BACK_WEIGHT] = backWeights[V].abs()
+    dicOfBackward = {}
+    for t in [CAVITY_BACKWARD_NAME, WAKE_BACKWARD_NAME]:
+        p = dicOf3D[t].drop(columns = [HEIGHT_FIELD, U, W])\
+            .merge(backWeights[[ID_POINT_X, UPWIND_FACADE_FIELD, HEIGHT_FIELD, BACK_WEIGHT]],
+                   on = [ID_POINT_X, UPWIND_FACADE_FIELD], how = "left")
+        p[U] = np.nan
+        p[V] = p[V] * p[BACK_WEIGHT]
+        p[W] = np.nan
+        dicOfBackward[t] = p
+    backward = manageUpstreamSuperimposition(dicOfBackward,
+                                             upstreamPriorityTables = UPSTREAM_BACKWARD_PRIORITY_TABLES,
+                                             upstreamWeightingTables = UPSTREAM_BACKWARD_WEIGHTING_TABLES,
+                                             backward = True)
+    # The backward points only replace existing points
+    backward = backward.merge(result[keys], on = keys)
+    result = result.merge(backward[keys], how = "left", indicator = True)
+    result = pd.concat([backward, result[result["_merge"] == "left_only"].drop(columns = "_merge")],
+                       ignore_index = True)
+
+    # Weight the wind factors by the vegetation factors
+    veg = vegetationFactor.merge(result, on = keys, how = "left")
+    veg[U] = veg[VEGETATION_FACTOR] * veg[U]
+    veg[V] = (veg[VEGETATION_FACTOR] * veg[V]).fillna(veg[VEGETATION_FACTOR])
+    veg[W] = veg[VEGETATION_FACTOR] * veg[W]
+    veg[REF_HEIGHT_FIELD] = veg[REF_HEIGHT_FIELD].fillna(REF_HEIGHT_DOWNSTREAM_WEIGHTING)
+    result = result.merge(vegetationFactor[keys], how = "left", indicator = True)
+    result = result[result["_merge"] == "left_only"].drop(columns = "_merge")
+
+    return pd.concat([result[columns], veg[columns]], ignore_index = True)
+
+
+def setInitialWindField(allZonesPointFactor, buildPoints, nx, ny, z0, sketchHeight,
+                        profileType = PROFILE_TYPE, dz = DZ, z_ref = Z_REF,
+                        V_ref = V_REF, **kwargs):
+    """ Initial 3D wind field from the wind factors of the Röckle zones and
+    the vertical wind profile (same as InitWindField.setInitialWindField and
+    InitWindField.rasterizeWindField).
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            buildGrid3D: 3D array
+                0 for the cells intersecting a building (or the ground), 1 otherwise
+            u0, v0, w0: 3D arrays
+                Initial wind speed in X, Y and Z directions (v axis facing
+                South as in InitWindField.rasterizeWindField)
+            nPoints: dictionary
+                Number of grid points along X, Y and Z
+            verticalWindSpeedProfile: pd.DataFrame
+                Initial wind speed profile along a vertical axis z"""
+    profileArgs = dict(z0 = z0, V_ref = V_ref, z_ref = z_ref, profileType = profileType,
+                       d = kwargs.get('d', None), H = kwargs.get('H', None),
+                       lambda_f = kwargs.get('lambda_f', None),
+                       verticalProfileFile = kwargs.get('verticalProfileFile', None))
+    levelHeightList = [i for i in np.arange(float(dz)/2,
+                                            float(dz)/2+math.trunc(sketchHeight/dz)*dz,
+                                            dz)]
+    verticalWindSpeedProfile = InitWindField.getVerticalProfile(cursor = None,
+                                                                pointHeightList = levelHeightList,
+                                                                **profileArgs)
+    if V_ref is None or z_ref is None:
+        V_ref = verticalWindSpeedProfile.loc[verticalWindSpeedProfile.index[-1], HORIZ_WIND_SPEED]
+    nz = verticalWindSpeedProfile.index.max() + 1
+    verticalWindSpeedProfile.loc[0] = [0, 0]
+    verticalWindSpeedProfile.sort_index(inplace = True)
+    profile = verticalWindSpeedProfile[HORIZ_WIND_SPEED].values
+
+    # Wind speed by which the wind factors are multiplied
+    points = allZonesPointFactor
+    k = points[ID_POINT_Z].values.astype(int)
+    ref = points[REF_HEIGHT_FIELD].values
+    windSpeed = np.where(ref == 2, V_ref, np.where(ref == 3, profile[k], 5 * profile[k]))
+    buildingHeights = points.loc[ref == 1, HEIGHT_FIELD].dropna().unique()
+    if buildingHeights.size > 0:
+        buildingHeightWindSpeed = InitWindField.getVerticalProfile(cursor = None,
+                                                                   pointHeightList = pd.Series(buildingHeights),
+                                                                   **profileArgs)\
+            .set_index(Z)[HORIZ_WIND_SPEED]
+        windSpeed = np.where(ref == 1, buildingHeightWindSpeed.reindex(points[HEIGHT_FIELD]).values,
+                             windSpeed)
+
+    # Wind field without obstacles updated by the values of the Röckle zones
+    wind = {U: np.zeros((nx, ny, nz)),
+            V: np.broadcast_to(profile, (nx, ny, nz)).copy(),
+            W: np.zeros((nx, ny, nz))}
+    i = points[ID_POINT_X].values.astype(int)
+    j = points[ID_POINT_Y].values.astype(int)
+    for c in [U, V, W]:
+        values = points[c].values.astype(float) * windSpeed
+        defined = ~np.isnan(values)
+        wind[c][i[defined], j[defined], k[defined]] = values[defined]
+
+    # Renormalize wind speed at each height (see InitWindField.setInitialWindField)
+    if REMOVE_INITIALIZATION_OFFSET and k.size > 0:
+        for z_i in range(1, k.max() + 1):
+            norm = np.sqrt(wind[U][:, :, z_i] ** 2 + wind[V][:, :, z_i] ** 2 + wind[W][:, :, z_i] ** 2).mean()
+            for c in wind:
+                wind[c][:, :, z_i] *= profile[z_i] / norm
+
+    # Set to 0 wind speed within buildings and the ground to building
+    buildGrid3D = np.ones((nx, ny, nz), dtype = np.int32)
+    buildGrid3D[buildPoints[0], buildPoints[1], buildPoints[2]] = 0
+    for c in wind:
+        wind[c][buildPoints[0], buildPoints[1], buildPoints[2]] = 0
+    buildGrid3D[1:nx-1, 1:ny-1, 0] = 0
+    nPoints = {X: nx, Y: ny, Z: nz}
+
+    return buildGrid3D, wind[U], -wind[V], wind[W], nPoints, verticalWindSpeedProfile
+
+
+def identifyBuildPoints(stackedBlocks, x, y, dz = DZ):
+    """ Indices (ID_X, ID_Y, ID_Z) of the grid cells located within the
+    stacked blocks (same as InitWindField.identifyBuildPoints)."""
+    if stackedBlocks.empty:
+        return np.zeros((3, 0), dtype = int)
+    p = zonePoints(stackedBlocks[GEOM_FIELD].values, x, y)
+    maxHeight = stackedBlocks[HEIGHT_FIELD].max()
+    levelHeights = np.arange(float(dz) / 2, float(dz) / 2 + math.trunc(maxHeight / dz) * dz, dz)
+    top = stackedBlocks[HEIGHT_FIELD].values[p[ZONE_INDEX].values]
+    base = stackedBlocks[BASE_HEIGHT_FIELD].values[p[ZONE_INDEX].values]
+    inside = (levelHeights[np.newaxis, :] <= top[:, np.newaxis]) & (levelHeights[np.newaxis, :] > base[:, np.newaxis])
+    n, k = np.nonzero(inside)
+
+    return np.unique(np.stack([p[ID_POINT_X].values[n], p[ID_POINT_Y].values[n], k + 1]), axis = 1)
+
+
+def initWindField(cursor, windDirection, srid, meshSize = MESH_SIZE, dz = DZ,
+                  alongWindZoneExtend = ALONG_WIND_ZONE_EXTEND,
+                  crossWindZoneExtend = CROSS_WIND_ZONE_EXTEND,
+                  verticalExtend = VERTICAL_EXTEND, z_ref = Z_REF, v_ref = V_REF,
+                  profileType = PROFILE_TYPE, verticalProfileFile = None,
+                  outputRaster = None, prefix = PREFIX_NAME, feedback = None):
+    """ Calculates natively the initial wind field of URock (steps 2 to 9 of
+    MainCalculation.main) from the buildings and vegetation loaded in H2GIS.
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            cursor: conn.cursor
+                A cursor object, used to load the obstacles and to create the
+                grid point table (needed to save the outputs)
+            windDirection: float
+                Wind direction (°, clock-wise, North = 0°)
+            srid: int
+                SRID of the building data
+            (other parameters): see MainCalculation.main
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            results: dictionary
+                Results of rockleWindField and "gridPoint" (name of the H2GIS grid table)"""
+    if shapely is None:
+        raise ImportError("'shapely' Python package is needed by the native Röckle initialisation")
+    if feedback:
+        feedback.setProgressText('Creates the stacked blocks and the Röckle zones (native)')
+    buildings, vegetation = loadObstacles(cursor)
+    stackedBlocks = identifyBlockBase(createsBlocks(buildings))
+    outputExtent = None
+    if outputRaster:
+        extent = outputRaster.extent()
+        outputExtent = [extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()]
+    results = rockleWindField(stackedBlocks, vegetation, windDirection, meshSize = meshSize,
+                              dz = dz, alongWindZoneExtend = alongWindZoneExtend,
+                              crossWindZoneExtend = crossWindZoneExtend,
+                              verticalExtend = verticalExtend, z_ref = z_ref, v_ref = v_ref,
+                              profileType = profileType, verticalProfileFile = verticalProfileFile,
+                              outputExtent = outputExtent, feedback = feedback)
+    results["gridPoint"] = createGridTable(cursor, results["x"], results["y"], meshSize, srid,
+                                           prefix = prefix)
+
+    return results
+
+
+def rockleWindField(stackedBlocks, vegetation, windDirection, meshSize = MESH_SIZE, dz = DZ,
+                    alongWindZoneExtend = ALONG_WIND_ZONE_EXTEND,
+                    crossWindZoneExtend = CROSS_WIND_ZONE_EXTEND,
+                    verticalExtend = VERTICAL_EXTEND, z_ref = Z_REF, v_ref = V_REF,
+                    profileType = PROFILE_TYPE, verticalProfileFile = None,
+                    outputExtent = None, feedback = None):
+    """ Calculates the initial wind field of URock for a wind direction from
+    the (not rotated) stacked blocks with their base height and vegetation,
+    which do not depend on the wind direction (see BatchCalculation).
+
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _
+
+            stackedBlocks: pd.DataFrame
+                Stacked blocks (createsBlocks) with their base height (identifyBlockBase)
+            vegetation: pd.DataFrame
+                Vegetation polygons (loadObstacles)
+            windDirection: float
+                Wind direction (°, clock-wise, North = 0°)
+            outputExtent: list, default None
+                xmin, ymin, xmax, ymax of the output raster (the vegetation
+                zones are reduced to those potentially impacting it, see
+                impactingVegetationZones)
+            (other parameters): see MainCalculation.main
+
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _
+
+            results: dictionary
+                "buildGrid3D", "u0", "v0", "w0", "nPoints", "verticalWindProfile",
+                "rotationCenterCoordinates", "x", "y" (grid coordinates in the
+                rotated frame) and the intermediate tables ("stackedBlocks",
+                "buildZones", "vegZones", "buildZonePoints", "allZonesPointFactor")"""
+    stackedBlocks = stackedBlocks.copy()
+    vegetation = vegetation.copy()
+
+    # Rotates obstacles to have the wind coming from the North
+    rotationCenterCoordinates = rotationCenter(stackedBlocks, vegetation)
+    stackedBlocks[GEOM_FIELD] = rotateGeometries(stackedBlocks[GEOM_FIELD].values,
+                                                 windDirection, rotationCenterCoordinates)
+    vegetation[GEOM_FIELD] = rotateGeometries(vegetation[GEOM_FIELD].values,
+                                              windDirection, rotationCenterCoordinates)
+    upwindInited, downwind = initFacades(stackedBlocks)
+    upwind = updateUpwindFacadeBase(upwindInited)
+    props = zoneProperties(stackedBlocks)
+    z0, d, Hr, H_ob_max, lambda_f = studyAreaProperties(upwindInited, stackedBlocks, vegetation)
+
+    # Creates the 2D Röckle zones
+    displacement, displacementVortex = displacementZones(upwind, props)
+    cavity, wake = cavityAndWakeZones(downwind, props)
+    dicOfBuildZones = {DISPLACEMENT_NAME       : displacement,
+                       DISPLACEMENT_VORTEX_NAME: displacementVortex,
+                       CAVITY_NAME             : cavity,
+                       WAKE_NAME               : wake,
+                       STREET_CANYON_NAME      : streetCanyonZones(upwind, cavity, downwind, props),
+                       ROOFTOP_PERP_NAME       : rooftopZones(upwind, props),
+                       ROOFTOP_CORN_NAME       : rooftopCornerZones(upwind, props)}
+    vegetationBuilt, vegetationOpen = vegetationZones(vegetation, wake)
+    dicOfVegZones = {VEGETATION_BUILT_NAME: vegetationBuilt,
+                     VEGETATION_OPEN_NAME : vegetationOpen}
+    if outputExtent is not None:
+        impactedZone = rotateGeometries(shapely.box(*outputExtent), windDirection,
+                                        rotationCenterCoordinates)
+        dicOfVegZones = impactingVegetationZones(dicOfVegZones, stackedBlocks, vegetation,
+                                                 impactedZone, crossWindExtend = crossWindZoneExtend)
+
+    # Grid points in the Röckle zones and 3D wind factors
+    if feedback:
+        feedback.setProgressText('Initializes the 3D wind within Röckle zones (native)')
+    x, y, envelope = createGrid(list(dicOfBuildZones.values()) + list(dicOfVegZones.values()),
+                                meshSize = meshSize,
+                                alongWindZoneExtend = alongWindZoneExtend,
+                                crossWindZoneExtend = crossWindZoneExtend)
+    dicOfInitBuildZoneGridPoint = affectsPointToBuildZone(dicOfBuildZones, x, y)
+    dicOfBuildZoneGridPoint, facadeWithinCavity = \
+        manageBackwardZones(removeBuildZonePoints(dicOfInitBuildZoneGridPoint),
+                            dicOfInitBuildZoneGridPoint, dicOfBuildZones[STREET_CANYON_NAME],
+                            y.size, meshSize = meshSize, dz = dz)
+    dicOf3D, maxBuildHeight = calculates3dBuildWindFactor(dicOfBuildZoneGridPoint, dz = dz)
+    maxHeight = H_ob_max
+    if maxBuildHeight and maxBuildHeight > H_ob_max:
+        maxHeight = maxBuildHeight
+    sketchHeight = maxHeight + verticalExtend
+    vegetationFactor = calculates3dVegWindFactor(dicOfVegZones, x, y, sketchHeight, z0, dz = dz)
+    allZonesPointFactor = manageSuperimposition(dicOf3D, vegetationFactor, facadeWithinCavity)
+
+    # 3D initial wind field
+    buildGrid3D, u0, v0, w0, nPoints, verticalWindProfile = \
+        setInitialWindField(allZonesPointFactor, identifyBuildPoints(stackedBlocks, x, y, dz = dz),
+                            x.size, y.size, z0, sketchHeight, profileType = profileType,
+                            dz = dz, z_ref = z_ref, V_ref = v_ref, d = d, H = Hr,
+                            lambda_f = lambda_f, verticalProfileFile = verticalProfileFile)
+
+    return {"buildGrid3D": buildGrid3D, "u0": u0, "v0": v0, "w0": w0, "nPoints": nPoints,
+            "verticalWindProfile": verticalWindProfile,
+            "rotationCenterCoordinates": rotationCenterCoordinates, "x": x, "y": y,
+            "stackedBlocks": stackedBlocks, "buildZones": dicOfBuildZones, "vegZones": dicOfVegZones,
+            "buildZonePoints": dicOfBuildZoneGridPoint, "allZonesPointFactor": allZonesPointFactor}
@@ -13,16 +13,22 @@ Created on Mon Mar 29 14:57:25 2021
 """
 import numpy as np
 import time
-from .GlobalVariables import MAX_ITERATIONS, THRESHOLD_ITERATIONS, DESCENDING_Y
+from .GlobalVariables import MAX_ITERATIONS, THRESHOLD_ITERATIONS, DESCENDING_Y, \
+    SOLVER_METHOD, NORM_CHECK_INTERVAL, MULTIGRID_COARSEST_SIZE
 try:
-    from numba import jit
+    from numba import jit, prange
 except ImportError:
     exit("'numba' Python package is missing")
-import pandas as pd
+try:
+    from scipy import sparse
+    from scipy.sparse.linalg import splu
+except ImportError:
+    sparse = None
 
 def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, cursor,
            maxIterations = MAX_ITERATIONS, thresholdIterations = THRESHOLD_ITERATIONS,
-           feedback = None):
+           feedback = None, method = SOLVER_METHOD, normInterval = NORM_CHECK_INTERVAL,
+           report = None):
     """ Use the mass-balance solver minimizing the modification of the initial
     wind speed field. The method used is based on Pardyjak and Brown (2003).
     
@@ -64,6 +70,22 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
                 threshold, the wind solver stops
             feedback: Qgis.core class QgsProcessingFeedback
                 Base class for providing feedback to QGIS from a processing algorithm (if not in standalone mode).
+            method: str, default SOLVER_METHOD
+                Iteration scheme: "sor" (cells updated in lexicographic order),
+                "redblack" (cells updated in checkerboard order, the two
+                colors one after the other, each in parallel) or "multigrid"
+                (conjugate gradient preconditioned by a multigrid V-cycle,
+                needs scipy). The "multigrid" solver stops when the relative
+                residual of the equations goes under thresholdIterations
+            normInterval: int, default NORM_CHECK_INTERVAL
+                Number of iterations between two convergence checks ("redblack" only)
+            report: dict, default None
+                If given, filled with the convergence of the solver: method,
+                iterations, criterion, history (iteration and value of the
+                stopping criterion, from iteration 0, the initial residual, for
+                "multigrid"), residual (final relative residual of the
+                equations, comparable between methods), setupTime (coefficients
+                near obstacles) and time (iterations)
         
     		Returns
     		_ _ _ _ _ _ _ _ _ _ 
@@ -119,6 +141,78 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
 
     # Set coefficients according to table 1 (Pardyjak et Brown, 2003) 
     # to modify the Equation near obstacles
+    e, f, g, h, m, n, o, p, q = obstacleCoefficients(buildingCoordinates, nx, ny, nz)
+    
+    timeSetup = time.time() - timeStartCalculation
+    print("Time spent by the wind solver setup: {0} s".format(timeSetup))
+    
+    timeStartIterations = time.time()
+    history = []
+    if method == "redblack":
+        lambdaN1, iterations = iterateRedBlack(cells4Solver, lambdaN1, omega, alpha1, u0, v0, w0,
+                                               dx, dy, dz, e, f, g, h, m, n, o, p, q, A, B,
+                                               maxIterations, thresholdIterations, normInterval,
+                                               feedback, history)
+    elif method == "multigrid":
+        lambdaN1, iterations = iterateMultigrid(cells4Solver, lambdaN1, alpha1, u0, v0, w0,
+                                                dx, dy, dz, e, f, g, h, m, n, o, p, q, A, B,
+                                                maxIterations, thresholdIterations, feedback,
+                                                history)
+    else:
+        lambdaN1, iterations = iterateSor(cells4Solver, lambdaN, lambdaN1, omega, alpha1, u0, v0, w0,
+                                          dx, dy, dz, e, f, g, h, m, n, o, p, q, A, B,
+                                          maxIterations, thresholdIterations, feedback, history)
+    
+    if report is not None:
+        rhs, diagonal, weights = stencilTerms(cells4Solver, alpha1, u0, v0, w0, dx, dy, dz,
+                                              e, f, g, h, m, n, o, p, q, DESCENDING_Y, A, B)
+        report.update(method = method,
+                      iterations = iterations,
+                      maxIterations = maxIterations,
+                      threshold = thresholdIterations,
+                      criterion = "relative residual" if method == "multigrid"
+                                  else "relative variation of lambda",
+                      converged = bool(history) and history[-1][1] < thresholdIterations,
+                      history = history,
+                      residual = relativeResidual(cells4Solver, lambdaN1, rhs, diagonal, weights),
+                      setupTime = timeSetup,
+                      time = time.time() - timeStartIterations)
+    
+    # Calculates the final wind speed
+
+    # go descending order along y
+    if DESCENDING_Y:
+        u[1:nx, :, :] = u0[1:nx, :, :] + 0.5 * (
+                1. / (alpha1 ** 2)) * (lambdaN1[0:nx-1, :, :] - lambdaN1[1:nx, :, :]) / dx
+        v[:, 1:ny, :] = v0[:, 1:ny, :] + 0.5 * (
+                1. / (alpha1 ** 2)) * (lambdaN1[:, 0:ny-1, :] - lambdaN1[:, 1:ny, :]) / dy
+        w[:, :, 1:nz] = w0[:, :, 1:nz] + 0.5 * (
+                1. / (alpha2 ** 2)) * (lambdaN1[:, :, 0:nz - 1] - lambdaN1[:, :, 1:nz]) / dz
+    else:
+        u[1:nx, :, :] = u0[1:nx, :, :] + 0.5 * (
+                1. / (alpha1 ** 2)) * (lambdaN1[1:nx, :, :] - lambdaN1[0:nx - 1, :, :]) / dx
+        v[:, 1:ny, :] = v0[:, 1:ny, :] + 0.5 * (
+                1. / (alpha1 ** 2)) * (lambdaN1[:, 1:ny, :] - lambdaN1[:, 0:ny - 1, :]) / dy
+        w[:, :, 1:nz] = w0[:, :, 1:nz] + 0.5 * (
+                1. / (alpha2 ** 2)) * (lambdaN1[:, :, 1:nz] - lambdaN1[:, :, 0:nz - 1]) / dz
+
+    # Reset input and output wind speed to zero for building cells
+    u[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
+    u[buildingCoordinates[0]+1,buildingCoordinates[1],buildingCoordinates[2]]=0
+    v[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
+    v[buildingCoordinates[0],buildingCoordinates[1]+1,buildingCoordinates[2]]=0
+    w[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
+    w[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]+1]=0
+
+    print("Time spent by the wind speed solver: {0} s (setup {1} s)".format(time.time()-timeStartCalculation,
+                                                                          timeSetup))
+    
+    return u, v, w
+
+def obstacleCoefficients(buildingCoordinates, nx, ny, nz):
+    """ Coefficients e, f, g, h, m, n, o, p and q of the equations of the
+    cells near obstacles according to table 1 (Pardyjak et Brown, 2003),
+    set from shifts of the 3D building mask. Returns the 9 3D arrays."""
     e = np.ones([nx, ny, nz])
     f = np.ones([nx, ny, nz])
     g = np.ones([nx, ny, nz])
@@ -129,61 +223,67 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
     p = np.ones([nx, ny, nz])
     q = np.ones([nx, ny, nz])
     
-    # Identify index having wall below AND front, left, right or behind
-    indBelow = pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0], 
-                                                    buildingCoordinates[1], 
-                                                    buildingCoordinates[2] + 1])))
-    indBelowFront = indBelow.intersection(pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0], 
-                                                                               buildingCoordinates[1] - 1, 
-                                                                               buildingCoordinates[2]]))))
-    indBelowBehind = indBelow.intersection(pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0], 
-                                                                               buildingCoordinates[1] + 1, 
-                                                                               buildingCoordinates[2]]))))
-    indBelowLeft = indBelow.intersection(pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0] + 1, 
-                                                                               buildingCoordinates[1], 
-                                                                               buildingCoordinates[2]]))))
-    indBelowRight = indBelow.intersection(pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0] - 1, 
-                                                                               buildingCoordinates[1], 
-                                                                               buildingCoordinates[2]]))))
-    indBelowAnyAround = indBelowFront.union(indBelowBehind).union(indBelowLeft).union(indBelowRight)
-    indBelowLeftRight = indBelowLeft.union(indBelowRight)
-    indBelowFrontBehind = indBelowFront.union(indBelowBehind)  
+    building = np.zeros([nx, ny, nz], dtype = bool)
+    building[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2]] = True
+    
+    # Identify cells having wall below AND front, left, right or behind
+    below = shiftMask(building, 1, 2)
+    belowFront = below & shiftMask(building, -1, 1)
+    belowBehind = below & shiftMask(building, 1, 1)
+    belowLeft = below & shiftMask(building, 1, 0)
+    belowRight = below & shiftMask(building, -1, 0)
+    belowAnyAround = belowFront | belowBehind | belowLeft | belowRight
+    
+    # Cells next to a building: cells at -1 of buildings along an axis are
+    # wrapped to the other side of the grid (as by negative indices)
+    before = [np.roll(building, -1, axis) for axis in range(3)]
+    after = [np.roll(building, 1, axis) for axis in range(3)]
     
     # Go descending order along y
     if DESCENDING_Y:
-        e[buildingCoordinates[0] + 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.
-        e[indBelowLeft.get_level_values(0), indBelowLeft.get_level_values(1), indBelowLeft.get_level_values(2)] = 0.
-        f[buildingCoordinates[0] - 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.
-        f[indBelowRight.get_level_values(0), indBelowRight.get_level_values(1), indBelowRight.get_level_values(2)] = 0. 
-        g[buildingCoordinates[0], buildingCoordinates[1] + 1, buildingCoordinates[2]] = 0.
-        g[indBelowBehind.get_level_values(0), indBelowBehind.get_level_values(1), indBelowBehind.get_level_values(2)] = 0.
-        h[buildingCoordinates[0], buildingCoordinates[1] - 1, buildingCoordinates[2]] = 0.  
-        h[indBelowFront.get_level_values(0), indBelowFront.get_level_values(1), indBelowFront.get_level_values(2)] = 0.
-        m[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] + 1] = 0.
-        n[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] - 1] = 0.
-    else:    
-        e[buildingCoordinates[0] - 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.
-        e[indBelowRight.get_level_values(0), indBelowRight.get_level_values(1), indBelowRight.get_level_values(2)] = 0.        
-        f[buildingCoordinates[0] + 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.
-        f[indBelowLeft.get_level_values(0), indBelowLeft.get_level_values(1), indBelowLeft.get_level_values(2)] = 0.    
-        g[buildingCoordinates[0], buildingCoordinates[1] - 1, buildingCoordinates[2]] = 0.
-        g[indBelowFront.get_level_values(0), indBelowFront.get_level_values(1), indBelowFront.get_level_values(2)] = 0.
-        h[buildingCoordinates[0], buildingCoordinates[1] + 1, buildingCoordinates[2]] = 0.
-        h[indBelowBehind.get_level_values(0), indBelowBehind.get_level_values(1), indBelowBehind.get_level_values(2)] = 0.
-        m[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] - 1] = 0.
-        n[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] + 1] = 0.
+        e[after[0] | belowLeft] = 0.
+        f[before[0] | belowRight] = 0.
+        g[after[1] | belowBehind] = 0.
+        h[before[1] | belowFront] = 0.
+        m[after[2]] = 0.
+        n[before[2]] = 0.
+    else:
+        e[before[0] | belowRight] = 0.
+        f[after[0] | belowLeft] = 0.
+        g[before[1] | belowFront] = 0.
+        h[after[1] | belowBehind] = 0.
+        m[before[2]] = 0.
+        n[after[2]] = 0.
     
-    o[buildingCoordinates[0] - 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.5
-    o[buildingCoordinates[0] + 1, buildingCoordinates[1], buildingCoordinates[2]] = 0.5
-    p[buildingCoordinates[0], buildingCoordinates[1] - 1, buildingCoordinates[2]] = 0.5
-    p[buildingCoordinates[0], buildingCoordinates[1] + 1, buildingCoordinates[2]] = 0.5
-    q[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] + 1] = 0.5
-    q[buildingCoordinates[0], buildingCoordinates[1], buildingCoordinates[2] - 1] = 0.5
-    n[indBelowAnyAround.get_level_values(0), indBelowAnyAround.get_level_values(1), indBelowAnyAround.get_level_values(2)] = 0.
-    o[indBelowLeftRight.get_level_values(0), indBelowLeftRight.get_level_values(1), indBelowLeftRight.get_level_values(2)] = 0.5
-    p[indBelowFrontBehind.get_level_values(0), indBelowFrontBehind.get_level_values(1), indBelowFrontBehind.get_level_values(2)] = 0.5
-    q[indBelowAnyAround.get_level_values(0), indBelowAnyAround.get_level_values(1), indBelowAnyAround.get_level_values(2)] = 0.5
-       
+    o[before[0] | after[0] | belowLeft | belowRight] = 0.5
+    p[before[1] | after[1] | belowFront | belowBehind] = 0.5
+    q[before[2] | after[2] | belowAnyAround] = 0.5
+    n[belowAnyAround] = 0.
+    
+    return e, f, g, h, m, n, o, p, q
+
+def shiftMask(mask, shift, axis):
+    """ Mask of the cells at shift (along axis) of the True cells of mask,
+    the cells shifted outside the grid being dropped."""
+    shifted = np.zeros_like(mask)
+    source = [slice(None)] * 3
+    target = [slice(None)] * 3
+    if shift > 0:
+        source[axis] = slice(0, -shift)
+        target[axis] = slice(shift, None)
+    else:
+        source[axis] = slice(-shift, None)
+        target[axis] = slice(0, shift)
+    shifted[tuple(target)] = mask[tuple(source)]
+    return shifted
+
+def iterateSor(cells4Solver, lambdaN, lambdaN1, omega, alpha1, u0, v0, w0, dx, dy, dz,
+               e, f, g, h, m, n, o, p, q, A, B, maxIterations, thresholdIterations, feedback,
+               history):
+    """ SOR iterations updating the cells in lexicographic order (calcLambda)
+    until the relative variation of lambda between 2 iterations goes under
+    thresholdIterations. The variations are appended to history. Returns
+    lambda and the number of iterations."""
     for N in range(maxIterations):
         print("Iteration {0} (max {1})".format( N + 1, 
                                                 maxIterations))
@@ -195,6 +295,7 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
         
         # Calculate how much lambda evolves between 2 consecutive iterations                                      
         eps = np.sum(np.abs(lambdaN1 - lambdaN)) / np.sum(np.abs(lambdaN1))
+        history.append((N + 1, eps))
         
         # Check if the condition for ending process is reached
         if eps < thresholdIterations:
@@ -213,37 +314,250 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
                 if feedback.isCanceled():
                     feedback.setProgressText("Calculation cancelled by user")
                     break
-            
+
+    return lambdaN1, N + 1
+
+def iterateRedBlack(cells4Solver, lambdaN1, omega, alpha1, u0, v0, w0, dx, dy, dz,
+                    e, f, g, h, m, n, o, p, q, A, B, maxIterations, thresholdIterations,
+                    normInterval, feedback, history):
+    """ SOR iterations updating the cells in red-black (checkerboard) order:
+    the neighbours of a cell all have the other color, so the cells of one
+    color are updated independently of each other (calcLambdaRedBlack). The
+    stopping criterion is the one of iterateSor (relative variation of lambda
+    between 2 iterations), checked every normInterval iterations. Returns
+    lambda and the number of iterations."""
+    # Stencil coefficients of the cells of each color (i + j + k even, odd)
+    colors = []
+    for parity in (0, 1):
+        cells = cells4Solver[cells4Solver.sum(axis = 1) % 2 == parity]
+        rhs, diagonal, weights = stencilTerms(cells, alpha1, u0, v0, w0, dx, dy, dz,
+                                              e, f, g, h, m, n, o, p, q, DESCENDING_Y, A, B)
+        colors.append((cells, omega * rhs / diagonal)
+                      + tuple(omega * weight / diagonal for weight in weights))
+    
+    for N in range(maxIterations):
+        change = 0.
+        for cells, const, cxp, cxm, cyp, cym, czp, czm in colors:
+            change += calcLambdaRedBlack(cells, lambdaN1, const, cxp, cxm, cyp, cym,
+                                         czp, czm, 1. - omega)
+        
+        if (N + 1) % normInterval == 0 or N == maxIterations - 1:
+            # Calculate how much lambda evolves between 2 consecutive iterations
+            eps = change / np.sum(np.abs(lambdaN1))
+            history.append((N + 1, eps))
+            print("Iteration {0} (max {1}) - eps = {2}".format(N + 1, maxIterations,
+                                                               np.round(eps, 6)))
+            if eps < thresholdIterations:
+                break
+            # Feedback to QGIS at every check
+            if feedback is not None:
+                feedback.setProgressText("""Iteration {0} (max {1}) - eps = {2} >= {3}
+                                         """.format(N + 1, maxIterations,
+                                                    np.round(eps, 6),
+                                                    thresholdIterations))
+                if feedback.isCanceled():
+                    feedback.setProgressText("Calculation cancelled by user")
+                    break
     
-    # Calculates the final wind speed
+    return lambdaN1, N + 1
 
-    # go descending order along y
+def iterateMultigrid(cells4Solver, lambdaN1, alpha1, u0, v0, w0, dx, dy, dz,
+                     e, f, g, h, m, n, o, p, q, A, B, maxIterations, thresholdIterations,
+                     feedback, history):
+    """ Conjugate gradient iterations on the equations of the cells (see
+    stencilTerms, the matrix of the equations is symmetric positive definite)
+    preconditioned by a multigrid V-cycle (see multigridLevels), starting from
+    the initial lambda. Stops when the relative residual of the equations goes
+    under thresholdIterations, possibly without iterating. The residuals,
+    from the initial one (iteration 0), are appended to history. Returns
+    lambda and the number of iterations."""
+    if sparse is None:
+        raise ImportError("The 'multigrid' wind solver requires the Python package 'scipy'")
+    i, j, k = cells4Solver[:, 0], cells4Solver[:, 1], cells4Solver[:, 2]
+    rhs, diagonal, weights = stencilTerms(cells4Solver, alpha1, u0, v0, w0, dx, dy, dz,
+                                          e, f, g, h, m, n, o, p, q, DESCENDING_Y, A, B)
+    matrix, b = assembleEquations(cells4Solver, lambdaN1, rhs, diagonal, weights)
+    levels = multigridLevels(matrix, cells4Solver)
+    
+    x = lambdaN1[i, j, k].copy()
+    r = b - matrix.dot(x)
+    normB = np.linalg.norm(b)
+    if normB == 0:
+        normB = 1.
+    res = np.linalg.norm(r) / normB
+    history.append((0, res))
+    N = 0
+    if res >= thresholdIterations:
+        z = vCycle(levels, 0, r)
+        d = z.copy()
+        rz = r.dot(z)
+        for N in range(1, maxIterations + 1):
+            Ad = matrix.dot(d)
+            step = rz / d.dot(Ad)
+            x += step * d
+            r -= step * Ad
+            res = np.linalg.norm(r) / normB
+            history.append((N, res))
+            print("Iteration {0} (max {1}) - residual = {2}".format(N, maxIterations,
+                                                                  np.round(res, 8)))
+            if res < thresholdIterations:
+                break
+            if feedback is not None:
+                feedback.setProgressText("""Iteration {0} (max {1}) - residual = {2} >= {3}
+                                         """.format(N, maxIterations,
+                                                    np.round(res, 8),
+                                                    thresholdIterations))
+                if feedback.isCanceled():
+                    feedback.setProgressText("Calculation cancelled by user")
+                    break
+            z = vCycle(levels, 0, r)
+            rzNew = r.dot(z)
+            d = z + (rzNew / rz) * d
+            rz = rzNew
+    
+    lambdaN1[i, j, k] = x
+    return lambdaN1, N
+
+def assembleEquations(cells, lambdaN1, rhs, diagonal, weights):
+    """ Sparse matrix and right-hand side of the equations of the cells
+    (see stencilTerms), the lambda of the other cells (boundaries and
+    buildings) being fixed to their value in lambdaN1."""
+    nx, ny, nz = lambdaN1.shape
+    ncells = cells.shape[0]
+    flat = np.ravel_multi_index((cells[:, 0], cells[:, 1], cells[:, 2]), lambdaN1.shape)
+    unknown = np.full(nx * ny * nz, -1, dtype = np.int64)
+    unknown[flat] = np.arange(ncells)
+    b = rhs.copy()
+    rows = [np.arange(ncells)]
+    cols = [np.arange(ncells)]
+    values = [diagonal]
+    # Neighbours at i + 1, i - 1, j + 1, j - 1, k + 1 and k - 1
+    for offset, weight in zip((ny * nz, -ny * nz, nz, -nz, 1, -1), weights):
+        neighbour = unknown[flat + offset]
+        isUnknown = neighbour >= 0
+        rows.append(np.nonzero(isUnknown)[0])
+        cols.append(neighbour[isUnknown])
+        values.append(-weight[isUnknown])
+        b[~isUnknown] += weight[~isUnknown] * lambdaN1.ravel()[flat[~isUnknown] + offset]
+    matrix = sparse.csr_matrix((np.concatenate(values),
+                                (np.concatenate(rows), np.concatenate(cols))),
+                               shape = (ncells, ncells))
+    return matrix, b
+
+def multigridLevels(matrix, cells, coarsestSize = MULTIGRID_COARSEST_SIZE):
+    """ Levels of a smoothed aggregation multigrid for the equations matrix of
+    the cells: the cells of each 2 x 2 x 2 block of the grid are aggregated
+    into one coarse cell, the prolongation of the aggregates is smoothed with
+    a damped Jacobi step and the coarse matrix is P^T A P. Levels are added
+    until the coarse matrix has fewer than coarsestSize rows, which is
+    factorized. Returns the list of (matrix, prolongation) of each level, the
+    last one being (LU factorization, None)."""
+    levels = []
+    coordinates = cells.astype(np.int64)
+    while matrix.shape[0] > coarsestSize:
+        coarse = coordinates // 2
+        keys = np.ravel_multi_index(coarse.T, tuple(coarse.max(axis = 0) + 1))
+        keys, first, aggregate = np.unique(keys, return_index = True, return_inverse = True)
+        if keys.size == matrix.shape[0]:
+            break
+        tentative = sparse.csr_matrix((np.ones(matrix.shape[0]),
+                                       (np.arange(matrix.shape[0]), aggregate.ravel())),
+                                      shape = (matrix.shape[0], keys.size))
+        prolongation = tentative - sparse.diags(2. / 3. / matrix.diagonal()).dot(matrix.dot(tentative))
+        prolongation = prolongation.tocsr()
+        levels.append((matrix, prolongation))
+        matrix = prolongation.T.dot(matrix.dot(prolongation)).tocsr()
+        coordinates = coarse[first]
+    levels.append((splu(matrix.tocsc()), None))
+    return levels
+
+def vCycle(levels, level, r):
+    """ Approximate solution of the equations of level for the residual r,
+    with a symmetric Gauss-Seidel smoothing before and after the coarse
+    level correction."""
+    matrix, prolongation = levels[level]
+    if prolongation is None:
+        return matrix.solve(r)
+    x = np.zeros(r.size)
+    gaussSeidel(matrix.indptr, matrix.indices, matrix.data, x, r, True)
+    x += prolongation.dot(vCycle(levels, level + 1, prolongation.T.dot(r - matrix.dot(x))))
+    gaussSeidel(matrix.indptr, matrix.indices, matrix.data, x, r, False)
+    return x
+
+def stencilTerms(cells, alpha1, u0, v0, w0, dx, dy, dz, e, f, g, h, m, n, o, p, q, DESCENDING_Y, A, B):
+    """ Terms of the equation solved for lambda at the cells (i, j, k),
+        diagonal * lambda - sum(weight * lambda of neighbour) = rhs
+    (see calcLambda). Returns rhs, diagonal and the weights of the
+    neighbours at i + 1, i - 1, j + 1, j - 1, k + 1 and k - 1."""
+    i, j, k = cells[:, 0], cells[:, 1], cells[:, 2]
+    diagonal = 2. * (o[i, j, k] + A * p[i, j, k] + B * q[i, j, k])
+    divergence = (u0[i + 1, j, k] - u0[i, j, k]) / dx + (v0[i, j + 1, k] - v0[i, j, k]) / dy \
+        + (w0[i, j, k + 1] - w0[i, j, k]) / dz
+    # Go descending order along y
     if DESCENDING_Y:
-        u[1:nx, :, :] = u0[1:nx, :, :] + 0.5 * (
-                1. / (alpha1 ** 2)) * (lambdaN1[0:nx-1, :, :] - lambdaN1[1:nx, :, :]) / dx
-        v[:, 1:ny, :] = v0[:, 1:ny, :] + 0.5 * (
-                1. / (alpha1 ** 2)) * (lambdaN1[:, 0:ny-1, :] - lambdaN1[:, 1:ny, :]) / dy
-        w[:, :, 1:nz] = w0[:, :, 1:nz] + 0.5 * (
-                1. / (alpha2 ** 2)) * (lambdaN1[:, :, 0:nz - 1] - lambdaN1[:, :, 1:nz]) / dz
+        divergence = -divergence
+        weights = (f, e, A * h, A * g, B * n, B * m)
     else:
-        u[1:nx, :, :] = u0[1:nx, :, :] + 0.5 * (
-                1. / (alpha1 ** 2)) * (lambdaN1[1:nx, :, :] - lambdaN1[0:nx - 1, :, :]) / dx
-        v[:, 1:ny, :] = v0[:, 1:ny, :] + 0.5 * (
-                1. / (alpha1 ** 2)) * (lambdaN1[:, 1:ny, :] - lambdaN1[:, 0:ny - 1, :]) / dy
-        w[:, :, 1:nz] = w0[:, :, 1:nz] + 0.5 * (
-                1. / (alpha2 ** 2)) * (lambdaN1[:, :, 1:nz] - lambdaN1[:, :, 0:nz - 1]) / dz
+        weights = (e, f, A * g, A * h, B * m, B * n)
+    rhs = 2. * dx ** 2 * alpha1 ** 2 * divergence
+    return rhs, diagonal, tuple(weight[i, j, k] for weight in weights)
 
-    # Reset input and output wind speed to zero for building cells
-    u[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
-    u[buildingCoordinates[0]+1,buildingCoordinates[1],buildingCoordinates[2]]=0
-    v[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
-    v[buildingCoordinates[0],buildingCoordinates[1]+1,buildingCoordinates[2]]=0
-    w[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]] = 0
-    w[buildingCoordinates[0],buildingCoordinates[1],buildingCoordinates[2]+1]=0
+def relativeResidual(cells, lambdaN1, rhs, diagonal, weights):
+    """ Norm of the residual of the equations of the cells (see stencilTerms)
+    relative to the norm of rhs."""
+    i, j, k = cells[:, 0], cells[:, 1], cells[:, 2]
+    cxp, cxm, cyp, cym, czp, czm = weights
+    residual = rhs - diagonal * lambdaN1[i, j, k] + cxp * lambdaN1[i + 1, j, k] \
+        + cxm * lambdaN1[i - 1, j, k] + cyp * lambdaN1[i, j + 1, k] + cym * lambdaN1[i, j - 1, k] \
+        + czp * lambdaN1[i, j, k + 1] + czm * lambdaN1[i, j, k - 1]
+    normRhs = np.linalg.norm(rhs)
+    return np.linalg.norm(residual) / (normRhs if normRhs > 0 else 1.)
 
-    print("Time spent by the wind speed solver: {0} s".format(time.time()-timeStartCalculation))
-    
-    return u, v, w
+def saveConvergenceReport(report, filename):
+    """ Save the convergence report of the wind solver (see solver) as a text
+    file: the summary as comment lines (starting with "#") followed by the
+    iteration and the value of the stopping criterion at each check."""
+    with open(filename, "w") as f:
+        for key in ("method", "iterations", "maxIterations", "threshold", "criterion",
+                    "converged", "residual", "setupTime", "time"):
+            f.write("# {0}: {1}\n".format(key, report[key]))
+        f.write("# iteration value\n")
+        for iteration, value in report["history"]:
+            f.write("{0} {1:.6e}\n".format(iteration, value))
+
+@jit(nopython=True)
+def gaussSeidel(indptr, indices, data, x, b, forward):
+    """ Gauss-Seidel sweep (in place) on the sparse (CSR) equations
+    data x = b, in increasing row order if forward else decreasing."""
+    nrows = x.size
+    for t in range(nrows):
+        row = t if forward else nrows - 1 - t
+        total = b[row]
+        diagonal = 0.
+        for c in range(indptr[row], indptr[row + 1]):
+            col = indices[c]
+            if col == row:
+                diagonal = data[c]
+            else:
+                total -= data[c] * x[col]
+        x[row] = total / diagonal
+
+@jit(nopython=True, parallel=True)
+def calcLambdaRedBlack(cells, lambdaN1, const, cxp, cxm, cyp, cym, czp, czm, relaxation):
+    """ SOR update (in place) of the cells of one color, returns the sum of
+    the absolute changes of lambda."""
+    change = 0.
+    for t in prange(cells.shape[0]):
+        i = cells[t, 0]
+        j = cells[t, 1]
+        k = cells[t, 2]
+        old = lambdaN1[i, j, k]
+        new = const[t] + cxp[t] * lambdaN1[i + 1, j, k] + cxm[t] * lambdaN1[i - 1, j, k] \
+            + cyp[t] * lambdaN1[i, j + 1, k] + cym[t] * lambdaN1[i, j - 1, k] \
+            + czp[t] * lambdaN1[i, j, k + 1] + czm[t] * lambdaN1[i, j, k - 1] + relaxation * old
+        lambdaN1[i, j, k] = new
+        change += abs(new - old)
+    return change
 
 @jit(nopython=True)
 def calcLambda(cells4Solver, lambdaN, lambdaN1, omega, alpha1, u0, v0, w0, dx, dy, dz, e, f, g, h, m, n, o, p, q, DESCENDING_Y, A, B):
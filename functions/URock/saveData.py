@@ -15,7 +15,8 @@ from .GlobalVariables import HORIZ_WIND_DIRECTION, HORIZ_WIND_SPEED, WIND_SPEED,
     OUTPUT_DIRECTORY, MESH_SIZE, OUTPUT_FILENAME, DELETE_OUTPUT_IF_EXISTS,\
     OUTPUT_RASTER_EXTENSION, OUTPUT_VECTOR_EXTENSION, OUTPUT_NETCDF_EXTENSION,\
     WIND_GROUP, WINDSPEED_PROFILE, RLON, RLAT, LON, LAT, LEVELS, WINDSPEED_X,\
-    WINDSPEED_Y, WINDSPEED_Z, VERT_WIND, Z, OUTPUT_FILENAME, PREFIX_NAME
+    WINDSPEED_Y, WINDSPEED_Z, VERT_WIND, Z, OUTPUT_FILENAME, PREFIX_NAME,\
+    DIRECTION, SPEED
 from datetime import datetime
 import netCDF4 as nc4
 import os
@@ -300,6 +301,117 @@ def saveToNetCDF(longitude,
     
     return path + OUTPUT_NETCDF_EXTENSION
     
+def createBatchNetCDF(longitude,
+                      latitude,
+                      x,
+                      y,
+                      windDirections,
+                      windSpeeds,
+                      path,
+                      urock_srid,
+                      horizontal_res,
+                      vertical_res):
+    """
+    Create the netCDF file of a batch calculation (see BatchCalculation), the
+    wind speed and vertical wind profile being indexed by wind direction and
+    reference wind speed, and filled direction by direction (fillBatchNetCDF)
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        longitude: np.array (2D - X, Y)
+            Longitude of each of the (X, Y) points
+        latitude: np.array (2D - X, Y)
+            Latitude of each of the (X, Y) points
+        x: np.array (1D)
+            X grid coordinates (in the urock_srid coordinate system)
+        y: np.array (1D)
+            Y grid coordinates (in the urock_srid coordinate system)
+        windDirections: list
+            Wind directions (°, clock-wise, North = 0°)
+        windSpeeds: list
+            Wind speeds at the reference height (m/s)
+        path: String
+            Path and filename to save NetCDF file
+        urock_srid: int
+            EPSG code initially used for the URock calculations
+    
+    Returns
+    -------
+        The netCDF4.Dataset opened in writing mode
+    """    
+    f = nc4.Dataset(path + OUTPUT_NETCDF_EXTENSION,'w', format='NETCDF4')
+    
+    # 3D WIND SPEED DATA (the number of levels depends on the wind direction)
+    wind3dGrp = f.createGroup(WIND_GROUP)
+    wind3dGrp.createDimension(DIRECTION, len(windDirections))
+    wind3dGrp.createDimension(SPEED, len(windSpeeds))
+    wind3dGrp.createDimension('rlon', len(x))
+    wind3dGrp.createDimension('rlat', len(y))
+    wind3dGrp.createDimension('z', None)
+    direction = wind3dGrp.createVariable(DIRECTION, 'f4', DIRECTION)
+    speed = wind3dGrp.createVariable(SPEED, 'f4', SPEED)
+    rlon = wind3dGrp.createVariable(RLON, 'f8', 'rlon')
+    rlat = wind3dGrp.createVariable(RLAT, 'f8', 'rlat')
+    z = wind3dGrp.createVariable(Z, 'f4', 'z')
+    lon = wind3dGrp.createVariable(LON, 'f8', ('rlon', 'rlat'))
+    lat = wind3dGrp.createVariable(LAT, 'f8', ('rlon', 'rlat'))
+    dimensions = (DIRECTION, SPEED, 'rlon', 'rlat', 'z')
+    for name in [WINDSPEED_X, WINDSPEED_Y, WINDSPEED_Z]:
+        wind3dGrp.createVariable(name, 'f4', dimensions, fill_value = np.nan, zlib = True)\
+            .units = 'meter per second'
+    direction[:] = windDirections
+    speed[:] = windSpeeds
+    rlon[:] = x
+    rlat[:] = y
+    lon[:,:] = longitude
+    lat[:,:] = latitude
+    
+    # VERTICAL WIND PROFILE DATA
+    vertWindProfGrp = f.createGroup(VERT_WIND)
+    vertWindProfGrp.createDimension(DIRECTION, len(windDirections))
+    vertWindProfGrp.createDimension(SPEED, len(windSpeeds))
+    vertWindProfGrp.createDimension('z', None)
+    z_profile = vertWindProfGrp.createVariable(Z, 'f4', 'z')
+    WindSpeed = vertWindProfGrp.createVariable(WINDSPEED_PROFILE, 'f4', (DIRECTION, SPEED, 'z'),
+                                               fill_value = np.nan)
+    
+    # ADD METADATA
+    direction.units = 'degrees clock-wise from North'
+    speed.units = 'meter per second'
+    rlon.units = 'meters'
+    rlat.units = 'meters'
+    lon.units = 'degrees east'
+    lat.units = 'degrees north'
+    z.units = 'meters'
+    WindSpeed.units = 'meter per second'
+    z_profile.units = 'meters'
+    f.description = "URock dataset containing one group of 3D wind field value and one group of input vertical wind speed profile for each wind direction and reference wind speed"
+    f.history = "Created " + datetime.today().strftime("%y-%m-%d")
+    f.urock_srid = urock_srid
+    f.horizontal_res = horizontal_res
+    f.vertical_res = vertical_res
+    
+    return f
+
+def fillBatchNetCDF(f, i_direction, u, v, w, verticalWindProfiles):
+    """
+    Fill the netCDF file created by createBatchNetCDF with the wind speed
+    (4D arrays: speed, X, Y, Z) and initial vertical wind profiles (2D array:
+    speed, Z) of the wind direction of index i_direction
+    """
+    wind3dGrp = f.groups[WIND_GROUP]
+    vertWindProfGrp = f.groups[VERT_WIND]
+    nz = u.shape[-1]
+    for name, values in [(WINDSPEED_X, u), (WINDSPEED_Y, v), (WINDSPEED_Z, w)]:
+        wind3dGrp.variables[name][i_direction, :, :, :, 0:nz] = values
+    vertWindProfGrp.variables[WINDSPEED_PROFILE][i_direction, :, 0:nz] = verticalWindProfiles
+    
+    # Height of the levels (the first level is the ground)
+    vertical_res = f.vertical_res
+    levels = np.concatenate([[0], (np.arange(1, wind3dGrp.dimensions['z'].size) - 0.5) * vertical_res])
+    wind3dGrp.variables[Z][:] = levels
+    vertWindProfGrp.variables[Z][:] = levels
+
 def saveTable(cursor, tableName, filedir, delete = False, 
               rotationCenterCoordinates = None, rotateAngle = None):
     """ Save a table in .geojson or .shp (the table can be rotated before saving if needed).
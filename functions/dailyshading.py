@@ -9,7 +9,7 @@ from ..util.SEBESOLWEIGCommonFiles import sun_position as sp
 import numpy as np
 
 
-def dailyshading(dsm, vegdsm, vegdsm2, scale, lon, lat, sizex, sizey, tv, UTC, usevegdem, timeInterval, onetime, feedback, folder, gdal_data, trans, dst, wallshadow, wheight, waspect):
+def dailyshading(dsm, vegdsm, vegdsm2, scale, lon, lat, sizex, sizey, tv, UTC, usevegdem, timeInterval, onetime, feedback, folder, gdal_data, trans, dst, wallshadow, wheight, waspect, shadowcache=None):
 
     # lon = lonlat[0]
     # lat = lonlat[1]
@@ -42,8 +42,6 @@ def dailyshading(dsm, vegdsm, vegdsm2, scale, lon, lat, sizex, sizey, tv, UTC, u
     else:
         itera = int(1440 / timeInterval)
 
-    alt = np.zeros(itera)
-    azi = np.zeros(itera)
     hour = int(0)
     index = 0
     time = dict()
@@ -56,10 +54,17 @@ def dailyshading(dsm, vegdsm, vegdsm2, scale, lon, lat, sizex, sizey, tv, UTC, u
         walls = np.zeros((sizex, sizey))
         dirwalls = np.zeros((sizex, sizey))
 
+    # shadowcache (util/shadowcache.py) reuses shadows cast for this surface in earlier runs
+    if shadowcache is not None:
+        if usevegdem == 1:
+            shadowcache = shadowcache.surface(dsm, walls, dirwalls * np.pi / 180., scale, vegdem, vegdem2, bush,
+                                              amaxvalue)
+        else:
+            shadowcache = shadowcache.surface(dsm, walls, dirwalls * np.pi / 180., scale)
+
+    # Times of all timesteps, the sun positions are then calculated in one call
+    timesteps = []
     for i in range(0, itera):
-        if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
         if onetime == 0:
             minu = int(timeInterval * i)
             if minu >= 60:
@@ -82,16 +87,24 @@ def dailyshading(dsm, vegdsm, vegdsm2, scale, lon, lat, sizex, sizey, tv, UTC, u
 
         HHMMSS = dectime_to_timevec(ut_time)
         # feedback.setProgressText('HHMMSS:' + str(HHMMSS))
-        time['year'] = year
-        time['month'] = month
-        time['day'] = day
-        time['hour'] = HHMMSS[0]
-        time['min'] = HHMMSS[1]
-        time['sec'] = HHMMSS[2]
+        timesteps.append((year, month, day) + HHMMSS)
+
+    timesteps = np.array(timesteps)
+    time['year'] = timesteps[:, 0]
+    time['month'] = timesteps[:, 1]
+    time['day'] = timesteps[:, 2]
+    time['hour'] = timesteps[:, 3]
+    time['min'] = timesteps[:, 4]
+    time['sec'] = timesteps[:, 5]
+    sun = sp.sun_positions(time, location)
+    alt = 90. - sun['zenith']
+    azi = sun['azimuth']
 
-        sun = sp.sun_position(time, location)
-        alt[i] = 90. - sun['zenith']
-        azi[i] = sun['azimuth']
+    for i in range(0, itera):
+        if feedback.isCanceled():
+                feedback.setProgressText("Calculation cancelled")
+                break
+        year, month, day, time['hour'], time['min'], time['sec'] = timesteps[i].tolist()
 
         if time['sec'] == 59: #issue 228 and 256
             time['sec'] = 0
@@ -108,12 +121,17 @@ def dailyshading(dsm, vegdsm, vegdsm2, scale, lon, lat, sizex, sizey, tv, UTC, u
         if alt[i] > 0:
             if wallshadow == 1: # Include wall shadows (Issue #121)
                 if usevegdem == 1:
-                    vegsh, sh, _, wallsh, _, wallshve, _, _ = shadowingfunction_wallheight_23(dsm, vegdem, vegdem2,
+                    if shadowcache is not None:
+                        vegsh, sh, _, wallsh, _, wallshve, _, _ = shadowcache.wallheight_23(azi[i], alt[i])
+                    else:
+                        vegsh, sh, _, wallsh, _, wallshve, _, _ = shadowingfunction_wallheight_23(dsm, vegdem, vegdem2,
                                                 azi[i], alt[i], scale, amaxvalue, bush, walls, dirwalls * np.pi / 180.)
                     sh = sh - (1 - vegsh) * (1 - psi)
                     if onetime == 0:
                         filenamewallshve = folder + '/Facadeshadow_fromvegetation_' + timestr + '_LST.tif'
                         saveraster(gdal_data, filenamewallshve, wallshve)
+                elif shadowcache is not None:
+                    sh, wallsh, _, _, _ = shadowcache.wallheight_13(azi[i], alt[i])
                 else:
                     sh, wallsh, _, _, _ = shadowingfunction_wallheight_13(dsm, azi[i], alt[i], scale,
                                                                                         walls, dirwalls * np.pi / 180.)
@@ -128,11 +146,17 @@ def dailyshading(dsm, vegdsm, vegdsm2, scale, lon, lat, sizex, sizey, tv, UTC, u
 
             else:
                 if usevegdem == 0:
-                    sh = shadow.shadowingfunctionglobalradiation(dsm, azi[i], alt[i], scale, feedback, 0)
+                    if shadowcache is not None:
+                        sh = shadowcache.globalradiation(azi[i], alt[i])
+                    else:
+                        sh = shadow.shadowingfunctionglobalradiation(dsm, azi[i], alt[i], scale, feedback, 0)
                     # shtot = shtot + sh
                 else:
-                    shadowresult = shadow.shadowingfunction_20(dsm, vegdem, vegdem2, azi[i], alt[i], scale, amaxvalue,
-                                                            bush, feedback, 0)
+                    if shadowcache is not None:
+                        shadowresult = shadowcache.shadowingfunction_20(azi[i], alt[i])
+                    else:
+                        shadowresult = shadow.shadowingfunction_20(dsm, vegdem, vegdem2, azi[i], alt[i], scale,
+                                                                   amaxvalue, bush, feedback, 0)
                     vegsh = shadowresult["vegsh"]
                     sh = shadowresult["sh"]
                     sh = sh - (1-vegsh)*(1-psi)
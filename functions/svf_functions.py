@@ -1,5 +1,7 @@
 import numpy as np
 from ..util import shadowingfunctions as shadow
+from ..util import parallel
+from ..util.shadowmats import ShadowMatrix
 from ..util.SEBESOLWEIGCommonFiles.create_patches import create_patches
 
 def annulus_weight(altitude, aziinterval):
@@ -41,180 +43,63 @@ def svf_angles_100121():
     return angleresult
 
 
-def svfForProcessing153(dsm, vegdem, vegdem2, scale, usevegdem, feedback):
-    rows = dsm.shape[0]
-    cols = dsm.shape[1]
-    svf = np.zeros([rows, cols])
-    svfE = np.zeros([rows, cols])
-    svfS = np.zeros([rows, cols])
-    svfW = np.zeros([rows, cols])
-    svfN = np.zeros([rows, cols])
-    svfveg = np.zeros((rows, cols))
-    svfEveg = np.zeros((rows, cols))
-    svfSveg = np.zeros((rows, cols))
-    svfWveg = np.zeros((rows, cols))
-    svfNveg = np.zeros((rows, cols))
-    svfaveg = np.zeros((rows, cols))
-    svfEaveg = np.zeros((rows, cols))
-    svfSaveg = np.zeros((rows, cols))
-    svfWaveg = np.zeros((rows, cols))
-    svfNaveg = np.zeros((rows, cols))
-
-    # % amaxvalue
-    vegmax = vegdem.max()
-    amaxvalue = dsm.max()
-    amaxvalue = np.maximum(amaxvalue, vegmax)
-
-    # % Elevation vegdems if buildingDSM inclused ground heights
-    vegdem = vegdem + dsm
-    vegdem[vegdem == dsm] = 0
-    vegdem2 = vegdem2 + dsm
-    vegdem2[vegdem2 == dsm] = 0
-    # % Bush separation
-    bush = np.logical_not((vegdem2 * vegdem)) * vegdem
-
-    index = int(0)
-
+def svf_patches_153():
+    """Altitude, azimuth and annulus band of each patch of the 153-patch sky vault."""
     # patch_option = 1 # 145 patches
     patch_option = 2 # 153 patches
     # patch_option = 3 # 306 patches
     # patch_option = 4 # 612 patches
-    
+
     # Create patches based on patch_option
     skyvaultalt, skyvaultazi, annulino, skyvaultaltint, aziinterval, skyvaultaziint, azistart = create_patches(patch_option)
 
     skyvaultaziint = np.array([360/patches for patches in aziinterval])
     iazimuth = np.hstack(np.zeros((1, np.sum(aziinterval)))) # Nils
+    ialtitude = np.zeros(np.sum(aziinterval))
+    iband = np.zeros(np.sum(aziinterval), dtype=int)
 
-    shmat = np.zeros((rows, cols, np.sum(aziinterval)))
-    vegshmat = np.zeros((rows, cols, np.sum(aziinterval)))
-    vbshvegshmat = np.zeros((rows, cols, np.sum(aziinterval)))
-
+    index = int(0)
     for j in range(0, skyvaultaltint.shape[0]):
         for k in range(0, int(360 / skyvaultaziint[j])):
             iazimuth[index] = k * skyvaultaziint[j] + azistart[j]
             if iazimuth[index] > 360.:
                 iazimuth[index] = iazimuth[index] - 360.
+            ialtitude[index] = skyvaultaltint[j]
+            iband[index] = j
             index = index + 1
-    aziintervalaniso = np.ceil(aziinterval / 2.0)
-    index = int(0)
-    for i in range(0, skyvaultaltint.shape[0]):
-        for j in np.arange(0, (aziinterval[int(i)])):
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
-            altitude = skyvaultaltint[int(i)]
-            azimuth = iazimuth[int(index)]
 
-            # Casting shadow
-            if usevegdem == 1:
-                shadowresult = shadow.shadowingfunction_20(dsm, vegdem, vegdem2, azimuth, altitude,
-                                                           scale, amaxvalue, bush, feedback, 1)
-                vegsh = shadowresult["vegsh"]
-                vbshvegsh = shadowresult["vbshvegsh"]
-                sh = shadowresult["sh"]
-                vegshmat[:, :, index] = vegsh
-                vbshvegshmat[:, :, index] = vbshvegsh
-            else:
-                sh = shadow.shadowingfunctionglobalradiation(dsm, azimuth, altitude, scale, feedback, 1)
-
-            shmat[:, :, index] = sh
-
-            # Calculate svfs
-            for k in np.arange(annulino[int(i)]+1, (annulino[int(i+1.)])+1):
-                weight = annulus_weight(k, aziinterval[i])*sh
-                svf = svf + weight
-                weight = annulus_weight(k, aziintervalaniso[i]) * sh
-                if (azimuth >= 0) and (azimuth < 180):
-                    svfE = svfE + weight
-                if (azimuth >= 90) and (azimuth < 270):
-                    svfS = svfS + weight
-                if (azimuth >= 180) and (azimuth < 360):
-                    svfW = svfW + weight
-                if (azimuth >= 270) or (azimuth < 90):
-                    svfN = svfN + weight
+    patches = {'altitude': ialtitude, 'azimuth': iazimuth, 'band': iband, 'annulino': annulino,
+               'aziinterval': aziinterval, 'progresstotal': np.sum(aziinterval)}
 
-            if usevegdem == 1:
-                for k in np.arange(annulino[int(i)] + 1, (annulino[int(i + 1.)]) + 1):
-                    # % changed to include 90
-                    weight = annulus_weight(k, aziinterval[i])
-                    svfveg = svfveg + weight * vegsh
-                    svfaveg = svfaveg + weight * vbshvegsh
-                    weight = annulus_weight(k, aziintervalaniso[i])
-                    if (azimuth >= 0) and (azimuth < 180):
-                        svfEveg = svfEveg + weight * vegsh
-                        svfEaveg = svfEaveg + weight * vbshvegsh
-                    if (azimuth >= 90) and (azimuth < 270):
-                        svfSveg = svfSveg + weight * vegsh
-                        svfSaveg = svfSaveg + weight * vbshvegsh
-                    if (azimuth >= 180) and (azimuth < 360):
-                        svfWveg = svfWveg + weight * vegsh
-                        svfWaveg = svfWaveg + weight * vbshvegsh
-                    if (azimuth >= 270) or (azimuth < 90):
-                        svfNveg = svfNveg + weight * vegsh
-                        svfNaveg = svfNaveg + weight * vbshvegsh
-
-            index += 1
-            feedback.setProgress(int(index * (100. / np.sum(aziinterval))))
-
-    svfS = svfS + 3.0459e-004
-    svfW = svfW + 3.0459e-004
-    # % Last azimuth is 90. Hence, manual add of last annuli for svfS and SVFW
-    # %Forcing svf not be greater than 1 (some MATLAB crazyness)
-    svf[(svf > 1.)] = 1.
-    svfE[(svfE > 1.)] = 1.
-    svfS[(svfS > 1.)] = 1.
-    svfW[(svfW > 1.)] = 1.
-    svfN[(svfN > 1.)] = 1.
+    return patches
 
-    if usevegdem == 1:
-        last = np.zeros((rows, cols))
-        last[(vegdem2 == 0.)] = 3.0459e-004
-        svfSveg = svfSveg + last
-        svfWveg = svfWveg + last
-        svfSaveg = svfSaveg + last
-        svfWaveg = svfWaveg + last
-        # %Forcing svf not be greater than 1 (some MATLAB crazyness)
-        svfveg[(svfveg > 1.)] = 1.
-        svfEveg[(svfEveg > 1.)] = 1.
-        svfSveg[(svfSveg > 1.)] = 1.
-        svfWveg[(svfWveg > 1.)] = 1.
-        svfNveg[(svfNveg > 1.)] = 1.
-        svfaveg[(svfaveg > 1.)] = 1.
-        svfEaveg[(svfEaveg > 1.)] = 1.
-        svfSaveg[(svfSaveg > 1.)] = 1.
-        svfWaveg[(svfWaveg > 1.)] = 1.
-        svfNaveg[(svfNaveg > 1.)] = 1.
-
-    svfresult = {'svf': svf, 'svfE': svfE, 'svfS': svfS, 'svfW': svfW, 'svfN': svfN,
-                    'svfveg': svfveg, 'svfEveg': svfEveg, 'svfSveg': svfSveg, 'svfWveg': svfWveg,
-                    'svfNveg': svfNveg, 'svfaveg': svfaveg, 'svfEaveg': svfEaveg, 'svfSaveg': svfSaveg,
-                    'svfWaveg': svfWaveg, 'svfNaveg': svfNaveg, 'shmat': shmat, 'vegshmat': vegshmat, 'vbshvegshmat': vbshvegshmat}
-                    # ,
-                    # 'vbshvegshmat': vbshvegshmat, 'wallshmat': wallshmat, 'wallsunmat': wallsunmat,
-                    # 'wallshvemat': wallshvemat, 'facesunmat': facesunmat}
-    return svfresult
 
+def svf_patches_655():
+    """Altitude, azimuth and annulus band of each patch of the 655-patch sky vault."""
+    noa = 19.
+    #% No. of anglesteps minus 1
+    step = 89./noa
+    iangle = np.array(np.hstack((np.arange(step/2., 89., step), 90.)))
+    annulino = np.array(np.hstack((np.round(np.arange(0., 89., step)), 90.)))
+    angleresult = svf_angles_100121()
+    aziinterval = angleresult["aziinterval"]
+    iazimuth = angleresult["iazimuth"]
+
+    ialtitude = []
+    iband = []
+    for i in np.arange(0, iangle.shape[0]-1):
+        for j in np.arange(0, (aziinterval[int(i)])):
+            ialtitude.append(iangle[int(i)])
+            iband.append(int(i))
 
-def svfForProcessing655(dsm, vegdem, vegdem2, scale, usevegdem, feedback):
-    rows = dsm.shape[0]
-    cols = dsm.shape[1]
-    svf = np.zeros([rows, cols])
-    svfE = np.zeros([rows, cols])
-    svfS = np.zeros([rows, cols])
-    svfW = np.zeros([rows, cols])
-    svfN = np.zeros([rows, cols])
-    svfveg = np.zeros((rows, cols))
-    svfEveg = np.zeros((rows, cols))
-    svfSveg = np.zeros((rows, cols))
-    svfWveg = np.zeros((rows, cols))
-    svfNveg = np.zeros((rows, cols))
-    svfaveg = np.zeros((rows, cols))
-    svfEaveg = np.zeros((rows, cols))
-    svfSaveg = np.zeros((rows, cols))
-    svfWaveg = np.zeros((rows, cols))
-    svfNaveg = np.zeros((rows, cols))
+    patches = {'altitude': np.array(ialtitude), 'azimuth': iazimuth[:len(ialtitude)], 'band': np.array(iband),
+               'annulino': annulino, 'aziinterval': aziinterval, 'progresstotal': 655.}
 
+    return patches
+
+
+def svf_prepare(dsm, vegdem, vegdem2):
+    """Maximum height, elevated vegetation DSMs and bush separation used for shadow casting."""
     # % amaxvalue
     vegmax = vegdem.max()
     amaxvalue = dsm.max()
@@ -228,107 +113,312 @@ def svfForProcessing655(dsm, vegdem, vegdem2, scale, usevegdem, feedback):
     # % Bush separation
     bush = np.logical_not((vegdem2 * vegdem)) * vegdem
 
-    # shmat = np.zeros((rows, cols, 145))
-    # vegshmat = np.zeros((rows, cols, 145))
+    return amaxvalue, vegdem, vegdem2, bush
 
-    noa = 19.
-    #% No. of anglesteps minus 1
-    step = 89./noa
-    iangle = np.array(np.hstack((np.arange(step/2., 89., step), 90.)))
-    annulino = np.array(np.hstack((np.round(np.arange(0., 89., step)), 90.)))
-    angleresult = svf_angles_100121()
-    aziinterval = angleresult["aziinterval"]
-    iazimuth = angleresult["iazimuth"]
-    aziintervalaniso = np.ceil((aziinterval/2.))
-    index = 1.
 
-    for i in np.arange(0, iangle.shape[0]-1):
-        for j in np.arange(0, (aziinterval[int(i)])):
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
-            altitude = iangle[int(i)]
-            azimuth = iazimuth[int(index)-1]
+def svf_accumulators(rows, cols):
+    names = ['svf', 'svfE', 'svfS', 'svfW', 'svfN', 'svfveg', 'svfEveg', 'svfSveg', 'svfWveg', 'svfNveg',
+             'svfaveg', 'svfEaveg', 'svfSaveg', 'svfWaveg', 'svfNaveg']
+    return dict((name, np.zeros((rows, cols))) for name in names)
 
-            # Casting shadow
-            if usevegdem == 1:
-                shadowresult = shadow.shadowingfunction_20(dsm, vegdem, vegdem2, azimuth, altitude,
-                                                            scale, amaxvalue, bush, feedback, 1)
-                vegsh = shadowresult["vegsh"]
-                vbshvegsh = shadowresult["vbshvegsh"]
-                sh = shadowresult["sh"]
-            else:
-                sh = shadow.shadowingfunctionglobalradiation(dsm, azimuth, altitude, scale, feedback, 1)
-
-            # Calculate svfs
-            for k in np.arange(annulino[int(i)]+1, (annulino[int(i+1.)])+1):
-                weight = annulus_weight(k, aziinterval[i])*sh
-                svf = svf + weight
-                weight = annulus_weight(k, aziintervalaniso[i]) * sh
-                if (azimuth >= 0) and (azimuth < 180):
-                    svfE = svfE + weight
-                if (azimuth >= 90) and (azimuth < 270):
-                    svfS = svfS + weight
-                if (azimuth >= 180) and (azimuth < 360):
-                    svfW = svfW + weight
-                if (azimuth >= 270) or (azimuth < 90):
-                    svfN = svfN + weight
 
+def svf_accumulate(svfresult, sh, vegsh, vbshvegsh, azimuth, band, patches, usevegdem):
+    """Add the contribution of one sky patch to the svf accumulators (in place)."""
+    annulino = patches['annulino']
+    aziinterval = patches['aziinterval']
+    aziintervalaniso = np.ceil(aziinterval / 2.0)
+    i = band
+
+    # Directional contributions of this patch
+    dirs = ''
+    if (azimuth >= 0) and (azimuth < 180):
+        dirs += 'E'
+    if (azimuth >= 90) and (azimuth < 270):
+        dirs += 'S'
+    if (azimuth >= 180) and (azimuth < 360):
+        dirs += 'W'
+    if (azimuth >= 270) or (azimuth < 90):
+        dirs += 'N'
+
+    # Calculate svfs
+    for k in np.arange(annulino[int(i)]+1, (annulino[int(i+1.)])+1):
+        svfresult['svf'] += annulus_weight(k, aziinterval[i])*sh
+        weight = annulus_weight(k, aziintervalaniso[i]) * sh
+        for d in dirs:
+            svfresult['svf' + d] += weight
+
+    if usevegdem == 1:
+        for k in np.arange(annulino[int(i)] + 1, (annulino[int(i + 1.)]) + 1):
+            # % changed to include 90
+            weight = annulus_weight(k, aziinterval[i])
+            svfresult['svfveg'] += weight * vegsh
+            svfresult['svfaveg'] += weight * vbshvegsh
+            weight = annulus_weight(k, aziintervalaniso[i])
+            for d in dirs:
+                svfresult['svf' + d + 'veg'] += weight * vegsh
+                svfresult['svf' + d + 'aveg'] += weight * vbshvegsh
+
+
+def svf_sweep(dsm, vegdem, vegdem2, bush, scale, amaxvalue, usevegdem, patches, feedback, selection=None,
+              shmats=None):
+    """
+    Cast shadows for the sky patches in selection (default all) and stream each shadow
+    mask into the svf accumulators and, if given, the (shmat, vegshmat, vbshvegshmat) ShadowMatrix objects.
+    Returns the accumulated (not yet finalised) svfs.
+    """
+    rows = dsm.shape[0]
+    cols = dsm.shape[1]
+    svfresult = svf_accumulators(rows, cols)
+    if selection is None:
+        selection = np.arange(patches['altitude'].shape[0])
+    sunpositions = [(patches['azimuth'][idx], patches['altitude'][idx]) for idx in selection]
+
+    index = 0
+    for n, sh, vegsh, vbshvegsh in shadow.shadowingfunction_20_batch(dsm, vegdem, vegdem2, sunpositions, scale,
+                                                                     amaxvalue, bush, usevegdem, feedback):
+        if feedback.isCanceled():
+            feedback.setProgressText("Calculation cancelled")
+            break
+        idx = selection[n]
+        if shmats is not None:
+            shmats[0][:, :, idx] = sh
             if usevegdem == 1:
-                for k in np.arange(annulino[int(i)] + 1, (annulino[int(i + 1.)]) + 1):
-                    # % changed to include 90
-                    weight = annulus_weight(k, aziinterval[i])
-                    svfveg = svfveg + weight * vegsh
-                    svfaveg = svfaveg + weight * vbshvegsh
-                    weight = annulus_weight(k, aziintervalaniso[i])
-                    if (azimuth >= 0) and (azimuth < 180):
-                        svfEveg = svfEveg + weight * vegsh
-                        svfEaveg = svfEaveg + weight * vbshvegsh
-                    if (azimuth >= 90) and (azimuth < 270):
-                        svfSveg = svfSveg + weight * vegsh
-                        svfSaveg = svfSaveg + weight * vbshvegsh
-                    if (azimuth >= 180) and (azimuth < 360):
-                        svfWveg = svfWveg + weight * vegsh
-                        svfWaveg = svfWaveg + weight * vbshvegsh
-                    if (azimuth >= 270) or (azimuth < 90):
-                        svfNveg = svfNveg + weight * vegsh
-                        svfNaveg = svfNaveg + weight * vbshvegsh
-
-            index += 1
-            feedback.setProgress(int(index * (100. / 655.)))
-
-    svfS = svfS + 3.0459e-004
-    svfW = svfW + 3.0459e-004
+                shmats[1][:, :, idx] = vegsh
+                shmats[2][:, :, idx] = vbshvegsh
+
+        svf_accumulate(svfresult, sh, vegsh, vbshvegsh, patches['azimuth'][idx], patches['band'][idx], patches,
+                       usevegdem)
+
+        index += 1
+        feedback.setProgress(int(index * (100. / patches['progresstotal'])))
+
+    return svfresult
+
+
+def svf_partition(patches, workers):
+    """
+    Deterministic split of the sky patches over workers. Patches sharing an azimuth
+    stay together so that they can be cast in one sweep, and groups are assigned
+    largest first (cost ~ 1/tan(altitude), the length of the casting loop) to the
+    least loaded worker. Returns one sorted array of patch indices per worker.
+    """
+    groups = {}
+    for idx, azimuth in enumerate(patches['azimuth']):
+        groups.setdefault(azimuth, []).append(idx)
+    groups = list(groups.values())
+    cost = [sum(1. / np.tan(np.radians(min(patches['altitude'][idx], 89.))) for idx in group) for group in groups]
+    order = sorted(range(len(groups)), key=lambda g: (-cost[g], groups[g][0]))
+
+    load = np.zeros(workers)
+    selections = [[] for _ in range(workers)]
+    for g in order:
+        worker = int(np.argmin(load))
+        load[worker] += cost[g]
+        selections[worker].extend(groups[g])
+
+    return [np.array(sorted(selection), dtype=int) for selection in selections if len(selection) > 0]
+
+
+def _svf_worker(task):
+    """Partial svf sweep over a subset of the sky patches, run in a worker process."""
+    descriptors, patches, selection, scale, amaxvalue, usevegdem, backend = task
+    shadow.set_shadow_backend(backend)
+    blocks, arrays = parallel.attach_arrays(descriptors)
+    try:
+        shmats = None
+        if 'shmat' in arrays:
+            cols = arrays['dsm'].shape[1]
+            shmats = tuple(ShadowMatrix(arrays[name], cols) for name in ('shmat', 'vegshmat', 'vbshvegshmat'))
+        svfresult = svf_sweep(arrays['dsm'], arrays['vegdem'], arrays['vegdem2'], arrays['bush'], scale, amaxvalue,
+                              usevegdem, patches, parallel.worker_feedback(), selection, shmats)
+    finally:
+        shmats = None
+        arrays.clear()
+        parallel.release_arrays(blocks, unlink=False)
+
+    return svfresult
+
+
+def svf_sweep_parallel(dsm, vegdem, vegdem2, bush, scale, amaxvalue, usevegdem, patches, feedback, workers,
+                       shadowmats=False):
+    """
+    Same as svf_sweep, with the sky patches split over a pool of worker processes.
+    The inputs are shared with the workers through shared memory. Each worker accumulates
+    its own partial svfs, which are reduced here in worker order so that the result is
+    reproducible for a given number of workers. With shadowmats the packed shadow matrices
+    are cast as well and returned in svfresult ('shmat', 'vegshmat', 'vbshvegshmat'). They
+    are allocated in shared memory, filled by the workers in place and handed over without
+    a copy.
+    """
+    rows = dsm.shape[0]
+    cols = dsm.shape[1]
+    selections = svf_partition(patches, workers)
+
+    inputs = {'dsm': dsm, 'vegdem': vegdem, 'vegdem2': vegdem2, 'bush': bush}
+    blocks, shared, descriptors = parallel.share_arrays(inputs)
+    inputs = None
+    outputs = {}
+    if shadowmats:
+        packedshape = (patches['altitude'].shape[0], rows, (cols + 7) // 8)
+        outputs, outdescriptors = parallel.share_zeros(
+            dict((name, (packedshape, np.uint8)) for name in ('shmat', 'vegshmat', 'vbshvegshmat')))
+        descriptors.update(outdescriptors)
+    try:
+        pool, counter, cancel = parallel.process_pool(len(selections))
+        try:
+            tasks = [(descriptors, patches, selection, scale, amaxvalue, usevegdem, shadow.get_shadow_backend())
+                     for selection in selections]
+            partials = parallel.run_in_pool(pool, _svf_worker, tasks, feedback, counter, cancel,
+                                            patches['progresstotal'])
+        finally:
+            pool.terminate()
+            pool.join()
+
+        if cancel.is_set():
+            feedback.setProgressText("Calculation cancelled")
+
+        svfresult = svf_accumulators(rows, cols)
+        for partial in partials:
+            for name in svfresult:
+                svfresult[name] += partial[name]
+    finally:
+        shared.clear()
+        parallel.release_arrays(blocks)
+
+    svfresult.update((name, ShadowMatrix(outputs[name], cols)) for name in outputs)
+    return svfresult
+
+
+def svf_finalise(svfresult, vegdem2, usevegdem):
+    """Add the last annuli for svfS and svfW and force svfs not to be greater than 1 (in place)."""
+    rows = vegdem2.shape[0]
+    cols = vegdem2.shape[1]
+
+    svfresult['svfS'] += 3.0459e-004
+    svfresult['svfW'] += 3.0459e-004
     # % Last azimuth is 90. Hence, manual add of last annuli for svfS and SVFW
     # %Forcing svf not be greater than 1 (some MATLAB crazyness)
-    svf[(svf > 1.)] = 1.
-    svfE[(svfE > 1.)] = 1.
-    svfS[(svfS > 1.)] = 1.
-    svfW[(svfW > 1.)] = 1.
-    svfN[(svfN > 1.)] = 1.
+    for name in ['svf', 'svfE', 'svfS', 'svfW', 'svfN']:
+        svfresult[name][(svfresult[name] > 1.)] = 1.
 
     if usevegdem == 1:
         last = np.zeros((rows, cols))
         last[(vegdem2 == 0.)] = 3.0459e-004
-        svfSveg = svfSveg + last
-        svfWveg = svfWveg + last
-        svfSaveg = svfSaveg + last
-        svfWaveg = svfWaveg + last
+        svfresult['svfSveg'] += last
+        svfresult['svfWveg'] += last
+        svfresult['svfSaveg'] += last
+        svfresult['svfWaveg'] += last
         # %Forcing svf not be greater than 1 (some MATLAB crazyness)
-        svfveg[(svfveg > 1.)] = 1.
-        svfEveg[(svfEveg > 1.)] = 1.
-        svfSveg[(svfSveg > 1.)] = 1.
-        svfWveg[(svfWveg > 1.)] = 1.
-        svfNveg[(svfNveg > 1.)] = 1.
-        svfaveg[(svfaveg > 1.)] = 1.
-        svfEaveg[(svfEaveg > 1.)] = 1.
-        svfSaveg[(svfSaveg > 1.)] = 1.
-        svfWaveg[(svfWaveg > 1.)] = 1.
-        svfNaveg[(svfNaveg > 1.)] = 1.
-
-    svfresult = {'svf': svf, 'svfE': svfE, 'svfS': svfS, 'svfW': svfW, 'svfN': svfN,
-                    'svfveg': svfveg, 'svfEveg': svfEveg, 'svfSveg': svfSveg, 'svfWveg': svfWveg,
-                    'svfNveg': svfNveg, 'svfaveg': svfaveg, 'svfEaveg': svfEaveg, 'svfSaveg': svfSaveg,
-                    'svfWaveg': svfWaveg, 'svfNaveg': svfNaveg}
+        for name in ['svfveg', 'svfEveg', 'svfSveg', 'svfWveg', 'svfNveg',
+                     'svfaveg', 'svfEaveg', 'svfSaveg', 'svfWaveg', 'svfNaveg']:
+            svfresult[name][(svfresult[name] > 1.)] = 1.
 
     return svfresult
+
+
+def svfForProcessing153(dsm, vegdem, vegdem2, scale, usevegdem, feedback, workers=1):
+    rows = dsm.shape[0]
+    cols = dsm.shape[1]
+
+    amaxvalue, vegdem, vegdem2, bush = svf_prepare(dsm, vegdem, vegdem2)
+    patches = svf_patches_153()
+
+    if workers > 1:
+        svfresult = svf_sweep_parallel(dsm, vegdem, vegdem2, bush, scale, amaxvalue, usevegdem, patches, feedback,
+                                       workers, shadowmats=True)
+    else:
+        npatches = patches['altitude'].shape[0]
+        shmat = ShadowMatrix.zeros(rows, cols, npatches)
+        vegshmat = ShadowMatrix.zeros(rows, cols, npatches)
+        vbshvegshmat = ShadowMatrix.zeros(rows, cols, npatches)
+        svfresult = svf_sweep(dsm, vegdem, vegdem2, bush, scale, amaxvalue, usevegdem, patches, feedback,
+                              shmats=(shmat, vegshmat, vbshvegshmat))
+        svfresult.update({'shmat': shmat, 'vegshmat': vegshmat, 'vbshvegshmat': vbshvegshmat})
+    svf_finalise(svfresult, vegdem2, usevegdem)
+
+                    # ,
+                    # 'vbshvegshmat': vbshvegshmat, 'wallshmat': wallshmat, 'wallsunmat': wallsunmat,
+                    # 'wallshvemat': wallshvemat, 'facesunmat': facesunmat}
+    return svfresult
+
+
+def svfForProcessing655(dsm, vegdem, vegdem2, scale, usevegdem, feedback, workers=1):
+    amaxvalue, vegdem, vegdem2, bush = svf_prepare(dsm, vegdem, vegdem2)
+    patches = svf_patches_655()
+
+    if workers > 1:
+        svfresult = svf_sweep_parallel(dsm, vegdem, vegdem2, bush, scale, amaxvalue, usevegdem, patches, feedback,
+                                       workers)
+    else:
+        svfresult = svf_sweep(dsm, vegdem, vegdem2, bush, scale, amaxvalue, usevegdem, patches, feedback)
+    svf_finalise(svfresult, vegdem2, usevegdem)
+
+    return svfresult
+
+
+def svf_halo(dsm, vegdem, scale, patches):
+    """
+    Number of pixels a shadow can be cast from onto a tile. Shadow casting steps at
+    which the lowered surface is below the lowest DSM pixel cannot change any result,
+    so the reach is set by the height range of the (elevated) surfaces, the pixel
+    size and the lowest patch altitude. Two steps are added for the last step of the
+    casting loop and the pergola condition, which looks one step back.
+    """
+    heightrange = np.maximum(dsm.max(), vegdem.max()) - dsm.min()
+    lowest = np.radians(np.min(patches['altitude']))
+    return int(np.ceil(heightrange * scale / np.tan(lowest))) + 2
+
+
+def svfForProcessingTiles(dsm, vegdem, vegdem2, scale, usevegdem, feedback, tilesize, aniso=1, workers=1):
+    """
+    Tiled version of svfForProcessing153 (aniso == 1) or svfForProcessing655 for
+    rasters that do not fit in memory together with the svf accumulators and the
+    shadow matrices. Each tile is extended by a halo large enough to capture
+    all shadows cast into it, so the results inside each tile equal the untiled ones.
+    Yields (row offset, column offset, svfresult) per tile with all arrays (including
+    shmat, vegshmat and vbshvegshmat if aniso == 1) cropped to the tile.
+    """
+    rows = dsm.shape[0]
+    cols = dsm.shape[1]
+
+    amaxvalue, vegdem, vegdem2, bush = svf_prepare(dsm, vegdem, vegdem2)
+    if aniso == 1:
+        patches = svf_patches_153()
+    else:
+        patches = svf_patches_655()
+    halo = svf_halo(dsm, vegdem, scale, patches)
+    npatches = patches['altitude'].shape[0]
+
+    tiles = [(r, c) for r in range(0, rows, tilesize) for c in range(0, cols, tilesize)]
+    for t, (r0, c0) in enumerate(tiles):
+        if feedback.isCanceled():
+            feedback.setProgressText("Calculation cancelled")
+            break
+        feedback.setProgressText('Calculating SVF for tile ' + str(t + 1) + ' of ' + str(len(tiles)))
+        r1 = min(r0 + tilesize, rows)
+        c1 = min(c0 + tilesize, cols)
+        pr0 = max(r0 - halo, 0)
+        pr1 = min(r1 + halo, rows)
+        pc0 = max(c0 - halo, 0)
+        pc1 = min(c1 + halo, cols)
+        window = (slice(pr0, pr1), slice(pc0, pc1))
+        core = (slice(r0 - pr0, r1 - pr0), slice(c0 - pc0, c1 - pc0))
+
+        if workers > 1:
+            svfresult = svf_sweep_parallel(dsm[window], vegdem[window], vegdem2[window], bush[window], scale,
+                                           amaxvalue, usevegdem, patches, feedback, workers, shadowmats=aniso == 1)
+        else:
+            shmats = None
+            if aniso == 1:
+                shmats = tuple(ShadowMatrix.zeros(pr1 - pr0, pc1 - pc0, npatches) for _ in range(3))
+            svfresult = svf_sweep(dsm[window], vegdem[window], vegdem2[window], bush[window], scale, amaxvalue,
+                                  usevegdem, patches, feedback, shmats=shmats)
+            if aniso == 1:
+                svfresult.update({'shmat': shmats[0], 'vegshmat': shmats[1], 'vbshvegshmat': shmats[2]})
+        svf_finalise(svfresult, vegdem2[window], usevegdem)
+
+        shmatnames = ('shmat', 'vegshmat', 'vbshvegshmat')
+        svfresult = dict((name, svfresult[name].crop(*core) if name in shmatnames else svfresult[name][core])
+                         for name in svfresult)
+
+        yield r0, c0, svfresult
@@ -27,6 +27,7 @@ from qgis.PyQt.QtGui import QIcon
 from osgeo import gdal, osr, ogr
 from osgeo.gdalconst import *
 import os
+import glob
 import numpy as np
 import pandas as pd
 import inspect
@@ -52,6 +53,23 @@ def load_grid(filepath, feedback):
     # Return gdal raster layer as numpy array, number of rows and columns in raster
     return temp_grid.ReadAsArray().astype(float), temp_grid.ReadAsArray().astype(float).shape[0], temp_grid.ReadAsArray().astype(float).shape[1] 
 
+# Number of Tmrt rasters evaluated as one stack when all timesteps are calculated
+TIMESTEP_BATCH = 24
+
+def tmrt_timestep(filepath):
+    # Year, day of year, hour and minute from a SOLWEIG raster name, e.g. Tmrt_2021_172_1200D.tif
+    name = Path(filepath).stem.split('_')
+    return int(name[1]), int(name[2]), int(name[3][:2]), int(name[3][2:4])
+
+def met_row(metdata, yyyy, doy, hours, minu):
+    # Row of the meteorological data of a timestep
+    rows = np.where((metdata[:, 0] == yyyy) & (metdata[:, 1] == doy) & (metdata[:, 2] == hours) &
+                    (metdata[:, 3] == minu))[0]
+    if rows.shape[0] == 0:
+        raise QgsProcessingException("Error: No meteorological data for " + str(yyyy) + ' ' + str(doy) + ' ' +
+                                     str(hours) + ':' + str(minu) + ". Use the forcing file that was used when Tmrt was calculated")
+    return rows[0]
+
 def get_latlon(raster, gdal_raster):
     old_cs = osr.SpatialReference()
     raster_ref = raster.crs().toWkt()
@@ -113,9 +131,11 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
     WEIGHT = 'WEIGHT'
     HEIGHT = 'HEIGHT'
     SEX = 'SEX'
+    PET_LOOKUP = 'PET_LOOKUP'
     # SENSOR_HEIGHT = 'SENSOR_HEIGHT'
 
     COMFA = 'COMFA'
+    ALL_TIMESTEPS = 'ALL_TIMESTEPS'
 
     # Output
     TC_OUT = 'TC_OUT'
@@ -179,6 +199,11 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
             self.SEX, self.tr('Sex'), ['Male', 'Female'], optional=True, defaultValue=0)
         sex.setFlags(sex.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(sex)
+        petlookup = QgsProcessingParameterBoolean(self.PET_LOOKUP,
+            self.tr("PET interpolated from a lookup table (faster for many pixels and timesteps, interpolation error reported in the log)"),
+            defaultValue=False)
+        petlookup.setFlags(petlookup.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(petlookup)
 
         # COMFA or COMFA-kid
         comfa = QgsProcessingParameterBoolean(self.COMFA,
@@ -186,6 +211,11 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
         comfa.setFlags(comfa.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(comfa)        
 
+        alltimesteps = QgsProcessingParameterBoolean(self.ALL_TIMESTEPS,
+            self.tr("Calculate all timesteps of the SOLWEIG run (one band per timestep)"), defaultValue=False)
+        alltimesteps.setFlags(alltimesteps.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(alltimesteps)
+
         # Output
         self.addParameter(QgsProcessingParameterRasterDestination(self.TC_OUT,
                                                                   self.tr("Output thermal comfort raster"),
@@ -220,6 +250,7 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
         # metdata = self.parameterAsString(parameters, self.METDATA, context)
 
         outputRaster = self.parameterAsOutputLayer(parameters, self.TC_OUT, context)
+        allTimesteps = self.parameterAsBool(parameters, self.ALL_TIMESTEPS, context)
 
         mbody = None
         ht = None
@@ -270,52 +301,13 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
         # P = self.metdata[:, 12]
         # Ws = self.metdata[:, 9]
 
-        # Derive metdata from Trmt raster name
-        yyyyTmrt = int(filepath_tmrt[-18:-14])
-        doyTmrt = int(filepath_tmrt[-13:-10])
-        hoursTmrt = int(filepath_tmrt[-9:-7])
-        minuTmrt = int(filepath_tmrt[-7:-5])
-
-        if np.where(metdata[:,2] == hoursTmrt).__len__() == 1:
-            posMet = np.where(metdata[:,0] == yyyyTmrt) and np.where(metdata[:,1] == doyTmrt) and np.where(metdata[:,2] == hoursTmrt)  
+        # All Tmrt rasters of the SOLWEIG run or only the selected one
+        if allTimesteps:
+            tmrtFiles = sorted(glob.glob(solweig_path + 'Tmrt_*_*_*.tif'), key=tmrt_timestep)
+            if len(tmrtFiles) == 0:
+                raise QgsProcessingException("Error: No Tmrt rasters of single timesteps found in " + solweig_path)
         else:
-            posMet = np.where(metdata[:,0] == yyyyTmrt) and np.where(metdata[:,1] == doyTmrt) and np.where(metdata[:,2] == hoursTmrt) and np.where(metdata[:,3] == minuTmrt) 
-        
-        Ta = metdata[posMet, 11][0][0]
-        RH = metdata[posMet, 10][0][0]
-        YYYY = metdata[posMet, 0][0][0]
-        jday = metdata[posMet, 1][0][0]
-        hours = metdata[posMet, 2][0][0]
-        minu = metdata[posMet, 3][0][0]
-
-        # Timestamp
-        current_time = str((pd.to_datetime(YYYY, format='%Y') + pd.to_timedelta(jday - 1, unit='d') + 
-                 pd.to_timedelta(hours, unit='h') + pd.to_timedelta(minu, unit='m')))
-        
-        feedback.setProgressText('Estimating ' + thermal_index + ' on ' + current_time)
-        feedback.setProgressText('Location: ' + str(np.around(lat, decimals=2)) + ' latitude,  ' + str(np.around(lon, decimals=2)) + ' longitude')
-        feedback.setProgressText("Air temperature derived from meteorological data is: " + str(Ta) + ' ' + u'\N{DEGREE SIGN}C')
-        feedback.setProgressText("Relative Humidity derived from meteorological data is: " + str(RH) + '%')
-        feedback.setProgressText("Incoming shortwave radiation derived from meteorological data is: " + str(metdata[posMet[0], 14][0]) + u' Wm\u00b2')
-        # feedback.setProgressText("Wind speed derived from meteorological data is: " + str(metdata[posMet[0], 9][0]) + ' m/s')
-
-        # Loading Kup, Kdown, Kdiff, Lup and Ldown if calculating COMFA
-        if tcType == 2:
-            filepath = filepath_tmrt.split('Tmrt')
-            # filepath = os.path.dirname(filepath_tmrt) # issue 31  filepath_tmrt.split('Tmrt')
-            # Load Kup, Kdown, Lup, Ldown grids
-            Kup, rows, cols = load_grid(filepath[0] + 'Kup' + filepath[1], feedback)
-            Kdown, _, __ = load_grid(filepath[0] + 'Kdown' + filepath[1], feedback)
-            Kdiff, _, __ = load_grid(filepath[0] + 'Kdiff' + filepath[1], feedback)
-            Lup, _, __ = load_grid(filepath[0] + 'Lup' + filepath[1], feedback)
-            Ldown, _, __ = load_grid(filepath[0] + 'Ldown' + filepath[1], feedback)
-            settingsSolweig = np.loadtxt(filepath[0] + '/treeplantersettings.txt', skiprows=1, delimiter=' ')
-            UTC = int(settingsSolweig[0])
-            alt = settingsSolweig[12]
-            location = {'longitude': lon, 'latitude': lat, 'altitude': alt}
-        else:
-            # Load Tmrt grid for PET and UTCI
-            tmrtGrid, rows, cols = load_grid(filepath_tmrt, feedback)
+            tmrtFiles = [filepath_tmrt]
 
         # Load wind speed grid (URock)
         provider = ws.dataProvider()
@@ -325,12 +317,6 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
         rows3 = build.shape[0] # Number of rows in building grid
         cols3 = build.shape[1] # Number of columns in building grid
 
-        if not (rows == rows2) & (cols == cols2):
-            raise QgsProcessingException("Error: Wind speed raster not same domain as Tmrt raster: All rasters must be of same extent and resolution")
-
-        if not (rows == rows3) & (cols == cols3):
-            raise QgsProcessingException("Error: Buildings raster not same domain as Tmrt raster: All rasters must be of same extent and resolution")
-
         # Physiological variables for PET and COMFA
         mbody = self.parameterAsDouble(parameters, self.WEIGHT, context) # Body weight in kg
         clo = self.parameterAsDouble(parameters, self.CLO, context) # Clothing in clo
@@ -338,8 +324,8 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
         activity = self.parameterAsDouble(parameters, self.WEIGHT, context) # Activity in watt
         sex = self.parameterAsInt(parameters, self.SEX, context) + 1 # Sex, #TODO CHECK SO SAME FOR PET AND COMFA
 
+        lookup = None
         if tcType == 0:
-            feedback.setProgressText("Calculating PET for all ground level pixels")
             # Other PET variables
             ht = self.parameterAsDouble(parameters, self.HEIGHT, context) / 100. # Body height in meters
 
@@ -350,23 +336,18 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
             pet.sex = sex
             pet.clo = clo
 
-            # Wind speed
-            #WsPET = (10. / sensorheight) ** 0.2 * wsGrid
-
-            result = pet.calculate_PET_grid(Ta, RH, tmrtGrid, wsGrid, pet, feedback)
-
-        elif tcType == 1:
-            feedback.setProgressText("Calculating UTCI for all ground level pixels")
-            # Recalculating wind speed based on power law
-            WsUTCI = (10. / sensorheight) ** 0.2 * wsGrid
-            result = utci.utci_calculator_grid(Ta, RH, tmrtGrid, WsUTCI, feedback)
-
+            if self.parameterAsBool(parameters, self.PET_LOOKUP, context):
+                feedback.setProgressText("Solving the PET lookup table")
+                try:
+                    lookup = pet.PET_lookup(pet, feedback=feedback)
+                except ValueError:
+                    # cancelled, the timesteps are not calculated
+                    lookup = None
+                else:
+                    feedback.setProgressText('PET lookup table interpolation error: max ' +
+                                             str(np.around(lookup.max_error, decimals=2)) + ' °C, 99th percentile ' +
+                                             str(np.around(lookup.p99_error, decimals=2)) + ' °C')
         elif tcType == 2:
-            # If True = COMFA-kid (Cheng & Brown, 2020), if False = regular COMFA
-            if comfa_kid:
-                feedback.setProgressText("Calculating energy balance (COMFA-kid (Cheng and Brown, 2020)) for all ground level pixels")                
-            else:
-                feedback.setProgressText("Calculating energy balance (COMFA) for all ground level pixels")
             # COMFA parameters
             # Settings
             # Atr = 0.7 # atmospheric transmittance
@@ -376,10 +357,6 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
             L = 0.1 # length of cylinder (cm)
             D = 0.01 # Diameter of cylinder (cm)
             ht = self.parameterAsDouble(parameters, self.HEIGHT, context) # Height of person in cm
-            # Calculate COMFA radiation using SOLWEIG output L, D, Lin, Lup, Kin, Kup, emis, alpha, Aeff, Kd, metdata, location, utc
-            Rabs = COMFA_rad(L, D, Ldown, Lup, Kdown, Kup, emis, alpha, Aeff, Kdiff, metdata[posMet[0],:], location, UTC)
-            # Recalculating wind speed based on powerlaw
-            WsCOMFA = (10 / sensorheight) ** 0.2 * wsGrid
             # Mact (Wm-2) based on Cheng & Brown (2020)
             Mact, Mact_PET = COMFA_Mact(mbody, ht, sex, age, activity, 'W')
             # Activity speed
@@ -391,19 +368,113 @@ class ProcessingSpatialTCAlgorithm(QgsProcessingAlgorithm):
             # 2) Convert Re,cl to rcvo:  rcvo = Re,cl*18,400, where 18400 is a conversion factor from Re,cl (vapour resistance, in m2kPaW-1) 		
             # to rcvo, using Lv = 2.5*106 J kg-1, rho = 1.16 kg m-3, and Pa = 98kPa.
             rcvo = clo * 0.18 * 18400
+            settingsSolweig = np.loadtxt(solweig_path + '/treeplantersettings.txt', skiprows=1, delimiter=' ')
+            UTC = int(settingsSolweig[0])
+            alt = settingsSolweig[12]
+            location = {'longitude': lon, 'latitude': lat, 'altitude': alt}
 
-            MET = np.zeros((Rabs.shape[0], Rabs.shape[1]))
-            CONV = np.zeros((Rabs.shape[0], Rabs.shape[1]))
-            EVAP = np.zeros((Rabs.shape[0], Rabs.shape[1]))
-            TREMIT = np.zeros((Rabs.shape[0], Rabs.shape[1]))
-            for y in np.arange(Rabs.shape[0]):
-                for x in np.arange(Rabs.shape[1]):
-                    MET[y,x], CONV[y,x], EVAP[y,x], TREMIT[y,x] = COMFA_BUDGET(Mact, Ta, RH, WsCOMFA[y,x], va, rco, rcvo, mbody, ht, age, comfa_kid)
-            result = MET + Rabs - CONV - EVAP - TREMIT     
-        
-        result[build == 0] = -9999
-
-        saveraster(gdal_buildings, outputRaster, result)
+        feedback.setProgressText('Location: ' + str(np.around(lat, decimals=2)) + ' latitude,  ' + str(np.around(lon, decimals=2)) + ' longitude')
+        if len(tmrtFiles) > 1:
+            feedback.setProgressText('Estimating ' + thermal_index + ' for ' + str(len(tmrtFiles)) + ' timesteps')
+            gdal_out = gdal.GetDriverByName('GTiff').Create(outputRaster, cols3, rows3, len(tmrtFiles), GDT_Float32,
+                                                            ['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=3',
+                                                             'BIGTIFF=IF_SAFER'])
+            gdal_out.SetGeoTransform(gdal_buildings.GetGeoTransform())
+            gdal_out.SetProjection(gdal_buildings.GetProjection())
+
+        # Timesteps are processed in batches (TIMESTEP_BATCH, one day of hourly data), one stack per batch
+        for batchStart in range(0, len(tmrtFiles), TIMESTEP_BATCH):
+            if feedback.isCanceled():
+                feedback.setProgressText("Calculation cancelled")
+                break
+            batchFiles = tmrtFiles[batchStart:batchStart + TIMESTEP_BATCH]
+            posMet = np.array([met_row(metdata, *tmrt_timestep(f)) for f in batchFiles])
+
+            Ta = metdata[posMet, 11]
+            RH = metdata[posMet, 10]
+            YYYY = metdata[posMet, 0]
+            jday = metdata[posMet, 1]
+            hours = metdata[posMet, 2]
+            minu = metdata[posMet, 3]
+
+            Rabs = []
+            tmrtStack = []
+            for t, filepath in enumerate(batchFiles):
+                # Timestamp
+                current_time = str((pd.to_datetime(YYYY[t], format='%Y') + pd.to_timedelta(jday[t] - 1, unit='d') + 
+                         pd.to_timedelta(hours[t], unit='h') + pd.to_timedelta(minu[t], unit='m')))
+
+                feedback.setProgressText('Estimating ' + thermal_index + ' on ' + current_time)
+                feedback.setProgressText("Air temperature derived from meteorological data is: " + str(Ta[t]) + ' ' + u'\N{DEGREE SIGN}C')
+                feedback.setProgressText("Relative Humidity derived from meteorological data is: " + str(RH[t]) + '%')
+                feedback.setProgressText("Incoming shortwave radiation derived from meteorological data is: " + str(metdata[posMet[t], 14]) + u' Wm²')
+                # feedback.setProgressText("Wind speed derived from meteorological data is: " + str(metdata[posMet[0], 9][0]) + ' m/s')
+
+                # Loading Kup, Kdown, Kdiff, Lup and Ldown if calculating COMFA
+                if tcType == 2:
+                    filepath = filepath.split('Tmrt')
+                    # filepath = os.path.dirname(filepath_tmrt) # issue 31  filepath_tmrt.split('Tmrt')
+                    # Load Kup, Kdown, Lup, Ldown grids
+                    Kup, rows, cols = load_grid(filepath[0] + 'Kup' + filepath[1], feedback)
+                    Kdown, _, __ = load_grid(filepath[0] + 'Kdown' + filepath[1], feedback)
+                    Kdiff, _, __ = load_grid(filepath[0] + 'Kdiff' + filepath[1], feedback)
+                    Lup, _, __ = load_grid(filepath[0] + 'Lup' + filepath[1], feedback)
+                    Ldown, _, __ = load_grid(filepath[0] + 'Ldown' + filepath[1], feedback)
+                    # Calculate COMFA radiation using SOLWEIG output L, D, Lin, Lup, Kin, Kup, emis, alpha, Aeff, Kd, metdata, location, utc
+                    Rabs.append(COMFA_rad(L, D, Ldown, Lup, Kdown, Kup, emis, alpha, Aeff, Kdiff, metdata[posMet[t:t + 1], :], location, UTC))
+                else:
+                    # Load Tmrt grid for PET and UTCI
+                    tmrtGrid, rows, cols = load_grid(filepath, feedback)
+                    tmrtStack.append(tmrtGrid)
+
+                if not (rows == rows2) & (cols == cols2):
+                    raise QgsProcessingException("Error: Wind speed raster not same domain as Tmrt raster: All rasters must be of same extent and resolution")
+
+                if not (rows == rows3) & (cols == cols3):
+                    raise QgsProcessingException("Error: Buildings raster not same domain as Tmrt raster: All rasters must be of same extent and resolution")
+
+            if tcType == 0:
+                feedback.setProgressText("Calculating PET for all ground level pixels")
+                # Wind speed
+                #WsPET = (10. / sensorheight) ** 0.2 * wsGrid
+
+                result = pet.calculate_PET_stack(Ta, RH, np.array(tmrtStack), wsGrid, pet, feedback, lookup)
+
+            elif tcType == 1:
+                feedback.setProgressText("Calculating UTCI for all ground level pixels")
+                # Recalculating wind speed based on power law
+                WsUTCI = (10. / sensorheight) ** 0.2 * wsGrid
+                result = utci.utci_calculator_stack(Ta, RH, np.array(tmrtStack), WsUTCI, feedback)
+
+            elif tcType == 2:
+                # If True = COMFA-kid (Cheng & Brown, 2020), if False = regular COMFA
+                if comfa_kid:
+                    feedback.setProgressText("Calculating energy balance (COMFA-kid (Cheng and Brown, 2020)) for all ground level pixels")                
+                else:
+                    feedback.setProgressText("Calculating energy balance (COMFA) for all ground level pixels")
+                Rabs = np.array(Rabs)
+                # Recalculating wind speed based on powerlaw
+                WsCOMFA = (10 / sensorheight) ** 0.2 * wsGrid
+                # Energy budget of all pixels and timesteps at once, Ta and RH broadcast along the time axis
+                MET, CONV, EVAP, TREMIT = COMFA_BUDGET(Mact, Ta[:, np.newaxis, np.newaxis], RH[:, np.newaxis, np.newaxis],
+                                                       WsCOMFA, va, rco, rcvo, mbody, ht, age, comfa_kid)
+                result = MET + Rabs - CONV - EVAP - TREMIT     
+
+            result[:, build == 0] = -9999
+
+            if len(tmrtFiles) == 1:
+                saveraster(gdal_buildings, outputRaster, result[0])
+            else:
+                for t in range(result.shape[0]):
+                    band = gdal_out.GetRasterBand(batchStart + t + 1)
+                    band.WriteArray(result[t], 0, 0)
+                    band.SetNoDataValue(-9999)
+                    band.SetDescription(Path(batchFiles[t]).stem[5:])
+                feedback.setProgress(int((batchStart + len(batchFiles)) * 100. / len(tmrtFiles)))
+
+        if len(tmrtFiles) > 1:
+            gdal_out.FlushCache()
+            gdal_out = None
 
         feedback.setProgressText("Processing finished.")
 
@@ -35,6 +35,7 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterBoolean,
                        QgsProcessingParameterNumber,
+                       QgsProcessingParameterDefinition,
                        QgsProcessingParameterFolderDestination,
                        QgsProcessingParameterRasterDestination,
                        QgsProcessingException,
@@ -51,6 +52,7 @@ from pathlib import Path
 import zipfile
 import sys
 from ..util import misc
+from ..util import shadowmats
 from ..functions import svf_functions as svf
 
 
@@ -67,6 +69,8 @@ class ProcessingSkyViewFactorAlgorithm(QgsProcessingAlgorithm):
     # TSDM_EXIST = 'TSDM_EXIST'
     INPUT_THEIGHT = 'INPUT_THEIGHT'
     ANISO = 'ANISO'
+    WORKERS = 'WORKERS'
+    TILE_SIZE = 'TILE_SIZE'
     OUTPUT_DIR = 'OUTPUT_DIR'
     OUTPUT_FILE = 'OUTPUT_FILE'
     
@@ -93,6 +97,18 @@ class ProcessingSkyViewFactorAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterBoolean(self.ANISO,
             self.tr("Use method with 153 shadow images instead of 655. Required for anisotropic sky scheme (SOLWEIG)"),
             defaultValue=True))
+        workers = QgsProcessingParameterNumber(self.WORKERS,
+            self.tr('Number of parallel processes used to cast shadows for the sky patches'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(1), True, minValue=1, maxValue=256)
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
+        tilesize = QgsProcessingParameterNumber(self.TILE_SIZE,
+            self.tr('Tile size (pixels) for large DSMs, 0 = no tiling'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(0), True, minValue=0)
+        tilesize.setFlags(tilesize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(tilesize)
         self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT_DIR, 
         'Output folder for individual raster files'))
         self.addParameter(QgsProcessingParameterRasterDestination(self.OUTPUT_FILE,
@@ -110,6 +126,8 @@ class ProcessingSkyViewFactorAlgorithm(QgsProcessingAlgorithm):
         # tdsmExists = self.parameterAsBool(parameters, self.TSDM_EXIST, context)
         trunkr = self.parameterAsDouble(parameters, self.INPUT_THEIGHT, context)
         aniso = self.parameterAsBool(parameters, self.ANISO, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        tilesize = self.parameterAsInt(parameters, self.TILE_SIZE, context)
 
         feedback.setProgressText('Initiating algorithm')
 
@@ -183,13 +201,6 @@ class ProcessingSkyViewFactorAlgorithm(QgsProcessingAlgorithm):
             vegdsm2 = 0.
             usevegdem = 0
 
-        if aniso == 1:
-            feedback.setProgressText('Calculating SVF using 153 iterations')
-            ret = svf.svfForProcessing153(dsm, vegdsm, vegdsm2, scale, usevegdem, feedback)
-        else:
-            feedback.setProgressText('Calculating SVF using 655 iterations')
-            ret = svf.svfForProcessing655(dsm, vegdsm, vegdsm2, scale, usevegdem, feedback)
-
         filename = outputFile
 
         # temporary fix for mac, ISSUE #15
@@ -198,6 +209,17 @@ class ProcessingSkyViewFactorAlgorithm(QgsProcessingAlgorithm):
             if not os.path.exists(outputDir):
                 os.makedirs(outputDir)
 
+        if tilesize > 0:
+            self.processTiles(gdal_dsm, dsm, vegdsm, vegdsm2, scale, usevegdem, transVeg / 100.0, aniso, workers,
+                              tilesize, outputDir, filename, feedback)
+            ret = None
+        elif aniso == 1:
+            feedback.setProgressText('Calculating SVF using 153 iterations')
+            ret = svf.svfForProcessing153(dsm, vegdsm, vegdsm2, scale, usevegdem, feedback, workers)
+        else:
+            feedback.setProgressText('Calculating SVF using 655 iterations')
+            ret = svf.svfForProcessing655(dsm, vegdsm, vegdsm2, scale, usevegdem, feedback, workers)
+
         if ret is not None:
             svfbu = ret["svf"]
             svfbuE = ret["svfE"]
@@ -293,14 +315,61 @@ class ProcessingSkyViewFactorAlgorithm(QgsProcessingAlgorithm):
                 # wallshvemat = ret["wallshvemat"]
                 # facesunmat = ret["facesunmat"]
 
-                np.savez_compressed(outputDir + '/' + "shadowmats.npz", shadowmat=shmat, vegshadowmat=vegshmat, vbshmat=vbshvegshmat) #,
+                shadowmats.save_shadowmats(outputDir + '/' + "shadowmats.npz", shmat, vegshmat, vbshvegshmat) #,
                                     # vbshvegshmat=vbshvegshmat, wallshmat=wallshmat, wallsunmat=wallsunmat,
                                     # facesunmat=facesunmat, wallshvemat=wallshvemat)
 
         feedback.setProgressText("Sky View Factor: SVF grid(s) successfully generated")
 
         return {self.OUTPUT_DIR: outputDir, self.OUTPUT_FILE: outputFile}
-    
+
+    def processTiles(self, gdal_dsm, dsm, vegdsm, vegdsm2, scale, usevegdem, trans, aniso, workers, tilesize,
+                     outputDir, filename, feedback):
+        # Tiled SVF calculation: every tile is written straight into the output rasters
+        # and the bit-packed shadow matrices are collected in memory mapped files on disk.
+        svfnames = ['svf', 'svfE', 'svfS', 'svfW', 'svfN']
+        if usevegdem == 1:
+            svfnames += ['svfveg', 'svfEveg', 'svfSveg', 'svfWveg', 'svfNveg',
+                         'svfaveg', 'svfEaveg', 'svfSaveg', 'svfWaveg', 'svfNaveg']
+        outDs = dict((name, misc.createraster(gdal_dsm, outputDir + '/' + name + '.tif')) for name in svfnames)
+        totalDs = misc.createraster(gdal_dsm, filename)
+
+        shmatnames = ['shmat', 'vegshmat', 'vbshvegshmat']
+        shmats = {}
+        if aniso == 1:
+            npatches = svf.svf_patches_153()['altitude'].shape[0]
+            writer = shadowmats.ShadowMatrixWriter(outputDir + '/' + "shadowmats.npz", dsm.shape[0], dsm.shape[1],
+                                                   npatches)
+            shmats = dict(zip(shmatnames, writer.shmats))
+
+        for row, col, ret in svf.svfForProcessingTiles(dsm, vegdsm, vegdsm2, scale, usevegdem, feedback, tilesize,
+                                                       aniso, workers):
+            for name in svfnames:
+                outDs[name].GetRasterBand(1).WriteArray(ret[name], col, row)
+            if usevegdem == 0:
+                svftotal = ret['svf']
+            else:
+                svftotal = (ret['svf'] - (1 - ret['svfveg']) * (1 - trans))
+            totalDs.GetRasterBand(1).WriteArray(svftotal, col, row)
+            for name in shmats:
+                shmats[name].paste(ret[name], row, col)
+
+        outDs = None
+        totalDs = None
+
+        if os.path.isfile(outputDir + '/' + 'svfs.zip'):
+            os.remove(outputDir + '/' + 'svfs.zip')
+        zippo = zipfile.ZipFile(outputDir + '/' + 'svfs.zip', 'a')
+        for name in svfnames:
+            zippo.write(outputDir + '/' + name + '.tif', name + '.tif')
+        zippo.close()
+        for name in svfnames:
+            os.remove(outputDir + '/' + name + '.tif')
+
+        if aniso == 1:
+            shmats = None
+            writer.close()
+
     def name(self):
         return 'Urban Geometry: Sky View Factor'
 
@@ -40,6 +40,7 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterFileDestination,
                        QgsProcessingParameterFile,
                        QgsProcessingException,
+                       QgsProcessingParameterDefinition,
                        QgsProcessingParameterRasterLayer)
 from processing.gui.wrappers import WidgetWrapper
 from qgis.PyQt.QtWidgets import QDateEdit, QTimeEdit
@@ -53,8 +54,10 @@ from pathlib import Path
 from ..functions.SEBEfiles import SEBE_2015a_calc_forprocessing as sebe
 from ..functions.SEBEfiles.sunmapcreator_2015a import sunmapcreator_2015a
 from ..functions.SEBEfiles import WriteMetaDataSEBE
+from ..functions.SEBEfiles import wallirradiance
 from ..util.SEBESOLWEIGCommonFiles.Solweig_v2015_metdata_noload import Solweig_2015a_metdata_noload
-from ..util.misc import get_ders, saveraster
+from ..util.misc import get_ders, saveraster, createraster
+from ..util.shadowcache import ShadowCache
 
 
 class ProcessingSEBEAlgorithm(QgsProcessingAlgorithm):
@@ -84,6 +87,12 @@ class ProcessingSEBEAlgorithm(QgsProcessingAlgorithm):
     OUTPUT_DIR = 'OUTPUT_DIR'
     # OUTPUT_SKY = 'OUTPUT_SKY'
     OUTPUT_ROOF = 'OUTPUT_ROOF'
+    SHADOW_CACHE = 'SHADOW_CACHE'
+    SHADOW_CACHE_TOLERANCE = 'SHADOW_CACHE_TOLERANCE'
+    SHADOW_CACHE_SIZE = 'SHADOW_CACHE_SIZE'
+    WORKERS = 'WORKERS'
+    TILE_SIZE = 'TILE_SIZE'
+    WALL_TEXT = 'WALL_TEXT'
     
 
     def initAlgorithm(self, config):
@@ -124,6 +133,40 @@ class ProcessingSEBEAlgorithm(QgsProcessingAlgorithm):
             self.tr("Save sky irradiance distribution"), defaultValue=False))
         self.addParameter(QgsProcessingParameterFileDestination(self.IRR_FILE,
              self.tr('Sky irradiance distribution'), self.tr('txt files (*.txt)')))
+        shadowcache = QgsProcessingParameterFile(self.SHADOW_CACHE,
+            self.tr('Shadow cache folder, reused by later runs on the same DSM (optional)'),
+            QgsProcessingParameterFile.Folder, optional=True)
+        shadowcache.setFlags(shadowcache.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(shadowcache)
+        cachetolerance = QgsProcessingParameterNumber(self.SHADOW_CACHE_TOLERANCE,
+            self.tr('Shadow cache sun position tolerance (degrees)'),
+            QgsProcessingParameterNumber.Double,
+            QVariant(0.1), True, minValue=0., maxValue=5.)
+        cachetolerance.setFlags(cachetolerance.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cachetolerance)
+        cachesize = QgsProcessingParameterNumber(self.SHADOW_CACHE_SIZE,
+            self.tr('Shadow cache size limit (MB)'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(2048), True, minValue=1)
+        cachesize.setFlags(cachesize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cachesize)
+        workers = QgsProcessingParameterNumber(self.WORKERS,
+            self.tr('Number of parallel processes used to cast shadows for the sky patches'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(1), True, minValue=1, maxValue=256)
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
+        tilesize = QgsProcessingParameterNumber(self.TILE_SIZE,
+            self.tr('Tile size (pixels) for large DSMs, 0 = no tiling'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(0), True, minValue=0)
+        tilesize.setFlags(tilesize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(tilesize)
+        walltext = QgsProcessingParameterBoolean(self.WALL_TEXT,
+            self.tr('Save wall irradiance as text (Energyyearwall.txt) next to Energyyearwall.npz'),
+            defaultValue=True)
+        walltext.setFlags(walltext.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(walltext)
         self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT_DIR,
                                                      'Output folder'))
         self.addParameter(QgsProcessingParameterRasterDestination(self.OUTPUT_ROOF,
@@ -150,6 +193,12 @@ class ProcessingSEBEAlgorithm(QgsProcessingAlgorithm):
         saveskyirr = self.parameterAsBool(parameters, self.SAVESKYIRR, context)
         irrFile = self.parameterAsFileOutput(parameters, self.IRR_FILE, context)
         outputRoof = self.parameterAsOutputLayer(parameters, self.OUTPUT_ROOF, context)
+        cacheFolder = self.parameterAsString(parameters, self.SHADOW_CACHE, context)
+        cacheTolerance = self.parameterAsDouble(parameters, self.SHADOW_CACHE_TOLERANCE, context)
+        cacheSize = self.parameterAsInt(parameters, self.SHADOW_CACHE_SIZE, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        tilesize = self.parameterAsInt(parameters, self.TILE_SIZE, context)
+        wallText = self.parameterAsBool(parameters, self.WALL_TEXT, context)
 
         if parameters['OUTPUT_DIR'] == 'TEMPORARY_OUTPUT':
             if not (os.path.isdir(outputDir)):
@@ -341,29 +390,46 @@ class ProcessingSEBEAlgorithm(QgsProcessingAlgorithm):
                                         filePath_cdsm, trunkfile, filePath_tdsm, lat, lon, utc,
                                         inputMet, albedo, onlyglobal, trunkratio, psi, sizex, sizey)
 
+        if cacheFolder:
+            shadowcache = ShadowCache(cacheFolder, cacheTolerance, cacheSize)
+        else:
+            shadowcache = None
+
         # Main function
         feedback.setProgressText("Executing main model")
-        seberesult = sebe.SEBE_2015a_calc(self.dsm, self.scale, building_slope,
-                    building_aspect, voxelheight, sizey, sizex, vegdsm, vegdsm2, wheight,
-                    waspect, albedo, psi, radmatI, radmatD, radmatR, usevegdem, feedback, wallmaxheight)
+        if tilesize > 0:
+            walls = self.processTiles(building_slope, building_aspect, voxelheight, vegdsm, vegdsm2, wheight,
+                                      waspect, albedo, psi, radmatI, radmatD, radmatR, usevegdem, feedback,
+                                      wallmaxheight, tilesize, shadowcache, workers, outputDir, outputRoof)
+            vegdata = sebe.sebe_prepare(self.dsm, vegdsm, vegdsm2, usevegdem)[4]
+        else:
+            seberesult = sebe.SEBE_2015a_calc(self.dsm, self.scale, building_slope,
+                        building_aspect, voxelheight, sizey, sizex, vegdsm, vegdsm2, wheight,
+                        waspect, albedo, psi, radmatI, radmatD, radmatR, usevegdem, feedback, wallmaxheight,
+                        shadowcache, workers)
+
+            Energyyearroof = seberesult["Energyyearroof"]
+            walls = wallirradiance.pack_walls(seberesult["Energyyearwall"])
+            vegdata = seberesult["vegdata"]
+            seberesult = None
 
-        Energyyearroof = seberesult["Energyyearroof"]
-        Energyyearwall = seberesult["Energyyearwall"]
-        vegdata = seberesult["vegdata"]
+        if shadowcache is not None:
+            feedback.setProgressText('Shadow cache: ' + str(shadowcache.hits) + ' shadows reused, ' +
+                                     str(shadowcache.misses) + ' cast')
 
         feedback.setProgressText("SEBE: Model calculation finished. Saving to disk")
 
-        
-        if outputRoof:
-            saveraster(self.gdal_dsm, outputRoof, Energyyearroof)
+        if tilesize == 0:
+            if outputRoof:
+                saveraster(self.gdal_dsm, outputRoof, Energyyearroof)
+            filenameroof = outputDir + '/Energyyearroof.tif'
+            saveraster(self.gdal_dsm, filenameroof, Energyyearroof)
 
         saveraster(self.gdal_dsm, outputDir + '/dsm.tif', self.dsm)
-        filenameroof = outputDir + '/Energyyearroof.tif'
-        saveraster(self.gdal_dsm, filenameroof, Energyyearroof)
-        filenamewall = outputDir + '/Energyyearwall.txt'
-        header = '%row col irradiance'
-        numformat = '%4d %4d ' + '%6.2f ' * (Energyyearwall.shape[1] - 2)
-        np.savetxt(filenamewall, Energyyearwall, fmt=numformat, header=header, comments='')
+        # run-length packed wall sections, and the text file of earlier versions
+        wallirradiance.save_walls_npz(outputDir + '/Energyyearwall.npz', walls)
+        if wallText:
+            wallirradiance.save_walls_text(outputDir + '/Energyyearwall.txt', walls)
         if usevegdem == 1:
             filenamewall = outputDir + '/Vegetationdata.txt'
             header = '%row col height'
@@ -371,6 +437,26 @@ class ProcessingSEBEAlgorithm(QgsProcessingAlgorithm):
             np.savetxt(filenamewall, vegdata, fmt=numformat, header=header, comments='')
 
         return {self.OUTPUT_DIR: outputDir, self.IRR_FILE: irrFile, self.OUTPUT_ROOF: outputRoof}
+
+    def processTiles(self, slope, aspect, voxelheight, vegdsm, vegdsm2, wheight, waspect, albedo, psi, radmatI,
+                     radmatD, radmatR, usevegdem, feedback, wallmaxheight, tilesize, shadowcache, workers,
+                     outputDir, outputRoof):
+        # Tiled SEBE calculation: the roof irradiance of every tile is written straight into the
+        # output rasters and the walls of the tiles are collected as runs of non-zero sections.
+        outDs = [createraster(self.gdal_dsm, outputDir + '/Energyyearroof.tif')]
+        if outputRoof:
+            outDs.append(createraster(self.gdal_dsm, outputRoof))
+
+        parts = []
+        for row, col, Energyyearroof, Energyyearwall in sebe.SEBE_2015a_calc_tiles(self.dsm, self.scale, slope,
+                aspect, voxelheight, vegdsm, vegdsm2, wheight, waspect, albedo, psi, radmatI, radmatD, radmatR,
+                usevegdem, feedback, wallmaxheight, tilesize, shadowcache, workers):
+            for ds in outDs:
+                ds.GetRasterBand(1).WriteArray(Energyyearroof, col, row)
+            parts.append(wallirradiance.pack_walls(Energyyearwall))
+
+        outDs = None
+        return wallirradiance.concatenate_walls(parts, int(np.floor(wallmaxheight * (1 / voxelheight))))
     
     def name(self):
         """
@@ -40,6 +40,8 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterRasterDestination,
                        QgsProcessingParameterFileDestination,
                        QgsProcessingException,
+                       QgsProcessingParameterFile,
+                       QgsProcessingParameterDefinition,
                        QgsProcessingParameterDateTime,               
                        QgsProcessingParameterRasterLayer)
 
@@ -50,6 +52,7 @@ from osgeo import gdal, osr
 from osgeo.gdalconst import *
 import os
 from ..functions import dailyshading as dsh
+from ..util.shadowcache import ShadowCache
 from qgis.PyQt.QtGui import QIcon
 import inspect
 from pathlib import Path
@@ -84,6 +87,9 @@ class ProcessingShadowGeneratorAlgorithm(QgsProcessingAlgorithm):
     DST = 'DST'
     OUTPUT_DIR = 'OUTPUT_DIR'
     OUTPUT_FILE = 'OUTPUT_FILE'
+    SHADOW_CACHE = 'SHADOW_CACHE'
+    SHADOW_CACHE_TOLERANCE = 'SHADOW_CACHE_TOLERANCE'
+    SHADOW_CACHE_SIZE = 'SHADOW_CACHE_SIZE'
 
     def initAlgorithm(self, config):
         self.addParameter(
@@ -180,6 +186,24 @@ class ProcessingShadowGeneratorAlgorithm(QgsProcessingAlgorithm):
             self.tr('Time for single shadow'),
             QgsProcessingParameterDateTime.Time))
 
+        shadowcache = QgsProcessingParameterFile(self.SHADOW_CACHE,
+            self.tr('Shadow cache folder, reused by later runs on the same DSM (optional)'),
+            QgsProcessingParameterFile.Folder, optional=True)
+        shadowcache.setFlags(shadowcache.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(shadowcache)
+        cachetolerance = QgsProcessingParameterNumber(self.SHADOW_CACHE_TOLERANCE,
+            self.tr('Shadow cache sun position tolerance (degrees)'),
+            QgsProcessingParameterNumber.Double,
+            QVariant(0.1), True, minValue=0., maxValue=5.)
+        cachetolerance.setFlags(cachetolerance.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cachetolerance)
+        cachesize = QgsProcessingParameterNumber(self.SHADOW_CACHE_SIZE,
+            self.tr('Shadow cache size limit (MB)'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(2048), True, minValue=1)
+        cachesize.setFlags(cachesize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cachesize)
+
         self.addParameter(
             QgsProcessingParameterFolderDestination(
                 self.OUTPUT_DIR,
@@ -214,6 +238,9 @@ class ProcessingShadowGeneratorAlgorithm(QgsProcessingAlgorithm):
         oneShadow = self.parameterAsDouble(parameters, self.ONE_SHADOW, context) 
         myTime = self.parameterAsString(parameters, self.TIMEINI, context)
         iterShadow = self.parameterAsDouble(parameters, self.ITERTIME, context)
+        cacheFolder = self.parameterAsString(parameters, self.SHADOW_CACHE, context)
+        cacheTolerance = self.parameterAsDouble(parameters, self.SHADOW_CACHE_TOLERANCE, context)
+        cacheSize = self.parameterAsInt(parameters, self.SHADOW_CACHE_SIZE, context)
 
         if parameters['OUTPUT_DIR'] == 'TEMPORARY_OUTPUT':
             if not os.path.isdir(outputDir):
@@ -382,9 +409,13 @@ class ProcessingShadowGeneratorAlgorithm(QgsProcessingAlgorithm):
 
             timeInterval = iterShadow # self.dlg.intervalTimeEdit.time()
             # feedback.setProgressText('Test:' + str(tv))
+            if cacheFolder:
+                shadowcache = ShadowCache(cacheFolder, cacheTolerance, cacheSize)
+            else:
+                shadowcache = None
             shadowresult = dsh.dailyshading(dsm, vegdsm, vegdsm2, scale, lon, lat, sizex, sizey, tv, UTC, usevegdem,
                                             timeInterval, onetime, feedback, outputDir, gdal_dsm, trans,
-                                            dst, wallsh, wheight, waspect)
+                                            dst, wallsh, wheight, waspect, shadowcache)
             
             shfinal = shadowresult["shfinal"]
         #     time_vector = shadowresult["time_vector"]
@@ -57,22 +57,30 @@ from qgis.PyQt.QtGui import QIcon
 import inspect
 from pathlib import Path, PurePath
 from ..util.misc import get_ders, saveraster
+from ..util.shadowmats import load_shadowmats, DiffuseShadowMatrix
+from ..util.rasterwriter import RasterWriter, OUTPUT_FORMATS, timestep_datetime
+from ..util.aggregators import (make_aggregates, aggregate_states, restore_aggregates, aggregate_result,
+                                AGGREGATES)
 import zipfile
 from osgeo.gdalconst import *
 from ..util.SEBESOLWEIGCommonFiles.Solweig_v2015_metdata_noload import Solweig_2015a_metdata_noload
 from ..util.SEBESOLWEIGCommonFiles import Solweig_v2015_metdata_noload as metload
-from ..util.SEBESOLWEIGCommonFiles.clearnessindex_2013b import clearnessindex_2013b
 from ..functions.SOLWEIGpython.Tgmaps_v1 import Tgmaps_v1
-from ..functions.SOLWEIGpython import Solweig_2022a_calc_forprocessing as so
+from ..functions.SOLWEIGpython.solweig_timeseries import (initial_state, solweig_step, poi_rows, timestep_stamp,
+                                                          model_shadowcache, model_gvfengine, day_segments,
+                                                          run_segments, run_signature, open_checkpoints,
+                                                          segment_outputs, remove_segment_rasters, snapshot_due,
+                                                          save_snapshot, load_snapshot, model_precision,
+                                                          RASTER_OUTPUTS)
+from ..functions.SOLWEIGpython.poi_recorder import PoiRecorder, POI_TABLES
 from ..functions.SOLWEIGpython import WriteMetadataSOLWEIG
-from ..functions.SOLWEIGpython import PET_calculations as p
-from ..functions.SOLWEIGpython import UTCI_calculations as utci
 from ..functions.SOLWEIGpython.CirclePlotBar import PolarBarPlot
 
 import matplotlib.pyplot as plt
 
 # For "Save necessary rasters for TreePlanter tool"
 from shutil import copyfile
+import shutil
 
 class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
     """
@@ -131,6 +139,16 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
     POI_FILE = 'POI_FILE'
     POI_FIELD = 'POI_FIELD'
     CYL = 'CYL'
+    SHADOW_CACHE = 'SHADOW_CACHE'
+    SHADOW_CACHE_TOLERANCE = 'SHADOW_CACHE_TOLERANCE'
+    SHADOW_CACHE_SIZE = 'SHADOW_CACHE_SIZE'
+    WORKERS = 'WORKERS'
+    SNAPSHOT = 'SNAPSHOT'
+    SNAPSHOT_STEPS = 'SNAPSHOT_STEPS'
+    PRECISION = 'PRECISION'
+
+    # Variables that can be aggregated during the run
+    AGGREGATE_NAMES = ['Tmrt', 'Kdown', 'Kup', 'Ldown', 'Lup', 'Shadow']
 
     #Output
     OUTPUT_DIR = 'OUTPUT_DIR'
@@ -141,6 +159,13 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
     OUTPUT_LDOWN = 'OUTPUT_LDOWN'
     OUTPUT_SH = 'OUTPUT_SH'
     OUTPUT_TREEPLANTER = 'OUTPUT_TREEPLANTER'
+    OUTPUT_FORMAT = 'OUTPUT_FORMAT'
+    OUTPUT_POI_TEXT = 'OUTPUT_POI_TEXT'
+    OUTPUT_POI_TABLE = 'OUTPUT_POI_TABLE'
+    OUTPUT_AGGREGATES = 'OUTPUT_AGGREGATES'
+    AGGREGATE_VARIABLES = 'AGGREGATE_VARIABLES'
+    AGGREGATE_THRESHOLD = 'AGGREGATE_THRESHOLD'
+    AGGREGATE_PERCENTILE = 'AGGREGATE_PERCENTILE'
 
 
     def initAlgorithm(self, config):
@@ -276,6 +301,47 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         shei.setFlags(shei.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(shei)
 
+        shadowcache = QgsProcessingParameterFile(self.SHADOW_CACHE,
+            self.tr('Shadow cache folder, reused by later runs on the same DSM (optional)'),
+            QgsProcessingParameterFile.Folder, optional=True)
+        shadowcache.setFlags(shadowcache.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(shadowcache)
+        cachetolerance = QgsProcessingParameterNumber(self.SHADOW_CACHE_TOLERANCE,
+            self.tr('Shadow cache sun position tolerance (degrees)'),
+            QgsProcessingParameterNumber.Double,
+            QVariant(0.1), True, minValue=0., maxValue=5.)
+        cachetolerance.setFlags(cachetolerance.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cachetolerance)
+        cachesize = QgsProcessingParameterNumber(self.SHADOW_CACHE_SIZE,
+            self.tr('Shadow cache size limit (MB)'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(2048), True, minValue=1)
+        cachesize.setFlags(cachesize.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cachesize)
+        workers = QgsProcessingParameterNumber(self.WORKERS,
+            self.tr('Number of parallel processes, each running one day of the meteorological data at a time'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(1), True, minValue=1, maxValue=256)
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
+        snapshot = QgsProcessingParameterEnum(self.SNAPSHOT,
+            self.tr('Save model state for resuming an interrupted run (one process only)'),
+            ['Never', 'At each midnight', 'Every N timesteps'], optional=True, defaultValue=0)
+        snapshot.setFlags(snapshot.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(snapshot)
+        snapshotsteps = QgsProcessingParameterNumber(self.SNAPSHOT_STEPS,
+            self.tr('Number of timesteps (N) between saved model states'),
+            QgsProcessingParameterNumber.Integer,
+            QVariant(24), True, minValue=1)
+        snapshotsteps.setFlags(snapshotsteps.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(snapshotsteps)
+        precision = QgsProcessingParameterEnum(self.PRECISION,
+            self.tr('Numerical precision of the radiation calculations'),
+            ['Double (64 bit)', 'Single (32 bit, half the memory for grids)'],
+            optional=True, defaultValue=0)
+        precision.setFlags(precision.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(precision)
+
         #OUTPUT
         self.addParameter(QgsProcessingParameterBoolean(self.OUTPUT_TMRT,
             self.tr("Save Mean Radiant Temperature raster(s)"), defaultValue=True))
@@ -291,6 +357,44 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             self.tr("Save shadow raster(s)"), defaultValue=False))
         self.addParameter(QgsProcessingParameterBoolean(self.OUTPUT_TREEPLANTER,
             self.tr("Save necessary raster(s) for the TreePlanter and Spatial TC tools"), defaultValue=False))
+        outputformat = QgsProcessingParameterEnum(self.OUTPUT_FORMAT,
+            self.tr('Output raster format'),
+            ['One GeoTIFF per timestep', 'Multi-band GeoTIFF per variable', 'Cloud Optimised GeoTIFF per variable',
+             'NetCDF per variable'], optional=True, defaultValue=0)
+        outputformat.setFlags(outputformat.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(outputformat)
+        poitext = QgsProcessingParameterBoolean(self.OUTPUT_POI_TEXT,
+            self.tr("Save a text file per POI"), defaultValue=True)
+        poitext.setFlags(poitext.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(poitext)
+        poitable = QgsProcessingParameterEnum(self.OUTPUT_POI_TABLE,
+            self.tr('Table of all POIs'),
+            ['None', 'CSV (POI.csv)', 'NetCDF (POI.nc)'], optional=True, defaultValue=0)
+        poitable.setFlags(poitable.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(poitable)
+        aggregates = QgsProcessingParameterEnum(self.OUTPUT_AGGREGATES,
+            self.tr('Statistics calculated during the run (saved as one raster each)'),
+            ['Mean', 'Daytime mean', 'Nighttime mean', 'Maximum', 'Minimum', 'Hours above threshold',
+             'Hours below threshold', 'Percentile'], allowMultiple=True, optional=True, defaultValue=[])
+        aggregates.setFlags(aggregates.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(aggregates)
+        aggregatevars = QgsProcessingParameterEnum(self.AGGREGATE_VARIABLES,
+            self.tr('Variables of the statistics'),
+            self.AGGREGATE_NAMES, allowMultiple=True, optional=True, defaultValue=[0])
+        aggregatevars.setFlags(aggregatevars.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(aggregatevars)
+        aggregatethres = QgsProcessingParameterNumber(self.AGGREGATE_THRESHOLD,
+            self.tr('Threshold of the statistics of hours above/below'),
+            QgsProcessingParameterNumber.Double,
+            QVariant(55), True)
+        aggregatethres.setFlags(aggregatethres.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(aggregatethres)
+        aggregatepercentile = QgsProcessingParameterNumber(self.AGGREGATE_PERCENTILE,
+            self.tr('Percentile (estimated without storing all timesteps)'),
+            QgsProcessingParameterNumber.Double,
+            QVariant(95), True, minValue=0., maxValue=100.)
+        aggregatepercentile.setFlags(aggregatepercentile.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(aggregatepercentile)
         self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT_DIR,
                                                      'Output folder'))
 
@@ -361,6 +465,16 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         eground = self.parameterAsDouble(parameters, self.EMIS_GROUND, context)
         elvis = 0 # option removed 20200907 in processing UMEP
 
+        cacheFolder = self.parameterAsString(parameters, self.SHADOW_CACHE, context)
+        cacheTolerance = self.parameterAsDouble(parameters, self.SHADOW_CACHE_TOLERANCE, context)
+        cacheSize = self.parameterAsInt(parameters, self.SHADOW_CACHE_SIZE, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        # None = no snapshots, 0 = at midnight, otherwise every snapshot timesteps
+        snapshot = [None, 0, self.parameterAsInt(parameters, self.SNAPSHOT_STEPS, context)][
+            self.parameterAsInt(parameters, self.SNAPSHOT, context)]
+        singlePrecision = self.parameterAsInt(parameters, self.PRECISION, context) == 1
+        # grids are read and set up in the precision of the run, so that no float64 copies are kept
+        precision = np.float32 if singlePrecision else np.float64
         outputDir = self.parameterAsString(parameters, self.OUTPUT_DIR, context)
         outputTmrt = self.parameterAsBool(parameters, self.OUTPUT_TMRT, context)
         outputSh = self.parameterAsBool(parameters, self.OUTPUT_SH, context)
@@ -369,6 +483,15 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         outputLup = self.parameterAsBool(parameters, self.OUTPUT_LUP, context)
         outputLdown = self.parameterAsBool(parameters, self.OUTPUT_LDOWN, context)
         outputTreeplanter = self.parameterAsBool(parameters, self.OUTPUT_TREEPLANTER, context)
+        outputFormat = OUTPUT_FORMATS[self.parameterAsInt(parameters, self.OUTPUT_FORMAT, context)]
+        outputPoiText = self.parameterAsBool(parameters, self.OUTPUT_POI_TEXT, context)
+        outputPoiTable = POI_TABLES[self.parameterAsInt(parameters, self.OUTPUT_POI_TABLE, context)]
+        aggregates = make_aggregates([AGGREGATES[i] for i in self.parameterAsEnums(parameters, self.OUTPUT_AGGREGATES,
+                                                                                   context)],
+                                     [self.AGGREGATE_NAMES[i] for i in
+                                      self.parameterAsEnums(parameters, self.AGGREGATE_VARIABLES, context)],
+                                     self.parameterAsDouble(parameters, self.AGGREGATE_THRESHOLD, context),
+                                     self.parameterAsDouble(parameters, self.AGGREGATE_PERCENTILE, context))
         outputKdiff = False
         #outputSstr = False
 
@@ -383,6 +506,10 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             saveBuild = True
             outputKdiff = True
             #outputSstr = True
+            # TreePlanter and Spatial TC read one file per timestep
+            if outputFormat != 'files':
+                feedback.setProgressText('TreePlanter and Spatial TC rasters requested, saving one GeoTIFF per timestep')
+                outputFormat = 'files'
 
         if parameters['OUTPUT_DIR'] == 'TEMPORARY_OUTPUT':
             if not (os.path.isdir(outputDir)):
@@ -392,7 +519,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         provider = dsmlayer.dataProvider()
         filepath_dsm = str(provider.dataSourceUri())
         gdal_dsm = gdal.Open(filepath_dsm)
-        dsm = gdal_dsm.ReadAsArray().astype(float)
+        dsm = gdal_dsm.ReadAsArray().astype(precision)
         sizex = dsm.shape[0]
         sizey = dsm.shape[1]
         rows = dsm.shape[0]
@@ -465,7 +592,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             provider = vegdsm.dataProvider()
             filePathOld = str(provider.dataSourceUri())
             dataSet = gdal.Open(filePathOld)
-            vegdsm = dataSet.ReadAsArray().astype(float)
+            vegdsm = dataSet.ReadAsArray().astype(precision)
             filePath_cdsm = filePathOld
             vegsizex = vegdsm.shape[0]
             vegsizey = vegdsm.shape[1]
@@ -479,7 +606,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
                 filePathOld = str(provider.dataSourceUri())
                 filePath_tdsm = filePathOld
                 dataSet = gdal.Open(filePathOld)
-                vegdsm2 = dataSet.ReadAsArray().astype(float)
+                vegdsm2 = dataSet.ReadAsArray().astype(precision)
             else:
                 trunkratio = trunkr / 100.0
                 vegdsm2 = vegdsm * trunkratio
@@ -491,8 +618,8 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             if not (vegsizex == sizex) & (vegsizey == sizey):  # &
                 raise QgsProcessingException("Error in Trunk Zone DSM: All rasters must be of same extent and resolution")
         else:
-            vegdsm = np.zeros([rows, cols])
-            vegdsm2 = np.zeros([rows, cols])
+            vegdsm = np.zeros([rows, cols], dtype=precision)
+            vegdsm2 = np.zeros([rows, cols], dtype=precision)
             usevegdem = 0
             filePath_cdsm = None
             filePath_tdsm = None
@@ -507,7 +634,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             provider = lcgrid.dataProvider()
             filePath_lc = str(provider.dataSourceUri())
             dataSet = gdal.Open(filePath_lc)
-            lcgrid = dataSet.ReadAsArray().astype(float)
+            lcgrid = dataSet.ReadAsArray().astype(precision)
 
             lcsizex = lcgrid.shape[0]
             lcsizey = lcgrid.shape[1]
@@ -540,7 +667,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             provider = dem.dataProvider()
             filePathOld = str(provider.dataSourceUri())
             dataSet = gdal.Open(filePathOld)
-            dem = dataSet.ReadAsArray().astype(float)
+            dem = dataSet.ReadAsArray().astype(precision)
 
             demsizex = dem.shape[0]
             demsizey = dem.shape[1]
@@ -572,49 +699,49 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
 
         try:
             dataSet = gdal.Open(self.temp_dir + "/svf.tif")
-            svf = dataSet.ReadAsArray().astype(float)
+            svf = dataSet.ReadAsArray().astype(precision)
             dataSet = gdal.Open(self.temp_dir + "/svfN.tif")
-            svfN = dataSet.ReadAsArray().astype(float)
+            svfN = dataSet.ReadAsArray().astype(precision)
             dataSet = gdal.Open(self.temp_dir + "/svfS.tif")
-            svfS = dataSet.ReadAsArray().astype(float)
+            svfS = dataSet.ReadAsArray().astype(precision)
             dataSet = gdal.Open(self.temp_dir + "/svfE.tif")
-            svfE = dataSet.ReadAsArray().astype(float)
+            svfE = dataSet.ReadAsArray().astype(precision)
             dataSet = gdal.Open(self.temp_dir + "/svfW.tif")
-            svfW = dataSet.ReadAsArray().astype(float)
+            svfW = dataSet.ReadAsArray().astype(precision)
 
             if usevegdem == 1:
                 dataSet = gdal.Open(self.temp_dir + "/svfveg.tif")
-                svfveg = dataSet.ReadAsArray().astype(float)
+                svfveg = dataSet.ReadAsArray().astype(precision)
                 dataSet = gdal.Open(self.temp_dir + "/svfNveg.tif")
-                svfNveg = dataSet.ReadAsArray().astype(float)
+                svfNveg = dataSet.ReadAsArray().astype(precision)
                 dataSet = gdal.Open(self.temp_dir + "/svfSveg.tif")
-                svfSveg = dataSet.ReadAsArray().astype(float)
+                svfSveg = dataSet.ReadAsArray().astype(precision)
                 dataSet = gdal.Open(self.temp_dir + "/svfEveg.tif")
-                svfEveg = dataSet.ReadAsArray().astype(float)
+                svfEveg = dataSet.ReadAsArray().astype(precision)
                 dataSet = gdal.Open(self.temp_dir + "/svfWveg.tif")
-                svfWveg = dataSet.ReadAsArray().astype(float)
+                svfWveg = dataSet.ReadAsArray().astype(precision)
 
                 dataSet = gdal.Open(self.temp_dir + "/svfaveg.tif")
-                svfaveg = dataSet.ReadAsArray().astype(float)
+                svfaveg = dataSet.ReadAsArray().astype(precision)
                 dataSet = gdal.Open(self.temp_dir + "/svfNaveg.tif")
-                svfNaveg = dataSet.ReadAsArray().astype(float)
+                svfNaveg = dataSet.ReadAsArray().astype(precision)
                 dataSet = gdal.Open(self.temp_dir + "/svfSaveg.tif")
-                svfSaveg = dataSet.ReadAsArray().astype(float)
+                svfSaveg = dataSet.ReadAsArray().astype(precision)
                 dataSet = gdal.Open(self.temp_dir + "/svfEaveg.tif")
-                svfEaveg = dataSet.ReadAsArray().astype(float)
+                svfEaveg = dataSet.ReadAsArray().astype(precision)
                 dataSet = gdal.Open(self.temp_dir + "/svfWaveg.tif")
-                svfWaveg = dataSet.ReadAsArray().astype(float)
+                svfWaveg = dataSet.ReadAsArray().astype(precision)
             else:
-                svfveg = np.ones((rows, cols))
-                svfNveg = np.ones((rows, cols))
-                svfSveg = np.ones((rows, cols))
-                svfEveg = np.ones((rows, cols))
-                svfWveg = np.ones((rows, cols))
-                svfaveg = np.ones((rows, cols))
-                svfNaveg = np.ones((rows, cols))
-                svfSaveg = np.ones((rows, cols))
-                svfEaveg = np.ones((rows, cols))
-                svfWaveg = np.ones((rows, cols))
+                svfveg = np.ones((rows, cols), dtype=precision)
+                svfNveg = np.ones((rows, cols), dtype=precision)
+                svfSveg = np.ones((rows, cols), dtype=precision)
+                svfEveg = np.ones((rows, cols), dtype=precision)
+                svfWveg = np.ones((rows, cols), dtype=precision)
+                svfaveg = np.ones((rows, cols), dtype=precision)
+                svfNaveg = np.ones((rows, cols), dtype=precision)
+                svfSaveg = np.ones((rows, cols), dtype=precision)
+                svfEaveg = np.ones((rows, cols), dtype=precision)
+                svfWaveg = np.ones((rows, cols), dtype=precision)
         except:
             raise QgsProcessingException("SVF import error: The zipfile including the SVFs seems corrupt. Retry calcualting the SVFs in the Pre-processor or choose another file.")
 
@@ -637,7 +764,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         provider = whlayer.dataProvider()
         filepath_wh = str(provider.dataSourceUri())
         self.gdal_wh = gdal.Open(filepath_wh)
-        wallheight = self.gdal_wh.ReadAsArray().astype(float)
+        wallheight = self.gdal_wh.ReadAsArray().astype(precision)
         vhsizex = wallheight.shape[0]
         vhsizey = wallheight.shape[1]
         if not (vhsizex == sizex) & (vhsizey == sizey):
@@ -649,7 +776,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         provider = walayer.dataProvider()
         filepath_wa = str(provider.dataSourceUri())
         self.gdal_wa = gdal.Open(filepath_wa)
-        wallaspect = self.gdal_wa.ReadAsArray().astype(float)
+        wallaspect = self.gdal_wa.ReadAsArray().astype(precision)
         vasizex = wallaspect.shape[0]
         vasizey = wallaspect.shape[1]
         if not (vasizex == sizex) & (vasizey == sizey):
@@ -660,7 +787,6 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         # Metdata
         headernum = 1
         delim = ' '
-        Twater = []
 
         try:
             self.metdata = np.loadtxt(inputMet,skiprows=headernum, delimiter=delim)
@@ -748,11 +874,6 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
 
                 ind += 1
 
-            for k in range(0, poisxy.shape[0]):
-                poi_save = []  # np.zeros((1, 33))
-                data_out = outputDir + '/POI_' + str(poiname[k]) + '.txt'
-                np.savetxt(data_out, poi_save,  delimiter=' ', header=header, comments='')
-            
             # Other PET variables
             mbody = self.parameterAsDouble(parameters, self.WEIGHT, context)
             ht = self.parameterAsDouble(parameters, self.HEIGHT, context) / 100.
@@ -807,17 +928,12 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         else:
             psi = leafon * 0. + 1.
             svfbuveg = svf
-            bush = np.zeros([rows, cols])
+            bush = np.zeros([rows, cols], dtype=precision)
             amaxvalue = 0
 
         # %Initialization of maps
-        Knight = np.zeros((rows, cols))
-        Tgmap1 = np.zeros((rows, cols))
-        Tgmap1E = np.zeros((rows, cols))
-        Tgmap1S = np.zeros((rows, cols))
-        Tgmap1W = np.zeros((rows, cols))
-        Tgmap1N = np.zeros((rows, cols))
-        
+        Knight = np.zeros((rows, cols), dtype=precision)
+
         # building grid and land cover preparation
         sitein = self.plugin_dir + "/landcoverclasses_2016a.txt"
         f = open(sitein)
@@ -847,16 +963,12 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         # Import shadow matrices (Anisotropic sky)
         if folderPathPerez:  #UseAniso
             anisotropic_sky = 1
-            data = np.load(folderPathPerez)
-            shmat = data['shadowmat']
-            vegshmat = data['vegshadowmat']
-            vbshvegshmat = data['vbshmat']
+            # bit-packed shadow matrices are memory mapped and read one patch at a time
+            shmat, vegshmat, vbshvegshmat = load_shadowmats(folderPathPerez)
             if usevegdem == 1:
-                diffsh = np.zeros((rows, cols, shmat.shape[2]))
-                for i in range(0, shmat.shape[2]):
-                    diffsh[:, :, i] = shmat[:, :, i] - (1 - vegshmat[:, :, i]) * (1 - transVeg) # changes in psi not implemented yet
+                diffsh = DiffuseShadowMatrix(shmat, vegshmat, transVeg, dtype=precision) # changes in psi not implemented yet
             else:
-                diffsh = shmat
+                diffsh = DiffuseShadowMatrix(shmat, dtype=precision)
                 vegshmat += 1
                 vbshvegshmat += 1
 
@@ -905,18 +1017,6 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             TmaxLST = 15.
             TmaxLST_wall = 15.
 
-         # Initialisation of time related variables
-        if Ta.__len__() == 1:
-            timestepdec = 0
-        else:
-            timestepdec = dectime[1] - dectime[0]
-        timeadd = 0.
-        timeaddE = 0.
-        timeaddS = 0.
-        timeaddW = 0.
-        timeaddN = 0.
-        firstdaytime = 1.
-
         WriteMetadataSOLWEIG.writeRunInfo(outputDir, filepath_dsm, gdal_dsm, usevegdem,
                                               filePath_cdsm, trunkfile, filePath_tdsm, lat, lon, utc, landcover,
                                               filePath_lc, metfileexist, inputMet, self.metdata, self.plugin_dir,
@@ -930,32 +1030,72 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             if not poisxy is None:
                 patch_characteristics = np.zeros((shmat.shape[2], poisxy.shape[0]))
                 for idx in range(poisxy.shape[0]):
-                    for idy in range(shmat.shape[2]):
-                        # Calculations for patches on sky, shmat = 1 = sky is visible
-                        temp_sky = ((shmat[:,:,idy] == 1) & (vegshmat[:,:,idy] == 1))
-                        # Calculations for patches that are vegetation, vegshmat = 0 = shade from vegetation
-                        temp_vegsh = ((vegshmat[:,:,idy] == 0) | (vbshvegshmat[:,:,idy] == 0))
-                        # Calculations for patches that are buildings, shmat = 0 = shade from buildings
-                        temp_vbsh = (1 - shmat[:,:,idy]) * vbshvegshmat[:,:,idy]
-                        temp_sh = (temp_vbsh == 1)
-                        # Sky patch
-                        if temp_sky[int(poisxy[idx, 2]), int(poisxy[idx, 1])]:
-                            patch_characteristics[idy,idx] = 1.8
-                        # Vegetation patch
-                        elif (temp_vegsh[int(poisxy[idx, 2]), int(poisxy[idx, 1])]):
-                            patch_characteristics[idy,idx] = 2.5
-                        # Building patch
-                        elif (temp_sh[int(poisxy[idx, 2]), int(poisxy[idx, 1])]):
-                            patch_characteristics[idy,idx] = 4.5
-
-        #  If metfile starts at night
-        CI = 1.
+                    # all patches seen from the POI pixel
+                    row, col = int(poisxy[idx, 2]), int(poisxy[idx, 1])
+                    poi_shmat = shmat[row, col, :]
+                    poi_vegshmat = vegshmat[row, col, :]
+                    poi_vbshvegshmat = vbshvegshmat[row, col, :]
+                    # Calculations for patches on sky, shmat = 1 = sky is visible
+                    temp_sky = ((poi_shmat == 1) & (poi_vegshmat == 1))
+                    # Calculations for patches that are vegetation, vegshmat = 0 = shade from vegetation
+                    temp_vegsh = ((poi_vegshmat == 0) | (poi_vbshvegshmat == 0))
+                    # Calculations for patches that are buildings, shmat = 0 = shade from buildings
+                    temp_vbsh = (1 - poi_shmat) * poi_vbshvegshmat
+                    temp_sh = (temp_vbsh == 1)
+                    # Building patch
+                    patch_characteristics[temp_sh, idx] = 4.5
+                    # Vegetation patch
+                    patch_characteristics[temp_vegsh, idx] = 2.5
+                    # Sky patch
+                    patch_characteristics[temp_sky, idx] = 1.8
+
+        # Static inputs, forcing and points of interest of the model run
+        model = dict(dsm=dsm, scale=scale, rows=rows, cols=cols, svf=svf, svfN=svfN, svfW=svfW, svfE=svfE, svfS=svfS,
+                     svfveg=svfveg, svfNveg=svfNveg, svfEveg=svfEveg, svfSveg=svfSveg, svfWveg=svfWveg,
+                     svfaveg=svfaveg, svfEaveg=svfEaveg, svfSaveg=svfSaveg, svfWaveg=svfWaveg, svfNaveg=svfNaveg,
+                     vegdsm=vegdsm, vegdsm2=vegdsm2, albedo_b=albedo_b, absK=absK, absL=absL, ewall=ewall,
+                     Fside=Fside, Fup=Fup, Fcyl=Fcyl, usevegdem=usevegdem, onlyglobal=onlyglobal, buildings=buildings,
+                     location=location, landcover=landcover, lcgrid=lcgrid, wallaspect=wallaspect,
+                     wallheight=wallheight, cyl=cyl, elvis=elvis, amaxvalue=amaxvalue, bush=bush, TgK=TgK,
+                     Tstart=Tstart, alb_grid=alb_grid, emis_grid=emis_grid, TgK_wall=TgK_wall, Tstart_wall=Tstart_wall,
+                     TmaxLST=TmaxLST, TmaxLST_wall=TmaxLST_wall, first=first, second=second, svfalfa=svfalfa,
+                     svfbuveg=svfbuveg, diffsh=diffsh, shmat=shmat, vegshmat=vegshmat, vbshvegshmat=vbshvegshmat,
+                     anisotropic_sky=anisotropic_sky, asvf=asvf, patch_option=patch_option)
+        met = dict(YYYY=YYYY[0], DOY=DOY, hours=hours, minu=minu, altitude=altitude[0], azimuth=azimuth[0],
+                   zen=zen[0], jday=jday[0], psi=psi[0], dectime=dectime, altmax=altmax[0], Ta=Ta, RH=RH, radG=radG,
+                   radD=radD, radI=radI, P=P, Ws=Ws)
+        if poisxy is None:
+            poi = None
+        else:
+            poi = dict(xy=poisxy, sensorheight=sensorheight, mbody=mbody, age=age, ht=ht, activity=activity, clo=clo,
+                       sex=sex)
+        rasters = [name for name, save in (('Tmrt', outputTmrt), ('Kup', outputKup), ('Kdown', outputKdown),
+                                           ('Lup', outputLup), ('Ldown', outputLdown), ('Shadow', outputSh),
+                                           ('Kdiff', outputKdiff)) if save]
+        # rasters kept by day segments, also those only needed for the statistics
+        segmentrasters = rasters + [name for name in self.AGGREGATE_NAMES
+                                    if name not in rasters and any(a.variable == name for a in aggregates)]
+        if dectime.shape[0] > 1:
+            stephours = (dectime[1] - dectime[0]) * 24.
+        else:
+            stephours = 1.
+
+        # Shadow matrices unpacked in single precision, the grids were read as float32 and are not copied
+        if singlePrecision:
+            model = model_precision(model, np.float32)
+
+        # Shadows from earlier runs on the same surface
+        if cacheFolder:
+            model['shadowcache'] = model_shadowcache(model, cacheFolder, cacheTolerance, cacheSize)
+        else:
+            model['shadowcache'] = None
+        # Direction independent parts of the ground view factors, set up once for all timesteps
+        model['gvfengine'] = model_gvfengine(model)
 
         # Main function
         feedback.setProgressText("Executing main model")
     
         tmrtplot = np.zeros((rows, cols))
-        TgOut1 = np.zeros((rows, cols))
 
         # Initiate array for I0 values
         if np.unique(DOY).shape[0] > 1:
@@ -966,247 +1106,151 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             first_unique_day = DOY.copy()
             I0_array = np.zeros((DOY.shape[0]))
 
-        #numformat = '%d %d %d %d %.5f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f ' \
-        #            '%.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f'
-
-        numformat = '%d %d %d %d %.5f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f ' \
-                    '%.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f ' \
-                        '%.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f'
-
-        for i in np.arange(0, Ta.__len__()):
-            feedback.setProgress(int(i * (100. / Ta.__len__()))) # move progressbar forward
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
-            # Daily water body temperature
-            if landcover == 1:
-                if ((dectime[i] - np.floor(dectime[i]))) == 0 or (i == 0):
-                    Twater = np.mean(Ta[jday[0] == np.floor(dectime[i])])
-            # Nocturnal cloudfraction from Offerle et al. 2003
-            if (dectime[i] - np.floor(dectime[i])) == 0:
-                daylines = np.where(np.floor(dectime) == dectime[i])
-                if daylines.__len__() > 1:
-                    alt = altitude[0][daylines]
-                    alt2 = np.where(alt > 1)
-                    rise = alt2[0][0]
-                    [_, CI, _, _, _] = clearnessindex_2013b(zen[0, i + rise + 1], jday[0, i + rise + 1],
-                                                            Ta[i + rise + 1],
-                                                            RH[i + rise + 1] / 100., radG[i + rise + 1], location,
-                                                            P[i + rise + 1])  # i+rise+1 to match matlab code. correct?
-                    if (CI > 1.) or (CI == np.inf):
-                        CI = 1.
-                else:
-                    CI = 1.
-
-            # radI[i] = radI[i]/np.sin(altitude[0][i] * np.pi/180)
-
-            Tmrt, Kdown, Kup, Ldown, Lup, Tg, ea, esky, I0, CI, shadow, firstdaytime, timestepdec, timeadd, \
-                    Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, Keast, Ksouth, Kwest, Knorth, Least, \
-                    Lsouth, Lwest, Lnorth, KsideI, TgOut1, TgOut, radIout, radDout, \
-                    Lside, Lsky_patch_characteristics, CI_Tg, CI_TgG, KsideD, \
-                        dRad, Kside = so.Solweig_2022a_calc(
-                        i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, svfveg,
-                        svfNveg, svfEveg, svfSveg, svfWveg, svfaveg, svfEaveg, svfSaveg, svfWaveg, svfNaveg, \
-                        vegdsm, vegdsm2, albedo_b, absK, absL, ewall, Fside, Fup, Fcyl, altitude[0][i],
-                        azimuth[0][i], zen[0][i], jday[0][i], usevegdem, onlyglobal, buildings, location,
-                        psi[0][i], landcover, lcgrid, dectime[i], altmax[0][i], wallaspect,
-                        wallheight, cyl, elvis, Ta[i], RH[i], radG[i], radD[i], radI[i], P[i], amaxvalue,
-                        bush, Twater, TgK, Tstart, alb_grid, emis_grid, TgK_wall, Tstart_wall, TmaxLST,
-                        TmaxLST_wall, first, second, svfalfa, svfbuveg, firstdaytime, timeadd, timestepdec, 
-                        Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, CI, TgOut1, diffsh, shmat, vegshmat, vbshvegshmat, 
-                        anisotropic_sky, asvf, patch_option)
-
-            # Tmrt, Kdown, Kup, Ldown, Lup, Tg, ea, esky, I0, CI, shadow, firstdaytime, timestepdec, timeadd, \
-            #         Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, Keast, Ksouth, Kwest, Knorth, Least, \
-            #         Lsouth, Lwest, Lnorth, KsideI, TgOut1, TgOut, radIout, radDout = so.Solweig_2021a_calc(
-            #             i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, svfveg,
-            #             svfNveg, svfEveg, svfSveg, svfWveg, svfaveg, svfEaveg, svfSaveg, svfWaveg, svfNaveg,
-            #             vegdsm, vegdsm2, albedo_b, absK, absL, ewall, Fside, Fup, Fcyl, altitude[0][i],
-            #             azimuth[0][i], zen[0][i], jday[0][i], usevegdem, onlyglobal, buildings, location,
-            #             psi[0][i], landcover, lcgrid, dectime[i], altmax[0][i], wallaspect,
-            #             wallheight, cyl, elvis, Ta[i], RH[i], radG[i], radD[i], radI[i], P[i], amaxvalue,
-            #             bush, Twater, TgK, Tstart, alb_grid, emis_grid, TgK_wall, Tstart_wall, TmaxLST,
-            #             TmaxLST_wall, first, second, svfalfa, svfbuveg, firstdaytime, timeadd, timestepdec, 
-            #             Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, CI, TgOut1, diffsh, ani)
-
-
-
-            # Tmrt, Kdown, Kup, Ldown, Lup, Tg, ea, esky, I0, CI, shadow, firstdaytime, timestepdec, timeadd, \
-            # Tgmap1, timeaddE, Tgmap1E, timeaddS, Tgmap1S, timeaddW, Tgmap1W, timeaddN, Tgmap1N, \
-            # Keast, Ksouth, Kwest, Knorth, Least, Lsouth, Lwest, Lnorth, KsideI, TgOut1, TgOut, radIout, radDout \
-            #     = so.Solweig_2019a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, svfveg,
-            #         svfNveg, svfEveg, svfSveg, svfWveg, svfaveg, svfEaveg, svfSaveg, svfWaveg, svfNaveg,
-            #         vegdsm, vegdsm2, albedo_b, absK, absL, ewall, Fside, Fup, Fcyl, altitude[0][i],
-            #         azimuth[0][i], zen[0][i], jday[0][i], usevegdem, onlyglobal, buildings, location,
-            #         psi[0][i], landcover, lcgrid, dectime[i], altmax[0][i], waspect,
-            #         wheight, cyl, elvis, Ta[i], RH[i], radG[i], radD[i], radI[i], P[i], amaxvalue,
-            #         bush, Twater, TgK, Tstart, alb_grid, emis_grid, TgK_wall, Tstart_wall, TmaxLST,
-            #         TmaxLST_wall, first, second, svfalfa, svfbuveg, firstdaytime, timeadd, timeaddE, timeaddS,
-            #         timeaddW, timeaddN, timestepdec, Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, CI, TgOut1, diffsh, ani)
-
-            # Save I0 for I0 vs. Kdown output plot to check if UTC is off
-            if i < first_unique_day.shape[0]:
-                I0_array[i] = I0
-
-            tmrtplot = tmrtplot + Tmrt
-
-            if altitude[0][i] > 0:
-                w = 'D'
-            else:
-                w = 'N'
-
-            # # Write to POIs
-            # if not poisxy is None:
-            #     for k in range(0, poisxy.shape[0]):
-            #         poi_save = np.zeros((1, 35))
-            #         poi_save[0, 0] = YYYY[0][i]
-            #         poi_save[0, 1] = jday[0][i]
-            #         poi_save[0, 2] = hours[i]
-            #         poi_save[0, 3] = minu[i]
-            #         poi_save[0, 4] = dectime[i]
-            #         poi_save[0, 5] = altitude[0][i]
-            #         poi_save[0, 6] = azimuth[0][i]
-            #         poi_save[0, 7] = radIout
-            #         poi_save[0, 8] = radDout
-            #         poi_save[0, 9] = radG[i]
-            #         poi_save[0, 10] = Kdown[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 11] = Kup[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 12] = Keast[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 13] = Ksouth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 14] = Kwest[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 15] = Knorth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 16] = Ldown[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 17] = Lup[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 18] = Least[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 19] = Lsouth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 20] = Lwest[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 21] = Lnorth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 22] = Ta[i]
-            #         poi_save[0, 23] = TgOut[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 24] = RH[i]
-            #         poi_save[0, 25] = esky
-            #         poi_save[0, 26] = Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 27] = I0
-            #         poi_save[0, 28] = CI
-            #         poi_save[0, 29] = shadow[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 30] = svf[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 31] = svfbuveg[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         poi_save[0, 32] = KsideI[int(poisxy[k, 2]), int(poisxy[k, 1])]
-            #         # Recalculating wind speed based on powerlaw
-            #         WsPET = (1.1 / sensorheight) ** 0.2 * Ws[i]
-            #         WsUTCI = (10. / sensorheight) ** 0.2 * Ws[i]
-            #         resultPET = p._PET(Ta[i], RH[i], Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])], WsPET,
-            #                             mbody, age, ht, activity, clo, sex)
-            #         poi_save[0, 33] = resultPET
-            #         resultUTCI = utci.utci_calculator(Ta[i], RH[i], Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])],
-            #                                             WsUTCI)
-            #         poi_save[0, 34] = resultUTCI
-            #         data_out = outputDir + '/POI_' + str(poiname[k]) + '.txt'
-            #         # f_handle = file(data_out, 'a')
-            #         f_handle = open(data_out, 'ab')
-            #         np.savetxt(f_handle, poi_save, fmt=numformat)
-            #         f_handle.close()
-
-            # Write to POIs
-            if not poisxy is None:
-                for k in range(0, poisxy.shape[0]):
-                    poi_save = np.zeros((1, 41))
-                    poi_save[0, 0] = YYYY[0][i]
-                    poi_save[0, 1] = jday[0][i]
-                    poi_save[0, 2] = hours[i]
-                    poi_save[0, 3] = minu[i]
-                    poi_save[0, 4] = dectime[i]
-                    poi_save[0, 5] = altitude[0][i]
-                    poi_save[0, 6] = azimuth[0][i]
-                    poi_save[0, 7] = radIout
-                    poi_save[0, 8] = radDout
-                    poi_save[0, 9] = radG[i]
-                    poi_save[0, 10] = Kdown[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 11] = Kup[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 12] = Keast[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 13] = Ksouth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 14] = Kwest[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 15] = Knorth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 16] = Ldown[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 17] = Lup[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 18] = Least[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 19] = Lsouth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 20] = Lwest[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 21] = Lnorth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 22] = Ta[i]
-                    poi_save[0, 23] = TgOut[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 24] = RH[i]
-                    poi_save[0, 25] = esky
-                    poi_save[0, 26] = Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 27] = I0
-                    poi_save[0, 28] = CI
-                    poi_save[0, 29] = shadow[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 30] = svf[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 31] = svfbuveg[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 32] = KsideI[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    # Recalculating wind speed based on powerlaw
-                    WsPET = (1.1 / sensorheight) ** 0.2 * Ws[i]
-                    WsUTCI = (10. / sensorheight) ** 0.2 * Ws[i]
-                    resultPET = p._PET(Ta[i], RH[i], Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])], WsPET,
-                                        mbody, age, ht, activity, clo, sex)
-                    poi_save[0, 33] = resultPET
-                    resultUTCI = utci.utci_calculator(Ta[i], RH[i], Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])],
-                                                        WsUTCI)
-                    poi_save[0, 34] = resultUTCI
-                    poi_save[0, 35] = CI_Tg
-                    poi_save[0, 36] = CI_TgG
-                    poi_save[0, 37] = KsideD[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 38] = Lside[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 39] = dRad[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 40] = Kside[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    data_out = outputDir + '/POI_' + str(poiname[k]) + '.txt'
-                    # f_handle = file(data_out, 'a')
-                    f_handle = open(data_out, 'ab')
-                    np.savetxt(f_handle, poi_save, fmt=numformat)
-                    f_handle.close()
-
-            if hours[i] < 10:
-                XH = '0'
-            else:
-                XH = ''
-            if minu[i] < 10:
-                XM = '0'
+        segments = day_segments(met)
+        parallelrun = workers > 1 and len(segments) > 1
+
+        # Resume from the state saved by an interrupted run with the same inputs. Day segments run in parallel
+        # are stitched into the outputs in time order, the state of the outputs is saved after each segment.
+        snapshotfile = os.path.join(outputDir, 'SOLWEIG_state.npz')
+        resumed = None
+        if snapshot is not None or parallelrun:
+            signature = run_signature(model, met, poi, segmentrasters) + '_' + outputFormat + '_' + \
+                str(outputPoiText) + '_' + str(outputPoiTable) + '_' + \
+                '_'.join(aggregate.filename for aggregate in aggregates)
+            if parallelrun:
+                checkpoints = os.path.join(outputDir, 'segments')
+                open_checkpoints(checkpoints, signature)
+                snapshotfile = os.path.join(checkpoints, 'SOLWEIG_state.npz')
+            resumed = load_snapshot(snapshotfile, signature)
+        if resumed is None:
+            start = 0
+            state = initial_state(rows, cols, met, model['dsm'].dtype)
+        else:
+            start, state, saved = resumed
+            tmrtplot = saved['tmrtplot']
+            I0_array = saved['I0_array']
+            restore_aggregates(aggregates, saved)
+            feedback.setProgressText("Resuming from the model state saved before timestep " + str(start + 1) +
+                                     " of " + str(Ta.__len__()))
+
+        try:
+            writer = RasterWriter(gdal_dsm, outputDir, outputFormat, Ta.__len__(), resume=start > 0)
+            # POI rows are buffered and written in blocks of timesteps
+            recorder = None
+            if poi is not None:
+                recorder = PoiRecorder(outputDir, poiname, poi, header, Ta.__len__(), outputPoiText, outputPoiTable,
+                                       resume=start > 0)
+                if start > 0:
+                    recorder.truncate(saved['poi_positions'])
+        except ImportError as e:
+            raise QgsProcessingException(str(e))
+
+        Lsky_patch_characteristics = None
+        cancelled = False
+        if parallelrun:
+            # Day segments in parallel, the outputs of a segment are kept until it is stitched
+            feedback.setProgressText("Running " + str(len(segments)) + " day segments on " + str(workers) +
+                                     " processes (checkpoints in " + checkpoints + ")")
+            stitched = 0
+            for segment in run_segments(model, met, poi, segmentrasters, (cacheFolder, cacheTolerance, cacheSize)
+                                        if cacheFolder else None, checkpoints, segments, workers, feedback):
+                summary, timesteps = segment_outputs(checkpoints, segment, segmentrasters)
+                if 'Lsky_patch_characteristics' in summary:
+                    Lsky_patch_characteristics = summary['Lsky_patch_characteristics']
+                stitched = segment[1]
+                if segment[1] <= start:
+                    # stitched by an interrupted run
+                    continue
+                for i, arrays, poirows, I0 in timesteps:
+                    if i < first_unique_day.shape[0]:
+                        I0_array[i] = I0
+                    if poirows is not None:
+                        recorder.record(i, poirows)
+                    stamp = timestep_stamp(met, i)
+                    time = timestep_datetime(YYYY[0, i], DOY[i], hours[i], minu[i])
+                    for name in rasters:
+                        writer.write(name, i, stamp, time, arrays[name])
+                    for aggregate in aggregates:
+                        aggregate.update(arrays[aggregate.variable], altitude[0][i] > 0, stephours)
+                tmrtplot = tmrtplot + summary['tmrt']
+
+                # State of the outputs saved once the segment is on disk, then its rasters are no longer needed
+                writer.flush()
+                saved = {'tmrtplot': tmrtplot, 'I0_array': I0_array}
+                saved.update(aggregate_states(aggregates))
+                if recorder is not None:
+                    saved['poi_positions'] = recorder.positions()
+                save_snapshot(snapshotfile, signature, segment[1], {}, saved)
+                remove_segment_rasters(checkpoints, segment, segmentrasters)
+            if stitched == Ta.__len__():
+                shutil.rmtree(checkpoints)
             else:
-                XM = ''
-
-            if outputTmrt:
-                saveraster(gdal_dsm, outputDir + '/Tmrt_' + str(int(YYYY[0, i])) + '_' + str(int(DOY[i]))
-                                + '_' + XH + str(int(hours[i])) + XM + str(int(minu[i])) + w + '.tif', Tmrt)
-            if outputKup:
-                saveraster(gdal_dsm, outputDir + '/Kup_' + str(int(YYYY[0, i])) + '_' + str(int(DOY[i]))
-                                + '_' + XH + str(int(hours[i])) + XM + str(int(minu[i])) + w + '.tif', Kup)
-            if outputKdown:
-                saveraster(gdal_dsm, outputDir + '/Kdown_' + str(int(YYYY[0, i])) + '_' + str(int(DOY[i]))
-                                + '_' + XH + str(int(hours[i])) + XM + str(int(minu[i])) + w + '.tif', Kdown)
-            if outputLup:
-                saveraster(gdal_dsm, outputDir + '/Lup_' + str(int(YYYY[0, i])) + '_' + str(int(DOY[i]))
-                                + '_' + XH + str(int(hours[i])) + XM + str(int(minu[i])) + w + '.tif', Lup)
-            if outputLdown:
-                saveraster(gdal_dsm, outputDir + '/Ldown_' + str(int(YYYY[0, i])) + '_' + str(int(DOY[i]))
-                                + '_' + XH + str(int(hours[i])) + XM + str(int(minu[i])) + w + '.tif', Ldown)
-            if outputSh:
-                saveraster(gdal_dsm, outputDir + '/Shadow_' + str(int(YYYY[0, i])) + '_' + str(int(DOY[i]))
-                                + '_' + XH + str(int(hours[i])) + XM + str(int(minu[i])) + w + '.tif', shadow)
-                
-            if outputKdiff:
-                saveraster(gdal_dsm, outputDir + '/Kdiff_' + str(int(YYYY[0, i])) + '_' + str(int(DOY[i]))
-                                + '_' + XH + str(int(hours[i])) + XM + str(int(minu[i])) + w + '.tif', dRad)
-
-            # if outputSstr:
-            #     saveraster(gdal_dsm, outputDir + '/Sstr_' + str(int(YYYY[0, i])) + '_' + str(int(DOY[i]))
-            #                     + '_' + XH + str(int(hours[i])) + XM + str(int(minu[i])) + w + '.tif', Sstr)
-
-            # Sky view image of patches
-            if ((anisotropic_sky == 1) & (i == 0) & (not poisxy is None)):
-                    for k in range(poisxy.shape[0]):
-                        Lsky_patch_characteristics[:,2] = patch_characteristics[:,k]
-                        skyviewimage_out = outputDir + '/POI_' + str(poiname[k]) + '.png'
-                        PolarBarPlot(Lsky_patch_characteristics, altitude[0][i], azimuth[0][i], 'Hemisphere partitioning', skyviewimage_out, 0, 5, 0)
+                cancelled = True
+                feedback.setProgressText("Calculation cancelled, finished day segments are reused when the run is "
+                                         "started again with the same output folder")
+        else:
+            for i in np.arange(start, Ta.__len__()):
+                feedback.setProgress(int(i * (100. / Ta.__len__()))) # move progressbar forward
+                if feedback.isCanceled():
+                    feedback.setProgressText("Calculation cancelled")
+                    cancelled = True
+                    break
+
+                # radI[i] = radI[i]/np.sin(altitude[0][i] * np.pi/180)
+
+                out = solweig_step(i, 0, model, met, state)
+
+                # Save I0 for I0 vs. Kdown output plot to check if UTC is off
+                if i < first_unique_day.shape[0]:
+                    I0_array[i] = out['I0']
+
+                tmrtplot = tmrtplot + out['Tmrt']
+
+                # Write to POIs, PET and UTCI are calculated for all buffered timesteps at once
+                if poi is not None:
+                    recorder.record(i, poi_rows(i, out, model, met, poi, comfort=False), Ws[i])
+
+                stamp = timestep_stamp(met, i)
+                time = timestep_datetime(YYYY[0, i], DOY[i], hours[i], minu[i])
+                for name in rasters:
+                    writer.write(name, i, stamp, time, out[RASTER_OUTPUTS[name]])
+                for aggregate in aggregates:
+                    aggregate.update(out[RASTER_OUTPUTS[aggregate.variable]], altitude[0][i] > 0, stephours)
+
+                if i == 0:
+                    Lsky_patch_characteristics = out['Lsky_patch_characteristics']
+
+                # Model state for resuming, saved once all outputs up to this timestep are on disk
+                if snapshot is not None and snapshot_due(snapshot, met, i):
+                    writer.flush()
+                    saved = {'tmrtplot': tmrtplot, 'I0_array': I0_array}
+                    saved.update(aggregate_states(aggregates))
+                    if recorder is not None:
+                        saved['poi_positions'] = recorder.positions()
+                    save_snapshot(snapshotfile, signature, i + 1, state, saved)
+
+        # Sky view image of patches
+        if ((anisotropic_sky == 1) & (Lsky_patch_characteristics is not None) & (not poisxy is None)):
+                for k in range(poisxy.shape[0]):
+                    Lsky_patch_characteristics[:,2] = patch_characteristics[:,k]
+                    skyviewimage_out = outputDir + '/POI_' + str(poiname[k]) + '.png'
+                    PolarBarPlot(Lsky_patch_characteristics, altitude[0][0], azimuth[0][0], 'Hemisphere partitioning', skyviewimage_out, 0, 5, 0)
+
+        feedback.setProgressText("Finishing output rasters")
+        writer.close()
+        if recorder is not None:
+            recorder.close()
+        if not cancelled and os.path.isfile(snapshotfile):
+            os.remove(snapshotfile)
+
+        # Statistics accumulated during the run
+        if not cancelled:
+            for aggregate in aggregates:
+                result = aggregate_result(aggregate)
+                if result is None:
+                    feedback.setProgressText("No timesteps for " + aggregate.filename + ", raster not saved")
+                else:
+                    saveraster(gdal_dsm, outputDir + '/' + aggregate.filename + '.tif', result)
 
         # Save files for Tree Planter
         if outputTreeplanter:
@@ -1244,6 +1288,10 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         
         tmrtplot = tmrtplot / Ta.__len__()  # fix average Tmrt instead of sum, 20191022
         saveraster(gdal_dsm, outputDir + '/Tmrt_average.tif', tmrtplot)
+        shadowcache = model['shadowcache']
+        if shadowcache is not None and shadowcache.cache.hits + shadowcache.cache.misses > 0:
+            feedback.setProgressText('Shadow cache: ' + str(shadowcache.cache.hits) + ' shadows reused, ' +
+                                     str(shadowcache.cache.misses) + ' cast')
         feedback.setProgressText("SOLWEIG: Model calculation finished.")
 
         return {self.OUTPUT_DIR: outputDir}
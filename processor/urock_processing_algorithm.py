@@ -62,6 +62,7 @@ import processing
 from ..functions.URock import DataUtil
 
 from ..functions.URock import MainCalculation
+from ..functions.URock import BatchCalculation
 from ..functions.URock.GlobalVariables import *
 from ..functions.URock.H2gisConnection import getJavaDir, setJavaDir, saveJavaDir
 from ..functions.URock import WriteMetadataURock
@@ -108,6 +109,13 @@ class URockAlgorithm(QgsProcessingAlgorithm):
     INPUT_PROFILE_TYPE = "INPUT_PROFILE_TYPE"
     INPUT_PROFILE_FILE = "INPUT_PROFILE_FILE"
     LIST_OF_PROFILES = pd.Series(['power', 'urban', 'user'])
+    WIND_SOLVER = "WIND_SOLVER"
+    LIST_OF_SOLVERS = pd.Series(SOLVER_METHODS)
+    ROCKLE_BACKEND = "ROCKLE_BACKEND"
+    LIST_OF_ROCKLE_BACKENDS = pd.Series(ROCKLE_BACKENDS)
+    BATCH_WIND_DIRECTIONS = "BATCH_WIND_DIRECTIONS"
+    BATCH_WIND_SPEEDS = "BATCH_WIND_SPEEDS"
+    BATCH_N_WORKERS = "BATCH_N_WORKERS"
 
     # Output variables    
     OUTPUT_DIRECTORY = "UROCK_OUTPUT"
@@ -243,6 +251,40 @@ class URockAlgorithm(QgsProcessingAlgorithm):
                 QgsProcessingParameterNumber.Integer,
                 2,
                 False))
+        self.addParameter(
+           QgsProcessingParameterEnum(
+               self.WIND_SOLVER, 
+               self.tr('Wind solver ("sor": lexicographic, "redblack": checkerboard, parallel, "multigrid": preconditioned conjugate gradient)'),
+               self.LIST_OF_SOLVERS.values,
+               defaultValue=SOLVER_METHODS.index(SOLVER_METHOD),
+               optional = True))
+        self.addParameter(
+           QgsProcessingParameterEnum(
+               self.ROCKLE_BACKEND, 
+               self.tr('Röckle zones calculation ("h2gis": spatial SQL queries, "native": same zones calculated in memory, faster, needs shapely)'),
+               self.LIST_OF_ROCKLE_BACKENDS.values,
+               defaultValue=ROCKLE_BACKENDS.index(ROCKLE_BACKEND),
+               optional = True))
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.BATCH_WIND_DIRECTIONS,
+                self.tr('Batch mode: wind directions (° clock-wise from North) - if several values, separated by "," (replaces the wind direction, 3D wind saved in one NetCDF file, uses the "native" Röckle zones calculation)'),
+                defaultValue = "",
+                optional = True))
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.BATCH_WIND_SPEEDS,
+                self.tr('Batch mode: wind speeds at the reference height (m/s) - if several values, separated by ","'),
+                defaultValue = "",
+                optional = True))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BATCH_N_WORKERS,
+                self.tr('Batch mode: number of wind directions calculated in parallel processes'),
+                QgsProcessingParameterNumber.Integer,
+                1,
+                True,
+                minValue = 1))
 
 
         # We add several output parameters
@@ -316,6 +358,12 @@ class URockAlgorithm(QgsProcessingAlgorithm):
             import xarray
         except Exception:
             raise QgsProcessingException("'xarray' Python package is missing. Most tools still work. Visit the UMEP manual (Getting Started) for instructions on how to install.")
+        if self.LIST_OF_ROCKLE_BACKENDS.loc[self.parameterAsInt(parameters, self.ROCKLE_BACKEND, context)] == ROCKLE_BACKENDS[1]\
+            or self.parameterAsString(parameters, self.BATCH_WIND_DIRECTIONS, context):
+            try:
+                import shapely
+            except Exception:
+                raise QgsProcessingException("'shapely' Python package is missing (needed by the native Röckle zones calculation). Visit the UMEP manual (Getting Started) for instructions on how to install.")
 
         # Get the plugin directory to save some useful files
         plugin_directory = self.plugin_dir = os.path.dirname(__file__)
@@ -348,6 +396,15 @@ class URockAlgorithm(QgsProcessingAlgorithm):
         dz = self.parameterAsInt(parameters, self.VERTICAL_RESOLUTION, context)
         profileType = self.LIST_OF_PROFILES.loc[self.parameterAsInt(parameters, self.INPUT_PROFILE_TYPE, context)]
         profileFile = self.parameterAsString(parameters, self.INPUT_PROFILE_FILE, context)
+        solverMethod = self.LIST_OF_SOLVERS.loc[self.parameterAsInt(parameters, self.WIND_SOLVER, context)]
+        rockleBackend = self.LIST_OF_ROCKLE_BACKENDS.loc[self.parameterAsInt(parameters, self.ROCKLE_BACKEND, context)]
+        batchDirections = [float(i) for i in self.parameterAsString(parameters, self.BATCH_WIND_DIRECTIONS, context).split(",") if i.strip()]
+        batchSpeeds = [float(i) for i in self.parameterAsString(parameters, self.BATCH_WIND_SPEEDS, context).split(",") if i.strip()]
+        if not batchSpeeds:
+            batchSpeeds = [v_ref]
+        if len(set(batchDirections)) != len(batchDirections) or len(set(batchSpeeds)) != len(batchSpeeds):
+            raise QgsProcessingException('Each batch wind direction and wind speed should be given only once')
+        nWorkers = self.parameterAsInt(parameters, self.BATCH_N_WORKERS, context)
         
         # Get building layer and then file directory
         inputBuildinglayer = self.parameterAsVectorLayer(parameters, self.BUILDING_TABLE_NAME, context)
@@ -440,6 +497,48 @@ class URockAlgorithm(QgsProcessingAlgorithm):
                                         profileFile,
                                         meshSize, dz)
         
+        # Batch mode: one NetCDF file for all wind directions and speeds
+        if batchDirections:
+            outputExtent = None
+            if outputRaster:
+                outputExtent = [outputRaster.extent().xMinimum(), outputRaster.extent().yMinimum(),
+                                outputRaster.extent().xMaximum(), outputRaster.extent().yMaximum()]
+            netcdf_path = \
+                BatchCalculation.main(javaEnvironmentPath = javaEnvVar,
+                                      pluginDirectory = plugin_directory,
+                                      outputFilePath = outputDirectory,
+                                      buildingFilePath = build_file,
+                                      srid = srid_build,
+                                      windDirections = batchDirections,
+                                      windSpeeds = batchSpeeds,
+                                      outputFilename = outputFilename,
+                                      vegetationFilePath = veg_file,
+                                      z_ref = z_ref,
+                                      prefix = '',
+                                      meshSize = meshSize,
+                                      dz = dz,
+                                      alongWindZoneExtend = ALONG_WIND_ZONE_EXTEND,
+                                      crossWindZoneExtend = CROSS_WIND_ZONE_EXTEND,
+                                      verticalExtend = VERTICAL_EXTEND,
+                                      tempoDirectory = TEMPO_DIRECTORY,
+                                      onlyInitialization = ONLY_INITIALIZATION,
+                                      maxIterations = MAX_ITERATIONS,
+                                      thresholdIterations = THRESHOLD_ITERATIONS,
+                                      solverMethod = solverMethod,
+                                      idFieldBuild = None,
+                                      buildingHeightField = heightBuild,
+                                      vegetationBaseHeight = baseHeightVeg,
+                                      vegetationTopHeight = topHeightVeg,
+                                      idVegetation = None,
+                                      vegetationAttenuationFactor = attenuationVeg,
+                                      outputExtent = outputExtent,
+                                      nWorkers = nWorkers,
+                                      feedback = feedback,
+                                      profileType = profileType,
+                                      verticalProfileFile = profileFile)
+            return {self.OUTPUT_DIRECTORY: outputDirectory,
+                    self.OUTPUT_FILENAME: outputFilename}
+        
         # Make the calculations
         u, v, w, u0, v0, w0, x, y, z, buildingCoordinates, cursor, gridName,\
         rotationCenterCoordinates, verticalWindProfile, dicVectorTables,\
@@ -466,6 +565,7 @@ class URockAlgorithm(QgsProcessingAlgorithm):
                                  onlyInitialization = ONLY_INITIALIZATION,
                                  maxIterations = MAX_ITERATIONS,
                                  thresholdIterations = THRESHOLD_ITERATIONS,
+                                 solverMethod = solverMethod,
                                  idFieldBuild = None, # idBuild,
                                  buildingHeightField = heightBuild,
                                  vegetationBaseHeight = baseHeightVeg,
@@ -481,7 +581,8 @@ class URockAlgorithm(QgsProcessingAlgorithm):
                                  z_out = z_out,
                                  debug = DEBUG,
                                  profileType = profileType,
-                                 verticalProfileFile = profileFile)
+                                 verticalProfileFile = profileFile,
+                                 rockleBackend = rockleBackend)
         
         # Load files into QGIS if user set it
         if loadOutput:
@@ -0,0 +1,33 @@
+# coding=utf-8
+"""Benchmark of the SEBE wall voxel irradiance against the loop over walls.
+
+Run from the directory containing the plugin folder, e.g.
+    python -m processing_umep.test.benchmark_sebe_walls
+"""
+
+import time
+
+import numpy as np
+
+from ..functions.SEBEfiles.SEBE_2015a_calc_forprocessing import wall_voxels
+from .test_sebe_walls import random_walls, wall_voxels_loop
+
+
+def run_benchmark(sizes=(200, 1000), voxelheight=1.):
+    sections = int(np.floor(30. * (1 / voxelheight)))
+    for size in sizes:
+        wallrow, wallcol, wallsun, wallstot, wallsh, wallshve, Iw, Dw, Rw = random_walls(size, voxelheight)
+        args = (wallrow, wallcol, wallsun, wallstot, wallsh, wallshve, Iw, Dw, Rw, 0.03, voxelheight, sections)
+        start = time.time()
+        reference = wall_voxels_loop(*args)
+        tloop = time.time() - start
+        start = time.time()
+        wallmatrix = wall_voxels(*args)
+        tvector = time.time() - start
+        print('%8d walls x %3d sections  loop: %8.3f s  vectorised: %8.3f s  (x%.0f, identical: %s)'
+              % (wallrow.shape[0], sections, tloop, tvector, tloop / tvector,
+                 np.array_equal(wallmatrix, reference)))
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,64 @@
+# coding=utf-8
+"""Benchmark of the shadow casting backends on 1k x 1k and 4k x 4k DSMs.
+
+Run from the directory containing the plugin folder, e.g.
+    python -m processing_umep.test.benchmark_shadowing
+"""
+
+import time
+
+import numpy as np
+
+from ..util import shadowingfunctions as shadow
+from ..util import shadowingfunctions_numba as shadow_numba
+from ..util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_23 import shadowingfunction_wallheight_23
+
+
+def city_surface(size, seed=1):
+    """Random block city with trees, 1 m pixels."""
+    rng = np.random.RandomState(seed)
+    dsm = 5. + rng.rand(size, size)
+    cdsm = np.zeros((size, size))
+    for _ in range(size // 10):
+        x, y = rng.randint(0, size - 40, 2)
+        dsm[x:x + rng.randint(10, 40), y:y + rng.randint(10, 40)] += rng.randint(5, 40)
+        x, y = rng.randint(0, size - 10, 2)
+        cdsm[x:x + rng.randint(3, 10), y:y + rng.randint(3, 10)] = rng.randint(4, 15)
+    tdsm = cdsm * 0.25
+    vegdem = cdsm + dsm
+    vegdem[vegdem == dsm] = 0
+    vegdem2 = tdsm + dsm
+    vegdem2[vegdem2 == dsm] = 0
+    bush = np.logical_not((vegdem2 * vegdem)) * vegdem
+    amaxvalue = np.maximum(dsm.max() - dsm.min(), cdsm.max())
+    walls = np.zeros((size, size))
+    aspect = np.zeros((size, size))
+    return dsm, vegdem, vegdem2, amaxvalue, bush, walls, aspect
+
+
+def run_benchmark(sizes=(1000, 4000), azimuth=200., altitude=30.):
+    backends = [b for b in shadow.SHADOW_BACKENDS if b != 'numba' or shadow_numba.NUMBA_AVAILABLE]
+    current = shadow.get_shadow_backend()
+    try:
+        for size in sizes:
+            dsm, vegdem, vegdem2, amaxvalue, bush, walls, aspect = city_surface(size)
+            for backend in backends:
+                shadow.set_shadow_backend(backend)
+                # warm-up to exclude jit compilation
+                shadow.shadowingfunction_20(dsm[:50, :50], vegdem[:50, :50], vegdem2[:50, :50], azimuth, altitude,
+                                            1., amaxvalue, bush[:50, :50], None, 1)
+                start = time.time()
+                shadow.shadowingfunction_20(dsm, vegdem, vegdem2, azimuth, altitude, 1., amaxvalue, bush, None, 1)
+                t20 = time.time() - start
+                start = time.time()
+                shadowingfunction_wallheight_23(dsm, vegdem, vegdem2, azimuth, altitude, 1., amaxvalue, bush,
+                                                walls, aspect)
+                t23 = time.time() - start
+                print('%5d x %-5d %-6s shadowingfunction_20: %8.2f s  shadowingfunction_wallheight_23: %8.2f s'
+                      % (size, size, backend, t20, t23))
+    finally:
+        shadow.set_shadow_backend(current)
+
+
+if __name__ == '__main__':
+    run_benchmark()
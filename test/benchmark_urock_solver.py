@@ -0,0 +1,43 @@
+# coding=utf-8
+"""Benchmark of the iteration schemes of the URock wind solver on a 500 x 500 x 40 grid.
+
+Run from the directory containing the plugin folder, e.g.
+    python -m processing_umep.test.benchmark_urock_solver
+"""
+
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from ..functions.URock import WindSolver
+from ..functions.URock.GlobalVariables import SOLVER_METHODS
+from .test_urock_solver import synthetic_wind, divergence
+
+
+def run_benchmark(shapes=((500, 500, 40),)):
+    for shape in shapes:
+        case = synthetic_wind(*shape)
+        # warm-up to exclude jit compilation
+        small = synthetic_wind(20, 20, 8)
+        for method in SOLVER_METHODS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                WindSolver.solver(method=method, **small)
+
+        initial = np.abs(divergence(case['u0'], case['v0'], case['w0'], case['dx'], case['dy'], case['dz'],
+                                    case['cells4Solver'])).mean()
+        for method in SOLVER_METHODS:
+            report = {}
+            start = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                u, v, w = WindSolver.solver(method=method, report=report, **case)
+            elapsed = time.time() - start
+            divergent = np.abs(divergence(u, v, w, case['dx'], case['dy'], case['dz'], case['cells4Solver'])).mean()
+            print('%4d x %4d x %3d %-9s iterations: %5d  time: %8.2f s  relative residual: %.3g  '
+                  'mean divergence: %.3g (initial %.3g)'
+                  % (shape + (method, report['iterations'], elapsed, report['residual'], divergent, initial)))
+
+
+if __name__ == '__main__':
+    run_benchmark()
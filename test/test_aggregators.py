@@ -0,0 +1,67 @@
+# coding=utf-8
+"""Tests for the statistics of raster time series updated during a run."""
+
+import unittest
+
+import numpy as np
+
+from ..util import aggregators as ag
+
+
+class AggregatorsTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.rasters = np.concatenate([rng.randn(1000, 8, 10) * 5. + 30., rng.gamma(2., 3., (1000, 8, 10))], axis=2)
+        self.daytime = (np.arange(1000) % 24 >= 6) & (np.arange(1000) % 24 < 18)
+
+    def run_aggregates(self, aggregates, timesteps):
+        for i in timesteps:
+            for aggregate in aggregates:
+                aggregate.update(self.rasters[i], self.daytime[i], 0.5)
+
+    def test_exact(self):
+        aggregates = ag.make_aggregates(['mean', 'daymean', 'nightmean', 'max', 'min', 'hoursabove', 'hoursbelow'],
+                                        ['Tmrt'], threshold=32.)
+        self.run_aggregates(aggregates, range(1000))
+        results = dict((aggregate.filename, aggregate.result()) for aggregate in aggregates)
+        np.testing.assert_allclose(results['Tmrt_mean'], self.rasters.mean(axis=0))
+        np.testing.assert_allclose(results['Tmrt_day_mean'], self.rasters[self.daytime].mean(axis=0))
+        np.testing.assert_allclose(results['Tmrt_night_mean'], self.rasters[~self.daytime].mean(axis=0))
+        np.testing.assert_array_equal(results['Tmrt_max'], self.rasters.max(axis=0))
+        np.testing.assert_array_equal(results['Tmrt_min'], self.rasters.min(axis=0))
+        np.testing.assert_array_equal(results['Tmrt_hours_above_32'], (self.rasters >= 32.).sum(axis=0) * 0.5)
+        np.testing.assert_array_equal(results['Tmrt_hours_below_32'], (self.rasters < 32.).sum(axis=0) * 0.5)
+
+        # no nighttime values
+        mean = ag.Mean('Tmrt', 'night')
+        mean.update(self.rasters[0], True, 1.)
+        self.assertIsNone(ag.aggregate_result(mean))
+
+    def test_percentile(self):
+        for percentile in (5., 50., 95.):
+            aggregate = ag.Percentile('Tmrt', percentile)
+            self.run_aggregates([aggregate], range(3))
+            np.testing.assert_allclose(aggregate.result(), np.percentile(self.rasters[:3], percentile, axis=0))
+            self.run_aggregates([aggregate], range(3, 1000))
+            error = np.abs(aggregate.result() - np.percentile(self.rasters, percentile, axis=0))
+            self.assertLess(error.mean(), 0.2)
+            self.assertLess(error.max(), 2.)
+
+    def test_restore(self):
+        names = ['mean', 'max', 'hoursabove', 'percentile']
+        reference = ag.make_aggregates(names, ['Tmrt', 'Lup'])
+        self.run_aggregates(reference, range(200))
+
+        first = ag.make_aggregates(names, ['Tmrt', 'Lup'])
+        self.run_aggregates(first, range(120))
+        states = dict((name, np.asarray(value)) for name, value in ag.aggregate_states(first).items())
+        resumed = ag.make_aggregates(names, ['Tmrt', 'Lup'])
+        ag.restore_aggregates(resumed, states)
+        self.run_aggregates(resumed, range(120, 200))
+        for aggregate, expected in zip(resumed, reference):
+            np.testing.assert_array_equal(aggregate.result(), expected.result())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+# coding=utf-8
+"""Tests for the COMFA energy budget on arrays."""
+
+import unittest
+
+import numpy as np
+
+from ..functions.SOLWEIGpython.COMFA.COMFA_BUDGET import COMFA_BUDGET, COMFA_Mact
+
+
+class ComfaBudgetTest(unittest.TestCase):
+
+    def test_array_wind(self):
+        Mact, _ = COMFA_Mact(75., 180., 1, 35., 80., 'W')
+        # covers the three Reynolds number ranges of COMFA_ra
+        wind = np.array([[0.3, 1.2, 2.5], [3.9, 8., 60.]])
+        Ta = np.array([5., 22., 33.])
+        RH = np.array([80., 50., 20.])
+        for kid in (False, True):
+            stack = COMFA_BUDGET(Mact, Ta[:, np.newaxis, np.newaxis], RH[:, np.newaxis, np.newaxis], wind, 0.,
+                                 0.9 * 186.6, 0.9 * 0.18 * 18400, 75., 180., 35., kid)
+            for t in range(Ta.shape[0]):
+                for y in range(wind.shape[0]):
+                    for x in range(wind.shape[1]):
+                        scalar = COMFA_BUDGET(Mact, Ta[t], RH[t], wind[y, x], 0., 0.9 * 186.6, 0.9 * 0.18 * 18400,
+                                              75., 180., 35., kid)
+                        for flux, expected in zip(stack, scalar):
+                            self.assertTrue(np.isscalar(expected))
+                            self.assertAlmostEqual(np.broadcast_to(flux, (3, 2, 3))[t, y, x], expected, places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
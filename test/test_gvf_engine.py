@@ -0,0 +1,65 @@
+# coding=utf-8
+"""Parity tests for the precomputed ground view factor engine."""
+
+import unittest
+
+import numpy as np
+
+from ..functions.SOLWEIGpython.gvf_2018a import gvf_2018a
+from ..functions.SOLWEIGpython.gvf_engine import GvfEngine
+from ..util import shadowingfunctions as shadow
+from ..util import shadowingfunctions_numba as shadow_numba
+from ..util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_13 import shadowingfunction_wallheight_13
+from .test_shadowingfunctions import synthetic_surface
+
+
+class GvfEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = shadow.get_shadow_backend()
+        dsm, _, _, _, _, self.walls, aspect = synthetic_surface()
+        self.dsm = dsm
+        self.dirwalls = aspect * 180. / np.pi
+        self.buildings = (dsm < 15.).astype(float)
+        rows, cols = dsm.shape
+        rng = np.random.RandomState(3)
+        self.lc_grid = np.ones((rows, cols))
+        self.lc_grid[50:58, 20:35] = 3
+        self.lc_grid[self.buildings == 0] = 2
+        self.alb_grid = 0.15 + 0.05 * rng.rand(rows, cols)
+        self.emis_grid = 0.95 - 0.02 * rng.rand(rows, cols)
+        self.Tg = 5. + 10. * rng.rand(rows, cols)
+
+    def tearDown(self):
+        shadow.set_shadow_backend(self.backend)
+
+    def compare(self, landcover, azimuth, altitude):
+        sh, _, wallsun, _, _ = shadowingfunction_wallheight_13(self.dsm, azimuth, altitude, 0.5, self.walls,
+                                                               self.dirwalls * np.pi / 180.)
+        Tg = self.Tg.copy()
+        expected = gvf_2018a(wallsun, self.walls, self.buildings, 0.5, sh, 4., 40., self.dirwalls, Tg, 8., 20.,
+                             self.emis_grid, 0.9, self.alb_grid, 5.67051e-8, 0.2, sh.shape[0], sh.shape[1], 12.,
+                             self.lc_grid, landcover)
+
+        engine = GvfEngine(self.buildings, self.walls, self.dirwalls, 0.5, 4., 40., self.alb_grid, self.emis_grid, 0.2,
+                           self.lc_grid, landcover)
+        backends = [b for b in shadow.SHADOW_BACKENDS if b != 'numba' or shadow_numba.NUMBA_AVAILABLE]
+        for backend in backends:
+            shadow.set_shadow_backend(backend)
+            Tgengine = self.Tg.copy()
+            result = engine.calc(wallsun, sh, Tgengine, 8., 20., 0.9, 5.67051e-8, 12.)
+            np.testing.assert_array_equal(Tgengine, Tg)
+            self.assertEqual(len(result), len(expected))
+            for cast, reference in zip(result, expected):
+                np.testing.assert_allclose(cast, reference, rtol=1e-12, atol=1e-9)
+
+    def test_parity(self):
+        for azimuth, altitude in ((120., 35.), (250., 15.)):
+            self.compare(0, azimuth, altitude)
+
+    def test_parity_landcover(self):
+        self.compare(1, 160., 45.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# coding=utf-8
+"""Tests for the batched PET solver and the PET lookup table."""
+
+import unittest
+
+import numpy as np
+
+from ..functions.SOLWEIGpython import PET_calculations as p
+from .test_utci import Feedback
+
+
+class PetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.person = p.PET_person(mbody=75., age=35., height=1.8, activity=80., sex=1, clo=0.9)
+        rng = np.random.RandomState(7)
+        self.Tmrt = 15. + 45. * rng.rand(8, 9)
+        self.va = 0.2 + 6. * rng.rand(8, 9)
+        self.va[2, 3] = 0.
+
+    def solve(self, Ta, RH, Tmrt, va, person):
+        return p._PET(Ta, RH, Tmrt, va, person.mbody, person.age, person.height, person.activity, person.clo,
+                      person.sex)
+
+    def test_grid(self):
+        for sex in (1, 2):
+            person = self.person._replace(sex=sex)
+            result = p.calculate_PET_grid(24., 55., self.Tmrt, self.va, person, Feedback())
+            self.assertEqual(result[2, 3], -9999)
+            for y in range(self.Tmrt.shape[0]):
+                for x in range(self.Tmrt.shape[1]):
+                    if self.va[y, x] > 0:
+                        self.assertEqual(result[y, x], self.solve(24., 55., self.Tmrt[y, x], self.va[y, x], person))
+
+    def test_vec(self):
+        Ta = np.array([5., 18., 30.])[:, np.newaxis]
+        result = p.calculate_PET_index_vec(Ta, 60., self.Tmrt[:3], self.va[:3], self.person)
+        self.assertEqual(result.shape, (3, 9))
+        self.assertEqual(result[1, 4], self.solve(18., 60., self.Tmrt[1, 4], self.va[1, 4], self.person))
+
+    def test_lookup(self):
+        lookup = p.PET_lookup(self.person, Ta=np.arange(10., 31., 2.), RH=np.arange(30., 81., 10.),
+                              D_Tmrt=np.arange(-10., 51., 2.), va=p.LOOKUP_VA[5:20], samples=500)
+        self.assertLess(lookup.p99_error, 0.25)
+        self.assertLess(lookup.max_error, 1.)
+        result = lookup(24., 55., self.Tmrt, self.va)
+        expected = p.calculate_PET_array(24., 55., self.Tmrt, self.va, self.person)
+        inside = self.va >= p.LOOKUP_VA[5]
+        self.assertLess(np.percentile(np.abs(result - expected)[inside], 90), 0.25)
+        # values outside the table are solved directly
+        np.testing.assert_array_equal(result[~inside], expected[~inside])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# coding=utf-8
+"""Tests for the buffered POI outputs of SOLWEIG."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..functions.SOLWEIGpython import solweig_timeseries as ts
+from ..functions.SOLWEIGpython import PET_calculations as p
+from ..functions.SOLWEIGpython import UTCI_calculations as utci
+from ..functions.SOLWEIGpython.poi_recorder import PoiRecorder, netCDF4
+from .test_solweig_timeseries import synthetic_model, synthetic_met, HEADER
+
+
+class PoiRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.model = synthetic_model()
+        self.model['location'], self.met = synthetic_met(57.7, 172, 1)
+        self.poiname = ['a', 'b', 7]
+        self.poi = dict(xy=np.array([[0, 5, 12], [1, 30, 20], [2, 50, 40]]), sensorheight=2., mbody=75., age=35,
+                        ht=1.8, activity=80., clo=0.9, sex=1)
+        state = ts.initial_state(self.model['rows'], self.model['cols'], self.met)
+        self.outputs = [ts.solweig_step(i, 0, self.model, self.met, state) for i in range(24)]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_poi_rows(self):
+        # gathered rows and batch PET / UTCI as the values of each point
+        for i in (3, 12):
+            out = self.outputs[i]
+            rows = ts.poi_rows(i, out, self.model, self.met, self.poi)
+            for k in range(3):
+                row, col = self.poi['xy'][k, 2], self.poi['xy'][k, 1]
+                self.assertEqual(rows[k, 26], out['Tmrt'][row, col])
+                self.assertEqual(rows[k, 30], self.model['svf'][row, col])
+                self.assertEqual(rows[k, 22], self.met['Ta'][i])
+                WsPET = (1.1 / 2.) ** 0.2 * self.met['Ws'][i]
+                WsUTCI = (10. / 2.) ** 0.2 * self.met['Ws'][i]
+                self.assertAlmostEqual(rows[k, 33], p._PET(self.met['Ta'][i], self.met['RH'][i], rows[k, 26], WsPET,
+                                                           75., 35, 1.8, 80., 0.9, 1), places=10)
+                self.assertAlmostEqual(rows[k, 34], utci.utci_calculator(self.met['Ta'][i], self.met['RH'][i],
+                                                                         rows[k, 26], WsUTCI), places=10)
+        self.assertEqual(utci.utci_calculator_array(-999., 50., 30., 2.), -999)
+
+    def test_recorder(self):
+        recorder = PoiRecorder(self.folder, self.poiname, self.poi, HEADER, 24, table='csv', buffersize=5)
+        for i in range(24):
+            recorder.record(i, ts.poi_rows(i, self.outputs[i], self.model, self.met, self.poi, comfort=False),
+                            self.met['Ws'][i])
+            if i == 9:
+                positions = recorder.positions()
+        recorder.close()
+
+        # text files as written row by row, with PET and UTCI of each timestep
+        reference = os.path.join(self.folder, 'reference')
+        os.mkdir(reference)
+        unbuffered = PoiRecorder(reference, self.poiname, self.poi, HEADER, 24, buffersize=1)
+        for i in range(24):
+            unbuffered.record(i, ts.poi_rows(i, self.outputs[i], self.model, self.met, self.poi))
+        unbuffered.close()
+        for name in self.poiname:
+            with open(os.path.join(self.folder, 'POI_' + str(name) + '.txt')) as f:
+                text = f.read()
+            with open(os.path.join(reference, 'POI_' + str(name) + '.txt')) as f:
+                self.assertEqual(text, f.read())
+
+        table = np.genfromtxt(os.path.join(self.folder, 'POI.csv'), delimiter=',', names=True, dtype=None,
+                              encoding='utf-8')
+        self.assertEqual(table.shape[0], 24 * 3)
+        self.assertEqual(list(table['poi'][:3]), ['a', 'b', '7'])
+        rows = np.loadtxt(os.path.join(self.folder, 'POI_b.txt'), skiprows=1)
+        np.testing.assert_array_equal(table['Tmrt'][1::3], rows[:, 26])
+
+        # rows after the positions are removed, as when resuming
+        recorder = PoiRecorder(self.folder, self.poiname, self.poi, HEADER, 24, table='csv', resume=True)
+        recorder.truncate(positions)
+        recorder.close()
+        self.assertEqual(np.loadtxt(os.path.join(self.folder, 'POI_a.txt'), skiprows=1).shape[0], 10)
+        with open(os.path.join(self.folder, 'POI.csv')) as f:
+            self.assertEqual(len(f.readlines()), 1 + 10 * 3)
+
+    def test_netcdf(self):
+        if netCDF4 is None:
+            self.skipTest('netCDF4 is not installed')
+        recorder = PoiRecorder(self.folder, self.poiname, self.poi, HEADER, 24, textfiles=False, table='netcdf',
+                               buffersize=7)
+        for i in range(24):
+            recorder.record(i, ts.poi_rows(i, self.outputs[i], self.model, self.met, self.poi))
+        recorder.close()
+        with netCDF4.Dataset(os.path.join(self.folder, 'POI.nc')) as dataset:
+            self.assertEqual(dataset.variables['Tmrt'].shape, (24, 3))
+            self.assertEqual(dataset.variables['Tmrt'][23, 2], self.outputs[23]['Tmrt'][40, 50])
+
+
+if __name__ == '__main__':
+    unittest.main()
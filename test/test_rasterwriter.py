@@ -0,0 +1,142 @@
+# coding=utf-8
+"""Tests for the streaming raster writer."""
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    from osgeo import gdal, osr
+    from ..util import rasterwriter
+except ImportError:
+    gdal = None
+    rasterwriter = None
+
+
+NAMES = ('Tmrt', 'Kdown')
+
+
+def reference_raster(rows=12, cols=17):
+    """In-memory raster giving the extent and projection of the outputs."""
+    dataset = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, gdal.GDT_Float32)
+    dataset.SetGeoTransform((400000., 2., 0., 6400000., 0., -2.))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(3006)
+    dataset.SetProjection(srs.ExportToWkt())
+    return dataset
+
+
+@unittest.skipIf(rasterwriter is None, 'gdal is not installed')
+class RasterWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.gdal_data = reference_raster()
+        rng = np.random.RandomState(4)
+        self.ntimes = 5
+        self.rasters = dict((name, [rng.rand(12, 17) * 50. for _ in range(self.ntimes)]) for name in NAMES)
+        start = datetime.datetime(2021, 6, 21, 10)
+        self.times = [start + datetime.timedelta(hours=index) for index in range(self.ntimes)]
+        self.stamps = [time.strftime('%Y_%j_%H%MD') for time in self.times]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def folder(self, label):
+        folder = os.path.join(self.tempdir, label)
+        os.makedirs(folder)
+        return folder
+
+    def write(self, writer, indices):
+        for index in indices:
+            for name in NAMES:
+                writer.write(name, index, self.stamps[index], self.times[index], self.rasters[name][index])
+            if index == indices[0]:
+                writer.flush()
+
+    def read(self, writer, name):
+        """Timesteps written for name as (ntimes, rows, cols) array, with the band descriptions or times."""
+        if writer.mode == 'files':
+            rasters = [gdal.Open(writer.filename(name, stamp)).ReadAsArray() for stamp in self.stamps]
+            return np.array(rasters), self.stamps
+        if writer.mode == 'netcdf':
+            import netCDF4
+            with netCDF4.Dataset(writer.filename(name)) as dataset:
+                times = netCDF4.num2date(dataset.variables['time'][:], dataset.variables['time'].units,
+                                         only_use_cftime_datetimes=False)
+                return np.array(dataset.variables[name][:]), [time.strftime('%Y_%j_%H%MD') for time in times]
+        dataset = gdal.Open(writer.filename(name))
+        bands = [dataset.GetRasterBand(band + 1) for band in range(dataset.RasterCount)]
+        return dataset.ReadAsArray(), [band.GetDescription() for band in bands]
+
+    def check_modes(self, modes):
+        for mode in modes:
+            results = {}
+            for background in (False, True):
+                writer = rasterwriter.RasterWriter(self.gdal_data, self.folder(mode + str(background)), mode,
+                                                   self.ntimes, background=background, queuesize=2)
+                self.write(writer, list(range(self.ntimes)))
+                writer.close()
+                results[background] = dict((name, self.read(writer, name)) for name in NAMES)
+            for name in NAMES:
+                # the background thread writes the same files as the calling thread
+                np.testing.assert_array_equal(results[True][name][0], results[False][name][0])
+                self.assertEqual(results[True][name][1], results[False][name][1])
+                np.testing.assert_allclose(results[False][name][0], np.array(self.rasters[name], dtype=np.float32))
+                self.assertEqual(results[False][name][1], self.stamps)
+
+    def test_files_and_multiband(self):
+        self.check_modes(['files', 'multiband'])
+
+    @unittest.skipIf(rasterwriter is None or rasterwriter.netCDF4 is None, 'netCDF4 is not installed')
+    def test_netcdf(self):
+        self.check_modes(['netcdf'])
+
+    def test_resume(self):
+        modes = ['multiband']
+        if rasterwriter.netCDF4 is not None:
+            modes.append('netcdf')
+        for mode in modes:
+            folder = self.folder(mode)
+            # interrupted run, closed after the first timesteps
+            writer = rasterwriter.RasterWriter(self.gdal_data, folder, mode, self.ntimes)
+            self.write(writer, [0, 1])
+            writer.close()
+            writer = rasterwriter.RasterWriter(self.gdal_data, folder, mode, self.ntimes, resume=True)
+            self.write(writer, [2, 3, 4])
+            writer.close()
+            for name in NAMES:
+                rasters, stamps = self.read(writer, name)
+                np.testing.assert_allclose(rasters, np.array(self.rasters[name], dtype=np.float32))
+                if mode == 'netcdf':
+                    self.assertEqual(stamps, self.stamps)
+
+    def test_error(self):
+        writer = rasterwriter.RasterWriter(self.gdal_data, self.folder('error'), 'multiband', self.ntimes,
+                                           queuesize=1)
+        written = []
+
+        def failing(*item):
+            written.append(item)
+            raise IOError('disk full')
+
+        writer._write = failing
+        # the error is raised in the calling thread and the queue keeps draining, so writing never blocks
+        with self.assertRaises(IOError):
+            for _ in range(4):
+                self.write(writer, list(range(self.ntimes)))
+        writer.close()
+        self.assertEqual(len(written), 1)
+        self.assertEqual(writer.queue.unfinished_tasks, 0)
+        self.assertIsNone(writer.thread)
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, rasterwriter.RasterWriter, self.gdal_data, self.tempdir, 'png')
+
+
+if __name__ == '__main__':
+    unittest.main()
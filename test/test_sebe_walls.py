@@ -0,0 +1,169 @@
+# coding=utf-8
+"""Tests for the wall voxel irradiance of SEBE and its tiled and parallel runs."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..functions.SEBEfiles import SEBE_2015a_calc_forprocessing as sebe
+from ..functions.SEBEfiles import wallirradiance
+from ..functions.SEBEfiles.SEBE_2015a_calc_forprocessing import wall_voxels
+from .test_solweig_timeseries import Feedback
+
+
+def wall_voxels_loop(wallrow, wallcol, wallsun, wallstot, wallsh, wallshve, Iw, Dw, Rw, psi, voxelheight, sections):
+    """Wall voxels filled wall by wall, as in SEBE_2015a_calc of earlier versions."""
+    wallmatrix = np.zeros((wallrow.shape[0], sections))
+    for p in range(np.shape(wallmatrix)[0]):
+        if wallsun[wallrow[p], wallcol[p]] > 0:    # Sections in sun
+            if wallsun[wallrow[p], wallcol[p]] == wallstot[wallrow[p], wallcol[p]]:  # All sections in sun
+                wallmatrix[p, 0:int(wallstot[wallrow[p], wallcol[p]] / voxelheight)] = \
+                    Iw[wallrow[p], wallcol[p]] + Dw[wallrow[p], wallcol[p]] + Rw[wallrow[p], wallcol[p]]
+            else:
+                wallmatrix[p, int((wallstot[wallrow[p], wallcol[p]] - wallsun[wallrow[p], wallcol[p]]) /
+                                  voxelheight) - 1:int(wallstot[wallrow[p], wallcol[p]] / voxelheight)] = \
+                    Iw[wallrow[p], wallcol[p]] + Dw[wallrow[p], wallcol[p]] + Rw[wallrow[p], wallcol[p]]
+
+        if wallshve is not None and wallshve[wallrow[p], wallcol[p]] > 0:    # sections in vegetation shade
+            wallmatrix[p, 0:int((wallshve[wallrow[p], wallcol[p]] + wallsh[wallrow[p], wallcol[p]]) / voxelheight)] = \
+                (Iw[wallrow[p], wallcol[p]] + Dw[wallrow[p], wallcol[p]]) * psi
+
+        if wallsh[wallrow[p], wallcol[p]] > 0:    # sections in building shade
+            wallmatrix[p, 0:int(wallsh[wallrow[p], wallcol[p]] / voxelheight)] = Rw[wallrow[p], wallcol[p]]
+    return wallmatrix
+
+
+def random_walls(size, voxelheight, seed=1):
+    """Walls with sun, building and vegetation shade rounded to voxelheight, also beyond the wall tops."""
+    rng = np.random.RandomState(seed)
+    walls = np.where(rng.rand(size, size) > 0.6, rng.rand(size, size) * 30., 0.)
+    wallstot = np.floor(walls * (1 / voxelheight)) * voxelheight
+    wallsun = np.where(rng.rand(size, size) > 0.5, wallstot, wallstot * rng.rand(size, size))
+    wallsun[rng.rand(size, size) > 0.95] += 2.
+    wallsh = wallstot - wallsun
+    wallsh[rng.rand(size, size) > 0.9] = 0.
+    wallshve = np.where(rng.rand(size, size) > 0.7, wallsh * rng.rand(size, size), 0.)
+    wallsun, wallsh, wallshve = [np.floor(w * (1 / voxelheight)) * voxelheight for w in (wallsun, wallsh, wallshve)]
+    Iw, Dw, Rw = rng.rand(3, size, size) * 100.
+    wallcol, wallrow = np.where(np.transpose(walls) > 0)
+    return wallrow, wallcol, wallsun, wallstot, wallsh, wallshve, Iw, Dw, Rw
+
+
+class WallVoxelsTest(unittest.TestCase):
+
+    def test_loop(self):
+        for voxelheight in (1., 0.5, 0.3):
+            wallrow, wallcol, wallsun, wallstot, wallsh, wallshve, Iw, Dw, Rw = random_walls(60, voxelheight)
+            # sections of the tallest wall, and fewer than some walls have
+            for sections in (int(np.floor(30. * (1 / voxelheight))), 10):
+                for vegetation in (wallshve, None):
+                    np.testing.assert_array_equal(
+                        wall_voxels(wallrow, wallcol, wallsun, wallstot, wallsh, vegetation, Iw, Dw, Rw, 0.03,
+                                    voxelheight, sections),
+                        wall_voxels_loop(wallrow, wallcol, wallsun, wallstot, wallsh, vegetation, Iw, Dw, Rw, 0.03,
+                                         voxelheight, sections))
+
+
+def synthetic_sebe(size=100, seed=5):
+    """Low blocks with walls on their north side, a tree and random irradiance of the 145 sky patches."""
+    rng = np.random.RandomState(seed)
+    dsm = 1. + rng.rand(size, size) * 0.3
+    walls = np.zeros((size, size))
+    aspect = np.zeros((size, size))
+    for _ in range(size // 6):
+        row, col = rng.randint(2, size - 10, 2)
+        height = rng.randint(2, 4)
+        dsm[row:row + 6, col:col + 6] += height
+        walls[row, col:col + 6] = height + 0.4
+        aspect[row, col:col + 6] = 180.
+    cdsm = np.zeros((size, size))
+    cdsm[50:55, 60:66] = 2.5
+    altitude = np.repeat([6, 18, 30, 42, 54, 66, 78, 90], [30, 30, 24, 24, 18, 12, 6, 1]).astype(float)
+    azimuth = np.concatenate([np.arange(n) * 360. / n for n in [30, 30, 24, 24, 18, 12, 6, 1]])
+    radmats = [np.column_stack((altitude, azimuth, rng.rand(145) * 100. * (rng.rand(145) > 0.3)))
+               for _ in range(3)]
+    return dsm, cdsm, cdsm * 0.25, walls, aspect, radmats
+
+
+class SebeTilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dsm, self.cdsm, self.tdsm, self.walls, self.aspect, self.radmats = synthetic_sebe()
+        self.slope = np.zeros(self.dsm.shape)
+
+    def run_sebe(self, usevegdem, workers=1):
+        rows, cols = self.dsm.shape
+        return sebe.SEBE_2015a_calc(self.dsm, 1., self.slope, self.aspect * np.pi / 180., 1., cols, rows,
+                                    self.cdsm, self.tdsm, self.walls, self.aspect, 0.15, 0.03, *self.radmats,
+                                    usevegdem=usevegdem, feedback=Feedback(), wallmaxheight=self.walls.max(),
+                                    workers=workers)
+
+    def test_tiles(self):
+        for usevegdem in (1, 0):
+            reference = self.run_sebe(usevegdem)
+            roof = np.zeros(self.dsm.shape)
+            parts = []
+            for row, col, Energyyearroof, Energyyearwall in sebe.SEBE_2015a_calc_tiles(
+                    self.dsm, 1., self.slope, self.aspect * np.pi / 180., 1., self.cdsm, self.tdsm, self.walls,
+                    self.aspect, 0.15, 0.03, *self.radmats, usevegdem=usevegdem, feedback=Feedback(),
+                    wallmaxheight=self.walls.max(), tilesize=30):
+                roof[row:row + Energyyearroof.shape[0], col:col + Energyyearroof.shape[1]] = Energyyearroof
+                parts.append(wallirradiance.pack_walls(Energyyearwall))
+            np.testing.assert_array_equal(roof, reference['Energyyearroof'])
+            walls = wallirradiance.concatenate_walls(parts, reference['Energyyearwall'].shape[1] - 2)
+            np.testing.assert_array_equal(wallirradiance.unpack_walls(walls), reference['Energyyearwall'])
+
+    def test_workers(self):
+        reference = self.run_sebe(1)
+        seberesult = self.run_sebe(1, workers=2)
+        np.testing.assert_allclose(seberesult['Energyyearroof'], reference['Energyyearroof'], rtol=1e-12)
+        np.testing.assert_allclose(seberesult['Energyyearwall'], reference['Energyyearwall'], rtol=1e-12)
+
+
+class WallIrradianceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        wallrow, wallcol, wallsun, wallstot, wallsh, wallshve, Iw, Dw, Rw = random_walls(60, 0.5)
+        wallmatrix = wall_voxels(wallrow, wallcol, wallsun, wallstot, wallsh, wallshve, Iw, Dw, Rw, 0.03, 0.5, 60)
+        self.Energyyearwall = np.column_stack((wallrow + 1, wallcol + 1, wallmatrix / 1000.))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_pack(self):
+        walls = wallirradiance.pack_walls(self.Energyyearwall)
+        self.assertLess(walls['values'].size, self.Energyyearwall.size / 2)
+        np.testing.assert_array_equal(wallirradiance.unpack_walls(walls), self.Energyyearwall)
+        np.testing.assert_array_equal(wallirradiance.unpack_walls(walls, 100, 250), self.Energyyearwall[100:250])
+
+        # split in parts, merged in the order of the walls
+        order = np.random.RandomState(2).permutation(self.Energyyearwall.shape[0])
+        parts = [wallirradiance.pack_walls(self.Energyyearwall[order[:500]]),
+                 wallirradiance.pack_walls(self.Energyyearwall[order[500:]])]
+        np.testing.assert_array_equal(wallirradiance.unpack_walls(wallirradiance.concatenate_walls(parts, 60)),
+                                      self.Energyyearwall)
+
+    def test_files(self):
+        walls = wallirradiance.pack_walls(self.Energyyearwall)
+        filename = os.path.join(self.folder, 'Energyyearwall.txt')
+        wallirradiance.save_walls_text(filename, walls, blocksize=100)
+        reference = os.path.join(self.folder, 'reference.txt')
+        np.savetxt(reference, self.Energyyearwall, fmt='%4d %4d ' + '%6.2f ' * 60, header='%row col irradiance',
+                   comments='')
+        with open(filename) as f:
+            text = f.read()
+        with open(reference) as f:
+            self.assertEqual(text, f.read())
+
+        filename = os.path.join(self.folder, 'Energyyearwall.npz')
+        wallirradiance.save_walls_npz(filename, walls)
+        np.testing.assert_allclose(wallirradiance.unpack_walls(wallirradiance.load_walls_npz(filename)),
+                                   self.Energyyearwall, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
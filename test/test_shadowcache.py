@@ -0,0 +1,78 @@
+# coding=utf-8
+"""Tests for the on-disk shadow cache."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..util.shadowcache import ShadowCache
+from ..util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_13 import shadowingfunction_wallheight_13
+from ..util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_23 import shadowingfunction_wallheight_23
+from .test_shadowingfunctions import synthetic_surface
+
+
+class ShadowCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.dsm, self.vegdem, self.vegdem2, self.amaxvalue, self.bush, self.walls, self.aspect = synthetic_surface()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_wallheight_23(self):
+        cache = ShadowCache(self.folder, tolerance=0.5)
+        shadows = cache.surface(self.dsm, self.walls, self.aspect, 0.5, self.vegdem, self.vegdem2, self.bush,
+                                self.amaxvalue)
+        reference = shadowingfunction_wallheight_23(self.dsm, self.vegdem, self.vegdem2, 135.5, 30., 0.5,
+                                                    self.amaxvalue, self.bush, self.walls, self.aspect)
+        first = shadows.wallheight_23(135.6, 29.9)
+        second = shadows.wallheight_23(135.4, 30.1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        for expected, cast, cached in zip(reference, first, second):
+            np.testing.assert_array_equal(expected, cast)
+            np.testing.assert_array_equal(expected, cached)
+            self.assertEqual(np.asarray(expected).dtype, cached.dtype)
+
+        # a new run on the same surface reuses the entry, another vegetation grid does not
+        cache = ShadowCache(self.folder, tolerance=0.5)
+        cache.surface(self.dsm, self.walls, self.aspect, 0.5, self.vegdem, self.vegdem2, self.bush,
+                      self.amaxvalue).wallheight_23(135.5, 30.)
+        cache.surface(self.dsm, self.walls, self.aspect, 0.5, self.vegdem * 1.1, self.vegdem2, self.bush,
+                      self.amaxvalue).wallheight_23(135.5, 30.)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_wallheight_13(self):
+        shadows = ShadowCache(self.folder, tolerance=0.).surface(self.dsm, self.walls, self.aspect, 0.5)
+        reference = shadowingfunction_wallheight_13(self.dsm, 200.25, 45., 0.5, self.walls, self.aspect)
+        shadows.wallheight_13(200.25, 45.)
+        for expected, cached in zip(reference, shadows.wallheight_13(200.25, 45.)):
+            np.testing.assert_array_equal(expected, cached)
+
+    def test_eviction(self):
+        cache = ShadowCache(self.folder, tolerance=1.)
+        shadows = cache.surface(self.dsm, self.walls, self.aspect, 0.5)
+        shadows.wallheight_13(10., 20.)
+        cache.maxsize = int(2.5 * cache.size)
+        shadows.wallheight_13(10., 30.)
+        # reading an entry makes it the most recently used one
+        shadows.wallheight_13(10., 20.)
+        shadows.wallheight_13(10., 40.)
+        self.assertLessEqual(cache.size, cache.maxsize)
+        self.assertEqual(len(os.listdir(self.folder)), 2)
+        hits = cache.hits
+        shadows.wallheight_13(10., 20.)
+        self.assertEqual(cache.hits, hits + 1)
+
+    def test_overwrite(self):
+        cache = ShadowCache(self.folder)
+        cache.put('entry', (np.zeros((20, 20)),))
+        cache.put('entry', (np.ones((30, 30)),))
+        self.assertEqual(cache.size, os.path.getsize(os.path.join(self.folder, 'entry.npz')))
+
+
+if __name__ == '__main__':
+    unittest.main()
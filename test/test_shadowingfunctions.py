@@ -0,0 +1,116 @@
+# coding=utf-8
+"""Parity tests for the compiled shadow casting backend."""
+
+import unittest
+
+import numpy as np
+
+from ..util import shadowingfunctions as shadow
+from ..util import shadowingfunctions_numba as shadow_numba
+from ..util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_23 import shadowingfunction_wallheight_23
+
+
+def synthetic_surface(rows=60, cols=70, seed=1):
+    """DSM with ground relief, buildings, trees, bushes and walls."""
+    rng = np.random.RandomState(seed)
+    dsm = 10. + rng.rand(rows, cols)
+    dsm[10:25, 10:20] += 15.
+    dsm[35:50, 40:60] += 30.
+    dsm[5:12, 50:65] += 8.
+    cdsm = np.zeros((rows, cols))
+    cdsm[28:34, 15:24] = 9.
+    cdsm[52:58, 8:14] = 6.
+    cdsm[2:6, 30:34] = 1.5
+    tdsm = cdsm * 0.25
+    tdsm[2:6, 30:34] = 0.
+
+    vegmax = cdsm.max()
+    amaxvalue = np.maximum(dsm.max() - dsm.min(), vegmax)
+    vegdem = cdsm + dsm
+    vegdem[vegdem == dsm] = 0
+    vegdem2 = tdsm + dsm
+    vegdem2[vegdem2 == dsm] = 0
+    bush = np.logical_not((vegdem2 * vegdem)) * vegdem
+
+    walls = np.zeros((rows, cols))
+    walls[9, 10:20] = 15.
+    walls[25, 10:20] = 15.
+    walls[34, 40:60] = 30.
+    aspect = np.zeros((rows, cols))
+    aspect[9, 10:20] = 0.
+    aspect[25, 10:20] = np.pi
+    aspect[34, 40:60] = 0.
+
+    return dsm, vegdem, vegdem2, amaxvalue, bush, walls, aspect
+
+
+SUN_POSITIONS = [(0., 30.), (12.5, 5.), (45., 45.), (90., 20.), (135., 60.), (180., 10.),
+                 (200., 35.), (225., 15.), (270., 80.), (315., 25.), (359., 40.)]
+
+
+class FeedbackStub(object):
+    def setProgress(self, value):
+        pass
+
+
+@unittest.skipUnless(shadow_numba.NUMBA_AVAILABLE, 'numba is not installed')
+class ShadowBackendParityTest(unittest.TestCase):
+    """Compare the numba backend against the NumPy reference."""
+
+    def setUp(self):
+        self.backend = shadow.get_shadow_backend()
+        self.surface = synthetic_surface()
+
+    def tearDown(self):
+        shadow.set_shadow_backend(self.backend)
+
+    def test_shadowingfunction_20(self):
+        dsm, vegdem, vegdem2, amaxvalue, bush, _, _ = self.surface
+        for azimuth, altitude in SUN_POSITIONS:
+            results = {}
+            for backend in shadow.SHADOW_BACKENDS:
+                shadow.set_shadow_backend(backend)
+                results[backend] = shadow.shadowingfunction_20(dsm, vegdem, vegdem2, azimuth, altitude, 0.5,
+                                                               amaxvalue, bush, FeedbackStub(), 1)
+            for key in ('sh', 'vegsh', 'vbshvegsh'):
+                np.testing.assert_array_equal(results['numpy'][key], results['numba'][key],
+                                              err_msg=key + ' at ' + str((azimuth, altitude)))
+
+    def test_shadowingfunction_wallheight_23(self):
+        dsm, vegdem, vegdem2, amaxvalue, bush, walls, aspect = self.surface
+        names = ('vegsh', 'sh', 'vbshvegsh', 'wallsh', 'wallsun', 'wallshve', 'facesh', 'facesun')
+        for azimuth, altitude in SUN_POSITIONS:
+            results = {}
+            for backend in shadow.SHADOW_BACKENDS:
+                shadow.set_shadow_backend(backend)
+                results[backend] = shadowingfunction_wallheight_23(dsm, vegdem, vegdem2, azimuth, altitude, 1.,
+                                                                   amaxvalue, bush, walls, aspect)
+            for name, reference, compiled in zip(names, results['numpy'], results['numba']):
+                np.testing.assert_array_equal(reference, compiled,
+                                              err_msg=name + ' at ' + str((azimuth, altitude)))
+
+    def test_shadowingfunction_20_batch(self):
+        dsm, vegdem, vegdem2, amaxvalue, bush, _, _ = self.surface
+        # repeated azimuths are cast together in one sweep
+        positions = [(12., 6.), (45., 18.), (12., 30.), (200., 42.), (12., 66.), (45., 90.)]
+        for usevegdem in (1, 0):
+            results = {}
+            for backend in shadow.SHADOW_BACKENDS:
+                shadow.set_shadow_backend(backend)
+                batch = shadow.shadowingfunction_20_batch(dsm, vegdem, vegdem2, positions, 0.5, amaxvalue, bush,
+                                                          usevegdem, FeedbackStub())
+                results[backend] = dict((n, masks) for n, *masks in batch)
+            self.assertEqual(sorted(results['numba']), list(range(len(positions))))
+            for n in range(len(positions)):
+                for reference, compiled in zip(results['numpy'][n], results['numba'][n]):
+                    if reference is None:
+                        self.assertIsNone(compiled)
+                    else:
+                        np.testing.assert_array_equal(reference, compiled)
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, shadow.set_shadow_backend, 'fortran')
+
+
+if __name__ == '__main__':
+    unittest.main()
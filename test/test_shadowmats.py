@@ -0,0 +1,122 @@
+# coding=utf-8
+"""Tests for the bit-packed shadow matrix format."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+from ..util import shadowmats
+
+
+class ShadowMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.cubes = [(rng.rand(21, 19, 11) > 0.5).astype(float) for _ in range(3)]
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_indexing(self):
+        cube = self.cubes[0]
+        shmat = shadowmats.ShadowMatrix.from_array(cube)
+        self.assertEqual(shmat.shape, cube.shape)
+        np.testing.assert_array_equal(shmat[:, :, 4], cube[:, :, 4])
+        np.testing.assert_array_equal(shmat[3, 17, :], cube[3, 17, :])
+        np.testing.assert_array_equal(shmat[2:9, 5:18, 1:6], cube[2:9, 5:18, 1:6])
+        np.testing.assert_array_equal((shmat + 1)[:, :, 2], cube[:, :, 2] + 1)
+
+    def test_setitem_crop_paste(self):
+        cube = self.cubes[1]
+        shmat = shadowmats.ShadowMatrix.zeros(*cube.shape)
+        for idx in range(cube.shape[2]):
+            shmat[:, :, idx] = cube[:, :, idx]
+        np.testing.assert_array_equal(shmat[:, :, :], cube)
+
+        pasted = shadowmats.ShadowMatrix.zeros(*cube.shape)
+        for r0, c0 in ((0, 0), (0, 7), (10, 0), (10, 7)):
+            window = (slice(r0, r0 + 11), slice(c0, c0 + 12))
+            pasted.paste(shmat.crop(*window), r0, c0)
+        np.testing.assert_array_equal(pasted[:, :, :], cube)
+
+    def test_save_load(self):
+        filename = os.path.join(self.tempdir, 'shadowmats.npz')
+        shadowmats.save_shadowmats(filename, *self.cubes)
+        loaded = shadowmats.load_shadowmats(filename)
+        for shmat, cube in zip(loaded, self.cubes):
+            self.assertIsInstance(shmat.packed, np.memmap)
+            np.testing.assert_array_equal(shmat[:, :, :], cube)
+        loaded = None
+
+    def test_npy_versions(self):
+        filename = os.path.join(self.tempdir, 'shadowmats.npz')
+        shmats = [shadowmats.ShadowMatrix.from_array(cube) for cube in self.cubes]
+        # members written with npy format 1.0, 2.0 and 3.0
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED) as npz:
+            with npz.open('shape.npy', 'w') as member:
+                np.lib.format.write_array(member, np.array(shmats[0].shape))
+            for version, name, shmat in zip(((1, 0), (2, 0), (3, 0)), shadowmats.SHADOWMAT_NAMES, shmats):
+                with npz.open(name + '.npy', 'w') as member:
+                    np.lib.format.write_array(member, shmat.packed, version=version)
+        loaded = shadowmats.load_shadowmats(filename)
+        self.assertIsInstance(loaded[0].packed, np.memmap)
+        self.assertIsInstance(loaded[1].packed, np.memmap)
+        # no public header reader for 3.0, read into memory
+        self.assertNotIsInstance(loaded[2].packed, np.memmap)
+        for shmat, cube in zip(loaded, self.cubes):
+            np.testing.assert_array_equal(shmat[:, :, :], cube)
+        loaded = None
+
+    def test_add(self):
+        shmat = shadowmats.ShadowMatrix.from_array(self.cubes[0])
+        vegshmat = shmat
+        vegshmat += 1
+        self.assertIsNot(vegshmat, shmat)
+        np.testing.assert_array_equal(shmat[:, :, 3], self.cubes[0][:, :, 3])
+        np.testing.assert_array_equal(vegshmat[:, :, 3], self.cubes[0][:, :, 3] + 1)
+
+    def test_writer(self):
+        filename = os.path.join(self.tempdir, 'shadowmats.npz')
+        writer = shadowmats.ShadowMatrixWriter(filename, *self.cubes[0].shape)
+        for shmat, cube in zip(writer.shmats, self.cubes):
+            shmat.paste(shadowmats.ShadowMatrix.from_array(cube[:10]), 0, 0)
+            shmat.paste(shadowmats.ShadowMatrix.from_array(cube[10:]), 10, 0)
+        writer.close()
+        self.assertEqual(os.listdir(self.tempdir), ['shadowmats.npz'])
+        for shmat, cube in zip(shadowmats.load_shadowmats(filename), self.cubes):
+            np.testing.assert_array_equal(shmat[:, :, :], cube)
+
+    def test_load_old_format(self):
+        filename = os.path.join(self.tempdir, 'shadowmats.npz')
+        np.savez_compressed(filename, shadowmat=self.cubes[0], vegshadowmat=self.cubes[1], vbshmat=self.cubes[2])
+        for shmat, cube in zip(shadowmats.load_shadowmats(filename), self.cubes):
+            np.testing.assert_array_equal(shmat, cube)
+
+    def test_diffuse(self):
+        shmat = shadowmats.ShadowMatrix.from_array(self.cubes[0])
+        vegshmat = shadowmats.ShadowMatrix.from_array(self.cubes[1])
+        diffsh = shadowmats.DiffuseShadowMatrix(shmat, vegshmat, 0.03, cachesize=2)
+        # stored in float32, the luminance is accumulated in float64 over blocks of pixels
+        self.assertEqual(diffsh.matrix.dtype, np.float32)
+        diffsh.blocksize = 50
+        expected = (self.cubes[0] - (1 - self.cubes[1]) * (1 - 0.03)).astype(np.float32)
+        np.testing.assert_array_equal(diffsh[:, :, 5], expected[:, :, 5])
+        np.testing.assert_array_equal(shadowmats.DiffuseShadowMatrix(shmat)[:, :, 5], self.cubes[0][:, :, 5])
+
+        rng = np.random.RandomState(2)
+        for lv in [rng.rand(11) for _ in range(3)]:
+            aniLum = np.zeros(expected.shape[:2])
+            for idx in range(lv.shape[0]):
+                aniLum += expected[:, :, idx] * lv[idx]
+            self.assertEqual(diffsh.luminance(lv).dtype, np.float64)
+            np.testing.assert_allclose(diffsh.luminance(lv), aniLum, rtol=1e-12, atol=1e-12)
+            self.assertIs(diffsh.luminance(lv.copy()), diffsh.luminance(lv))
+        self.assertEqual(len(diffsh._cache), 2)
+
+if __name__ == '__main__':
+    unittest.main()
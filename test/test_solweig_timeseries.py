@@ -0,0 +1,229 @@
+# coding=utf-8
+"""Tests for the SOLWEIG time loop run in day segments."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..functions import svf_functions
+from ..functions.SOLWEIGpython import solweig_timeseries as ts
+from ..functions.SOLWEIGpython.poi_recorder import PoiRecorder
+from ..util.shadowmats import DiffuseShadowMatrix
+from ..util.SEBESOLWEIGCommonFiles.Solweig_v2015_metdata_noload import Solweig_2015a_metdata_noload
+from .test_shadowingfunctions import synthetic_surface
+
+# column names of the POI text files
+HEADER = 'yyyy id   it imin dectime altitude azimuth kdir kdiff kglobal kdown   kup    keast ksouth ' \
+         'kwest knorth ldown   lup    least lsouth lwest  lnorth   Ta      Tg     RH    Esky   Tmrt    ' \
+         'I0     CI   Shadow  SVF_b  SVF_bv KsideI PET UTCI  CI_Tg   CI_TgG  KsideD  Lside   diffDown    Kside'
+
+
+class Feedback(object):
+
+    def isCanceled(self):
+        return False
+
+    def setProgress(self, progress):
+        pass
+
+    def setProgressText(self, text):
+        pass
+
+
+def synthetic_model():
+    dsm, vegdem, vegdem2, amaxvalue, bush, walls, aspect = synthetic_surface()
+    rows, cols = dsm.shape
+    ones = np.ones((rows, cols))
+    svf = 0.6 * ones
+    model = dict(dsm=dsm, scale=0.5, rows=rows, cols=cols, svf=svf, svfN=0.7 * ones, svfW=0.65 * ones,
+                 svfE=0.7 * ones, svfS=0.65 * ones, svfveg=0.9 * ones, svfNveg=0.9 * ones, svfEveg=0.9 * ones,
+                 svfSveg=0.9 * ones, svfWveg=0.9 * ones, svfaveg=0.95 * ones, svfEaveg=0.95 * ones,
+                 svfSaveg=0.95 * ones, svfWaveg=0.95 * ones, svfNaveg=0.95 * ones, vegdsm=vegdem, vegdsm2=vegdem2,
+                 albedo_b=0.2, absK=0.7, absL=0.95, ewall=0.9, Fside=0.22, Fup=0.06, Fcyl=0.28, usevegdem=1,
+                 onlyglobal=1, buildings=(dsm < 15.).astype(float), landcover=0, lcgrid=None,
+                 wallaspect=aspect * 180. / np.pi, wallheight=walls, cyl=1, elvis=0, amaxvalue=amaxvalue, bush=bush,
+                 TgK=0.37 * ones, Tstart=-3.41 * ones, alb_grid=0.15 * ones, emis_grid=0.95 * ones, TgK_wall=0.37,
+                 Tstart_wall=-3.41, TmaxLST=15., TmaxLST_wall=15., first=1., second=22.,
+                 svfalfa=np.arcsin(np.exp((np.log((1. - svf)) / 2.))), svfbuveg=svf - 0.1 * 0.97, diffsh=None,
+                 shmat=None, vegshmat=None, vbshvegshmat=None, anisotropic_sky=0, asvf=None, patch_option=0,
+                 shadowcache=None)
+    model['gvfengine'] = ts.model_gvfengine(model)
+    return model
+
+
+def anisotropic_model(model, dtype=np.float64):
+    """model with the anisotropic sky, shadow matrices of the 153 patches cast on its surface."""
+    dsm = model['dsm']
+    cdsm = np.where(model['vegdsm'] > 0, model['vegdsm'] - dsm, 0.)
+    tdsm = np.where(model['vegdsm2'] > 0, model['vegdsm2'] - dsm, 0.)
+    svfresult = svf_functions.svfForProcessing153(dsm, cdsm, tdsm, model['scale'], 1, Feedback())
+    shmat, vegshmat = svfresult['shmat'], svfresult['vegshmat']
+    model = dict(model, anisotropic_sky=1, patch_option=2, shmat=shmat, vegshmat=vegshmat,
+                 vbshvegshmat=svfresult['vbshvegshmat'], diffsh=DiffuseShadowMatrix(shmat, vegshmat, 0.03, dtype=dtype),
+                 asvf=np.arccos(np.sqrt(model['svf'])))
+    return model
+
+
+def synthetic_met(latitude, doy, days):
+    hours = np.tile(np.arange(24), days)
+    metdata = np.zeros((hours.shape[0], 24)) - 999.
+    metdata[:, 0] = 2021
+    metdata[:, 1] = np.repeat(np.arange(doy, doy + days), 24)
+    metdata[:, 2] = hours
+    metdata[:, 3] = 0
+    metdata[:, 9] = 2. + np.cos(hours / 3.)
+    metdata[:, 10] = 60. - 20. * np.sin(np.pi * hours / 24.)
+    metdata[:, 11] = 12. + 8. * np.sin(np.pi * (hours - 6) / 12.) + np.arange(hours.shape[0]) / 24.
+    metdata[:, 12] = 101.3
+    location = {'longitude': 12., 'latitude': latitude, 'altitude': 10.}
+    YYYY, altitude, azimuth, zen, jday, leafon, dectime, altmax = Solweig_2015a_metdata_noload(metdata, location, 1)
+    metdata[:, 14] = np.maximum(850. * np.sin(altitude[0] * np.pi / 180.), 0.)
+    met = dict(YYYY=YYYY[0], DOY=metdata[:, 1], hours=metdata[:, 2], minu=metdata[:, 3], altitude=altitude[0],
+               azimuth=azimuth[0], zen=zen[0], jday=jday[0], psi=(leafon * 0.03)[0], dectime=dectime,
+               altmax=altmax[0], Ta=metdata[:, 11], RH=metdata[:, 10], radG=metdata[:, 14], radD=metdata[:, 21],
+               radI=metdata[:, 22], P=metdata[:, 12], Ws=metdata[:, 9])
+    return location, met
+
+
+class SolweigSegmentsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.model = synthetic_model()
+        self.rasters = ['Tmrt', 'Lup', 'Kdiff']
+        self.poi = dict(xy=np.array([[0, 5, 12], [1, 30, 20]]), sensorheight=2., mbody=75., age=35, ht=1.8,
+                        activity=80., clo=0.9, sex=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def sequential(self, met):
+        state = ts.initial_state(self.model['rows'], self.model['cols'], met)
+        outputs = []
+        for i in range(met['dectime'].shape[0]):
+            out = ts.solweig_step(i, 0, self.model, met, state)
+            outputs.append(({name: np.float32(out[ts.RASTER_OUTPUTS[name]]) for name in self.rasters},
+                            ts.poi_rows(i, out, self.model, met, self.poi), out['I0']))
+        return outputs
+
+    def compare(self, location, met, atol):
+        self.model['location'] = location
+        reference = self.sequential(met)
+        segments = ts.day_segments(met)
+        self.assertEqual(len(segments), met['dectime'].shape[0] // 24)
+        for segment in segments:
+            warmup = ts.segment_warmup(met, segment[0], 24)
+            self.assertTrue(ts.run_segment(self.model, met, self.poi, self.rasters, self.folder, segment, warmup,
+                                           Feedback()))
+            self.assertTrue(ts.segment_finished(self.folder, segment))
+            summary, timesteps = ts.segment_outputs(self.folder, segment, self.rasters)
+            for i, arrays, poirows, I0 in timesteps:
+                rasters, rows, I0ref = reference[i]
+                for name in self.rasters:
+                    np.testing.assert_allclose(arrays[name], rasters[name], rtol=0, atol=atol)
+                np.testing.assert_allclose(poirows, rows, rtol=0, atol=atol)
+                self.assertEqual(I0, I0ref)
+
+    def test_segments(self):
+        # nights between the days, segments start from the sequential state
+        location, met = synthetic_met(57.7, 172, 3)
+        self.assertEqual(ts.segment_warmup(met, 24, 24), 24)
+        self.compare(location, met, 0.)
+
+    def test_polar_day(self):
+        # midnight sun, the second day is preceded by a day of warm-up
+        location, met = synthetic_met(78.2, 172, 2)
+        self.assertTrue(np.all(met['altitude'] > 0))
+        self.assertEqual(ts.segment_warmup(met, 24, 24), 0)
+        self.compare(location, met, 1e-6)
+
+    def test_workers(self):
+        self.model['location'], met = synthetic_met(57.7, 100, 2)
+        segments = ts.day_segments(met)
+        signature = ts.run_signature(self.model, met, self.poi, self.rasters)
+        ts.open_checkpoints(self.folder, signature)
+        reference = self.sequential(met)
+        finished = []
+        for segment in ts.run_segments(self.model, met, self.poi, self.rasters, None, self.folder, segments, 2,
+                                       Feedback()):
+            finished.append(segment)
+            summary, timesteps = ts.segment_outputs(self.folder, segment, self.rasters)
+            for i, arrays, poirows, I0 in timesteps:
+                np.testing.assert_array_equal(arrays['Tmrt'], reference[i][0]['Tmrt'])
+                np.testing.assert_array_equal(poirows, reference[i][1])
+            # stitched segments only keep their summary
+            ts.remove_segment_rasters(self.folder, segment, self.rasters)
+            self.assertEqual(os.listdir(ts.segment_folder(self.folder, segment)), ['segment.npz'])
+        self.assertEqual(finished, segments)
+        # finished segments are not run again
+        self.assertEqual(list(ts.run_segments(self.model, met, self.poi, self.rasters, None, self.folder, segments,
+                                              2, Feedback())), segments)
+
+        # checkpoints of other inputs are not reused
+        ts.open_checkpoints(self.folder, signature)
+        self.assertTrue(ts.segment_finished(self.folder, segments[1]))
+        ts.open_checkpoints(self.folder, 'other')
+        self.assertFalse(ts.segment_finished(self.folder, segments[1]))
+
+    def test_snapshot(self):
+        self.model['location'], met = synthetic_met(57.7, 200, 2)
+        reference = self.sequential(met)
+        filename = os.path.join(self.folder, 'SOLWEIG_state.npz')
+        poiname = ['a', 'b']
+        recorder = PoiRecorder(self.folder, poiname, self.poi, HEADER, met['dectime'].shape[0], buffersize=5)
+
+        # interrupted run, snapshots at midnight
+        state = ts.initial_state(self.model['rows'], self.model['cols'], met)
+        tmrtsum = np.zeros((self.model['rows'], self.model['cols']))
+        for i in range(30):
+            out = ts.solweig_step(i, 0, self.model, met, state)
+            tmrtsum += out['Tmrt']
+            recorder.record(i, ts.poi_rows(i, out, self.model, met, self.poi))
+            if ts.snapshot_due(0, met, i):
+                self.assertEqual(i, 23)
+                ts.save_snapshot(filename, 'run', i + 1, state,
+                                 {'tmrtplot': tmrtsum, 'poi_positions': recorder.positions()})
+        recorder.close()
+
+        self.assertIsNone(ts.load_snapshot(filename, 'other run'))
+        start, state, saved = ts.load_snapshot(filename, 'run')
+        self.assertEqual(start, 24)
+        recorder = PoiRecorder(self.folder, poiname, self.poi, HEADER, met['dectime'].shape[0], buffersize=5,
+                               resume=True)
+        recorder.truncate(saved['poi_positions'])
+        for i in range(start, met['dectime'].shape[0]):
+            out = ts.solweig_step(i, 0, self.model, met, state)
+            np.testing.assert_array_equal(np.float32(out['Tmrt']), reference[i][0]['Tmrt'])
+            recorder.record(i, ts.poi_rows(i, out, self.model, met, self.poi))
+        recorder.close()
+
+        # the rows written after the snapshot are not duplicated
+        rows = np.loadtxt(os.path.join(self.folder, 'POI_b.txt'), skiprows=1)
+        self.assertEqual(rows.shape[0], met['dectime'].shape[0])
+        np.testing.assert_allclose(rows[:, 26], [reference[i][1][1, 26] for i in range(rows.shape[0])], atol=0.006)
+
+    def test_single_precision(self):
+        self.model['location'], met = synthetic_met(57.7, 172, 1)
+        for model in (self.model, anisotropic_model(self.model)):
+            reduced = ts.model_precision(model, np.float32)
+            self.assertEqual(model['dsm'].dtype, np.float64)
+            state = ts.initial_state(reduced['rows'], reduced['cols'], met, np.float32)
+            for i in (0, 12):
+                out = ts.solweig_step(i, 0, reduced, met, state)
+                for name in ('Tmrt', 'Kdown', 'Lup', 'Ldown', 'Tgmap1'):
+                    self.assertEqual(out[name].dtype, np.float32)
+
+            differences = ts.precision_differences(model, met)
+            self.assertLess(differences['max'], 0.01)
+            self.assertLessEqual(differences['rmse'], differences['max'])
+
+        # grids set up in single precision are shared, not copied
+        again = ts.model_precision(reduced, np.float32)
+        self.assertIs(again['dsm'], reduced['dsm'])
+        self.assertIs(again['diffsh'].matrix, reduced['diffsh'].matrix)
+
+if __name__ == '__main__':
+    unittest.main()
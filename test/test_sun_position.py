@@ -0,0 +1,63 @@
+# coding=utf-8
+"""Tests for the vectorised sun position."""
+
+import datetime
+import unittest
+
+import numpy as np
+
+from ..util.SEBESOLWEIGCommonFiles import sun_position as sp
+
+# (year, month, day, hour, min, sec, UTC), (longitude, latitude, altitude), zenith, azimuth
+# as given by the scalar implementation before vectorisation
+REFERENCE = [((2005, 10, 17, 6, 30, 30, -7), (-105.1786, 39.742476, 1830.14), 87.353495512, 104.335417157),
+             ((2020, 2, 29, 12, 10, 0, 1), (18.06, 59.33, 30.0), 67.016203825, 182.635901925),
+             ((2021, 6, 21, 4, 45, 0, 2), (24.94, 60.17, 10.0), 80.837139151, 57.898732621),
+             ((2022, 12, 21, 15, 20, 0, -3), (-46.63, -23.55, 760.0), 44.539084391, 259.878005290),
+             ((1995, 7, 4, 23, 55, 0, 10), (151.2, -33.87, 5.0), 168.973766593, 185.455573852),
+             ((1582, 10, 4, 12, 0, 0, 0), (0.0, 45.0, 0.0), 53.183918762, 184.268766523),
+             ((1582, 10, 15, 12, 0, 0, 0), (0.0, 45.0, 0.0), 53.559485089, 184.310422071),
+             ((1500, 3, 1, 9, 0, 0, 0), (0.0, 45.0, 0.0), 64.643594882, 125.319556153)]
+
+
+def time_dict(year, month, day, hour, minute, sec, UTC):
+    return {'year': year, 'month': month, 'day': day, 'hour': hour, 'min': minute, 'sec': sec, 'UTC': UTC}
+
+
+def location_dict(longitude, latitude, altitude):
+    return {'longitude': longitude, 'latitude': latitude, 'altitude': altitude}
+
+
+class SunPositionTest(unittest.TestCase):
+
+    def test_scalar(self):
+        for time, location, zenith, azimuth in REFERENCE:
+            sun = sp.sun_position(time_dict(*time), location_dict(*location))
+            self.assertEqual(sun['zenith'].shape, (1,))
+            self.assertAlmostEqual(sun['zenith'][0], zenith, delta=1e-6)
+            self.assertAlmostEqual(sun['azimuth'][0], azimuth, delta=1e-6)
+
+    def test_arrays(self):
+        times = np.array([reference[0] for reference in REFERENCE])
+        locations = np.array([reference[1] for reference in REFERENCE])
+        sun = sp.sun_positions(time_dict(*times.T), location_dict(*locations.T))
+        np.testing.assert_allclose(sun['zenith'], [reference[2] for reference in REFERENCE], rtol=0, atol=1e-6)
+        np.testing.assert_allclose(sun['azimuth'], [reference[3] for reference in REFERENCE], rtol=0, atol=1e-6)
+
+        # a day of 10 minute steps at one location, compared with the scalar wrapper
+        minutes = np.arange(0, 1440, 10)
+        location = location_dict(11.94, 57.7, 3.)
+        sun = sp.sun_positions(time_dict(2021, 6, 21, minutes // 60, minutes % 60, 0, 1), location)
+        for n in range(0, minutes.shape[0], 11):
+            scalar = sp.sun_position(time_dict(2021, 6, 21, minutes[n] // 60, minutes[n] % 60, 0, 1), location)
+            self.assertAlmostEqual(sun['zenith'][n], scalar['zenith'][0], delta=1e-6)
+            self.assertAlmostEqual(sun['azimuth'][n], scalar['azimuth'][0], delta=1e-6)
+
+        dates = [datetime.datetime(2010, 5, 5, 12, 0, 0), datetime.datetime(2010, 5, 5, 18, 30, 0)]
+        sun = sp.sun_positions(dates, location)
+        self.assertEqual(sun['zenith'].shape, (2,))
+        self.assertAlmostEqual(sun['zenith'][0], sp.sun_position(dates[0], location)['zenith'][0], delta=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
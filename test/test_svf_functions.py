@@ -0,0 +1,159 @@
+# coding=utf-8
+"""Parity tests for the parallel and tiled sky view factor calculation."""
+
+import unittest
+
+import numpy as np
+
+from ..functions import svf_functions
+from ..util import parallel
+from ..util.shadowmats import ShadowMatrix
+
+
+def synthetic_surface(rows=40, cols=46, seed=3):
+    """DSM with buildings and a tree canopy, small enough for the 153 and 655 patch sweeps."""
+    rng = np.random.RandomState(seed)
+    dsm = 10. + rng.rand(rows, cols)
+    dsm[8:18, 6:14] += 6.
+    dsm[24:34, 26:40] += 9.
+    cdsm = np.zeros((rows, cols))
+    cdsm[20:24, 8:16] = 4.
+    tdsm = cdsm * 0.25
+    return dsm, cdsm, tdsm
+
+
+class FeedbackStub(object):
+    def isCanceled(self):
+        return False
+
+    def setProgress(self, value):
+        pass
+
+    def setProgressText(self, text):
+        pass
+
+
+class SharedArraysTest(unittest.TestCase):
+
+    def test_share_attach_release(self):
+        arrays = {'a': np.arange(12.).reshape(3, 4), 'b': np.ones((2, 5), dtype=np.uint8)}
+        blocks, shared, descriptors = parallel.share_arrays(arrays)
+        try:
+            attached_blocks, attached = parallel.attach_arrays(descriptors)
+            for name in arrays:
+                np.testing.assert_array_equal(attached[name], arrays[name])
+                self.assertEqual(attached[name].dtype, arrays[name].dtype)
+            # both views use the same memory
+            attached['a'][0, 0] = -1.
+            self.assertEqual(shared['a'][0, 0], -1.)
+            attached.clear()
+            parallel.release_arrays(attached_blocks, unlink=False)
+        finally:
+            shared.clear()
+            parallel.release_arrays(blocks)
+
+    def test_share_zeros(self):
+        arrays, descriptors = parallel.share_zeros({'a': ((3, 4), np.uint8)})
+        attached_blocks, attached = parallel.attach_arrays(descriptors)
+        attached['a'][1, 2] = 7
+        attached.clear()
+        parallel.release_arrays(attached_blocks, unlink=False)
+        expected = np.zeros((3, 4), dtype=np.uint8)
+        expected[1, 2] = 7
+        np.testing.assert_array_equal(arrays['a'], expected)
+        # the block is released with the last view of its array
+        view = arrays.pop('a')[1:]
+        attached_blocks, attached = parallel.attach_arrays(descriptors)
+        self.assertEqual(attached['a'][1, 2], 7)
+        attached.clear()
+        parallel.release_arrays(attached_blocks, unlink=False)
+        self.assertEqual(view[0, 2], 7)
+        view = None
+        with self.assertRaises(FileNotFoundError):
+            parallel.attach_arrays(descriptors)
+
+
+class SvfParallelTest(unittest.TestCase):
+
+    def test_partition(self):
+        for patches in (svf_functions.svf_patches_153(), svf_functions.svf_patches_655()):
+            selections = svf_functions.svf_partition(patches, 3)
+            self.assertEqual(len(selections), 3)
+            self.assertEqual(sorted(np.concatenate(selections).tolist()),
+                             list(range(patches['altitude'].shape[0])))
+            # patches with the same azimuth are cast by the same worker
+            owner = dict((azimuth, n) for n, selection in enumerate(selections)
+                         for azimuth in patches['azimuth'][selection])
+            for n, selection in enumerate(selections):
+                self.assertTrue(all(owner[azimuth] == n for azimuth in patches['azimuth'][selection]))
+
+    def test_workers(self):
+        dsm, cdsm, tdsm = synthetic_surface()
+        reference = svf_functions.svfForProcessing153(dsm, cdsm, tdsm, 0.5, 1, FeedbackStub())
+        first = svf_functions.svfForProcessing153(dsm, cdsm, tdsm, 0.5, 1, FeedbackStub(), workers=2)
+        second = svf_functions.svfForProcessing153(dsm, cdsm, tdsm, 0.5, 1, FeedbackStub(), workers=2)
+        for name in reference:
+            if name in ('shmat', 'vegshmat', 'vbshvegshmat'):
+                np.testing.assert_array_equal(reference[name].packed, first[name].packed, err_msg=name)
+            else:
+                # reproducible for a given number of workers, summation order differs from the serial sweep
+                np.testing.assert_array_equal(first[name], second[name], err_msg=name)
+                np.testing.assert_allclose(reference[name], first[name], rtol=0, atol=1e-13, err_msg=name)
+
+        reference = svf_functions.svfForProcessing655(dsm, cdsm, tdsm, 0.5, 1, FeedbackStub())
+        result = svf_functions.svfForProcessing655(dsm, cdsm, tdsm, 0.5, 1, FeedbackStub(), workers=2)
+        for name in reference:
+            np.testing.assert_allclose(reference[name], result[name], rtol=0, atol=1e-13, err_msg=name)
+
+
+class SvfTilesTest(unittest.TestCase):
+
+    def tiled(self, dsm, cdsm, tdsm, aniso, tilesize=16, workers=1):
+        tiles = svf_functions.svfForProcessingTiles(dsm, cdsm, tdsm, 0.5, 1, FeedbackStub(), tilesize, aniso, workers)
+        result = {}
+        for r0, c0, svfresult in tiles:
+            for name, tile in svfresult.items():
+                if name not in result:
+                    if name in ('shmat', 'vegshmat', 'vbshvegshmat'):
+                        result[name] = ShadowMatrix.zeros(dsm.shape[0], dsm.shape[1], tile.shape[2])
+                    else:
+                        result[name] = np.full(dsm.shape, np.nan)
+                if name in ('shmat', 'vegshmat', 'vbshvegshmat'):
+                    result[name].paste(tile, r0, c0)
+                else:
+                    result[name][r0:r0 + tile.shape[0], c0:c0 + tile.shape[1]] = tile
+        return result
+
+    def test_halo(self):
+        dsm, cdsm, tdsm = synthetic_surface()
+        patches = svf_functions.svf_patches_153()
+        halo = svf_functions.svf_halo(dsm, cdsm + dsm, 0.5, patches)
+        heightrange = (cdsm + dsm).max() - dsm.min()
+        self.assertGreaterEqual(halo, heightrange * 0.5 / np.tan(np.radians(patches['altitude'].min())))
+
+    def test_tiles(self):
+        dsm, cdsm, tdsm = synthetic_surface()
+        for aniso, untiled in ((1, svf_functions.svfForProcessing153), (0, svf_functions.svfForProcessing655)):
+            reference = untiled(dsm, cdsm, tdsm, 0.5, 1, FeedbackStub())
+            result = self.tiled(dsm, cdsm, tdsm, aniso)
+            self.assertEqual(sorted(reference), sorted(result))
+            for name in reference:
+                if name in ('shmat', 'vegshmat', 'vbshvegshmat'):
+                    np.testing.assert_array_equal(reference[name].packed, result[name].packed, err_msg=name)
+                else:
+                    np.testing.assert_array_equal(reference[name], result[name], err_msg=name)
+
+    def test_tiles_workers(self):
+        dsm, cdsm, tdsm = synthetic_surface()
+        # a pool is started per tile, keep the number of tiles small
+        reference = self.tiled(dsm, cdsm, tdsm, 1, tilesize=23)
+        result = self.tiled(dsm, cdsm, tdsm, 1, tilesize=23, workers=2)
+        for name in reference:
+            if name in ('shmat', 'vegshmat', 'vbshvegshmat'):
+                np.testing.assert_array_equal(reference[name].packed, result[name].packed, err_msg=name)
+            else:
+                np.testing.assert_allclose(reference[name], result[name], rtol=0, atol=1e-13, err_msg=name)
+
+
+if __name__ == '__main__':
+    unittest.main()
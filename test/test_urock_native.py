@@ -0,0 +1,247 @@
+# coding=utf-8
+"""Tests for the native (Shapely / NumPy) Röckle zones of URock."""
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+
+from ..functions.URock import NativeRockle
+try:
+    from ..functions.URock import BatchCalculation
+    from ..functions.URock import saveData
+    import netCDF4
+except ImportError:
+    BatchCalculation = None
+    saveData = None
+    netCDF4 = None
+from ..functions.URock.GlobalVariables import BUILDING_TABLE_NAME, VEGETATION_TABLE_NAME, \
+    CAVITY_NAME, DISPLACEMENT_NAME, WAKE_NAME, STREET_CANYON_NAME, VEGETATION_BUILT_NAME, \
+    ROOFTOP_PERP_NAME, ROOFTOP_CORN_NAME, CAVITY_BACKWARD_NAME, WAKE_BACKWARD_NAME, \
+    ROOFTOP_CORNER_VAR_HEIGHT, ID_FIELD_STACKED_BLOCK, DZ, MESH_SIZE, GEOM_FIELD, HEIGHT_FIELD, \
+    BASE_HEIGHT_FIELD, ID_POINT_X, ID_POINT_Y, ID_POINT_Z, Y_WALL, X, Y, Z, V, HORIZ_WIND_SPEED, \
+    WIND_GROUP, VERT_WIND, WINDSPEED_X, WINDSPEED_Y, WINDSPEED_Z, WINDSPEED_PROFILE, DIRECTION, SPEED, \
+    OUTPUT_NETCDF_EXTENSION
+
+
+class SyntheticCursor(object):
+    """Answers the queries of NativeRockle.loadObstacles, ignores the others."""
+
+    def __init__(self, buildings, vegetation=()):
+        self.data = {BUILDING_TABLE_NAME: list(buildings), VEGETATION_TABLE_NAME: list(vegetation)}
+        self.query = ''
+
+    def execute(self, query):
+        self.query = query
+
+    def fetchall(self):
+        for table, rows in self.data.items():
+            if 'FROM ' + table in self.query:
+                return rows
+        return []
+
+
+def box(xmin, ymin, xmax, ymax):
+    return 'POLYGON((%g %g, %g %g, %g %g, %g %g, %g %g))' % (xmin, ymin, xmax, ymin, xmax, ymax,
+                                                           xmin, ymax, xmin, ymin)
+
+
+@unittest.skipIf(shapely is None, 'shapely is not installed')
+class NativeRockleTest(unittest.TestCase):
+
+    def test_single_block(self):
+        # 20 m wide, 10 m long and 10 m high block, wind from the North
+        cursor = SyntheticCursor([(box(0, 0, 20, 10), 1, 10.)])
+        result = NativeRockle.initWindField(cursor, windDirection=0, srid=2154)
+        # the blocks are buffered by a few centimeters when merging buildings
+        block = result['stackedBlocks'][GEOM_FIELD].values[0]
+        xmin, ymin, xmax, ymax = shapely.bounds(block)
+        W, L, H = xmax - xmin, ymax - ymin, 10.
+        Lf = 1.5 * W / (1 + 0.8 * W / H)
+        Lr = 1.8 * W / ((L / H) ** 0.3 * (1 + 0.24 * W / H))
+        displacement = result['buildZones'][DISPLACEMENT_NAME][GEOM_FIELD].values
+        cavity = result['buildZones'][CAVITY_NAME][GEOM_FIELD].values
+        wake = result['buildZones'][WAKE_NAME][GEOM_FIELD].values
+        self.assertEqual((displacement.size, cavity.size, wake.size), (1, 1, 1))
+        self.assertAlmostEqual(shapely.bounds(displacement[0])[3] - ymax, Lf, places=2)
+        # the facade is densified in 11 segments (as ST_DENSIFY), the closest
+        # points to its middle being W / 22 away from it
+        Lr *= math.sqrt(1 - (1 / 11.) ** 2)
+        self.assertAlmostEqual(ymin - shapely.bounds(cavity[0])[1], Lr, places=1)
+        self.assertAlmostEqual(ymin - shapely.bounds(wake[0])[1], 3 * Lr, places=1)
+
+        u0, v0, w0 = result['u0'], result['v0'], result['w0']
+        nPoints = result['nPoints']
+        self.assertEqual(u0.shape, (nPoints[X], nPoints[Y], nPoints[Z]))
+        x, y = result['x'], result['y']
+        i = np.searchsorted(x, 10.)
+        # Wind blowing towards the block (v axis facing South) upstream,
+        # reversed in the cavity and stopped within the block
+        profile = result['verticalWindProfile'][HORIZ_WIND_SPEED].values
+        np.testing.assert_allclose(v0[i, -1, :], -profile)
+        self.assertGreater(v0[i, np.searchsorted(y, ymin) - 1, 1], 0)
+        j = np.searchsorted(y, 5.)
+        self.assertEqual(result['buildGrid3D'][i, j, 1:6].tolist(), [0] * 5)
+        self.assertEqual(result['buildGrid3D'][i, j, 6], 1)
+        for wind in (u0, v0, w0):
+            self.assertTrue(np.all(wind[i, j, 1:6] == 0))
+            self.assertFalse(np.any(np.isnan(wind)))
+
+    def test_stacked_blocks_and_canyon(self):
+        cursor = SyntheticCursor([(box(0, 0, 20, 10), 1, 6.), (box(20, 0, 30, 10), 2, 10.),
+                                  (box(0, -30, 30, -20), 3, 15.)],
+                                 [(box(10, -70, 20, -60), 1, 2., 8., 1.)])
+        result = NativeRockle.initWindField(cursor, windDirection=0, srid=2154)
+        stacked = result['stackedBlocks'].sort_values(HEIGHT_FIELD)
+        self.assertEqual(stacked[HEIGHT_FIELD].tolist(), [6, 10, 15])
+        # the 10 m high part is stacked on the 6 m high block
+        self.assertEqual(stacked[BASE_HEIGHT_FIELD].tolist(), [0, 6, 0])
+        # street canyon between the blocks, tree within the wake of the downstream block
+        self.assertGreater(result['buildZonePoints'][STREET_CANYON_NAME].shape[0], 0)
+        self.assertEqual(result['vegZones'][VEGETATION_BUILT_NAME].shape[0], 1)
+        # only the most downstream cavity is kept where cavities overlap
+        cavity = result['buildZonePoints'][CAVITY_NAME]
+        self.assertEqual(cavity.groupby([ID_POINT_X, ID_POINT_Y])[Y_WALL].nunique().max(), 1)
+
+    def test_rooftop_corner(self):
+        # wind at 30 degrees: one facade oblique enough to create a corner zone on the roof
+        cursor = SyntheticCursor([(box(0, 0, 20, 20), 1, 10.)])
+        result = NativeRockle.initWindField(cursor, windDirection=30, srid=2154)
+        zones = result['buildZones'][ROOFTOP_CORN_NAME][GEOM_FIELD].values
+        self.assertEqual(zones.size, 1)
+        block = result['stackedBlocks'][GEOM_FIELD].values[0]
+        self.assertTrue(shapely.covered_by(zones[0], shapely.buffer(block, 1e-6)))
+        points = result['buildZonePoints'][ROOFTOP_CORN_NAME]
+        self.assertGreater(points.shape[0], 0)
+        self.assertTrue((points[ROOFTOP_CORNER_VAR_HEIGHT] > 0).all())
+        # the corner vortex is above the roof and slows down the along-wind component
+        corner = NativeRockle.calculates3dBuildWindFactor(result['buildZonePoints'])[0][ROOFTOP_CORN_NAME]
+        self.assertGreater(corner.shape[0], 0)
+        self.assertTrue((corner[ID_POINT_Z] * DZ - DZ / 2. > 10.).all())
+        self.assertTrue((corner[V] < 0).all())
+
+    def test_backward_zones(self):
+        # low block within the cavity zone of a tall upstream block
+        cursor = SyntheticCursor([(box(0, 20, 30, 30), 1, 30.), (box(0, 0, 30, 10), 2, 6.)])
+        result = NativeRockle.initWindField(cursor, windDirection=0, srid=2154)
+        stacked = result['stackedBlocks']
+        low, tall = stacked.sort_values(HEIGHT_FIELD)[ID_FIELD_STACKED_BLOCK].values
+        lowTop = shapely.bounds(stacked.set_index(ID_FIELD_STACKED_BLOCK).loc[low, GEOM_FIELD])[3]
+        tallBottom = shapely.bounds(stacked.set_index(ID_FIELD_STACKED_BLOCK).loc[tall, GEOM_FIELD])[1]
+        points = result['buildZonePoints']
+        # the street canyon and the rooftop zone of the low block are replaced by
+        # the cavity and wake zones of the low block reverted upstream
+        self.assertEqual(points[STREET_CANYON_NAME].shape[0], 0)
+        self.assertEqual(points[ROOFTOP_PERP_NAME][ID_FIELD_STACKED_BLOCK].unique().tolist(), [tall])
+        for name in (CAVITY_BACKWARD_NAME, WAKE_BACKWARD_NAME):
+            y = result['y'][points[name][ID_POINT_Y].values]
+            self.assertGreater(y.size, 0)
+            self.assertTrue(((y > lowTop) & (y < tallBottom + MESH_SIZE)).all())
+        factors = result['allZonesPointFactor']
+        self.assertEqual(factors.duplicated([ID_POINT_X, ID_POINT_Y, ID_POINT_Z]).sum(), 0)
+        self.assertFalse(np.any(np.isnan(result['v0'])))
+
+    def test_wind_direction(self):
+        # a square block gives the same zones whatever the wind direction
+        cursor = SyntheticCursor([(box(0, 0, 10, 10), 1, 10.)])
+        north = NativeRockle.initWindField(cursor, windDirection=0, srid=2154)
+        east = NativeRockle.initWindField(cursor, windDirection=90, srid=2154)
+        for name in (DISPLACEMENT_NAME, CAVITY_NAME, WAKE_NAME):
+            self.assertAlmostEqual(shapely.area(north['buildZones'][name][GEOM_FIELD].values[0]),
+                                   shapely.area(east['buildZones'][name][GEOM_FIELD].values[0]), places=3)
+        self.assertEqual(north['nPoints'], east['nPoints'])
+        np.testing.assert_allclose(north['v0'], east['v0'], atol=1e-9)
+
+
+@unittest.skipIf(shapely is None or BatchCalculation is None, 'shapely or the URock dependencies are not installed')
+class BatchCalculationTest(unittest.TestCase):
+
+    def test_directions_and_speeds(self):
+        cursor = SyntheticCursor([(box(0, 0, 10, 10), 1, 10.)])
+        buildings, vegetation = NativeRockle.loadObstacles(cursor)
+        stackedBlocks = NativeRockle.identifyBlockBase(NativeRockle.createsBlocks(buildings))
+        center = NativeRockle.rotationCenter(stackedBlocks, vegetation)
+        x = -35. + np.arange(40) * 2.
+        y = -35. + np.arange(40) * 2.
+        parameters = dict(meshSize=2, dz=2, alongWindZoneExtend=60, crossWindZoneExtend=40,
+                          verticalExtend=20, z_ref=10, profileType='power', verticalProfileFile=None,
+                          onlyInitialization=True, maxIterations=100, thresholdIterations=1e-4,
+                          solverMethod='sor', outputExtent=[-36., -36., 44., 44.])
+        fields = {}
+        for direction in (0., 90.):
+            fields[direction] = BatchCalculation.directionWindField(direction, [2., 5.], stackedBlocks,
+                                                                    vegetation, center, x, y, parameters)[1:]
+        u, v, w, profiles = fields[0.]
+        np.testing.assert_allclose(v[1], 2.5 * v[0])
+        np.testing.assert_allclose(profiles[1], 2.5 * profiles[0])
+        # North wind upstream of the block, East wind on the East of the block
+        i, j = np.searchsorted(x, 5.), np.searchsorted(y, 5.)
+        self.assertAlmostEqual(v[0, i, j + 14, 3], -profiles[0, 3], places=2)
+        u90, v90 = fields[90.][0], fields[90.][1]
+        self.assertAlmostEqual(u90[0, i + 14, j, 3], -profiles[0, 3], places=2)
+        self.assertAlmostEqual(v90[0, i + 14, j, 3], 0., places=2)
+
+        # the index of the direction is returned with its results
+        i_dir, results = BatchCalculation.directionWindFieldArgs(
+            (1, (90., [2., 5.], stackedBlocks, vegetation, center, x, y, parameters)))
+        self.assertEqual(i_dir, 1)
+        self.assertEqual(results[0], 90.)
+        np.testing.assert_array_equal(results[1], u90)
+
+
+@unittest.skipIf(netCDF4 is None, 'netCDF4 or the URock dependencies are not installed')
+class BatchNetCDFTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_write_read(self):
+        x = 100. + np.arange(6) * 2.
+        y = 200. + np.arange(5) * 2.
+        longitude, latitude = np.meshgrid(x / 1000., y / 1000., indexing='ij')
+        directions, speeds = [0., 90., 200.], [2., 5.]
+        path = os.path.join(self.folder, 'batch')
+        f = saveData.createBatchNetCDF(longitude, latitude, x, y, directions, speeds, path, 3006, 2, 2)
+        rng = np.random.RandomState(1)
+        # the number of levels depends on the wind direction, filled in any order
+        fields = {}
+        for i_dir, nz in ((2, 4), (0, 6), (1, 3)):
+            fields[i_dir] = [rng.rand(len(speeds), x.size, y.size, nz) for _ in range(3)] \
+                + [rng.rand(len(speeds), nz)]
+            saveData.fillBatchNetCDF(f, i_dir, *fields[i_dir])
+        f.close()
+
+        with netCDF4.Dataset(path + OUTPUT_NETCDF_EXTENSION) as dataset:
+            wind = dataset.groups[WIND_GROUP]
+            profile = dataset.groups[VERT_WIND]
+            np.testing.assert_array_equal(wind.variables[DIRECTION][:], directions)
+            np.testing.assert_array_equal(wind.variables[SPEED][:], speeds)
+            np.testing.assert_array_equal(wind.variables['rlon'][:], x)
+            np.testing.assert_array_equal(wind.variables['lat'][:], latitude)
+            self.assertEqual(wind.dimensions['z'].size, 6)
+            np.testing.assert_allclose(wind.variables[Z][:], [0., 1., 3., 5., 7., 9.])
+            for i_dir, (u, v, w, profiles) in fields.items():
+                nz = u.shape[-1]
+                for name, values in ((WINDSPEED_X, u), (WINDSPEED_Y, v), (WINDSPEED_Z, w)):
+                    saved = np.ma.filled(wind.variables[name][i_dir], np.nan)
+                    np.testing.assert_allclose(saved[..., :nz], values, rtol=1e-6)
+                    # levels above the top of this direction are left to the fill value
+                    self.assertTrue(np.isnan(saved[..., nz:]).all())
+                saved = np.ma.filled(profile.variables[WINDSPEED_PROFILE][i_dir], np.nan)
+                np.testing.assert_allclose(saved[:, :nz], profiles, rtol=1e-6)
+                self.assertTrue(np.isnan(saved[:, nz:]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
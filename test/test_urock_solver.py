@@ -0,0 +1,204 @@
+# coding=utf-8
+"""Tests for the iteration schemes of the URock wind solver."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ..functions.URock import WindSolver
+from ..functions.URock import InitWindField
+from ..functions.URock.GlobalVariables import U, V, W, X, Y, Z
+from ..functions.URock.WindSolver import sparse
+
+
+def synthetic_wind(nx, ny, nz, dx=2., dz=2., seed=1):
+    """
+    Blocks on flat ground in a power law wind profile, prepared as in
+    MainCalculation.main. Returns the arguments of WindSolver.solver.
+    """
+    rng = np.random.RandomState(seed)
+    buildGrid3D = np.ones((nx, ny, nz), dtype=np.int32)
+    buildGrid3D[1:nx - 1, 1:ny - 1, 0] = 0
+    for _ in range(max(nx * ny // 400, 1)):
+        x0, y0 = rng.randint(2, nx - 12), rng.randint(2, ny - 12)
+        buildGrid3D[x0:x0 + rng.randint(4, 10), y0:y0 + rng.randint(4, 10), 0:rng.randint(2, nz // 2)] = 0
+
+    z = np.arange(nz) * dz
+    profile = 2. * (np.maximum(z, dz / 2.) / 10.) ** 0.2
+    u0 = np.ones((nx, ny, nz)) * profile * np.cos(0.3)
+    v0 = np.ones((nx, ny, nz)) * profile * np.sin(0.3)
+    w0 = np.zeros((nx, ny, nz))
+    u0[buildGrid3D == 0] = 0.
+    v0[buildGrid3D == 0] = 0.
+
+    cells4Solver = np.transpose(np.where(buildGrid3D == 1))
+    inside = np.all((cells4Solver > 0) & (cells4Solver < np.array([nx, ny, nz]) - 1), axis=1)
+    cells4Solver = cells4Solver[inside].astype(np.int32)
+    buildingCoordinates = np.stack(np.where(buildGrid3D == 0)).astype(np.int32)
+
+    u0[1:nx, :, :] = (u0[0:nx - 1, :, :] + u0[1:nx, :, :]) / 2
+    v0[:, 1:ny, :] = (v0[:, 0:ny - 1, :] + v0[:, 1:ny, :]) / 2
+    w0[:, :, 1:nz] = (w0[:, :, 0:nz - 1] + w0[:, :, 1:nz]) / 2
+    b = buildingCoordinates
+    u0[b[0], b[1], b[2]] = 0
+    u0[b[0] + 1, b[1], b[2]] = 0
+    v0[b[0], b[1], b[2]] = 0
+    v0[b[0], b[1] + 1, b[2]] = 0
+    w0[b[0], b[1], b[2]] = 0
+    w0[b[0], b[1], b[2] + 1] = 0
+
+    return dict(x=np.arange(nx) * dx, y=np.arange(ny) * dx, z=z, dx=dx, dy=dx, dz=dz, u0=u0, v0=v0, w0=w0,
+                buildingCoordinates=buildingCoordinates, cells4Solver=cells4Solver, cursor=None)
+
+
+def divergence(u, v, w, dx, dy, dz, cells):
+    """Divergence of the wind of the solver cells."""
+    i, j, k = cells[:, 0], cells[:, 1], cells[:, 2]
+    return (u[i + 1, j, k] - u[i, j, k]) / dx + (v[i, j + 1, k] - v[i, j, k]) / dy + \
+        (w[i, j, k + 1] - w[i, j, k]) / dz
+
+
+def obstacle_coefficients_multiindex(b, nx, ny, nz, descending):
+    """Coefficients near obstacles set from MultiIndex intersections, as by earlier versions of the solver."""
+    e, f, g, h, m, n, o, p, q = [np.ones([nx, ny, nz]) for _ in range(9)]
+
+    def index(di, dj, dk):
+        return pd.MultiIndex.from_tuples(list(zip(*[b[0] + di, b[1] + dj, b[2] + dk])))
+
+    def at(ind):
+        return ind.get_level_values(0), ind.get_level_values(1), ind.get_level_values(2)
+
+    below = index(0, 0, 1)
+    front = below.intersection(index(0, -1, 0))
+    behind = below.intersection(index(0, 1, 0))
+    left = below.intersection(index(1, 0, 0))
+    right = below.intersection(index(-1, 0, 0))
+    around = front.union(behind).union(left).union(right)
+    if descending:
+        e[b[0] + 1, b[1], b[2]] = 0.
+        e[at(left)] = 0.
+        f[b[0] - 1, b[1], b[2]] = 0.
+        f[at(right)] = 0.
+        g[b[0], b[1] + 1, b[2]] = 0.
+        g[at(behind)] = 0.
+        h[b[0], b[1] - 1, b[2]] = 0.
+        h[at(front)] = 0.
+        m[b[0], b[1], b[2] + 1] = 0.
+        n[b[0], b[1], b[2] - 1] = 0.
+    else:
+        e[b[0] - 1, b[1], b[2]] = 0.
+        e[at(right)] = 0.
+        f[b[0] + 1, b[1], b[2]] = 0.
+        f[at(left)] = 0.
+        g[b[0], b[1] - 1, b[2]] = 0.
+        g[at(front)] = 0.
+        h[b[0], b[1] + 1, b[2]] = 0.
+        h[at(behind)] = 0.
+        m[b[0], b[1], b[2] - 1] = 0.
+        n[b[0], b[1], b[2] + 1] = 0.
+    o[b[0] - 1, b[1], b[2]] = 0.5
+    o[b[0] + 1, b[1], b[2]] = 0.5
+    p[b[0], b[1] - 1, b[2]] = 0.5
+    p[b[0], b[1] + 1, b[2]] = 0.5
+    q[b[0], b[1], b[2] + 1] = 0.5
+    q[b[0], b[1], b[2] - 1] = 0.5
+    n[at(around)] = 0.
+    o[at(left.union(right))] = 0.5
+    p[at(front.union(behind))] = 0.5
+    q[at(around)] = 0.5
+    return e, f, g, h, m, n, o, p, q
+
+
+class WindSolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.case = synthetic_wind(40, 36, 12)
+
+    def test_setup(self):
+        case = self.case
+        nx, ny, nz = case['u0'].shape
+        for descending in (False, True):
+            WindSolver.DESCENDING_Y = descending
+            try:
+                coefficients = WindSolver.obstacleCoefficients(case['buildingCoordinates'], nx, ny, nz)
+            finally:
+                WindSolver.DESCENDING_Y = False
+            expected = obstacle_coefficients_multiindex(case['buildingCoordinates'], nx, ny, nz, descending)
+            for a, b in zip(coefficients, expected):
+                np.testing.assert_array_equal(a, b)
+
+        # wind cubes from the MultiIndex wind field
+        rng = np.random.RandomState(2)
+        index = pd.MultiIndex.from_product([range(nx), range(ny), range(nz)])
+        df_wind0 = pd.DataFrame({U: rng.randn(index.size), V: rng.randn(index.size), W: rng.randn(index.size)},
+                                index=index)
+        buildings = case['buildingCoordinates'][:, case['buildingCoordinates'][2] > 0]
+        df_gridBuil = pd.DataFrame(index=pd.MultiIndex.from_arrays(buildings))
+        buildGrid3D, u0, v0, w0 = InitWindField.rasterizeWindField(df_wind0.sample(frac=1, random_state=0),
+                                                                   df_gridBuil, {X: nx, Y: ny, Z: nz})
+        np.testing.assert_array_equal(np.transpose(np.where(buildGrid3D == 0)),
+                                      np.transpose(case['buildingCoordinates']))
+        for array, column, sign in ((u0, U, 1), (v0, V, -1), (w0, W, 1)):
+            np.testing.assert_array_equal(array, sign * np.array([df_wind0[column].xs(i, level=0).unstack().values
+                                                                  for i in range(nx)]))
+
+    def test_redblack(self):
+        case = self.case
+        sor = WindSolver.solver(thresholdIterations=1e-9, **case)
+        redblack = WindSolver.solver(thresholdIterations=1e-9, method='redblack', **case)
+        for a, b in zip(sor, redblack):
+            np.testing.assert_allclose(a, b, rtol=0, atol=1e-7)
+
+        # same stopping criterion, checked every normInterval iterations
+        sor = WindSolver.solver(**case)
+        redblack = WindSolver.solver(method='redblack', normInterval=5, **case)
+        initial = np.abs(divergence(case['u0'], case['v0'], case['w0'], 2., 2., 2., case['cells4Solver'])).mean()
+        for u, v, w in (sor, redblack):
+            self.assertLess(np.abs(divergence(u, v, w, 2., 2., 2., case['cells4Solver'])).mean(), initial / 20.)
+        for a, b in zip(sor, redblack):
+            self.assertLess(np.abs(a - b).max(), 1e-3)
+
+    def test_multigrid(self):
+        if sparse is None:
+            self.skipTest('scipy is not installed')
+        case = self.case
+        sor = WindSolver.solver(thresholdIterations=1e-9, **case)
+        report = {}
+        multigrid = WindSolver.solver(thresholdIterations=1e-9, method='multigrid', report=report, **case)
+        for a, b in zip(sor, multigrid):
+            np.testing.assert_allclose(a, b, rtol=0, atol=1e-6)
+        self.assertTrue(report['converged'])
+        self.assertLess(report['iterations'], 30)
+
+        # smaller residual than SOR in fewer iterations at the default threshold
+        sorReport = {}
+        WindSolver.solver(report=sorReport, **case)
+        WindSolver.solver(method='multigrid', report=report, **case)
+        self.assertLess(report['residual'], sorReport['residual'])
+        self.assertLess(report['iterations'] * 5, sorReport['iterations'])
+
+        folder = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(folder, 'report.txt')
+            WindSolver.saveConvergenceReport(report, filename)
+            history = np.loadtxt(filename)
+            # the initial residual is saved as iteration 0
+            self.assertEqual(history.shape, (report['iterations'] + 1, 2))
+            np.testing.assert_array_equal(history[:, 0], np.arange(report['iterations'] + 1))
+            self.assertLess(history[-1, 1], 1e-4)
+        finally:
+            shutil.rmtree(folder)
+
+        # the initial lambda already meets the threshold
+        WindSolver.solver(thresholdIterations=10., method='multigrid', report=report, **case)
+        self.assertEqual(report['iterations'], 0)
+        self.assertTrue(report['converged'])
+        self.assertEqual([iteration for iteration, value in report['history']], [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
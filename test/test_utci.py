@@ -0,0 +1,69 @@
+# coding=utf-8
+"""Tests for the array UTCI calculation."""
+
+import unittest
+
+import numpy as np
+
+from ..functions.SOLWEIGpython import UTCI_calculations as utci
+
+
+class Feedback(object):
+
+    def isCanceled(self):
+        return False
+
+    def setProgress(self, progress):
+        pass
+
+    def setProgressText(self, text):
+        pass
+
+
+class UtciTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        self.Tmrt = 10. + 50. * rng.rand(3, 20, 30)
+        self.va = 0.5 + 10. * rng.rand(3, 20, 30)
+        self.Tmrt[:, 2, 3] = -9999.
+        self.va[:, 4, 5] = -999.
+        self.va[:, 6, 7] = 0.
+        self.Ta = np.array([12., 25., 31.])
+        self.RH = np.array([80., 45., 30.])
+
+    def reference(self, Ta, RH, Tmrt, va):
+        # the per pixel calculation of utci_calculator_grid
+        expected = np.zeros(Tmrt.shape)
+        if Ta <= -999 or RH <= -999:
+            return expected - 999
+        for iy in range(Tmrt.shape[0]):
+            for ix in range(Tmrt.shape[1]):
+                if Tmrt[iy, ix] <= -999 or va[iy, ix] <= -999:
+                    expected[iy, ix] = -9999
+                elif va[iy, ix] > 0:
+                    expected[iy, ix] = utci.utci_calculator(Ta, RH, Tmrt[iy, ix], va[iy, ix])
+        return expected
+
+    def test_grid(self):
+        result = utci.utci_calculator_grid(self.Ta[1], self.RH[1], self.Tmrt[1], self.va[1], Feedback())
+        np.testing.assert_allclose(result, self.reference(self.Ta[1], self.RH[1], self.Tmrt[1], self.va[1]),
+                                   rtol=0, atol=1e-9)
+        self.assertEqual(result[2, 3], -9999)
+        self.assertEqual(result[6, 7], 0)
+        np.testing.assert_array_equal(utci.utci_calculator_grid(-999., 50., self.Tmrt[0], self.va[0], Feedback()),
+                                      -999)
+
+    def test_stack(self):
+        Ta = self.Ta.copy()
+        Ta[2] = -999.
+        # small chunks to cover the chunk boundaries
+        result = utci.utci_calculator_stack(Ta, self.RH, self.Tmrt, self.va[0], chunksize=97)
+        self.assertEqual(result.shape, self.Tmrt.shape)
+        for t in range(3):
+            np.testing.assert_allclose(result[t], self.reference(Ta[t], self.RH[t], self.Tmrt[t], self.va[0]),
+                                       rtol=0, atol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
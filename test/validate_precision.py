@@ -0,0 +1,41 @@
+# coding=utf-8
+"""Tmrt differences of the single precision SOLWEIG mode against float64.
+
+Runs the synthetic model of the time series tests over three days at a few
+latitudes, with the isotropic and the anisotropic sky (153 patches), and
+prints the differences and the time per timestep of both precisions.
+
+Run from the directory containing the plugin folder, e.g.
+    python -m processing_umep.test.validate_precision
+"""
+
+import time
+
+import numpy as np
+
+from ..functions.SOLWEIGpython import solweig_timeseries as ts
+from .test_solweig_timeseries import synthetic_model, synthetic_met, anisotropic_model
+
+
+def time_run(model, met, dtype):
+    model = ts.model_precision(model, dtype)
+    state = ts.initial_state(model['rows'], model['cols'], met, dtype)
+    start = time.time()
+    for i in range(met['dectime'].shape[0]):
+        ts.solweig_step(i, 0, model, met, state)
+    return (time.time() - start) / met['dectime'].shape[0]
+
+
+def run_validation(latitudes=(0., 40., 57.7, 78.2), doy=172, days=3):
+    isotropic = synthetic_model()
+    for sky, model in (('isotropic', isotropic), ('anisotropic', anisotropic_model(isotropic))):
+        for latitude in latitudes:
+            model['location'], met = synthetic_met(latitude, doy, days)
+            d = ts.precision_differences(model, met)
+            print('%-11s latitude %5.1f  max %.2e K (timestep %d)  mean %.2e K  p99 %.2e K  rmse %.2e K'
+                  % (sky, latitude, d['max'], d['timestep'], d['mean'], d['p99'], d['rmse']))
+            print('                            float64: %.4f s per timestep  float32: %.4f s per timestep'
+                  % (time_run(model, met, np.float64), time_run(model, met, np.float32)))
+
+if __name__ == '__main__':
+    run_validation()
@@ -0,0 +1,93 @@
+# coding=utf-8
+"""Initial wind field of the native Röckle zones against the H2GIS ones.
+
+Runs the URock initialisation (no wind solver) of a building (and optionally
+vegetation) file with both Röckle backends for a few wind directions and
+prints the time spent by each backend and the differences of the initial
+horizontal wind speed over the cells of both grids located at the same
+coordinates (read from the rotated grid point table, the x_rot and y_rot
+matrices returned by MainCalculation.main being anchored to the upper corner
+of each grid). Needs Java and the H2GIS database used by URock.
+
+Run from the directory containing the plugin folder, e.g.
+    python -m processing_umep.test.validate_urock_native buildings.shp 2154 [vegetation.shp]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from ..functions.URock import MainCalculation
+from ..functions.URock.GlobalVariables import ROCKLE_BACKENDS, ID_POINT_X, ID_POINT_Y, GEOM_FIELD
+from ..functions.URock.H2gisConnection import getJavaDir, setJavaDir
+
+
+def initial_wind(backend, buildingFilePath, srid, vegetationFilePath, windDirection, outputDirectory):
+    pluginDirectory = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'processor')
+    start = time.time()
+    results = MainCalculation.main(javaEnvironmentPath=getJavaDir(pluginDirectory),
+                                   pluginDirectory=pluginDirectory,
+                                   outputFilePath=outputDirectory,
+                                   buildingFilePath=buildingFilePath,
+                                   srid=srid,
+                                   vegetationFilePath=vegetationFilePath,
+                                   windDirection=windDirection,
+                                   tempoDirectory=outputDirectory,
+                                   onlyInitialization=True,
+                                   saveRaster=False,
+                                   saveVector=False,
+                                   saveNetcdf=False,
+                                   rockleBackend=backend,
+                                   debug=True)
+    duration = time.time() - start
+    u0, v0, cursor, rotatedGrid = results[3], results[4], results[10], results[11]
+
+    # Real coordinates of each (ID_X, ID_Y) cell of the grid
+    cursor.execute("SELECT {0}, {1}, ST_X({2}), ST_Y({2}) FROM {3}"
+                   .format(ID_POINT_X, ID_POINT_Y, GEOM_FIELD, rotatedGrid))
+    points = np.array(cursor.fetchall(), dtype=float)
+    cursor.close()
+    x = np.full(u0.shape[:2], np.nan)
+    y = np.full(u0.shape[:2], np.nan)
+    i, j = points[:, 0].astype(int) - 1, points[:, 1].astype(int) - 1
+    x[i, j], y[i, j] = points[:, 2], points[:, 3]
+    return duration, np.sqrt(u0 ** 2 + v0 ** 2), x, y
+
+
+def common_cells(ref_x, ref_y, nat_x, nat_y, tolerance=0.05):
+    """Flat indices of the (x, y) cells of both grids located at less than
+    'tolerance' (m) from each other."""
+    distance, i_ref = cKDTree(np.column_stack([ref_x.ravel(), ref_y.ravel()]))\
+        .query(np.column_stack([nat_x.ravel(), nat_y.ravel()]), distance_upper_bound=tolerance)
+    i_nat = np.flatnonzero(np.isfinite(distance))
+    return i_ref[i_nat], i_nat
+
+
+def run_validation(buildingFilePath, srid, vegetationFilePath='', directions=(0., 45., 90., 200.)):
+    pluginDirectory = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'processor')
+    setJavaDir(getJavaDir(pluginDirectory))
+    for windDirection in directions:
+        runs = {}
+        for backend in ROCKLE_BACKENDS:
+            runs[backend] = initial_wind(backend, buildingFilePath, srid, vegetationFilePath,
+                                         windDirection, tempfile.mkdtemp())
+        (t_ref, ref, ref_x, ref_y), (t_nat, nat, nat_x, nat_y) = \
+            runs[ROCKLE_BACKENDS[0]], runs[ROCKLE_BACKENDS[1]]
+        i_ref, i_nat = common_cells(ref_x, ref_y, nat_x, nat_y)
+        nz = min(ref.shape[2], nat.shape[2])
+        diff = np.abs(ref.reshape(-1, ref.shape[2])[i_ref, :nz] - nat.reshape(-1, nat.shape[2])[i_nat, :nz])
+        print('direction %5.1f  grid %s / %s  common cells %d  levels %d'
+              % (windDirection, ref.shape, nat.shape, i_ref.size, nz))
+        if diff.size:
+            print('                 max %.3f m/s  mean %.4f m/s  p99 %.3f m/s  cells > 0.1 m/s %.2f %%'
+                  % (diff.max(), diff.mean(), np.percentile(diff, 99), 100. * (diff > 0.1).mean()))
+        print('                 %s: %.2f s  %s: %.2f s'
+              % (ROCKLE_BACKENDS[0], t_ref, ROCKLE_BACKENDS[1], t_nat))
+
+
+if __name__ == '__main__':
+    run_validation(sys.argv[1], int(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else '')
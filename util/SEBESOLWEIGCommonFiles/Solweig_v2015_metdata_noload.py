@@ -4,7 +4,6 @@ from . import sun_position as sp
 #import sun_position as sp
 import numpy as np
 import datetime
-import calendar
 
 def Solweig_2015a_metdata_noload(inputdata, location, UTC):
     """
@@ -25,9 +24,6 @@ def Solweig_2015a_metdata_noload(inputdata, location, UTC):
         halftimestepdec = 0
     else:
         halftimestepdec = (dectime[1] - dectime[0]) / 2.
-    time = dict()
-    time['sec'] = 0
-    time['UTC'] = UTC
     sunmaximum = 0.
     leafon1 = 97  #TODO this should change
     leafoff1 = 300  #TODO this should change
@@ -41,54 +37,46 @@ def Solweig_2015a_metdata_noload(inputdata, location, UTC):
     leafon = np.empty(shape=(1, data_len))
     altmax = np.empty(shape=(1, data_len))
 
-    sunmax = dict()
+    # Times of all rows (half a timestep earlier) and of the daily search for the maximum sun altitude
+    YMD = [datetime.datetime(int(met[i, 0]), 1, 1) + datetime.timedelta(int(met[i, 1]) - 1) for i in range(data_len)]
+    half = datetime.timedelta(days=halftimestepdec)
+    YMDHM = [YMD[i] + datetime.timedelta(hours=met[i, 2]) + datetime.timedelta(minutes=met[i, 3]) - half
+             for i in range(data_len)]
+    newday = [i for i in range(data_len) if (i == 0) or (np.mod(dectime[i], np.floor(dectime[i])) == 0)]
+
+    # Finding maximum altitude in 15 min intervals (20141027), from 10:15 onwards until the altitude decreases
+    fifteens = 96
+    sunmaxima = dict()
+    while newday:
+        times = [YMD[i] + datetime.timedelta(days=(60*10)/1440.0 + k * 15. / 1440.) for i in newday
+                 for k in range(1, fifteens + 1)]
+        sunmax = sp.sun_positions(times_to_dict(times, UTC), location)
+        altitudes = np.concatenate((np.zeros((len(newday), 1)),
+                                    90. - sunmax['zenith'].reshape(len(newday), fifteens)), axis=1)
+        decreasing = altitudes[:, 1:] < altitudes[:, :-1]
+        found = np.any(decreasing, axis=1)
+        for n in np.flatnonzero(found):
+            sunmaxima[newday[n]] = altitudes[n, np.argmax(decreasing[n])]
+        newday = [i for i, f in zip(newday, found) if not f]
+        fifteens *= 2
+
+    sun = sp.sun_positions(times_to_dict(YMDHM, UTC), location)
+    # Hopefully fixes weird values in Perez et al. when altitude < 1.0, i.e. close to sunrise/sunset
+    sun['zenith'][(sun['zenith'] > 89.0) & (sun['zenith'] <= 90.0)] = 89.0
 
     for i, row in enumerate(met[:, 0]):
-        if met[i, 1] == 221:
-            test = 4
-        YMD = datetime.datetime(int(met[i, 0]), 1, 1) + datetime.timedelta(int(met[i, 1]) - 1)
-        # Finding maximum altitude in 15 min intervals (20141027)
-        if (i == 0) or (np.mod(dectime[i], np.floor(dectime[i])) == 0):
-            fifteen = 0.
-            sunmaximum = -90.
-            sunmax['zenith'] = 90.
-            while sunmaximum <= 90. - sunmax['zenith']:
-                sunmaximum = 90. - sunmax['zenith']
-                fifteen = fifteen + 15. / 1440.
-                HM = datetime.timedelta(days=(60*10)/1440.0 + fifteen)
-                YMDHM = YMD + HM
-                time['year'] = YMDHM.year
-                time['month'] = YMDHM.month
-                time['day'] = YMDHM.day
-                time['hour'] = YMDHM.hour
-                time['min'] = YMDHM.minute
-                sunmax = sp.sun_position(time,location)
+        if i in sunmaxima:
+            sunmaximum = sunmaxima[i]
         altmax[0, i] = sunmaximum
 
-        half = datetime.timedelta(days=halftimestepdec)
-        H = datetime.timedelta(hours=met[i, 2])
-        M = datetime.timedelta(minutes=met[i, 3])
-        YMDHM = YMD + H + M - half
-        time['year'] = YMDHM.year
-        time['month'] = YMDHM.month
-        time['day'] = YMDHM.day
-        time['hour'] = YMDHM.hour
-        time['min'] = YMDHM.minute
-        sun = sp.sun_position(time, location)
-        if (sun['zenith'] > 89.0) & (sun['zenith'] <= 90.0):    # Hopefully fixes weird values in Perez et al. when altitude < 1.0, i.e. close to sunrise/sunset
-            sun['zenith'] = 89.0
-        altitude[0, i] = 90. - sun['zenith']
-        zen[0, i] = sun['zenith'] * (np.pi/180.)
-        azimuth[0, i] = sun['azimuth']
+        altitude[0, i] = 90. - sun['zenith'][i]
+        zen[0, i] = sun['zenith'][i] * (np.pi/180.)
+        azimuth[0, i] = sun['azimuth'][i]
 
-        # day of year and check for leap year
-        if calendar.isleap(time['year']):
-            dayspermonth = np.atleast_2d([31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
-        else:
-            dayspermonth = np.atleast_2d([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+        # day of year
         # jday[0, i] = np.sum(dayspermonth[0, 0:time['month']-1]) + time['day'] # bug when a new day 20191015
         YYYY[0, i] = met[i, 0]
-        doy = YMD.timetuple().tm_yday
+        doy = YMD[i].timetuple().tm_yday
         jday[0, i] = doy
         if (doy > leafon1) | (doy < leafoff1):
             leafon[0, i] = 1
@@ -98,5 +86,14 @@ def Solweig_2015a_metdata_noload(inputdata, location, UTC):
     return YYYY, altitude, azimuth, zen, jday, leafon, dectime, altmax
 
 
-
-
+def times_to_dict(times, UTC):
+    """Time dict of arrays for sun_position.sun_positions from a list of datetime objects in local time."""
+    time = dict()
+    time['year'] = np.array([t.year for t in times])
+    time['month'] = np.array([t.month for t in times])
+    time['day'] = np.array([t.day for t in times])
+    time['hour'] = np.array([t.hour for t in times])
+    time['min'] = np.array([t.minute for t in times])
+    time['sec'] = 0
+    time['UTC'] = UTC
+    return time
@@ -1,5 +1,7 @@
 from __future__ import division
 import numpy as np
+from .. import shadowingfunctions_numba as shadow_numba
+from ..shadowingfunctions import get_shadow_backend
 # import matplotlib.pylab as plt
 def shadowingfunction_wallheight_23(a, vegdem, vegdem2, azimuth, altitude, scale, amaxvalue, bush, walls, aspect):
     """
@@ -48,117 +50,122 @@ def shadowingfunction_wallheight_23(a, vegdem, vegdem2, azimuth, altitude, scale
     sizex = np.shape(a)[0]
     sizey = np.shape(a)[1]
     
-    # initialise parameters
-    dx = 0
-    dy = 0
-    dz = 0
-    temp = np.zeros((sizex, sizey))
-    tempvegdem = np.zeros((sizex, sizey))
-    tempvegdem2 = np.zeros((sizex, sizey))
-    templastfabovea = np.zeros((sizex, sizey))
-    templastgabovea = np.zeros((sizex, sizey))
-    bushplant = bush > 1
-    sh = np.zeros((sizex, sizey)) #shadows from buildings
-    vbshvegsh = np.copy(sh) #vegetation blocking buildings
-    vegsh = np.add(np.zeros((sizex, sizey)), bushplant, dtype=float) #vegetation shadow
-    f = np.copy(a)
-    shvoveg = np.copy(vegdem) # for vegetation shadowvolume
-    # g = np.copy(sh)
     wallbol = (walls > 0).astype(float)
 
-    # other loop parameters
-    pibyfour = np.pi/4
-    threetimespibyfour = 3*pibyfour
-    fivetimespibyfour = 5*pibyfour
-    seventimespibyfour = 7*pibyfour
-    sinazimuth = np.sin(azimuth)
-    cosazimuth = np.cos(azimuth)
-    tanazimuth = np.tan(azimuth)
-    signsinazimuth = np.sign(sinazimuth)
-    signcosazimuth = np.sign(cosazimuth)
-    dssin = np.abs(1/sinazimuth)
-    dscos = np.abs(1/cosazimuth)
-    tanaltitudebyscale = np.tan(altitude)/scale
-
-    index = 0
-
-    # new case with pergola (thin vertical layer of vegetation), August 2021
-    dzprev = 0
-
-    # main loop
-    while (amaxvalue >= dz) and (np.abs(dx) < sizex) and (np.abs(dy) < sizey):
-        if ((pibyfour <= azimuth) and (azimuth < threetimespibyfour)) or ((fivetimespibyfour <= azimuth) and (azimuth < seventimespibyfour)):
-            dy = signsinazimuth * index
-            dx = -1 * signcosazimuth * np.abs(np.round(index / tanazimuth))
-            ds = dssin
-        else:
-            dy = signsinazimuth * np.abs(np.round(index * tanazimuth))
-            dx = -1 * signcosazimuth * index
-            ds = dscos
-
-        # note: dx and dy represent absolute values while ds is an incremental value
-        dz = (ds * index) * tanaltitudebyscale
-        tempvegdem[0:sizex, 0:sizey] = 0
-        tempvegdem2[0:sizex, 0:sizey] = 0
-        temp[0:sizex, 0:sizey] = 0
-        templastfabovea[0:sizex, 0:sizey] = 0.
-        templastgabovea[0:sizex, 0:sizey] = 0.
-        absdx = np.abs(dx)
-        absdy = np.abs(dy)
-        xc1 = int((dx+absdx)/2)
-        xc2 = int(sizex+(dx-absdx)/2)
-        yc1 = int((dy+absdy)/2)
-        yc2 = int(sizey+(dy-absdy)/2)
-        xp1 = -int((dx-absdx)/2)
-        xp2 = int(sizex-(dx+absdx)/2)
-        yp1 = -int((dy-absdy)/2)
-        yp2 = int(sizey-(dy+absdy)/2)
-
-        tempvegdem[xp1:xp2, yp1:yp2] = vegdem[xc1:xc2, yc1:yc2] - dz
-        tempvegdem2[xp1:xp2, yp1:yp2] = vegdem2[xc1:xc2, yc1:yc2] - dz
-        temp[xp1:xp2, yp1:yp2] = a[xc1:xc2, yc1:yc2]-dz
-
-        f = np.fmax(f, temp) #Moving building shadow
-        shvoveg = np.fmax(shvoveg, tempvegdem) # moving vegetation shadow volume
-        sh[f > a] = 1
-        sh[f <= a] = 0   
-        fabovea = (tempvegdem > a).astype(int)   #vegdem above DEM
-        gabovea = (tempvegdem2 > a).astype(int)   #vegdem2 above DEM
+    if get_shadow_backend() == 'numba':
+        f, sh, vegsh, vbshvegsh, shvoveg = shadow_numba.cast_shadows(a, vegdem, vegdem2, azimuth, altitude, scale,
+                                                                     amaxvalue, bush, True)
+    else:
+        # initialise parameters
+        dx = 0
+        dy = 0
+        dz = 0
+        temp = np.zeros((sizex, sizey))
+        tempvegdem = np.zeros((sizex, sizey))
+        tempvegdem2 = np.zeros((sizex, sizey))
+        templastfabovea = np.zeros((sizex, sizey))
+        templastgabovea = np.zeros((sizex, sizey))
+        bushplant = bush > 1
+        sh = np.zeros((sizex, sizey)) #shadows from buildings
+        vbshvegsh = np.copy(sh) #vegetation blocking buildings
+        vegsh = np.add(np.zeros((sizex, sizey)), bushplant, dtype=float) #vegetation shadow
+        f = np.copy(a)
+        shvoveg = np.copy(vegdem) # for vegetation shadowvolume
+        # g = np.copy(sh)
+
+        # other loop parameters
+        pibyfour = np.pi/4
+        threetimespibyfour = 3*pibyfour
+        fivetimespibyfour = 5*pibyfour
+        seventimespibyfour = 7*pibyfour
+        sinazimuth = np.sin(azimuth)
+        cosazimuth = np.cos(azimuth)
+        tanazimuth = np.tan(azimuth)
+        signsinazimuth = np.sign(sinazimuth)
+        signcosazimuth = np.sign(cosazimuth)
+        dssin = np.abs(1/sinazimuth)
+        dscos = np.abs(1/cosazimuth)
+        tanaltitudebyscale = np.tan(altitude)/scale
+
+        index = 0
+
+        # new case with pergola (thin vertical layer of vegetation), August 2021
+        dzprev = 0
+
+        # main loop
+        while (amaxvalue >= dz) and (np.abs(dx) < sizex) and (np.abs(dy) < sizey):
+            if ((pibyfour <= azimuth) and (azimuth < threetimespibyfour)) or ((fivetimespibyfour <= azimuth) and (azimuth < seventimespibyfour)):
+                dy = signsinazimuth * index
+                dx = -1 * signcosazimuth * np.abs(np.round(index / tanazimuth))
+                ds = dssin
+            else:
+                dy = signsinazimuth * np.abs(np.round(index * tanazimuth))
+                dx = -1 * signcosazimuth * index
+                ds = dscos
+
+            # note: dx and dy represent absolute values while ds is an incremental value
+            dz = (ds * index) * tanaltitudebyscale
+            tempvegdem[0:sizex, 0:sizey] = 0
+            tempvegdem2[0:sizex, 0:sizey] = 0
+            temp[0:sizex, 0:sizey] = 0
+            templastfabovea[0:sizex, 0:sizey] = 0.
+            templastgabovea[0:sizex, 0:sizey] = 0.
+            absdx = np.abs(dx)
+            absdy = np.abs(dy)
+            xc1 = int((dx+absdx)/2)
+            xc2 = int(sizex+(dx-absdx)/2)
+            yc1 = int((dy+absdy)/2)
+            yc2 = int(sizey+(dy-absdy)/2)
+            xp1 = -int((dx-absdx)/2)
+            xp2 = int(sizex-(dx+absdx)/2)
+            yp1 = -int((dy-absdy)/2)
+            yp2 = int(sizey-(dy+absdy)/2)
+
+            tempvegdem[xp1:xp2, yp1:yp2] = vegdem[xc1:xc2, yc1:yc2] - dz
+            tempvegdem2[xp1:xp2, yp1:yp2] = vegdem2[xc1:xc2, yc1:yc2] - dz
+            temp[xp1:xp2, yp1:yp2] = a[xc1:xc2, yc1:yc2]-dz
+
+            f = np.fmax(f, temp) #Moving building shadow
+            shvoveg = np.fmax(shvoveg, tempvegdem) # moving vegetation shadow volume
+            sh[f > a] = 1
+            sh[f <= a] = 0   
+            fabovea = (tempvegdem > a).astype(int)   #vegdem above DEM
+            gabovea = (tempvegdem2 > a).astype(int)   #vegdem2 above DEM
         
-        #new pergola condition
-        templastfabovea[xp1:xp2, yp1:yp2] = vegdem[xc1:xc2, yc1:yc2]-dzprev
-        templastgabovea[xp1:xp2, yp1:yp2] = vegdem2[xc1:xc2, yc1:yc2]-dzprev
-        lastfabovea = templastfabovea > a
-        lastgabovea = templastgabovea > a
-        dzprev = dz
-        vegsh2 = np.add(np.add(np.add(fabovea, gabovea, dtype=float),lastfabovea, dtype=float),lastgabovea, dtype=float)
-        vegsh2[vegsh2 == 4] = 0.
-        # vegsh2[vegsh2 == 1] = 0. # This one is the ultimate question...
-        vegsh2[vegsh2 > 0] = 1.
-
-        # vegsh2 = fabovea - gabovea #old without pergolas
-        # vegsh = np.max([vegsh, vegsh2], axis=0) #old without pergolas
-
-        vegsh = np.fmax(vegsh, vegsh2)
-        vegsh[vegsh*sh > 0] = 0    
-        vbshvegsh = np.copy(vegsh) + vbshvegsh # removing shadows 'behind' buildings
-
-        # # vegsh at high sun altitudes # Not needed when pergolas are included
-        # if index == 0:
-        #     firstvegdem = np.copy(tempvegdem) - np.copy(temp)
-        #     firstvegdem[firstvegdem <= 0] = 1000
-        #     vegsh[firstvegdem < dz] = 1
-        #     vegsh *= (vegdem2 > a)
-        #     vbshvegsh = np.zeros((sizex, sizey))
-
-        # # Bush shadow on bush plant # Not needed when pergolas are included
-        # if np.max(bush) > 0 and np.max(fabovea*bush) > 0:
-        #     tempbush = np.zeros((sizex, sizey))
-        #     tempbush[int(xp1):int(xp2), int(yp1):int(yp2)] = bush[int(xc1):int(xc2), int(yc1):int(yc2)] - dz
-        #     g = np.max([g, tempbush], axis=0)
-        #     g = bushplant * g
+            #new pergola condition
+            templastfabovea[xp1:xp2, yp1:yp2] = vegdem[xc1:xc2, yc1:yc2]-dzprev
+            templastgabovea[xp1:xp2, yp1:yp2] = vegdem2[xc1:xc2, yc1:yc2]-dzprev
+            lastfabovea = templastfabovea > a
+            lastgabovea = templastgabovea > a
+            dzprev = dz
+            vegsh2 = np.add(np.add(np.add(fabovea, gabovea, dtype=float),lastfabovea, dtype=float),lastgabovea, dtype=float)
+            vegsh2[vegsh2 == 4] = 0.
+            # vegsh2[vegsh2 == 1] = 0. # This one is the ultimate question...
+            vegsh2[vegsh2 > 0] = 1.
+
+            # vegsh2 = fabovea - gabovea #old without pergolas
+            # vegsh = np.max([vegsh, vegsh2], axis=0) #old without pergolas
+
+            vegsh = np.fmax(vegsh, vegsh2)
+            vegsh[vegsh*sh > 0] = 0    
+            vbshvegsh = np.copy(vegsh) + vbshvegsh # removing shadows 'behind' buildings
+
+            # # vegsh at high sun altitudes # Not needed when pergolas are included
+            # if index == 0:
+            #     firstvegdem = np.copy(tempvegdem) - np.copy(temp)
+            #     firstvegdem[firstvegdem <= 0] = 1000
+            #     vegsh[firstvegdem < dz] = 1
+            #     vegsh *= (vegdem2 > a)
+            #     vbshvegsh = np.zeros((sizex, sizey))
+
+            # # Bush shadow on bush plant # Not needed when pergolas are included
+            # if np.max(bush) > 0 and np.max(fabovea*bush) > 0:
+            #     tempbush = np.zeros((sizex, sizey))
+            #     tempbush[int(xp1):int(xp2), int(yp1):int(yp2)] = bush[int(xc1):int(xc2), int(yc1):int(yc2)] - dz
+            #     g = np.max([g, tempbush], axis=0)
+            #     g = bushplant * g
     
-        index += 1
+            index += 1
 
     # Removing walls in shadow due to selfshadowing
     azilow = azimuth - np.pi/2
@@ -101,6 +101,28 @@ def sun_position(time, location):
     %               write code that  will both avoid this warning and work in future versions of
     %               MATLAB,  see R14SP2 Release Notes'. Script should now be
     %               compliant with futher release of Matlab...
+    %
+    % sun_position is a wrapper of sun_positions for a single time. As before,
+    % zenith and azimuth are returned as one-element arrays.
+    """
+
+    sun = sun_positions(time, location)
+    sun['zenith'] = np.atleast_1d(sun['zenith'])
+    sun['azimuth'] = np.atleast_1d(sun['azimuth'])
+    return sun
+
+
+def sun_positions(time, location):
+    """
+    Sun position (zenith and azimuth angle in degrees) for many times at once.
+
+    time is a dict as for sun_position whose entries (year, month, day, hour,
+    min, sec, UTC) may be arrays, or a sequence of datetime objects (UTC). The
+    entries of location (latitude, longitude, altitude) may be arrays as well.
+    All inputs are broadcast against each other and sun['zenith'] and
+    sun['azimuth'] are arrays of the broadcast shape. The periodic terms of
+    the heliocentric position and the nutation are evaluated for all times in
+    one go.
     """
 
     # 1. Calculate the Julian Day, and Century. Julian Ephemeris day, century
@@ -166,53 +188,44 @@ def julian_calculation(t_input):
     % this string and create the structure as defined in the main header of
     % this script.
     """
+    if isinstance(t_input, datetime.datetime):
+        t_input = [t_input]
+        single = True
+    else:
+        single = False
     if not isinstance(t_input, dict):
         # tt = datetime.datetime.strptime(t_input, "%Y-%m-%d %H:%M:%S.%f")    # if t_input is a string of this format
-        # t_input should be a datetime object
+        # t_input should be datetime objects
         time = dict()
         time['UTC'] = 0
-        time['year'] = t_input.year
-        time['month'] = t_input.month
-        time['day'] = t_input.day
-        time['hour'] = t_input.hour
-        time['min'] = t_input.minute
-        time['sec'] = t_input.second
+        time['year'] = np.array([t.year for t in t_input])
+        time['month'] = np.array([t.month for t in t_input])
+        time['day'] = np.array([t.day for t in t_input])
+        time['hour'] = np.array([t.hour for t in t_input])
+        time['min'] = np.array([t.minute for t in t_input])
+        time['sec'] = np.array([t.second for t in t_input])
+        if single:
+            time = dict((key, np.squeeze(value)) for key, value in time.items())
     else:
         time = t_input
+    year = np.asarray(time['year'])
+    month = np.asarray(time['month'])
+    day = np.asarray(time['day'])
 
-    if time['month'] == 1 or time['month'] == 2:
-        Y = time['year'] - 1
-        M = time['month'] + 12
-    else:
-        Y = time['year']
-        M = time['month']
+    Y = np.where((month == 1) | (month == 2), year - 1, year)
+    M = np.where((month == 1) | (month == 2), month + 12, month)
 
     ut_time = ((time['hour'] - time['UTC'])/24) + (time['min']/(60*24)) + (time['sec']/(60*60*24))   # time of day in UT time.
-    D = time['day'] + ut_time   # Day of month in decimal time, ex. 2sd day of month at 12:30:30UT, D=2.521180556
-
-    # In 1582, the gregorian calendar was adopted
-    if time['year'] == 1582:
-        if time['month'] == 10:
-            if time['day'] <= 4:   # The Julian calendar ended on October 4, 1582
-                B = (0)
-            elif time['day'] >= 15:   # The Gregorian calendar started on October 15, 1582
-                A = np.floor(Y/100)
-                B = 2 - A + np.floor(A/4)
-            else:
-                print('This date never existed!. Date automatically set to October 4, 1582')
-                time['month'] = 10
-                time['day'] = 4
-                B = 0
-        elif time['month'] < 10:   # Julian calendar
-            B = 0
-        else: # Gregorian calendar
-            A = np.floor(Y/100)
-            B = 2 - A + np.floor(A/4)
-    elif time['year'] < 1582:   # Julian calendar
-        B = 0
-    else:
-        A = np.floor(Y/100)    # Gregorian calendar
-        B = 2 - A + np.floor(A/4)
+    D = day + ut_time   # Day of month in decimal time, ex. 2sd day of month at 12:30:30UT, D=2.521180556
+
+    # In 1582, the gregorian calendar was adopted. The Julian calendar ended on
+    # October 4, 1582 and the Gregorian calendar started on October 15, 1582.
+    nonexistent = (year == 1582) & (month == 10) & (day > 4) & (day < 15)
+    if np.any(nonexistent):
+        print('This date never existed!. Date automatically set to October 4, 1582')
+    gregorian = (year > 1582) | ((year == 1582) & ((month > 10) | ((month == 10) & (day >= 15))))
+    A = np.floor(Y/100)
+    B = np.where(gregorian, 2 - A + np.floor(A/4), 0)
 
     julian = dict()
     julian['day'] = D + B + np.floor(365.25*(Y+4716)) + np.floor(30.6001*(M+1)) - 1524.5
@@ -396,14 +409,15 @@ def earth_heliocentric_position_calculation(julian):
     C5 = L5_terms[:, 2]
 
     JME = julian['ephemeris_millenium']
+    JMEterms = np.asarray(JME)[..., np.newaxis]    # periodic terms along the last axis
 
     # Compute the Earth Heliochentric longitude from the tabulated values.
-    L0 = np.sum(A0 * np.cos(B0 + (C0 * JME)))
-    L1 = np.sum(A1 * np.cos(B1 + (C1 * JME)))
-    L2 = np.sum(A2 * np.cos(B2 + (C2 * JME)))
-    L3 = np.sum(A3 * np.cos(B3 + (C3 * JME)))
-    L4 = np.sum(A4 * np.cos(B4 + (C4 * JME)))
-    L5 = A5 * np.cos(B5 + (C5 * JME))
+    L0 = np.sum(A0 * np.cos(B0 + (C0 * JMEterms)), axis=-1)
+    L1 = np.sum(A1 * np.cos(B1 + (C1 * JMEterms)), axis=-1)
+    L2 = np.sum(A2 * np.cos(B2 + (C2 * JMEterms)), axis=-1)
+    L3 = np.sum(A3 * np.cos(B3 + (C3 * JMEterms)), axis=-1)
+    L4 = np.sum(A4 * np.cos(B4 + (C4 * JMEterms)), axis=-1)
+    L5 = np.sum(A5 * np.cos(B5 + (C5 * JMEterms)), axis=-1)
 
     earth_heliocentric_position = dict()
     earth_heliocentric_position['longitude'] = (L0 + (L1 * JME) + (L2 * np.power(JME, 2)) +
@@ -435,8 +449,8 @@ def earth_heliocentric_position_calculation(julian):
     B1 = B1_terms[:, 1]
     C1 = B1_terms[:, 2]
     
-    L0 = np.sum(A0 * np.cos(B0 + (C0 * JME)))
-    L1 = np.sum(A1 * np.cos(B1 + (C1 * JME)))
+    L0 = np.sum(A0 * np.cos(B0 + (C0 * JMEterms)), axis=-1)
+    L1 = np.sum(A1 * np.cos(B1 + (C1 * JMEterms)), axis=-1)
 
     earth_heliocentric_position['latitude'] = (L0 + (L1 * JME)) / 1e8
 
@@ -534,11 +548,11 @@ def earth_heliocentric_position_calculation(julian):
     C4 = R4_terms[:, 2]
 
     # Compute the Earth heliocentric radius vector
-    L0 = np.sum(A0 * np.cos(B0 + (C0 * JME)))
-    L1 = np.sum(A1 * np.cos(B1 + (C1 * JME)))
-    L2 = np.sum(A2 * np.cos(B2 + (C2 * JME)))
-    L3 = np.sum(A3 * np.cos(B3 + (C3 * JME)))
-    L4 = A4 * np.cos(B4 + (C4 * JME))
+    L0 = np.sum(A0 * np.cos(B0 + (C0 * JMEterms)), axis=-1)
+    L1 = np.sum(A1 * np.cos(B1 + (C1 * JMEterms)), axis=-1)
+    L2 = np.sum(A2 * np.cos(B2 + (C2 * JMEterms)), axis=-1)
+    L3 = np.sum(A3 * np.cos(B3 + (C3 * JMEterms)), axis=-1)
+    L4 = np.sum(A4 * np.cos(B4 + (C4 * JMEterms)), axis=-1)
 
     # Units are in AU
     earth_heliocentric_position['radius'] = (L0 + (L1 * JME) + (L2 * np.power(JME, 2)) +
@@ -736,19 +750,20 @@ def nutation_calculation(julian):
 
     # Using the tabulated values, compute the delta_longitude and
     # delta_obliquity.
-    Xi = np.array([X0, X1, X2, X3, X4])    # a col mat in octave
+    Xi = np.stack(np.broadcast_arrays(X0, X1, X2, X3, X4), axis=-1)    # a col mat in octave, one row per time
 
-    tabulated_argument = Y_terms.dot(np.transpose(Xi)) * (np.pi/180)
+    tabulated_argument = Xi.dot(np.transpose(Y_terms)) * (np.pi/180)
 
-    delta_longitude = (nutation_terms[:, 0] + (nutation_terms[:, 1] * JCE)) * np.sin(tabulated_argument)
-    delta_obliquity = (nutation_terms[:, 2] + (nutation_terms[:, 3] * JCE)) * np.cos(tabulated_argument)
+    JCEterms = np.asarray(JCE)[..., np.newaxis]
+    delta_longitude = (nutation_terms[:, 0] + (nutation_terms[:, 1] * JCEterms)) * np.sin(tabulated_argument)
+    delta_obliquity = (nutation_terms[:, 2] + (nutation_terms[:, 3] * JCEterms)) * np.cos(tabulated_argument)
 
     nutation = dict()    # init nutation dictionary
     # Nutation in longitude
-    nutation['longitude'] = np.sum(delta_longitude) / 36000000
+    nutation['longitude'] = np.sum(delta_longitude, axis=-1) / 36000000
 
     # Nutation in obliquity
-    nutation['obliquity'] = np.sum(delta_obliquity) / 36000000
+    nutation['obliquity'] = np.sum(delta_obliquity, axis=-1) / 36000000
 
     return nutation
 
@@ -995,7 +1010,6 @@ def set_to_range(var, min_interval, max_interval):
     """
     var = var - max_interval * np.floor(var/max_interval)
 
-    if var < min_interval:
-        var = var + max_interval
+    var = np.where(var < min_interval, var + max_interval, var)
     return var
 
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Statistics of time series of rasters (e.g. the SOLWEIG outputs) updated one
+timestep at a time, so that the statistics of a run are available without
+saving the rasters of every timestep and reading them again.
+
+Each aggregate is updated with update(raster, daytime, hours), hours being
+the length of the timestep, and gives its raster with result(), None
+without any values (e.g. the nighttime mean of a run without nights).
+Percentiles are estimated with the P-square algorithm of Jain and Chlamtac
+(1985), which keeps five markers per pixel instead of all values. The
+accumulated values are returned by state() and set by restore(), e.g. for
+resuming a run.
+"""
+
+import numpy as np
+
+AGGREGATES = ['mean', 'daymean', 'nightmean', 'max', 'min', 'hoursabove', 'hoursbelow', 'percentile']
+
+NODATA = -9999.
+
+
+class Aggregate(object):
+    """
+    Statistic of variable, the attributes named in _state are accumulated.
+    Subclasses give filename, the file name (without extension) of the
+    result, e.g. 'Tmrt_max', and update and result.
+    """
+
+    _state = ()
+
+    def __init__(self, variable):
+        self.variable = variable
+
+    def state(self):
+        return dict((name, getattr(self, name)) for name in self._state if getattr(self, name) is not None)
+
+    def restore(self, state):
+        for name in self._state:
+            if name in state:
+                value = np.array(state[name])
+                setattr(self, name, value.item() if value.ndim == 0 else value)
+
+
+class Mean(Aggregate):
+    """Mean over all timesteps, or over the daytime or nighttime timesteps with period 'day' or 'night'."""
+
+    _state = ('total', 'count')
+
+    def __init__(self, variable, period=None):
+        Aggregate.__init__(self, variable)
+        self.period = period
+        self.total = None
+        self.count = 0
+
+    @property
+    def filename(self):
+        if self.period is None:
+            return self.variable + '_mean'
+        return self.variable + '_' + self.period + '_mean'
+
+    def update(self, raster, daytime, hours):
+        if (self.period == 'day' and not daytime) or (self.period == 'night' and daytime):
+            return
+        if self.total is None:
+            self.total = np.zeros(raster.shape)
+        self.total += raster
+        self.count += 1
+
+    def result(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+
+class Maximum(Aggregate):
+
+    _state = ('value',)
+
+    def __init__(self, variable):
+        Aggregate.__init__(self, variable)
+        self.value = None
+
+    @property
+    def filename(self):
+        return self.variable + '_max'
+
+    def update(self, raster, daytime, hours):
+        if self.value is None:
+            self.value = np.array(raster, dtype=float)
+        else:
+            np.maximum(self.value, raster, out=self.value)
+
+    def result(self):
+        return self.value
+
+
+class Minimum(Maximum):
+
+    @property
+    def filename(self):
+        return self.variable + '_min'
+
+    def update(self, raster, daytime, hours):
+        if self.value is None:
+            self.value = np.array(raster, dtype=float)
+        else:
+            np.minimum(self.value, raster, out=self.value)
+
+
+class Hours(Aggregate):
+    """Number of hours with values at or above threshold, or below threshold with below True."""
+
+    _state = ('hours',)
+
+    def __init__(self, variable, threshold, below=False):
+        Aggregate.__init__(self, variable)
+        self.threshold = threshold
+        self.below = below
+        self.hours = None
+
+    @property
+    def filename(self):
+        return '%s_hours_%s_%g' % (self.variable, 'below' if self.below else 'above', self.threshold)
+
+    def update(self, raster, daytime, hours):
+        if self.hours is None:
+            self.hours = np.zeros(raster.shape)
+        if self.below:
+            self.hours += (raster < self.threshold) * hours
+        else:
+            self.hours += (raster >= self.threshold) * hours
+
+    def result(self):
+        return self.hours
+
+
+class Percentile(Aggregate):
+    """Streaming estimate of the percentile (0 - 100) of each pixel (P-square algorithm)."""
+
+    _state = ('markers', 'positions', 'count')
+
+    def __init__(self, variable, percentile):
+        Aggregate.__init__(self, variable)
+        self.percentile = percentile
+        p = percentile / 100.
+        self.increments = np.array([0., p / 2., p, (1. + p) / 2., 1.])
+        self.markers = None
+        self.positions = None
+        self.count = 0
+
+    @property
+    def filename(self):
+        return '%s_p%g' % (self.variable, self.percentile)
+
+    def update(self, raster, daytime, hours):
+        if self.markers is None:
+            self.markers = np.zeros((5,) + raster.shape)
+            self.positions = np.zeros((5,) + raster.shape)
+        if self.count < 5:
+            # the first five values are kept, sorted as initial markers
+            self.markers[self.count] = raster
+            self.count += 1
+            if self.count == 5:
+                self.markers.sort(axis=0)
+                self.positions[:] = np.arange(5.)[:, np.newaxis, np.newaxis]
+            return
+
+        q = self.markers
+        n = self.positions
+        x = np.asarray(raster, dtype=float)
+        np.minimum(q[0], x, out=q[0])
+        np.maximum(q[4], x, out=q[4])
+        # cell of the new value and the positions of the markers above it
+        k = (x >= q[1]).astype(np.int8) + (x >= q[2]) + (x >= q[3])
+        n[1:] += np.arange(1, 5)[:, np.newaxis, np.newaxis] > k
+        self.count += 1
+        desired = (self.count - 1) * self.increments
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in (1, 2, 3):
+                d = desired[i] - n[i]
+                move = ((d >= 1) & (n[i + 1] - n[i] > 1)) | ((d <= -1) & (n[i - 1] - n[i] < -1))
+                if not np.any(move):
+                    continue
+                s = np.where(move, np.sign(d), 0.)
+                parabolic = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                qs = np.where(s > 0, q[i + 1], q[i - 1])
+                ns = np.where(s > 0, n[i + 1], n[i - 1])
+                linear = q[i] + s * (qs - q[i]) / (ns - n[i])
+                new = np.where((q[i - 1] < parabolic) & (parabolic < q[i + 1]), parabolic, linear)
+                q[i] = np.where(move, new, q[i])
+                n[i] += s
+
+    def result(self):
+        if self.count == 0:
+            return None
+        if self.count < 5:
+            return np.percentile(self.markers[:self.count], self.percentile, axis=0)
+        return self.markers[2].copy()
+
+
+def make_aggregates(names, variables, threshold=55., percentile=95.):
+    """Aggregates names (from AGGREGATES) of each of variables."""
+    aggregates = []
+    for variable in variables:
+        for name in names:
+            if name == 'mean':
+                aggregates.append(Mean(variable))
+            elif name == 'daymean':
+                aggregates.append(Mean(variable, 'day'))
+            elif name == 'nightmean':
+                aggregates.append(Mean(variable, 'night'))
+            elif name == 'max':
+                aggregates.append(Maximum(variable))
+            elif name == 'min':
+                aggregates.append(Minimum(variable))
+            elif name == 'hoursabove':
+                aggregates.append(Hours(variable, threshold))
+            elif name == 'hoursbelow':
+                aggregates.append(Hours(variable, threshold, below=True))
+            elif name == 'percentile':
+                aggregates.append(Percentile(variable, percentile))
+            else:
+                raise ValueError('Unknown aggregate: ' + str(name))
+    return aggregates
+
+
+def aggregate_states(aggregates):
+    """States of aggregates as one dict of arrays, e.g. to be saved with a snapshot."""
+    states = {}
+    for index, aggregate in enumerate(aggregates):
+        for name, value in aggregate.state().items():
+            states['aggregate%d_%s' % (index, name)] = value
+    return states
+
+
+def restore_aggregates(aggregates, states):
+    """Restore aggregates from a dict given by aggregate_states."""
+    for index, aggregate in enumerate(aggregates):
+        prefix = 'aggregate%d_' % index
+        aggregate.restore(dict((key[len(prefix):], value) for key, value in states.items() if key.startswith(prefix)))
+
+
+def aggregate_result(aggregate):
+    """Raster of aggregate, NODATA where there are no values."""
+    result = aggregate.result()
+    if result is None:
+        return None
+    return np.where(np.isfinite(result), result, NODATA)
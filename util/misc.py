@@ -58,4 +58,21 @@ def saverasternd(gdal_data, filename, raster):
 
     # georeference the image and set the projection
     outDs.SetGeoTransform(gdal_data.GetGeoTransform())
-    outDs.SetProjection(gdal_data.GetProjection())
\ No newline at end of file
+    outDs.SetProjection(gdal_data.GetProjection())
+
+
+def createraster(gdal_data, filename):
+    # Empty raster with the extent of gdal_data, to be written block by block (e.g. tiled processing)
+    rows = gdal_data.RasterYSize
+    cols = gdal_data.RasterXSize
+
+    outDs = gdal.GetDriverByName("GTiff").Create(filename, cols, rows, int(1), GDT_Float32,
+                                                 ['TILED=YES', 'BIGTIFF=IF_SAFER'])
+    outBand = outDs.GetRasterBand(1)
+    outBand.SetNoDataValue(-9999)
+
+    # georeference the image and set the projection
+    outDs.SetGeoTransform(gdal_data.GetGeoTransform())
+    outDs.SetProjection(gdal_data.GetProjection())
+
+    return outDs
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for running UMEP calculations in a pool of worker processes.
+
+Large input grids are handed to the workers through shared memory instead of
+being pickled, and progress and cancellation of the workers are forwarded to
+the QgsProcessingFeedback of the calling algorithm.
+"""
+
+import os
+import sys
+import weakref
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+_worker_state = {}
+
+
+def process_pool(workers):
+    """
+    Create a pool of worker processes together with the shared progress counter
+    and cancel event used by worker_feedback. The spawn start method is used since
+    the calling QGIS process runs threads (Qt, numba) that are not fork-safe. Inside
+    QGIS sys.executable is the QGIS binary, so the python interpreter of the same
+    installation is used to start the workers.
+    """
+    ctx = mp.get_context('spawn')
+    exe = os.path.basename(sys.executable).lower()
+    if not exe.startswith('python'):
+        if sys.platform == 'win32':
+            python = os.path.join(sys.exec_prefix, 'python.exe')
+        else:
+            python = os.path.join(sys.exec_prefix, 'bin', 'python3')
+        if os.path.isfile(python):
+            ctx.set_executable(python)
+    counter = ctx.Value('i', 0)
+    cancel = ctx.Event()
+    pool = ctx.Pool(processes=workers, initializer=_init_worker, initargs=(counter, cancel))
+    return pool, counter, cancel
+
+
+def _init_worker(counter, cancel):
+    _worker_state['counter'] = counter
+    _worker_state['cancel'] = cancel
+    # parallelism comes from the processes, avoid oversubscription by numba threads
+    try:
+        import numba
+        numba.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def worker_feedback():
+    """Feedback object for use inside a worker started by process_pool."""
+    return WorkerFeedback(_worker_state['counter'], _worker_state['cancel'])
+
+
+def share_arrays(arrays):
+    """
+    Copy a dict of numpy arrays into shared memory blocks. Returns the blocks
+    (to be closed and unlinked by the caller with release_arrays), views of the
+    shared arrays and a picklable description used by attach_arrays.
+    """
+    blocks = []
+    shared = {}
+    descriptors = {}
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        blocks.append(block)
+        shared[name] = view
+        descriptors[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, shared, descriptors
+
+
+def share_zeros(specs):
+    """
+    Zero-filled arrays in shared memory for results written by the workers,
+    {name: (shape, dtype)}. Returns the arrays and a description for attach_arrays.
+    Each block is closed and unlinked once its array (and every view of it) is
+    freed, so the arrays can be handed to the caller without a copy.
+    """
+    arrays = {}
+    descriptors = {}
+    for name, (shape, dtype) in specs.items():
+        dtype = np.dtype(dtype)
+        # new shared memory is zero-filled by the operating system
+        block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        weakref.finalize(arrays[name], release_arrays, [block])
+        descriptors[name] = (block.name, tuple(shape), dtype.str)
+    return arrays, descriptors
+
+
+def attach_arrays(descriptors):
+    """Attach to arrays created by share_arrays or share_zeros (in a worker process)."""
+    blocks = []
+    arrays = {}
+    for name, (blockname, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name=blockname)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def release_arrays(blocks, unlink=True):
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+class WorkerFeedback(object):
+    """
+    Minimal stand-in for QgsProcessingFeedback inside worker processes. Every
+    call to setProgress counts one finished work item in a shared counter, and
+    isCanceled reflects the cancel event set by the parent process.
+    """
+
+    def __init__(self, counter, cancel):
+        self.counter = counter
+        self.cancel = cancel
+
+    def isCanceled(self):
+        return self.cancel.is_set()
+
+    def setProgress(self, progress):
+        with self.counter.get_lock():
+            self.counter.value += 1
+
+    def setProgressText(self, text):
+        pass
+
+    def pushInfo(self, text):
+        pass
+
+
+def run_in_pool(pool, func, tasks, feedback, counter, cancel, total, interval=0.5):
+    """
+    Run func over tasks in the pool while forwarding progress (counter / total)
+    and cancellation to feedback. Results are returned in the order of tasks,
+    independent of the order in which the workers finish.
+    """
+    result = pool.map_async(func, tasks, chunksize=1)
+    while not result.ready():
+        result.wait(interval)
+        if feedback.isCanceled():
+            cancel.set()
+        feedback.setProgress(int(counter.value * (100. / total)))
+    return result.get()
+
+
+def imap_in_pool(pool, func, tasks, feedback, counter, cancel, total, interval=0.5):
+    """
+    As run_in_pool, but yielding the results in the order of tasks as soon as a
+    result and all results before it are available, while later tasks are
+    still running.
+    """
+    results = pool.imap(func, tasks, chunksize=1)
+    for _ in range(len(tasks)):
+        while True:
+            try:
+                result = results.next(interval)
+                break
+            except mp.TimeoutError:
+                if feedback.isCanceled():
+                    cancel.set()
+                feedback.setProgress(int(counter.value * (100. / total)))
+        yield result
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming writer for time series of rasters (e.g. the SOLWEIG outputs).
+
+In the 'files' mode every timestep of a variable is saved as a separate
+GeoTIFF, as done by saveraster. In the other modes one dataset per variable
+is kept open during the run and every timestep is appended to it:
+
+    'multiband' - tiled, deflate compressed GeoTIFF with one band per timestep
+    'cog'       - as 'multiband', converted to a Cloud Optimised GeoTIFF when closed
+    'netcdf'    - CF NetCDF with a time dimension, chunked along time (needs netCDF4)
+
+Writing is done by a background thread, so that the model loop does not wait
+for the disk. All GDAL and netCDF4 objects are only touched by that thread.
+With resume True, datasets left by an earlier (interrupted) run are opened for
+update instead of being created, so that a resumed run fills in the remaining
+timesteps.
+"""
+
+import datetime
+import os
+import queue
+import threading
+
+import numpy as np
+from osgeo import gdal, osr
+from osgeo.gdalconst import *
+
+from .misc import saveraster
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+OUTPUT_FORMATS = ['files', 'multiband', 'cog', 'netcdf']
+
+NODATA = -9999.
+
+
+class RasterWriter(object):
+    """
+    Writer for rasters with the extent and projection of gdal_data, saved in
+    folder. ntimes is the number of timesteps written per variable. With
+    background False everything is written in the calling thread.
+    """
+
+    def __init__(self, gdal_data, folder, mode='files', ntimes=1, background=True, queuesize=8, resume=False):
+        if mode not in OUTPUT_FORMATS:
+            raise ValueError('Unknown output format: ' + str(mode))
+        if mode == 'netcdf' and netCDF4 is None:
+            raise ImportError('NetCDF output requires the python package netCDF4')
+        self.gdal_data = gdal_data
+        self.folder = folder
+        self.mode = mode
+        self.ntimes = ntimes
+        self.resume = resume
+        self.rows = gdal_data.RasterYSize
+        self.cols = gdal_data.RasterXSize
+        self.geotransform = gdal_data.GetGeoTransform()
+        self.projection = gdal_data.GetProjection()
+        self.datasets = {}
+        self.error = None
+        self.failed = False
+        self.thread = None
+        if background:
+            # bounded, so that a slow disk holds back the model instead of filling the memory
+            self.queue = queue.Queue(maxsize=queuesize)
+            self.thread = threading.Thread(target=self._run, name='RasterWriter')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def write(self, name, index, stamp, time, raster):
+        """
+        Write raster of variable name for timestep index (0 based). stamp is the
+        file name suffix / band description (e.g. '2021_172_1200D') and time the
+        datetime of the timestep.
+        """
+        self._check()
+        # the model reuses some of its arrays, hand a copy to the writer thread
+        raster = np.array(raster, dtype=np.float32)
+        if self.thread is None:
+            self._write(name, index, stamp, time, raster)
+        else:
+            self.queue.put((name, index, stamp, time, raster))
+
+    def flush(self):
+        """Wait until everything written so far is on disk."""
+        self._check()
+        if self.thread is None:
+            self._flush()
+        else:
+            self.queue.put('flush')
+            self.queue.join()
+        self._check()
+
+    def close(self):
+        """Wait for all queued rasters and close the datasets."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        try:
+            self._check()
+        finally:
+            for name in list(self.datasets):
+                self._close(name)
+
+    def filename(self, name, stamp=None):
+        if self.mode == 'files':
+            return os.path.join(self.folder, name + '_' + stamp + '.tif')
+        if self.mode == 'netcdf':
+            return os.path.join(self.folder, name + '.nc')
+        return os.path.join(self.folder, name + '.tif')
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            # after an error keep emptying the queue, so that write() does not block forever,
+            # also once the error has been raised in the calling thread
+            if not self.failed:
+                try:
+                    if item == 'flush':
+                        self._flush()
+                    else:
+                        self._write(*item)
+                except Exception as e:
+                    self.failed = True
+                    self.error = e
+            self.queue.task_done()
+
+    def _flush(self):
+        for dataset in self.datasets.values():
+            if self.mode == 'netcdf':
+                dataset.sync()
+            else:
+                dataset.FlushCache()
+
+    def _write(self, name, index, stamp, time, raster):
+        if self.mode == 'files':
+            saveraster(self.gdal_data, self.filename(name, stamp), raster)
+            return
+        if name not in self.datasets:
+            self.datasets[name] = self._create(name, time)
+        if self.mode == 'netcdf':
+            dataset = self.datasets[name]
+            dataset.variables['time'][index] = netCDF4.date2num(time, dataset.variables['time'].units)
+            dataset.variables[name][index, :, :] = raster
+        else:
+            band = self.datasets[name].GetRasterBand(int(index) + 1)
+            band.WriteArray(raster, 0, 0)
+            band.SetDescription(stamp)
+            band.SetMetadataItem('DATETIME', time.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    def _create(self, name, time):
+        if self.mode == 'netcdf':
+            if self.resume and os.path.isfile(self.filename(name)):
+                return netCDF4.Dataset(self.filename(name), 'a')
+            return self._create_netcdf(name, time)
+        filename = self.filename(name)
+        if self.mode == 'cog':
+            filename = filename + '.tmp.tif'
+        if self.resume and os.path.isfile(filename):
+            dataset = gdal.Open(filename, GA_Update)
+            if dataset is not None and dataset.RasterCount == int(self.ntimes):
+                return dataset
+            dataset = None
+        options = ['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256', 'COMPRESS=DEFLATE', 'PREDICTOR=3',
+                   'INTERLEAVE=BAND', 'BIGTIFF=IF_SAFER']
+        dataset = gdal.GetDriverByName('GTiff').Create(filename, self.cols, self.rows, int(self.ntimes),
+                                                       GDT_Float32, options)
+        dataset.SetGeoTransform(self.geotransform)
+        dataset.SetProjection(self.projection)
+        # bands of timesteps never written (cancelled run) read as nodata
+        for band in range(int(self.ntimes)):
+            dataset.GetRasterBand(band + 1).SetNoDataValue(NODATA)
+        return dataset
+
+    def _create_netcdf(self, name, time):
+        dataset = netCDF4.Dataset(self.filename(name), 'w', format='NETCDF4')
+        dataset.Conventions = 'CF-1.7'
+        dataset.source = 'UMEP'
+        dataset.createDimension('time', None)
+        dataset.createDimension('y', self.rows)
+        dataset.createDimension('x', self.cols)
+
+        times = dataset.createVariable('time', 'f8', ('time',))
+        times.units = time.strftime('hours since %Y-%m-%d 00:00:00')
+        times.calendar = 'standard'
+        times.standard_name = 'time'
+
+        gt = self.geotransform
+        x = dataset.createVariable('x', 'f8', ('x',))
+        x[:] = gt[0] + (np.arange(self.cols) + 0.5) * gt[1]
+        x.standard_name = 'projection_x_coordinate'
+        y = dataset.createVariable('y', 'f8', ('y',))
+        y[:] = gt[3] + (np.arange(self.rows) + 0.5) * gt[5]
+        y.standard_name = 'projection_y_coordinate'
+
+        crs = dataset.createVariable('crs', 'i4')
+        crs.spatial_ref = self.projection
+        crs.crs_wkt = self.projection
+        crs.GeoTransform = ' '.join(str(v) for v in gt)
+        srs = osr.SpatialReference(wkt=self.projection)
+        if srs.IsProjected():
+            units = srs.GetLinearUnitsName()
+            x.units = units
+            y.units = units
+
+        # one chunk holds a block of timesteps, so that reading the series of a pixel touches few chunks
+        chunks = (min(24, max(1, int(self.ntimes))), min(256, self.rows), min(256, self.cols))
+        variable = dataset.createVariable(name, 'f4', ('time', 'y', 'x'), zlib=True, complevel=4, shuffle=True,
+                                          chunksizes=chunks, fill_value=NODATA)
+        variable.grid_mapping = 'crs'
+        return dataset
+
+    def _close(self, name):
+        dataset = self.datasets.pop(name)
+        if self.mode == 'netcdf':
+            dataset.close()
+            return
+        dataset.FlushCache()
+        dataset = None
+        if self.mode == 'cog':
+            tempname = self.filename(name) + '.tmp.tif'
+            if gdal.GetDriverByName('COG') is None:
+                # GDAL older than 3.1, keep the tiled GeoTIFF
+                os.replace(tempname, self.filename(name))
+                return
+            gdal.Translate(self.filename(name), tempname, format='COG',
+                           creationOptions=['COMPRESS=DEFLATE', 'PREDICTOR=YES', 'BIGTIFF=IF_SAFER'])
+            os.remove(tempname)
+
+
+def timestep_datetime(year, doy, hour, minute):
+    """datetime of a timestep given as year, day of year, hour and minute."""
+    return datetime.datetime(int(year), 1, 1) + datetime.timedelta(days=int(doy) - 1, hours=int(hour),
+                                                                   minutes=int(minute))
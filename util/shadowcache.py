@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of the shadows cast by shadowingfunction_wallheight_23,
+shadowingfunction_wallheight_13 (and shadowingfunction_20 and
+shadowingfunctionglobalradiation without wall shadows), shared by SOLWEIG,
+SEBE and the shadow generator.
+
+Entries are content addressed: the key combines a hash of the DSM and walls,
+a hash of the vegetation grids and the sun position quantised to the cache
+tolerance (degrees). Shadows are always cast for the quantised sun position,
+so a result read from the cache is identical to a freshly calculated one,
+independent of which run filled the cache. Binary masks are bit-packed and
+every entry is stored as a compressed npz. When the cache grows beyond its
+size limit, the least recently used entries are removed.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from . import shadowingfunctions as shadow
+from .SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_13 import shadowingfunction_wallheight_13
+from .SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_23 import shadowingfunction_wallheight_23
+
+
+def array_hash(*arrays):
+    """Content hash of a set of arrays (None entries allowed)."""
+    digest = hashlib.sha1()
+    for array in arrays:
+        if array is None:
+            digest.update(b'None')
+            continue
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode())
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+def pack_arrays(arrays):
+    """Dict for np.savez with binary (0/1) arrays bit-packed."""
+    packed = {}
+    for n, array in enumerate(arrays):
+        array = np.asarray(array)
+        if array.dtype != bool and np.all((array == 0) | (array == 1)):
+            packed['bits%d' % n] = np.packbits(array.ravel() == 1)
+            packed['shape%d' % n] = np.array(array.shape)
+            packed['dtype%d' % n] = np.array(array.dtype.str)
+        else:
+            packed['array%d' % n] = array
+    return packed
+
+
+def unpack_arrays(data, count):
+    arrays = []
+    for n in range(count):
+        if 'array%d' % n in data:
+            arrays.append(data['array%d' % n])
+        else:
+            shape = tuple(data['shape%d' % n])
+            bits = np.unpackbits(data['bits%d' % n], count=int(np.prod(shape)))
+            arrays.append(bits.reshape(shape).astype(np.dtype(str(data['dtype%d' % n]))))
+    return tuple(arrays)
+
+
+class ShadowCache(object):
+    """
+    Shadow cache in folder, limited to maxsize megabytes. tolerance is the step
+    (degrees) to which azimuth and altitude are rounded, 0 disables rounding.
+    """
+
+    def __init__(self, folder, tolerance=0.1, maxsize=2048):
+        self.folder = folder
+        self.tolerance = tolerance
+        self.maxsize = maxsize * 1024 ** 2
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.size = sum(os.path.getsize(f) for f in self._entries())
+
+    def _entries(self):
+        return [os.path.join(self.folder, name) for name in os.listdir(self.folder) if name.endswith('.npz')]
+
+    def quantise(self, angle):
+        if self.tolerance <= 0:
+            return float(angle)
+        return float(np.round(angle / self.tolerance) * self.tolerance)
+
+    def surface(self, dsm, walls, aspect, scale, vegdem=None, vegdem2=None, bush=None, amaxvalue=None):
+        """Cached shadow functions for one surface (aspect in radians as for the shadow functions)."""
+        return CachedShadows(self, dsm, walls, aspect, scale, vegdem, vegdem2, bush, amaxvalue)
+
+    def get(self, key, count):
+        filename = os.path.join(self.folder, key + '.npz')
+        try:
+            with np.load(filename) as data:
+                arrays = unpack_arrays(data, count)
+            os.utime(filename, None)
+        except (IOError, OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        filename = os.path.join(self.folder, key + '.npz')
+        fd, tempname = tempfile.mkstemp(suffix='.tmp', dir=self.folder)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, **pack_arrays(arrays))
+        try:
+            replaced = os.path.getsize(filename)
+        except OSError:
+            replaced = 0
+        # atomic, so that concurrent runs sharing the cache never see partial entries
+        os.replace(tempname, filename)
+        self.size += os.path.getsize(filename) - replaced
+        if self.size > self.maxsize:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache is below 90% of its size limit."""
+        entries = []
+        for filename in self._entries():
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        entries.sort()
+        self.size = sum(entry[1] for entry in entries)
+        for _, size, filename in entries:
+            if self.size <= 0.9 * self.maxsize:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            self.size -= size
+
+
+class CachedShadows(object):
+    """Shadow functions of a ShadowCache bound to one DSM, wall and vegetation setup."""
+
+    def __init__(self, cache, dsm, walls, aspect, scale, vegdem, vegdem2, bush, amaxvalue):
+        self.cache = cache
+        self.dsm = dsm
+        self.walls = walls
+        self.aspect = aspect
+        self.scale = scale
+        self.vegdem = vegdem
+        self.vegdem2 = vegdem2
+        self.bush = bush
+        self.amaxvalue = amaxvalue
+        self.dsmhash = array_hash(dsm, walls, aspect, np.array(scale, dtype=float))
+        if vegdem is None:
+            self.veghash = 'none'
+        else:
+            self.veghash = array_hash(vegdem, vegdem2, bush, np.array(amaxvalue, dtype=float))
+
+    def _key(self, name, azimuth, altitude):
+        key = '%s-%s-%s-%.6f-%.6f' % (name, self.dsmhash, self.veghash, azimuth, altitude)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def wallheight_23(self, azimuth, altitude):
+        """Cached shadowingfunction_wallheight_23 (vegsh, sh, vbshvegsh, wallsh, wallsun, wallshve, facesh, facesun)."""
+        azimuth = self.cache.quantise(azimuth)
+        altitude = self.cache.quantise(altitude)
+        key = self._key('wallheight_23', azimuth, altitude)
+        result = self.cache.get(key, 8)
+        if result is None:
+            result = shadowingfunction_wallheight_23(self.dsm, self.vegdem, self.vegdem2, azimuth, altitude, self.scale,
+                                                     self.amaxvalue, self.bush, self.walls, self.aspect)
+            self.cache.put(key, result)
+        return result
+
+    def wallheight_13(self, azimuth, altitude):
+        """Cached shadowingfunction_wallheight_13 (sh, wallsh, wallsun, facesh, facesun)."""
+        azimuth = self.cache.quantise(azimuth)
+        altitude = self.cache.quantise(altitude)
+        key = self._key('wallheight_13', azimuth, altitude)
+        result = self.cache.get(key, 5)
+        if result is None:
+            result = shadowingfunction_wallheight_13(self.dsm, azimuth, altitude, self.scale, self.walls, self.aspect)
+            self.cache.put(key, result)
+        return result
+
+    def shadowingfunction_20(self, azimuth, altitude):
+        """Cached shadowingfunction_20 without progress feedback ({'sh', 'vegsh', 'vbshvegsh'})."""
+        azimuth = self.cache.quantise(azimuth)
+        altitude = self.cache.quantise(altitude)
+        key = self._key('shadowingfunction_20', azimuth, altitude)
+        result = self.cache.get(key, 3)
+        if result is None:
+            result = shadow.shadowingfunction_20(self.dsm, self.vegdem, self.vegdem2, azimuth, altitude, self.scale,
+                                                 self.amaxvalue, self.bush, None, 1)
+            result = (result['sh'], result['vegsh'], result['vbshvegsh'])
+            self.cache.put(key, result)
+        return dict(zip(('sh', 'vegsh', 'vbshvegsh'), result))
+
+    def globalradiation(self, azimuth, altitude):
+        """Cached shadowingfunctionglobalradiation without progress feedback (sh)."""
+        azimuth = self.cache.quantise(azimuth)
+        altitude = self.cache.quantise(altitude)
+        key = self._key('globalradiation', azimuth, altitude)
+        result = self.cache.get(key, 1)
+        if result is None:
+            result = (shadow.shadowingfunctionglobalradiation(self.dsm, azimuth, altitude, self.scale, None, 1),)
+            self.cache.put(key, result)
+        return result[0]
@@ -1,9 +1,29 @@
 # -*- coding: utf-8 -*-
 # Ready for python action!
 import numpy as np
+from . import shadowingfunctions_numba as shadow_numba
 # import matplotlib.pylab as plt
 # from numba import jit
 
+# Backend used for casting shadows on buildings and vegetation. 'numpy' is the
+# reference implementation, 'numba' the compiled kernel in shadowingfunctions_numba.
+SHADOW_BACKENDS = ('numpy', 'numba')
+_shadow_backend = 'numba' if shadow_numba.NUMBA_AVAILABLE else 'numpy'
+
+
+def set_shadow_backend(backend):
+    global _shadow_backend
+    if backend not in SHADOW_BACKENDS:
+        raise ValueError('Unknown shadow backend: ' + str(backend))
+    if backend == 'numba' and not shadow_numba.NUMBA_AVAILABLE:
+        raise ValueError("'numba' Python package is missing. Use the 'numpy' shadow backend instead.")
+    _shadow_backend = backend
+
+
+def get_shadow_backend():
+    return _shadow_backend
+
+
 def shadowingfunctionglobalradiation(a, azimuth, altitude, scale, feedback, forsvf):
 
     #%This m.file calculates shadows on a DEM
@@ -106,7 +126,17 @@ def shadowingfunction_20(a, vegdem, vegdem2, azimuth, altitude, scale, amaxvalue
     degrees = np.pi/180.
     azimuth = azimuth * degrees
     altitude = altitude * degrees
-    
+
+    if _shadow_backend == 'numba':
+        _, sh, vegsh, vbshvegsh, _ = shadow_numba.cast_shadows(a, vegdem, vegdem2, azimuth, altitude, scale, amaxvalue,
+                                                               bush, False, feedback if forsvf == 0 else None)
+        sh = 1.-sh
+        vbshvegsh[(vbshvegsh > 0.)] = 1.
+        vbshvegsh = vbshvegsh-vegsh
+        vegsh = 1.-vegsh
+        vbshvegsh = 1.-vbshvegsh
+        return {'sh': sh, 'vegsh': vegsh, 'vbshvegsh': vbshvegsh}
+
     # measure the size of grid
     sizex = a.shape[0]
     sizey = a.shape[1]
@@ -256,6 +286,49 @@ def shadowingfunction_20(a, vegdem, vegdem2, azimuth, altitude, scale, amaxvalue
     return shadowresult
 
 
+def shadowingfunction_20_batch(a, vegdem, vegdem2, sunpositions, scale, amaxvalue, bush, usevegdem, feedback):
+    """
+    Cast shadows for a list of (azimuth, altitude) pairs, e.g. the sky patches of the
+    sky view factor calculation. Yields (n, sh, vegsh, vbshvegsh) where n is the position
+    of the pair in sunpositions. With the numba backend all patches sharing the same
+    azimuth are cast in one sweep over the DSM and yielded together, otherwise the
+    pairs are processed one at a time in the given order. Without vegetation
+    (usevegdem == 0) only sh is calculated, as in shadowingfunctionglobalradiation.
+    """
+    degrees = np.pi/180.
+
+    if _shadow_backend != 'numba':
+        for n, (azimuth, altitude) in enumerate(sunpositions):
+            if usevegdem == 1:
+                shadowresult = shadowingfunction_20(a, vegdem, vegdem2, azimuth, altitude, scale, amaxvalue, bush,
+                                                    feedback, 1)
+                yield n, shadowresult['sh'], shadowresult['vegsh'], shadowresult['vbshvegsh']
+            else:
+                yield n, shadowingfunctionglobalradiation(a, azimuth, altitude, scale, feedback, 1), None, None
+        return
+
+    # group patches by azimuth, keeping the order of first appearance
+    groups = {}
+    for n, (azimuth, altitude) in enumerate(sunpositions):
+        groups.setdefault(azimuth, []).append(n)
+
+    if usevegdem != 1:
+        amaxvalue = a.max()
+
+    for azimuth, members in groups.items():
+        altitudes = [sunpositions[n][1] * degrees for n in members]
+        f, sh, vegsh, vbshvegsh = shadow_numba.cast_shadows_batch(a, vegdem, vegdem2, azimuth * degrees, altitudes,
+                                                                  scale, amaxvalue, bush, usevegdem == 1)
+        for m, n in enumerate(members):
+            if usevegdem == 1:
+                vbsh = vbshvegsh[m]
+                vbsh[(vbsh > 0.)] = 1.
+                vbsh = vbsh-vegsh[m]
+                yield n, 1.-sh[m], 1.-vegsh[m], 1.-vbsh
+            else:
+                yield n, np.double(np.logical_not(f[m]-a)), None, None
+
+
 def shadowingfunction_20_old(a, vegdem, vegdem2, azimuth, altitude, scale, amaxvalue, bush, dlg, forsvf):
 
     #% This function casts shadows on buildings and vegetation units
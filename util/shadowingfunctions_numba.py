@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled shadow casting kernels used by shadowingfunction_20 and
+shadowingfunction_wallheight_23.
+
+The NumPy implementations in shadowingfunctions.py and
+SEBESOLWEIGCommonFiles/shadowingfunction_wallheight_23.py are the reference.
+The kernel below performs one step of the same `while amaxvalue >= dz` loop,
+but fuses the shift, fmax and vegetation tests into a single pass over the
+grid instead of allocating and zeroing full-grid temporaries. Inputs are
+expected as float64 (as read by all UMEP tools) for bit-identical results.
+"""
+
+import numpy as np
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+    prange = range
+
+
+def shadow_steps(azimuth, altitude, scale, amaxvalue, sizex, sizey):
+    """
+    Yield the per-step window offsets of the shadow casting loop.
+
+    azimuth and altitude are given in radians. Each step is returned as
+    (xc1, xc2, yc1, yc2, xp1, xp2, yp1, yp2, dz), i.e. source window
+    [xc1:xc2, yc1:yc2] is shifted to [xp1:xp2, yp1:yp2] and lowered by dz.
+    The arithmetic mirrors the reference loop exactly.
+    """
+    pibyfour = np.pi / 4.
+    threetimespibyfour = 3. * pibyfour
+    fivetimespibyfour = 5. * pibyfour
+    seventimespibyfour = 7. * pibyfour
+    sinazimuth = np.sin(azimuth)
+    cosazimuth = np.cos(azimuth)
+    tanazimuth = np.tan(azimuth)
+    signsinazimuth = np.sign(sinazimuth)
+    signcosazimuth = np.sign(cosazimuth)
+    with np.errstate(divide='ignore'):
+        dssin = np.abs((1. / sinazimuth))
+        dscos = np.abs((1. / cosazimuth))
+    tanaltitudebyscale = np.tan(altitude) / scale
+
+    dx = 0.
+    dy = 0.
+    dz = 0.
+    index = 0.
+    while (amaxvalue >= dz) and (np.abs(dx) < sizex) and (np.abs(dy) < sizey):
+        if ((pibyfour <= azimuth) and (azimuth < threetimespibyfour) or (fivetimespibyfour <= azimuth) and (azimuth < seventimespibyfour)):
+            dy = signsinazimuth * index
+            with np.errstate(divide='ignore'):
+                dx = -1. * signcosazimuth * np.abs(np.round(index / tanazimuth))
+            ds = dssin
+        else:
+            dy = signsinazimuth * np.abs(np.round(index * tanazimuth))
+            dx = -1. * signcosazimuth * index
+            ds = dscos
+        dz = (ds * index) * tanaltitudebyscale
+        absdx = np.abs(dx)
+        absdy = np.abs(dy)
+        xc1 = int((dx + absdx) / 2.)
+        xc2 = int(sizex + (dx - absdx) / 2.)
+        yc1 = int((dy + absdy) / 2.)
+        yc2 = int(sizey + (dy - absdy) / 2.)
+        xp1 = int(-((dx - absdx) / 2.))
+        xp2 = int(sizex - (dx + absdx) / 2.)
+        yp1 = int(-((dy - absdy) / 2.))
+        yp2 = int(sizey - (dy + absdy) / 2.)
+
+        yield xc1, xc2, yc1, yc2, xp1, xp2, yp1, yp2, dz
+
+        index += 1.
+
+
+@njit(inline='always')
+def _cast_pixel(ai, temp, tempvegdem, tempvegdem2, templastfabovea, templastgabovea, fi, shi, vi):
+    """Update the building (f, sh) and vegetation (vegsh) state of one pixel."""
+    # Moving building shadow (np.fmax semantics)
+    if temp > fi or fi != fi:
+        fi = temp
+    if fi > ai:
+        shi = 1.
+    elif fi <= ai:
+        shi = 0.
+
+    # Vegetation above DEM, including the pergola condition
+    count = 0
+    if tempvegdem > ai:
+        count += 1
+    if tempvegdem2 > ai:
+        count += 1
+    if templastfabovea > ai:
+        count += 1
+    if templastgabovea > ai:
+        count += 1
+    if count > 0 and count < 4 and vi < 1.:
+        vi = 1.
+    if vi * shi > 0.:
+        vi = 0.
+
+    return fi, shi, vi
+
+
+@njit(parallel=True, cache=True)
+def cast_shadow_step(a, vegdem, vegdem2, f, sh, vegsh, vbshvegsh, shvoveg, usevolume,
+                     xc1, yc1, xp1, xp2, yp1, yp2, dz, dzprev):
+    """
+    One step of the shadow casting loop, updating f, sh, vegsh, vbshvegsh
+    and (if usevolume) shvoveg in place. Pixels outside the shifted window
+    see a zero-valued shifted surface, as in the reference implementation.
+    """
+    sizex = a.shape[0]
+    sizey = a.shape[1]
+    for i in prange(sizex):
+        inx = (i >= xp1) and (i < xp2)
+        si = i - xp1 + xc1
+        for j in range(sizey):
+            if inx and (j >= yp1) and (j < yp2):
+                sj = j - yp1 + yc1
+                temp = a[si, sj] - dz
+                tempvegdem = vegdem[si, sj] - dz
+                tempvegdem2 = vegdem2[si, sj] - dz
+                templastfabovea = vegdem[si, sj] - dzprev
+                templastgabovea = vegdem2[si, sj] - dzprev
+            else:
+                temp = 0.
+                tempvegdem = 0.
+                tempvegdem2 = 0.
+                templastfabovea = 0.
+                templastgabovea = 0.
+
+            if usevolume:
+                vi = shvoveg[i, j]
+                if tempvegdem > vi or vi != vi:
+                    shvoveg[i, j] = tempvegdem
+            fi, shi, vi = _cast_pixel(a[i, j], temp, tempvegdem, tempvegdem2, templastfabovea, templastgabovea,
+                                      f[i, j], sh[i, j], vegsh[i, j])
+            f[i, j] = fi
+            sh[i, j] = shi
+            vegsh[i, j] = vi
+            vbshvegsh[i, j] += vi
+
+
+def cast_shadows(a, vegdem, vegdem2, azimuth, altitude, scale, amaxvalue, bush, usevolume=False, feedback=None):
+    """
+    Run the full shadow casting loop with the compiled kernel.
+
+    azimuth and altitude are given in radians. Returns the raw loop state
+    (f, sh, vegsh, vbshvegsh, shvoveg) before the final inversions so that
+    both shadowingfunction_20 and shadowingfunction_wallheight_23 can apply
+    their own post-processing. shvoveg is None unless usevolume is True.
+    """
+    a = np.ascontiguousarray(a, dtype=np.float64)
+    vegdem = np.ascontiguousarray(vegdem, dtype=np.float64)
+    vegdem2 = np.ascontiguousarray(vegdem2, dtype=np.float64)
+    sizex = a.shape[0]
+    sizey = a.shape[1]
+
+    f = np.copy(a)
+    sh = np.zeros((sizex, sizey))
+    vbshvegsh = np.zeros((sizex, sizey))
+    vegsh = np.add(np.zeros((sizex, sizey)), bush > 1., dtype=float)
+    if usevolume:
+        shvoveg = np.copy(vegdem)
+    else:
+        shvoveg = np.zeros((1, 1))
+
+    if feedback is not None:
+        total = 100. / np.max([sizex, sizey])
+        feedback.setProgress(0)
+
+    dzprev = 0.
+    for index, (xc1, xc2, yc1, yc2, xp1, xp2, yp1, yp2, dz) in enumerate(shadow_steps(azimuth, altitude, scale, amaxvalue, sizex, sizey)):
+        if feedback is not None:
+            feedback.setProgress(int(index * total))
+        cast_shadow_step(a, vegdem, vegdem2, f, sh, vegsh, vbshvegsh, shvoveg, usevolume,
+                         xc1, yc1, xp1, xp2, yp1, yp2, dz, dzprev)
+        dzprev = dz
+
+    if not usevolume:
+        shvoveg = None
+
+    return f, sh, vegsh, vbshvegsh, shvoveg
+
+
+@njit(parallel=True, cache=True)
+def cast_shadow_step_batch(a, vegdem, vegdem2, f, sh, vegsh, vbshvegsh, usevegdem, nactive,
+                           xc1, yc1, xp1, xp2, yp1, yp2, dz, dzprev):
+    """
+    One step of the shadow casting loop for several sun altitudes sharing the
+    same azimuth. The shifted window is identical for all of them, so each
+    source row is read once per step while the first nactive members of the
+    (n, rows, cols) state arrays are updated with their own dz and dzprev.
+    """
+    sizex = a.shape[0]
+    sizey = a.shape[1]
+    for i in prange(sizex):
+        inx = (i >= xp1) and (i < xp2)
+        si = i - xp1 + xc1
+        for m in range(nactive):
+            dzm = dz[m]
+            dzprevm = dzprev[m]
+            for j in range(sizey):
+                inside = inx and (j >= yp1) and (j < yp2)
+                if inside:
+                    sj = j - yp1 + yc1
+                    temp = a[si, sj] - dzm
+                else:
+                    temp = 0.
+                if not usevegdem:
+                    fi = f[m, i, j]
+                    if temp > fi or fi != fi:
+                        f[m, i, j] = temp
+                    continue
+                if inside:
+                    tempvegdem = vegdem[si, sj] - dzm
+                    tempvegdem2 = vegdem2[si, sj] - dzm
+                    templastfabovea = vegdem[si, sj] - dzprevm
+                    templastgabovea = vegdem2[si, sj] - dzprevm
+                else:
+                    tempvegdem = 0.
+                    tempvegdem2 = 0.
+                    templastfabovea = 0.
+                    templastgabovea = 0.
+                fi, shi, vi = _cast_pixel(a[i, j], temp, tempvegdem, tempvegdem2, templastfabovea,
+                                          templastgabovea, f[m, i, j], sh[m, i, j], vegsh[m, i, j])
+                f[m, i, j] = fi
+                sh[m, i, j] = shi
+                vegsh[m, i, j] = vi
+                vbshvegsh[m, i, j] += vi
+
+
+def cast_shadows_batch(a, vegdem, vegdem2, azimuth, altitudes, scale, amaxvalue, bush, usevegdem):
+    """
+    Run the shadow casting loop for one azimuth and several altitudes in a
+    single sweep. azimuth and altitudes are given in radians. Returns the raw
+    loop state stacks (f, sh, vegsh, vbshvegsh), one layer per altitude in
+    the given order. Without vegetation only f is updated and the other
+    stacks are None.
+    """
+    a = np.ascontiguousarray(a, dtype=np.float64)
+    if usevegdem:
+        vegdem = np.ascontiguousarray(vegdem, dtype=np.float64)
+        vegdem2 = np.ascontiguousarray(vegdem2, dtype=np.float64)
+    else:
+        vegdem = a
+        vegdem2 = a
+    sizex = a.shape[0]
+    sizey = a.shape[1]
+
+    schedules = [list(shadow_steps(azimuth, altitude, scale, amaxvalue, sizex, sizey)) for altitude in altitudes]
+    # members with the longest loops first, so that the active members are always a prefix
+    order = sorted(range(len(altitudes)), key=lambda m: -len(schedules[m]))
+    schedules = [schedules[m] for m in order]
+    nmembers = len(order)
+
+    f = np.repeat(a[np.newaxis, :, :], nmembers, axis=0)
+    if usevegdem:
+        sh = np.zeros((nmembers, sizex, sizey))
+        vbshvegsh = np.zeros((nmembers, sizex, sizey))
+        vegsh = np.repeat(np.add(np.zeros((1, sizex, sizey)), bush > 1., dtype=float), nmembers, axis=0)
+    else:
+        sh = vegsh = vbshvegsh = np.zeros((1, 1, 1))
+
+    dzprev = np.zeros(nmembers)
+    for step in range(len(schedules[0])):
+        nactive = sum(1 for schedule in schedules if len(schedule) > step)
+        xc1, xc2, yc1, yc2, xp1, xp2, yp1, yp2, _ = schedules[0][step]
+        dz = np.array([schedules[m][step][8] for m in range(nactive)])
+        cast_shadow_step_batch(a, vegdem, vegdem2, f, sh, vegsh, vbshvegsh, usevegdem, nactive,
+                               xc1, yc1, xp1, xp2, yp1, yp2, dz, dzprev[:nactive])
+        dzprev[:nactive] = dz
+
+    inverse = np.argsort(order)
+    if usevegdem:
+        return f[inverse], sh[inverse], vegsh[inverse], vbshvegsh[inverse]
+    return f[inverse], None, None, None
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Bit-packed storage of the sky patch shadow matrices (shadowmats.npz) used by
+the anisotropic sky in SOLWEIG.
+
+The masks are binary, so each of shadowmat, vegshadowmat and vbshmat is stored
+as uint8 with eight pixels per byte, packed along the columns and laid out as
+(patches, rows, packed columns). The file is an uncompressed npz, so its
+members can be memory mapped and a single patch (or a tile of all patches) is
+read from disk only when it is needed. Shadow matrices written by earlier
+versions (float64 cubes of shape (rows, cols, patches) in a compressed npz)
+are still read by load_shadowmats.
+"""
+
+import os
+import struct
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+
+SHADOWMAT_NAMES = ('shadowmat', 'vegshadowmat', 'vbshmat')
+
+
+class ShadowMatrix(object):
+    """
+    Bit-packed (rows, cols, patches) shadow matrix. Indexing with
+    [rows, cols, patches] (integers or slices) unpacks only the requested part
+    and returns float values (float64, or dtype), so that shmat[:, :, idx] can
+    be used exactly as with the float cubes. The last full patch read is kept, since the SOLWEIG
+    routines access the same patch several times in a row. Adding a scalar
+    (as done for the vegetation matrices when no vegetation is used) is
+    applied on reading.
+    """
+
+    def __init__(self, packed, cols, offset=0., dtype=np.float64):
+        self.packed = packed
+        self.shape = (packed.shape[1], cols, packed.shape[0])
+        self.offset = offset
+        self.dtype = np.dtype(dtype)
+        self._cached = (None, None)
+
+    @classmethod
+    def zeros(cls, rows, cols, npatches):
+        return cls(np.zeros((npatches, rows, (cols + 7) // 8), dtype=np.uint8), cols)
+
+    @classmethod
+    def from_array(cls, array):
+        """Pack a (rows, cols, patches) float cube."""
+        packed = np.packbits(np.moveaxis(np.asarray(array) != 0, 2, 0), axis=-1)
+        return cls(packed, array.shape[1])
+
+    @property
+    def ndim(self):
+        return 3
+
+    def __add__(self, value):
+        # no __iadd__: shmat += 1 rebinds to a new object sharing the packed bits
+        return ShadowMatrix(self.packed, self.shape[1], self.offset + value, self.dtype)
+
+    def crop(self, rows, cols):
+        """New ShadowMatrix holding the window [rows, cols] (slices) of all patches."""
+        r0, r1 = rows.indices(self.shape[0])[:2]
+        c0, c1 = cols.indices(self.shape[1])[:2]
+        cropped = ShadowMatrix.zeros(r1 - r0, c1 - c0, self.shape[2])
+        cropped.offset = self.offset
+        for idx in range(self.shape[2]):
+            cropped.packed[idx] = np.packbits(np.unpackbits(self.packed[idx, r0:r1], axis=-1)[:, c0:c1], axis=-1)
+        return cropped
+
+    def paste(self, other, row, col):
+        """Copy all patches of the ShadowMatrix other into this one at offset (row, col)."""
+        rows = slice(row, row + other.shape[0])
+        cols = slice(col, col + other.shape[1])
+        for idx in range(self.shape[2]):
+            self[rows, cols, idx] = np.unpackbits(other.packed[idx], axis=-1)[:, :other.shape[1]]
+
+    def _key(self, key):
+        if not isinstance(key, tuple) or len(key) != 3:
+            raise IndexError('ShadowMatrix is indexed with [rows, cols, patches]')
+        return key
+
+    def _columns(self, cols):
+        """Byte range holding the columns and the column key relative to that range."""
+        if isinstance(cols, slice):
+            c0, c1, step = cols.indices(self.shape[1])
+            if step != 1:
+                raise IndexError('column slices with a step are not supported')
+            c1 = max(c1, c0)
+            b0 = c0 // 8
+            return slice(b0, (c1 + 7) // 8), slice(c0 - b0 * 8, c1 - b0 * 8)
+        col = cols + self.shape[1] if cols < 0 else cols
+        if not 0 <= col < self.shape[1]:
+            raise IndexError('column index out of range')
+        return slice(col // 8, col // 8 + 1), col % 8
+
+    def __getitem__(self, key):
+        rows, cols, patches = self._key(key)
+        full = (rows == slice(None) and cols == slice(None))
+        if full and not isinstance(patches, slice) and self._cached[0] == patches:
+            return self._cached[1]
+
+        bytes_, inner = self._columns(cols)
+        bits = np.unpackbits(self.packed[patches, rows, bytes_], axis=-1)
+        values = bits[..., inner].astype(self.dtype)
+        if isinstance(patches, slice):
+            values = np.moveaxis(values, 0, -1)
+        if self.offset:
+            values += self.offset
+
+        if full and not isinstance(patches, slice):
+            values.setflags(write=False)
+            self._cached = (patches, values)
+        return values
+
+    def __setitem__(self, key, value):
+        rows, cols, patches = self._key(key)
+        bytes_, inner = self._columns(cols)
+        value = np.asarray(value) != 0
+        if isinstance(patches, slice) and value.ndim > 0:
+            value = np.moveaxis(value, -1, 0)
+        bits = np.unpackbits(self.packed[patches, rows, bytes_], axis=-1)
+        bits[..., inner] = value
+        self.packed[patches, rows, bytes_] = np.packbits(bits, axis=-1)
+        self._cached = (None, None)
+
+
+class DiffuseShadowMatrix(object):
+    """
+    Shadow matrix for diffuse radiation, shmat - (1 - vegshmat) * (1 - transVeg)
+    (or shmat if vegshmat is None), precomputed once per run as a (pixels, patches)
+    matrix. Its only values are 0, 1, transVeg and transVeg - 1, so it is stored
+    in float32 (4 bytes per pixel and patch instead of 8). The luminance from the
+    sky into each pixel is then a matrix product with the relative patch
+    luminances, accumulated in dtype block by block, and the results of the last
+    `cachesize` distinct luminance vectors are reused, since Perez_v3 returns
+    identical vectors for repeated sky conditions. Indexing with [rows, cols, patches]
+    gives float32 views of the matrix as (rows, cols, patches) cube.
+    """
+
+    # pixels per block of the luminance product, bounds the temporary copy in dtype
+    blocksize = 16384
+
+    def __init__(self, shmat, vegshmat=None, transVeg=0., cachesize=16, dtype=np.float64):
+        rows, cols, npatches = shmat.shape
+        self.shape = (rows, cols, npatches)
+        self.dtype = np.dtype(dtype)
+        self.matrix = np.empty((rows * cols, npatches), dtype=np.float32)
+        for idx in range(npatches):
+            if vegshmat is None:
+                self.matrix[:, idx] = shmat[:, :, idx].ravel()
+            else:
+                self.matrix[:, idx] = (shmat[:, :, idx] - (1 - vegshmat[:, :, idx]) * (1 - transVeg)).ravel()
+        self.cachesize = cachesize
+        self._cache = OrderedDict()
+
+    @classmethod
+    def from_matrix(cls, matrix, shape, cachesize=16, dtype=np.float64):
+        """DiffuseShadowMatrix around an already calculated (pixels, patches) matrix, e.g. in shared memory."""
+        diffsh = cls.__new__(cls)
+        diffsh.shape = tuple(shape)
+        diffsh.dtype = np.dtype(dtype)
+        diffsh.matrix = matrix
+        diffsh.cachesize = cachesize
+        diffsh._cache = OrderedDict()
+        return diffsh
+
+    @property
+    def ndim(self):
+        return 3
+
+    def __getitem__(self, key):
+        return self.matrix.reshape(self.shape)[key]
+
+    def luminance(self, lv):
+        """Total relative luminance from the sky into each pixel, i.e. sum over patches of diffsh * lv."""
+        lv = np.ascontiguousarray(lv, dtype=self.dtype)
+        key = lv.tobytes()
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        aniLum = np.empty(self.matrix.shape[0], dtype=self.dtype)
+        for start in range(0, aniLum.shape[0], self.blocksize):
+            block = slice(start, start + self.blocksize)
+            aniLum[block] = np.dot(self.matrix[block].astype(self.dtype, copy=False), lv)
+        aniLum = aniLum.reshape(self.shape[:2])
+        aniLum.setflags(write=False)
+        if self.cachesize > 0:
+            self._cache[key] = aniLum
+            if len(self._cache) > self.cachesize:
+                self._cache.popitem(last=False)
+        return aniLum
+
+
+class ShadowMatrixWriter(object):
+    """
+    Write the bit-packed shadow matrices of a raster to filename (shadowmats.npz)
+    without holding them in memory. The matrices are filled through the
+    ShadowMatrix objects in self.shmats (e.g. tile by tile) and collected into
+    the npz on close().
+    """
+
+    def __init__(self, filename, rows, cols, npatches):
+        self.filename = filename
+        self.tempfiles = [filename + '.' + name + '.npy' for name in SHADOWMAT_NAMES]
+        self.shmats = tuple(ShadowMatrix(np.lib.format.open_memmap(tempfile, mode='w+', dtype=np.uint8,
+                                                                   shape=(npatches, rows, (cols + 7) // 8)), cols)
+                            for tempfile in self.tempfiles)
+        self.shape = np.array([rows, cols, npatches])
+
+    def close(self):
+        # drop the memory maps before the temporary files are collected and removed
+        for shmat in self.shmats:
+            shmat.packed.flush()
+        shmat = self.shmats = None
+        with zipfile.ZipFile(self.filename, 'w', zipfile.ZIP_STORED, allowZip64=True) as npz:
+            with npz.open('shape.npy', 'w') as member:
+                np.lib.format.write_array(member, self.shape)
+            for name, tempfile in zip(SHADOWMAT_NAMES, self.tempfiles):
+                npz.write(tempfile, name + '.npy')
+        for tempfile in self.tempfiles:
+            os.remove(tempfile)
+
+
+def save_shadowmats(filename, shmat, vegshmat, vbshvegshmat):
+    """Save three ShadowMatrix objects (or float cubes) as bit-packed shadowmats.npz."""
+    shmats = [m if isinstance(m, ShadowMatrix) else ShadowMatrix.from_array(m) for m in (shmat, vegshmat, vbshvegshmat)]
+    arrays = dict((name, np.ascontiguousarray(m.packed)) for name, m in zip(SHADOWMAT_NAMES, shmats))
+    np.savez(filename, shape=np.array(shmats[0].shape), **arrays)
+
+
+def _memmap_member(filename, npz, name):
+    """
+    Memory map an uncompressed npy member of a zip file, None if it is compressed
+    or written in a npy format version without a public header reader.
+    """
+    info = npz.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    readers = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+    with open(filename, 'rb') as f:
+        # local file header (zip specification): 30 bytes ending with the lengths
+        # of the file name and of the extra field, which precede the member data
+        f.seek(info.header_offset)
+        header = f.read(30)
+        if header[:4] != b'PK\x03\x04':
+            return None
+        namelength, extralength = struct.unpack('<2H', header[26:30])
+        f.seek(info.header_offset + 30 + namelength + extralength)
+        version = np.lib.format.read_magic(f)
+        if version not in readers:
+            return None
+        shape, fortran_order, dtype = readers[version](f)
+        offset = f.tell()
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def load_shadowmats(filename):
+    """
+    Open shadowmats.npz and return (shmat, vegshmat, vbshvegshmat). Bit-packed
+    files give memory mapped ShadowMatrix objects, files from earlier versions
+    the float64 cubes.
+    """
+    with zipfile.ZipFile(filename) as npz:
+        names = [name[:-4] for name in npz.namelist()]
+        with np.load(filename) as data:
+            if 'shape' not in names:
+                return tuple(data[name] for name in SHADOWMAT_NAMES)
+            cols = int(data['shape'][1])
+            shmats = []
+            for name in SHADOWMAT_NAMES:
+                packed = _memmap_member(filename, npz, name)
+                if packed is None:
+                    packed = data[name]
+                shmats.append(ShadowMatrix(packed, cols))
+    return tuple(shmats)